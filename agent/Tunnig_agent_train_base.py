@@ -1,12 +1,14 @@
 #training_agent.py
-import random
 from q_learning_agent import QLearningAgent
-from state_builder import state_builder3
-from rewards import calcular_recompensa
-import pickle
-import matplotlib.pyplot as plt
+from q_table_array import ArrayQLearningAgent
+from entrenamiento_lockstep import EntrenadorLockstep
+from diagnostico import diag, RESUMEN, NORMAL
 import json
 from generar_data_artifitial import generar_tick_json_artificial
+from tick_cache import compilar_o_cargar, compilar_tick_json
+from discretizacion import discretizacion_para_entrenar
+from transiciones import (construir_o_cargar_transiciones, preparar_agente, reproducir_episodio,
+                          compartir_tabla, adjuntar_tabla)
 import pandas as pd
 import os
 import gc
@@ -20,39 +22,59 @@ SHOVEL_NAMES = ['PH002', 'EX004', 'PH003', 'PH001', 'CF001', 'CF002']
 TICK_JSON_REAL_PATH = r"C:\RL_model\agent\MINE-hudbay-2025-08-19.json"
 LOG_CSV_PATH = f"log_entrenamiento_AgenteRl_{MODO}.csv"
 QTABLE_PATH = f"q_table_{MODO}.pkl"
+# Discretización del estado (JSON/YAML, ver discretizacion.py); None = estado de state_builder3 sin cambios
+DISCRETIZACION_PATH = None
 
 
 # Variables globales para datos pre-cargados
-TICK_JSON = None
-TICK_KEYS = None
+DATOS = None  # TicksCompilados (columnas memory-map)
+TABLA = None  # TablaTransiciones precomputada (compartida por todas las configuraciones)
 TOTAL_TICKS = None
+_BLOQUES_COMPARTIDOS = []  # memoria compartida a la que está adjunto este proceso (workers del Pool)
 
 #===================================================
 # 1. INICIALIZACIÓN (CARGAR DATOS UNA SOLA VEZ)
 # ========================================================
 def inicializar_datos():
-    """Carga los datos UNA vez al inicio (optimización clave)"""
-    global TICK_JSON, TICK_KEYS, TOTAL_TICKS
+    """Carga los datos UNA vez al inicio (optimización clave).
+    El JSON real se compila a columnas una sola vez; luego se abre con memory-map.
+    """
+    global DATOS, TABLA, TOTAL_TICKS
     
-    if TICK_JSON is not None:
+    if DATOS is not None:
         return  # Ya está inicializado
     
     print("Cargando datos de entrenamiento...")
     
     if MODO == "real":
-        import json
-        with open(TICK_JSON_REAL_PATH, "r") as f:
-            TICK_JSON = json.load(f)
-        TICK_KEYS = sorted([k for k in TICK_JSON.keys() if k.isdigit()], key=int)
+        DATOS = compilar_o_cargar(TICK_JSON_REAL_PATH)
     else:
-        from generar_data_artifitial import generar_tick_json_artificial
-        TICK_JSON = generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5)
-        TICK_KEYS = sorted([k for k in TICK_JSON.keys() if k.isdigit()], key=int)
+        DATOS = compilar_tick_json(generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5))
     
-    TOTAL_TICKS = len(TICK_KEYS)
+    TOTAL_TICKS = DATOS.n_ticks
+    TABLA = construir_o_cargar_transiciones(DATOS, SHOVEL_NAMES,
+                                            espec=discretizacion_para_entrenar(DISCRETIZACION_PATH, DATOS, SHOVEL_NAMES))
     print(f"Datos cargados: {TOTAL_TICKS} ticks")
 
 
+def compartir_datos():
+    """
+    Proceso padre del tuning: preprocesa el dataset UNA vez y publica la tabla de
+    transiciones en memoria compartida. Devuelve (bloques, descriptor); el descriptor
+    se pasa al initializer del Pool (inicializar_worker) y los bloques se liberan al final.
+    """
+    inicializar_datos()
+    return compartir_tabla(TABLA)
+
+
+def inicializar_worker(descriptor):
+    """Initializer del Pool: adjunta la tabla compartida por el padre (sin json.load ni copias)."""
+    global TABLA, TOTAL_TICKS
+    bloques, TABLA = adjuntar_tabla(descriptor)
+    _BLOQUES_COMPARTIDOS.extend(bloques)
+    TOTAL_TICKS = len(TABLA.offsets) - 1
+
+
 # ============================================
 # 3. FUNCIONES AUXILIARES
 # ============================================
@@ -79,12 +101,12 @@ def entrenar_configuracion_analisisSensibilidad(alpha, gamma, epsilon_decay, num
     Devuelve recompensa promedio de los episodios
     """
     
-    # Inicializar datos si no están cargados
-    if TICK_JSON is None:
+    # Inicializar datos si no están cargados (los workers del Pool ya tienen la tabla compartida)
+    if TABLA is None:
         inicializar_datos()
     
-    # Crear agente con la configuración específica
-    agent = QLearningAgent(
+    # Crear agente con la configuración específica (Q-table en matriz para el replay por índices)
+    agent = ArrayQLearningAgent(
         actions=SHOVEL_NAMES,
         alpha=alpha,
         gamma=gamma,
@@ -94,91 +116,69 @@ def entrenar_configuracion_analisisSensibilidad(alpha, gamma, epsilon_decay, num
     )
 
     rewards_por_episodio = []
+    filas = preparar_agente(agent, TABLA)  # estados de la tabla -> filas de la Q-table del agente
 
     #==========Entrenamiento del Agente RL, por EPISODIOS ==============================================================
     for ep in range(num_episodios):
-        print(f"\n--- Episodio {ep + 1} ---")
-        total_reward = 0  # Total de recompensas
-
-        for tick_index in range(TOTAL_TICKS):
-            #tick_data = tick_json[str(tick_index)]
-            tick_data = TICK_JSON[TICK_KEYS[tick_index]]  # "5", "13", "27", "41": Cualquier secuencia
-            truck_states = tick_data["truck_states"]
-            shovels_info = tick_data["shovel_states"]
-
-            for truck_id, truck_info in truck_states.items():
-                tick_info = {
-                    "truck_states": {truck_id: truck_info},
-                    "shovel_states": shovels_info
-                }
-
-                # 1. Construir estado actual
-                states, truck_names_list = state_builder3(tick_info, SHOVEL_NAMES)
-                state = states[0]  # usamos solo el camion actual
-
-                # 2. Acciones válidas
-                valid_actions = SHOVEL_NAMES    # ← Ahora todas las acciones están disponibles
-
-                if not valid_actions:
-                    print(f"No hay acciones válidas para el camión {truck_id} en tick {tick_index}")
-                    continue
-
-                # 3. Elegir acción
-                action = agent.choose_action(state, valid_actions)
-
-                # 4. Obtener next_tick (mismo camión, siguiente tick)
-                next_tick_index = (tick_index + 1) % TOTAL_TICKS
-                next_tick_data = TICK_JSON[TICK_KEYS[next_tick_index]]
-
-                next_truck_info = next_tick_data["truck_states"].get(truck_id, truck_info)
-                next_tick_info = {
-                    "truck_states": {truck_id: next_truck_info},
-                    "shovel_states": next_tick_data["shovel_states"]
-                }
-                next_states, next_truck_names_list = state_builder3(next_tick_info, SHOVEL_NAMES)
-                next_state = next_states[0]
-
-                # 5. Extraer ETAs del camión actual
-                truck_etas = truck_info.get("ETA", {})
-                
-                # 5. Recompensa
-                reward = calcular_recompensa(
-                    status=next_truck_info.get("status", "waiting for shovel"), # valor por defecto, por si no se encuentra el status en next_truck_info
-                    action=action,
-                    shovels_info=shovels_info,
-                    truck_etas=truck_etas  # Agregar ETAs del camión
-                )
-
-                # 5.1 Calcular recompensas para todas las acciones posibles (debug, análisis, logging)
-                recompensas_acciones_posibles = {
-                    a: calcular_recompensa(
-                        status=next_truck_info.get("status", "waiting for shovel"),
-                        action=a,
-                        shovels_info=shovels_info,
-                        truck_etas=truck_etas  # Agregar ETAs del camión
-                    ) for a in valid_actions
-                }
-
-                # ==========Propuesta de Metricas ==================================================
-                mejor_accion = max(recompensas_acciones_posibles, key=recompensas_acciones_posibles.get)
-                decision_optima = (action == mejor_accion)
-                #waiting_time = truck_info.get("waiting_time", 0)
-
-
-                # 6. Validación de acciones para próximo estado
-                next_valid_actions = valid_actions
-
-                # 7. Actualizar agente
-                agent.update(state, action, reward, next_state, next_valid_actions)
-
-                total_reward += reward
-
+        diag(NORMAL, "\n--- Episodio {} ---", ep + 1)
+        # Replay sobre la tabla de transiciones: sin construir estados ni recompensas por episodio
+        total_reward = reproducir_episodio(agent, TABLA, filas)
 
         agent.decay_epsilon()
         rewards_por_episodio.append(total_reward)
-        print(f"Episodio {ep+1}: Recompensa {total_reward}")
+        diag(RESUMEN, "Episodio {}: Recompensa {}", ep + 1, total_reward)
         # Liberar memoria después de cada episodio
         #gc.collect()
 
     # Devuelve la recompensa media (para comparaciones en sensibilidad)
-    return sum(rewards_por_episodio) / len(rewards_por_episodio)
\ No newline at end of file
+    return sum(rewards_por_episodio) / len(rewards_por_episodio)
+
+
+def entrenar_episodios(config, agent=None, num_episodios=1):
+    """
+    Crea un agente con `config` (dict con alpha, gamma, epsilon_decay y opcionalmente
+    epsilon_min) o continúa `agent`, y lo entrena `num_episodios` episodios más.
+    Devuelve (agent, recompensas de esos episodios). Lo usa el planificador de tuning
+    para retomar cada configuración entre rungs sin empezar de cero.
+    """
+    if TABLA is None:
+        inicializar_datos()
+
+    if agent is None:
+        agent = ArrayQLearningAgent(
+            actions=SHOVEL_NAMES,
+            alpha=config["alpha"],
+            gamma=config["gamma"],
+            epsilon=1.0,
+            epsilon_min=config.get("epsilon_min", 0.01),
+            epsilon_decay=config["epsilon_decay"]
+        )
+    filas = preparar_agente(agent, TABLA)
+
+    recompensas = []
+    for _ in range(num_episodios):
+        recompensas.append(reproducir_episodio(agent, TABLA, filas))
+        agent.decay_epsilon()
+    return agent, recompensas
+
+
+def entrenar_lockstep(configs, num_episodios, semilla=None):
+    """
+    Entrena todas las configuraciones juntas en una sola pasada por los datos por episodio
+    (EntrenadorLockstep). Devuelve la recompensa media por episodio de cada configuración.
+    """
+    if TABLA is None:
+        inicializar_datos()
+
+    entrenador = EntrenadorLockstep(TABLA, configs, semilla=semilla)
+    rewards = entrenador.entrenar(num_episodios)  # (episodios, configuraciones)
+    for ep, fila in enumerate(rewards):
+        diag(RESUMEN, lambda: f"Episodio {ep+1}: Recompensas {fila.tolist()}")
+    return rewards.mean(axis=0).tolist()
+
+
+def ejecutar_trabajo(trabajo):
+    """Trabajo del planificador de tuning: (id, config, agente, episodios) -> (id, agente, recompensas)"""
+    id_config, config, agent, num_episodios = trabajo
+    agent, recompensas = entrenar_episodios(config, agent, num_episodios)
+    return id_config, agent, recompensas
\ No newline at end of file
@@ -2,6 +2,10 @@
 import pandas as pd
 from multiprocessing import Pool
 from Tunnig_agent_train_base import entrenar_configuracion_analisisSensibilidad  # tu función ya existente
+from Tunnig_agent_train_base import compartir_datos, inicializar_worker, ejecutar_trabajo, entrenar_lockstep
+from memoria_compartida import liberar
+from planificador_tuning import espacio_grilla, espacio_aleatorio, successive_halving, hyperband
+import random
 
 # === Definir hiperparámetros a probar ===
 alphas = [0.1, 0.3, 0.5]
@@ -42,6 +46,35 @@ for g in gammas:
 for e in epsilon_decays:
     params.append(("epsilon_decay", 0.1, 0.9, e))
 
+# -------------------------------
+# 3.1) ESTRATEGIA DE BÚSQUEDA
+# -------------------------------
+# "uno_a_la_vez": las 9 configuraciones de arriba, 5 episodios cada una (análisis de sensibilidad)
+# "lockstep":     las mismas 9 configuraciones, entrenadas juntas en un solo proceso con una
+#                 sola pasada por los datos por episodio (entrenamiento_lockstep.py)
+# "grilla":       successive halving sobre todas las combinaciones de ESPACIO_GRILLA
+# "aleatorio":    Hyperband con configuraciones muestreadas de ESPACIO_ALEATORIO
+# En "grilla" y "aleatorio" las configuraciones que van perdiendo se descartan en cada rung
+# y las que siguen retoman su agente con más episodios (hasta EPISODIOS_MAX).
+ESTRATEGIA = "uno_a_la_vez"
+ESPACIO_GRILLA = {
+    "alpha": alphas,
+    "gamma": gammas,
+    "epsilon_decay": epsilon_decays,
+    "epsilon_min": [0.01, 0.05],
+}
+ESPACIO_ALEATORIO = {          # tupla (min, max) -> uniforme; lista -> uno de los valores
+    "alpha": (0.01, 0.9),
+    "gamma": (0.5, 0.999),
+    "epsilon_decay": (0.95, 0.9999),
+    "epsilon_min": (0.0, 0.1),
+}
+EPISODIOS_MIN = 1   # episodios del primer rung
+EPISODIOS_MAX = 27  # episodios máximos por configuración
+ETA = 3             # en cada rung sigue el mejor 1/ETA
+SEMILLA_TUNING = 0
+RESULT_PLANIFICADOR_CSV = "Result_tunnig_planificador.csv"
+
 # -------------------------------
 # 4) FUNCIÓN WRAPPER QUE EJECUTA UN EXPERIMENTO
 # -------------------------------
@@ -82,20 +115,82 @@ def run_config(args):
     
     return resultado
 
+def run_lockstep(params):
+    """Las configuraciones de `params` en lockstep; mismo formato de resultados que run_config"""
+    configs = [{"alpha": alpha, "gamma": gamma, "epsilon_decay": decay} for _, alpha, gamma, decay in params]
+    recompensas = entrenar_lockstep(configs, num_episodios=5)
+    return [
+        {
+            "parametro": param,
+            "alpha": alpha,
+            "gamma": gamma,
+            "epsilon_decay": decay,
+            "recompensa": reward,
+            "status": "éxito"
+        }
+        for (param, alpha, gamma, decay), reward in zip(params, recompensas)
+    ]
+
+# -------------------------------
+# 4.1) BÚSQUEDA CON EL PLANIFICADOR (successive halving / Hyperband)
+# -------------------------------
+def buscar_con_planificador(pool):
+    """Corre la estrategia "grilla" o "aleatorio" con los trabajos de cada rung repartidos en el Pool"""
+    historial = []
+    rnd = random.Random(SEMILLA_TUNING)
+
+    def ejecutar(trabajos):
+        return pool.map(ejecutar_trabajo, trabajos)
+
+    def registrar(filas):
+        # guardamos parcial al terminar cada rung
+        historial.extend(filas)
+        pd.DataFrame(historial).to_csv(RESULT_PLANIFICADOR_CSV, index=False)
+        print(f"Rung {filas[0]['rung']} ({filas[0]['episodios']} episodios, {len(filas)} configs) | "
+              f"mejor: {filas[0]}")
+
+    if ESTRATEGIA == "grilla":
+        ranking, _ = successive_halving(espacio_grilla(ESPACIO_GRILLA), ejecutar, EPISODIOS_MIN,
+                                        eta=ETA, episodios_max=EPISODIOS_MAX, registrar=registrar)
+        mejor = {**ranking[0]["config"], "episodios": ranking[0]["episodios"], "puntaje": ranking[0]["puntaje"]}
+    else:
+        muestrear = lambda n: espacio_aleatorio(ESPACIO_ALEATORIO, n, semilla=rnd.random())
+        mejor, _ = hyperband(muestrear, ejecutar, EPISODIOS_MAX, eta=ETA, episodios_min=EPISODIOS_MIN,
+                             registrar=registrar)
+
+    print("\nMejor configuración:", mejor)
+    return historial
+
 # -------------------------------
 # 5) PROGRAMA PRINCIPAL (WINDOWS)
 # -------------------------------
 if __name__ == "__main__":
     resultados = []
 
-    # Ejecutar en paralelo (4 procesos)
-    with Pool(processes=7) as pool:  # usa 4 cores (4 procesos en paralelo)
-        for result in pool.imap_unordered(run_config, params):
-            # pool.imap_unordered toma CADA elemento de params y se lo pasa a run_config
-            # Esto sucede en paralelo para 4 elementos a la vez
-            resultados.append(result)
-            # guardamos parcial
-            pd.DataFrame(resultados).to_csv("Result_tunnig_hiperparametros.csv", index=False)
-            print("Guardado parcial:", result)
-
-    print("\nAnálisis de Tunnig Hiperparametros finalizado. Resultados en Result_tunnig_hiperparametros.csv")
\ No newline at end of file
+    if ESTRATEGIA == "lockstep":
+        # Un solo proceso: las 9 configuraciones avanzan juntas sobre los mismos datos
+        resultados = run_lockstep(params)
+        pd.DataFrame(resultados).to_csv("Result_tunnig_hiperparametros.csv", index=False)
+    else:
+        # Dataset preprocesado UNA vez en el padre; los workers se adjuntan a la tabla en memoria
+        # compartida (una sola copia en RAM sin importar el número de procesos)
+        bloques, descriptor = compartir_datos()
+
+        # Ejecutar en paralelo (4 procesos)
+        try:
+            with Pool(processes=7, initializer=inicializar_worker, initargs=(descriptor,)) as pool:  # usa 4 cores (4 procesos en paralelo)
+                if ESTRATEGIA == "uno_a_la_vez":
+                    for result in pool.imap_unordered(run_config, params):
+                        # pool.imap_unordered toma CADA elemento de params y se lo pasa a run_config
+                        # Esto sucede en paralelo para 4 elementos a la vez
+                        resultados.append(result)
+                        # guardamos parcial
+                        pd.DataFrame(resultados).to_csv("Result_tunnig_hiperparametros.csv", index=False)
+                        print("Guardado parcial:", result)
+                else:
+                    buscar_con_planificador(pool)
+        finally:
+            liberar(bloques, destruir=True)
+
+    archivo = RESULT_PLANIFICADOR_CSV if ESTRATEGIA in ("grilla", "aleatorio") else "Result_tunnig_hiperparametros.csv"
+    print(f"\nAnálisis de Tunnig Hiperparametros finalizado. Resultados en {archivo}")
\ No newline at end of file
@@ -0,0 +1,378 @@
+import random
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from .q_learning_agent import QLearningAgent
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from q_learning_agent import QLearningAgent
+
+# =========================================================
+# Aproximación lineal de Q con tile coding
+# =========================================================
+"""
+El estado de state_builder3 tiene 4 + 6 * n_palas columnas, así que en producción casi
+todos los estados son nuevos: la Q-table responde con una fila en 0 y además crece con
+cada estado. Aquí Q(s, a) es lineal en features binarias de tile coding sobre el vector
+del estado:
+
+    Q(s, a) = sesgo[a] + sum_i pesos[a, i]   para las features i activas en s
+
+- Cada conjunto de columnas (por defecto, cada columna sola) se cubre con `n_tilings`
+  grillas de ancho `anchos[c]` desplazadas entre sí; en cada grilla el estado cae en un
+  tile. Estados cercanos comparten tiles, así que lo aprendido en uno se generaliza a
+  sus vecinos (y a estados nunca vistos).
+- Los tiles se llevan por hash a una tabla de 2**bits pesos por acción: la memoria es
+  fija (n_acciones x 2**bits floats) sin importar cuántos estados distintos aparezcan.
+- choose_action / update calculan Q con un gather y una suma sobre las features activas,
+  y el update suma alpha / n_activas * error a esas features (np.add.at).
+
+Los anchos se ajustan a un dataset con CodificadorTiles.desde_estados (rango entre los
+percentiles 5 y 95 de cada columna, dividido en `tiles_por_rango`); sin ajustar son 1.0,
+que sobre columnas ya discretizadas equivale a un tile por valor.
+
+agent.q_table es una vista de solo lectura (QAproximada) con la interfaz de dict: q_table[state]
+devuelve {accion: Q} para cualquier estado, y al iterarla (len, items, a_dict, pickle) recorre
+los estados de referencia (los de la tabla de transiciones con que se preparó el agente), así
+que los scripts de entrenamiento pueden seguir escribiendo q_table_*.pkl con los Q-valores
+del aproximador en esos estados. Los pesos se guardan aparte con guardar() / cargar().
+"""
+
+# Primos para mezclar (conjunto, tiling, coordenadas) en el hash de cada tile
+_PRIMOS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F, 0x165667B1, 0xD3A2646C,
+                    0xFD7046C5, 0xB55A4F09], dtype=np.uint64)
+
+
+def matriz_estados(estados):
+    """Lista de tuplas de estado -> matriz float64 (n_estados, n_columnas); None pasa a -1."""
+    return np.array([[-1 if v is None else v for v in s] for s in estados], dtype=np.float64).reshape(
+        len(estados), -1)
+
+
+class CodificadorTiles:
+    def __init__(self, n_columnas, n_tilings=8, bits=16, anchos=None, conjuntos=None):
+        """
+        Parámetros:
+        - n_columnas: largo de la tupla de estado.
+        - n_tilings: grillas desplazadas por conjunto de columnas.
+        - bits: la tabla de hash tiene 2**bits features (memoria fija).
+        - anchos: ancho del tile por columna (None = 1.0 en todas).
+        - conjuntos: tuplas de columnas que se codifican juntas (None = cada columna sola).
+          Un conjunto de varias columnas captura interacciones (p. ej. eta y cola de una pala).
+        """
+        if len(_PRIMOS) < max((len(c) for c in (conjuntos or [()])), default=0) + 2:
+            raise ValueError(f"Conjuntos de a lo sumo {len(_PRIMOS) - 2} columnas")
+        self.n_columnas = n_columnas
+        self.n_tilings = n_tilings
+        self.bits = bits
+        self.tamano = 1 << bits
+        self.anchos = np.ones(n_columnas) if anchos is None else np.asarray(anchos, dtype=np.float64)
+        self.conjuntos = [tuple(c) for c in conjuntos] if conjuntos else [(c,) for c in range(n_columnas)]
+        self._preparar()
+
+    def _preparar(self):
+        # Los conjuntos del mismo tamaño se codifican juntos (un solo cálculo vectorizado por tamaño)
+        t = np.arange(self.n_tilings)
+        self._grupos = []
+        for tamano in sorted({len(c) for c in self.conjuntos}):
+            ids = [k for k, c in enumerate(self.conjuntos) if len(c) == tamano]
+            cols = np.array([self.conjuntos[k] for k in ids], dtype=np.int64)  # (n_conj, tamano)
+            anchos = self.anchos[cols]
+            # Desplazamiento de cada grilla: asimétrico (1, 3, 5, ...) por columna dentro del conjunto
+            impares = 1 + 2 * np.arange(tamano)
+            fraccion = (t[:, None] * impares % self.n_tilings) / self.n_tilings  # (n_tilings, tamano)
+            desplazamientos = fraccion[None, :, :] * anchos[:, None, :]      # (n_conj, n_tilings, tamano)
+            base = (np.array(ids, dtype=np.uint64)[:, None] * _PRIMOS[0]
+                    + t.astype(np.uint64)[None, :] * _PRIMOS[1])              # (n_conj, n_tilings)
+            self._grupos.append((cols, anchos[:, None, :], desplazamientos, base))
+        self.n_activas = len(self.conjuntos) * self.n_tilings
+
+    @classmethod
+    def desde_estados(cls, estados, n_tilings=8, bits=16, tiles_por_rango=8, conjuntos=None):
+        """
+        Codificador con los anchos ajustados a un dataset: (p95 - p5) / tiles_por_rango por
+        columna, sin contar los -1 (sin dato). Columnas constantes o de enteros chicos quedan en 1.0.
+        """
+        X = estados if isinstance(estados, np.ndarray) else matriz_estados(estados)
+        anchos = np.ones(X.shape[1])
+        for c in range(X.shape[1]):
+            valores = X[X[:, c] != -1, c]
+            if valores.size:
+                p5, p95 = np.percentile(valores, [5, 95])
+                anchos[c] = max((p95 - p5) / tiles_por_rango, 1.0)
+        return cls(X.shape[1], n_tilings=n_tilings, bits=bits, anchos=anchos, conjuntos=conjuntos)
+
+    def indices_matriz(self, X):
+        """Features activas de varios estados: matriz int64 (n_estados, n_activas)."""
+        X = np.asarray(X, dtype=np.float64)
+        partes = []
+        for cols, anchos, desplazamientos, base in self._grupos:
+            # coordenadas (n, n_conj, n_tilings, tamano) del tile en cada grilla
+            coords = np.floor((X[:, cols][:, :, None, :] + desplazamientos) / anchos).astype(np.int64)
+            h = np.broadcast_to(base, coords.shape[:3]).copy()
+            for j in range(cols.shape[1]):
+                h ^= coords[..., j].astype(np.uint64) * _PRIMOS[j + 2]
+                h *= _PRIMOS[j + 2]
+            partes.append(((h >> np.uint64(16)) % np.uint64(self.tamano)).reshape(len(X), -1))
+        return np.hstack(partes).astype(np.int64)
+
+    def indices(self, state):
+        """Features activas de un estado (tupla): array int64 (n_activas,)."""
+        return self.indices_matriz(matriz_estados([state]))[0]
+
+    def a_dict(self):
+        return {"n_columnas": self.n_columnas, "n_tilings": self.n_tilings, "bits": self.bits,
+                "anchos": self.anchos.tolist(), "conjuntos": [list(c) for c in self.conjuntos]}
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(d["n_columnas"], n_tilings=d["n_tilings"], bits=d["bits"], anchos=d["anchos"],
+                   conjuntos=d["conjuntos"])
+
+
+class QAproximada:
+    """
+    Vista de solo lectura de Q con la interfaz de dict {estado: {accion: Q}}.
+
+    Todo estado tiene Q (`in` siempre es True y q_table[state] nunca falla). len, iter,
+    items, a_dict y `q` recorren los estados de referencia del agente (los de la última
+    tabla con que se preparó).
+    """
+
+    def __init__(self, agent):
+        self._agent = agent
+
+    def __contains__(self, state):
+        return True
+
+    def __getitem__(self, state):
+        return dict(zip(self._agent.actions, self._agent.valores(state).tolist()))
+
+    def get(self, state, default=None):
+        return self[state]
+
+    def __setitem__(self, state, valores):
+        raise TypeError("La Q aproximada no se asigna por estado; se aprende con update()")
+
+    def __len__(self):
+        return len(self._agent.estados_referencia)
+
+    def __iter__(self):
+        return iter(self._agent.estados_referencia)
+
+    def keys(self):
+        return list(self._agent.estados_referencia)
+
+    @property
+    def q(self):
+        """Matriz Q (n_estados_referencia, n_acciones), calculada de los pesos actuales."""
+        return self._agent.matriz_q()
+
+    @property
+    def presente(self):
+        # Todas las acciones tienen Q en todos los estados (interfaz de QTableArray para convergencia.py)
+        return np.ones((len(self), len(self._agent.actions)), dtype=bool)
+
+    def items(self):
+        acciones = self._agent.actions
+        return [(s, dict(zip(acciones, fila))) for s, fila in zip(self._agent.estados_referencia,
+                                                                  self.q.tolist())]
+
+    def values(self):
+        return [fila for _, fila in self.items()]
+
+    def a_dict(self):
+        """{estado: {accion: Q}} en los estados de referencia (formato de q_table_*.pkl)."""
+        return dict(self.items())
+
+    def copy(self):
+        return self.a_dict()
+
+    def __reduce__(self):
+        # Se serializa como el dict de siempre (q_table_*.pkl), evaluado en los estados de referencia
+        return dict, (self.a_dict(),)
+
+
+# =========================================================
+# Agente Q-Learning con aproximación lineal
+# =========================================================
+class AproximadorQLearningAgent(QLearningAgent):
+    """
+    Misma API que QLearningAgent (choose_action / update / decay_epsilon) con Q(s, a) lineal
+    en features de tile coding. alpha es el paso por transición: cada una de las n_activas
+    features recibe alpha / n_activas del error, así que un estado aislado aprende igual
+    que en la tabla.
+
+    Parámetros (además de los de QLearningAgent):
+    - codificador: CodificadorTiles; None = se crea con el largo del primer estado y anchos 1.0.
+    - n_tilings, bits: para el codificador que se crea solo.
+    - cache_estados: features de los últimos estados vistos que se guardan (choose_action y
+      update del mismo estado no las recalculan).
+    """
+
+    def __init__(self, actions, alpha=0.1, gamma=0.9, epsilon=0.7, epsilon_decay=0.995,
+                 epsilon_min=0.01, codificador=None, n_tilings=8, bits=16, cache_estados=4096):
+        super().__init__(actions, alpha=alpha, gamma=gamma, epsilon=epsilon,
+                         epsilon_decay=epsilon_decay, epsilon_min=epsilon_min)
+        self.n_tilings = n_tilings
+        self.bits = bits
+        self.cache_estados = cache_estados
+        self._cache = OrderedDict()
+        self.estados_referencia = []
+        self._indices_referencia = None
+        self._indice_acciones = {a: i for i, a in enumerate(self.actions)}
+        self.codificador = None
+        self.pesos = None
+        if codificador is not None:
+            self.usar_codificador(codificador)
+
+    def usar_codificador(self, codificador):
+        """Fija el codificador y reinicia los pesos en 0 (una fila por acción, más el sesgo)."""
+        self.codificador = codificador
+        self.pesos = np.zeros((len(self.actions), codificador.tamano + 1), dtype=np.float64)
+        self._cache.clear()
+        self._indices_referencia = None
+        return self
+
+    @property
+    def q_table(self):
+        return QAproximada(self)
+
+    @q_table.setter
+    def q_table(self, valor):
+        # QLearningAgent.__init__ asigna un dict vacío; una Q-table con estados no se puede convertir
+        if valor:
+            raise TypeError("AproximadorQLearningAgent no carga Q-tables; use AproximadorQLearningAgent.cargar")
+
+    @property
+    def nbytes(self):
+        return self.pesos.nbytes if self.pesos is not None else 0
+
+    # -----------------------------
+    # Features y Q-valores
+    # -----------------------------
+    def _features(self, state):
+        indices = self._cache.get(state)
+        if indices is not None:
+            self._cache.move_to_end(state)
+            return indices
+        if self.codificador is None:
+            self.usar_codificador(CodificadorTiles(len(state), n_tilings=self.n_tilings, bits=self.bits))
+        indices = np.append(self.codificador.indices(state), self.codificador.tamano)  # + sesgo
+        self._cache[state] = indices
+        if len(self._cache) > self.cache_estados:
+            self._cache.popitem(last=False)
+        return indices
+
+    def columnas(self, actions):
+        """Filas de `pesos` de las acciones dadas (en ese orden)."""
+        return [self._indice_acciones[a] for a in actions]
+
+    def _q(self, indices):
+        # Q de todas las acciones: gather de las features activas (n_acciones x n_activas) y suma
+        return self.pesos[:, indices].sum(axis=1)
+
+    def valores(self, state):
+        """Q(state, a) de todas las acciones (array en el orden de self.actions)."""
+        return self._q(self._features(state))
+
+    def choose_action(self, state, valid_actions):
+        indices = self._features(state)
+
+        # Exploración
+        if random.random() < self.epsilon:
+            self.last_action_was_random = True
+            return random.choice(valid_actions)
+
+        # Explotación: argmax devuelve el primer máximo, igual que max() sobre el dict
+        self.last_action_was_random = False
+        return valid_actions[int(np.argmax(self._q(indices)[self.columnas(valid_actions)]))]
+
+    def update(self, state, action, reward, next_state, next_valid_actions):
+        indices = self._features(state)
+        indices_next = self._features(next_state)
+        self.actualizar_indices(indices, self._indice_acciones[action], reward, indices_next,
+                                self.columnas(next_valid_actions))
+
+    # -----------------------------
+    # Ruta por índices (tabla de transiciones)
+    # -----------------------------
+    def preparar(self, tabla):
+        """
+        Calcula una vez las features de todos los estados de la tabla (quedan como estados de
+        referencia de q_table). Retorna la matriz (n_estados, n_activas + 1) de features.
+        """
+        if self._indices_referencia is not None and self.estados_referencia is tabla.estados:
+            return self._indices_referencia
+        X = matriz_estados(tabla.estados)
+        if self.codificador is None:
+            self.usar_codificador(CodificadorTiles(X.shape[1], n_tilings=self.n_tilings, bits=self.bits))
+        indices = self.codificador.indices_matriz(X)
+        sesgo = np.full((len(indices), 1), self.codificador.tamano, dtype=np.int64)
+        self.estados_referencia = tabla.estados
+        self._indices_referencia = np.hstack([indices, sesgo])
+        return self._indices_referencia
+
+    def elegir_accion_indices(self, indices, cols):
+        """
+        choose_action con las features ya calculadas; `cols` son las filas de pesos de las
+        acciones válidas. Devuelve la posición elegida dentro de `cols`. Consume `random` igual
+        que choose_action.
+        """
+        if random.random() < self.epsilon:
+            self.last_action_was_random = True
+            return random.randrange(len(cols))
+        self.last_action_was_random = False
+        return int(np.argmax(self._q(indices)[cols]))
+
+    def actualizar_indices(self, indices, col, reward, indices_next, cols_next):
+        """update con las features ya calculadas y la acción como fila de pesos."""
+        pesos = self.pesos
+        q_predict = pesos[col, indices].sum()
+        q_target = reward
+        if len(cols_next):
+            q_target += self.gamma * self._q(indices_next)[cols_next].max()
+        # np.add.at: con colisiones del hash una feature puede repetirse en `indices`
+        np.add.at(pesos[col], indices, self.alpha / len(indices) * (q_target - q_predict))
+
+    def matriz_q(self, bloque=1024):
+        """Q de los estados de referencia: matriz (n_estados, n_acciones), por bloques de estados."""
+        indices = self._indices_referencia
+        if indices is None:
+            if not self.estados_referencia:
+                return np.zeros((0, len(self.actions)))
+            indices = np.vstack([self._features(s) for s in self.estados_referencia])
+        q = np.empty((len(indices), len(self.actions)))
+        for inicio in range(0, len(indices), bloque):
+            parte = indices[inicio:inicio + bloque]
+            q[inicio:inicio + bloque] = self.pesos[:, parte].sum(axis=2).T
+        return q
+
+    # -----------------------------
+    # Persistencia
+    # -----------------------------
+    def a_dict(self):
+        return {"acciones": list(self.actions), "alpha": self.alpha, "gamma": self.gamma,
+                "epsilon": self.epsilon, "epsilon_decay": self.epsilon_decay, "epsilon_min": self.epsilon_min,
+                "codificador": self.codificador.a_dict() if self.codificador is not None else None,
+                "pesos": self.pesos}
+
+    def guardar(self, ruta):
+        """Guarda pesos, codificador e hiperparámetros (pickle de a_dict())."""
+        with open(ruta, "wb") as f:
+            pickle.dump(self.a_dict(), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def cargar(cls, ruta, **kwargs):
+        """Agente desde un archivo de guardar(); kwargs reemplazan los hiperparámetros guardados."""
+        with open(ruta, "rb") as f:
+            d = pickle.load(f)
+        params = {k: d[k] for k in ("alpha", "gamma", "epsilon", "epsilon_decay", "epsilon_min")}
+        params.update(kwargs)
+        agent = cls(d["acciones"], **params)
+        if d["codificador"] is not None:
+            agent.usar_codificador(CodificadorTiles.desde_dict(d["codificador"]))
+            agent.pesos[...] = d["pesos"]
+        return agent
@@ -0,0 +1,58 @@
+import sys
+import time
+import importlib.util
+
+# =========================================================
+# Arranque rápido: imports diferidos y tiempos de arranque
+# =========================================================
+"""
+Los scripts de producción de un tick (Ejecucion_Agente_RealTime.py) pagan en cada
+ejecución el arranque completo: importar numpy/pandas, cargar la Q-table, etc.
+
+- importar_perezoso("numpy") devuelve el módulo sin ejecutarlo; se importa de verdad
+  en el primer acceso a un atributo (np.array, ...). Los módulos del agente lo usan
+  para numpy, que solo necesitan las versiones vectorizadas (por lote), así el camino
+  de un tick (state_builder3, calcular_recompensa, QLearningAgent) no lo importa.
+- TiemposArranque mide cuánto toma cada fase del arranque hasta la primera decisión.
+"""
+
+
+def importar_perezoso(nombre):
+    """Módulo `nombre` con import diferido al primer uso (o el ya importado, si existe)."""
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.find_spec(nombre)
+    if spec is None:
+        raise ImportError(f"No se encontró el módulo {nombre!r}")
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+class TiemposArranque:
+    def __init__(self, inicio=None):
+        """
+        Parámetros:
+        - inicio: time.perf_counter() del comienzo (p. ej. tomado en la primera línea del
+          script, antes de los imports); por defecto, ahora.
+        """
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self._ultimo = self.inicio
+        self.fases = []
+
+    def marcar(self, fase):
+        """Cierra la fase `fase` (tiempo desde la marca anterior)."""
+        ahora = time.perf_counter()
+        self.fases.append((fase, ahora - self._ultimo))
+        self._ultimo = ahora
+
+    def total(self):
+        return self._ultimo - self.inicio
+
+    def resumen(self):
+        """Una línea: 'imports 12.1 ms | config 2.3 ms | ... | total 20.4 ms'."""
+        partes = [f"{fase} {segundos * 1000:.1f} ms" for fase, segundos in self.fases]
+        partes.append(f"total {self.total() * 1000:.1f} ms")
+        return " | ".join(partes)
@@ -0,0 +1,311 @@
+import os
+import pickle
+import zlib
+
+try:
+    from .q_learning_agent import QLearningAgent
+    from .arranque import importar_perezoso
+    from .wal_decisiones import fsync_directorio
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from q_learning_agent import QLearningAgent
+    from arranque import importar_perezoso
+    from wal_decisiones import fsync_directorio
+
+# Solo para Q-tables en matriz; cargar un checkpoint no lo necesita
+np = importar_perezoso("numpy")
+
+# =========================================================
+# Checkpoints incrementales de la Q-table (base + log de cambios)
+# =========================================================
+"""
+En vez de volver a serializar toda la Q-table en cada checkpoint, se guarda:
+
+    ruta            base: la Q-table completa, mismo formato dict que q_table_*.pkl
+    ruta + ".delta" log de solo-agregar con las filas que cambiaron desde la base
+
+Cada checkpoint agrega al log un registro {"etiqueta", "epsilon", "meta", "cambios"} con las
+filas (estado, {accion: Q}) modificadas desde el checkpoint anterior ((estado, None) si el
+estado se borró, ver poda_q_table.py), así el costo
+depende del número de updates y no del tamaño de la tabla. Cada `compactar_cada`
+registros (o cuando el log ya acumula tantas filas como la tabla) se compacta: se
+reescribe la base completa y se empieza un log vacío.
+
+Cómo se detectan las filas modificadas:
+- QLearningAgent (dict): el agente anota los estados que toca en `agent.cambios`.
+- Q-table en matriz (ArrayQLearningAgent, también con updates por lote o multiproceso):
+  la QTableArray marca las filas que se escriben (seguir_cambios / tomar_cambios), sin
+  copiar ni comparar la matriz.
+  Con multiproceso, la sincronización con la Q compartida marca las filas que copia.
+
+El primer registro del log guarda el CRC de la base a la que pertenece. Si la base se
+reemplaza por otro medio (p. ej. un pickle.dump directo) o el proceso se corta durante
+una compactación, el log viejo ya no coincide y se ignora. Un registro cortado al final
+del log (corte durante una escritura) también se ignora.
+"""
+
+
+def _leer_base(ruta):
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    return pickle.loads(datos), zlib.crc32(datos)
+
+
+def _leer_registros(ruta_delta, crc_base):
+    """
+    Cabecera y registros del log que corresponden a la base
+    ((None, []) si no hay log o es de otra base).
+    """
+    if not os.path.exists(ruta_delta):
+        return None, []
+    registros = []
+    with open(ruta_delta, "rb") as f:
+        try:
+            cabecera = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            return None, []
+        if cabecera.get("base_crc") != crc_base:
+            return None, []
+        while True:
+            try:
+                registros.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError):
+                break
+    return cabecera, registros
+
+
+def cargar_checkpoint(ruta, hasta=None):
+    """
+    Reconstruye la Q-table de un checkpoint: base + registros del log.
+
+    Parámetros:
+    - ruta: archivo base (el log es ruta + ".delta"; si no existe se carga solo la base).
+    - hasta: aplica solo los registros con etiqueta <= hasta (None = todos). Solo se
+      pueden recuperar etiquetas posteriores a la última compactación.
+
+    Retorna:
+    - (q_table, info): q_table en formato dict e info con "etiqueta", "epsilon" y "meta" del
+      último registro aplicado (o de la base; None si la base no tiene log), "registros" y
+      "filas" aplicados, "con_log" (la base tiene un log válido), "cortado" (`hasta` dejó
+      registros sin aplicar) y "base_crc" (para CheckpointDelta.reanudar).
+    """
+    q_table, crc = _leer_base(ruta)
+    cabecera, registros = _leer_registros(ruta + ".delta", crc)
+    return q_table, _aplicar_registros(q_table, crc, cabecera, registros, hasta)
+
+
+def _aplicar_registros(q_table, crc, cabecera, registros, hasta=None):
+    """Aplica a q_table los registros del log (ver cargar_checkpoint) y retorna el info."""
+    info = {"etiqueta": None, "epsilon": None, "meta": None, "registros": 0, "filas": 0,
+            "con_log": cabecera is not None, "cortado": False, "base_crc": crc}
+    if cabecera is not None:
+        info["etiqueta"] = cabecera["etiqueta"]
+        info["epsilon"] = cabecera["epsilon"]
+        info["meta"] = cabecera.get("meta")
+    for registro in registros:
+        if hasta is not None and registro["etiqueta"] is not None and registro["etiqueta"] > hasta:
+            info["cortado"] = True
+            break
+        for estado, fila in registro["cambios"]:
+            if fila is not None:
+                q_table[estado] = fila
+            elif estado in q_table:
+                del q_table[estado]
+        info["etiqueta"] = registro["etiqueta"]
+        info["epsilon"] = registro["epsilon"]
+        info["meta"] = registro.get("meta")
+        info["registros"] += 1
+        info["filas"] += len(registro["cambios"])
+    return info
+
+
+def restaurar_agente(ruta, actions, hasta=None, clase=QLearningAgent, **kwargs):
+    """
+    Crea un agente (QLearningAgent por defecto) con la Q-table y el epsilon de un checkpoint.
+    `kwargs` se pasan al constructor (alpha, gamma, ...).
+    """
+    q_table, info = cargar_checkpoint(ruta, hasta=hasta)
+    agent = clase(actions=actions, **kwargs)
+    agent.q_table = q_table
+    if info["epsilon"] is not None:
+        agent.epsilon = info["epsilon"]
+    return agent
+
+
+class CheckpointDelta:
+    def __init__(self, ruta, compactar_cada=10, proporcion_compactacion=1.0, fsync=False):
+        """
+        Parámetros:
+        - ruta: archivo base (el log se escribe en ruta + ".delta").
+        - compactar_cada: registros del log antes de reescribir la base (None = sin límite).
+        - proporcion_compactacion: también se compacta cuando el log acumula
+          proporcion_compactacion × (filas de la tabla) filas, es decir, cuando leerlo ya
+          cuesta más que la base.
+        - fsync: fuerza cada escritura al disco, incluido el rename de la base y del log
+          (más lento, sobrevive a cortes de energía). Obligatorio si después de guardar se
+          compacta un WAL (despacho.recuperar_estado lo activa).
+        """
+        self.ruta = ruta
+        self.ruta_delta = ruta + ".delta"
+        self.compactar_cada = compactar_cada
+        self.proporcion_compactacion = proporcion_compactacion
+        self.fsync = fsync
+        self.registros = 0        # registros en el log desde la última compactación
+        self.filas_en_log = 0     # filas escritas en el log desde la última compactación
+        self.compactaciones = 0
+        self._base_escrita = False
+        self._cabecera_log = None  # log por empezar sobre una base existente (ver reanudar)
+
+    # -----------------------------
+    # Escritura
+    # -----------------------------
+    def escribir(self, escrituras):
+        """
+        Segunda mitad de guardar(): escribe lo armado por preparar(). No toca al agente,
+        así que puede correr en otro hilo (en el mismo orden en que se prepararon).
+        """
+        for ruta, datos, reemplazar in escrituras:
+            # Base y log nuevos en archivos temporales + os.replace: un corte nunca deja un archivo a medias
+            with open(ruta + ".tmp" if reemplazar else ruta, "wb" if reemplazar else "ab") as f:
+                f.write(datos)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            if reemplazar:
+                os.replace(ruta + ".tmp", ruta)
+                if self.fsync:
+                    fsync_directorio(ruta)
+
+    def _foto_compactacion(self, agent, etiqueta, meta, copiar):
+        q_table = agent.q_table
+        if copiar:
+            q_table = q_table.foto() if hasattr(q_table, "foto") else {s: dict(f) for s, f in q_table.items()}
+        cabecera = {"etiqueta": etiqueta, "epsilon": getattr(agent, "epsilon", None), "meta": meta}
+        self._iniciar_seguimiento(agent)
+        self._base_escrita = True
+        self._cabecera_log = None
+        self.registros = 0
+        self.filas_en_log = 0
+        self.compactaciones += 1
+        return "base", q_table, cabecera
+
+    def tomar_foto(self, agent, etiqueta=None, compactar=False, meta=None, copiar=True):
+        """
+        Primera mitad de preparar(): toma lo que va a entrar en el checkpoint sin serializarlo.
+        Debe llamarse con el agente quieto (entre updates, p. ej. con el lock del despachador);
+        serializar() y escribir() pueden quedar para otro hilo aunque el agente siga actualizando.
+
+        Un registro del log ya es una copia de las filas modificadas. Al compactar, con `copiar`
+        se copia la Q-table (foto() de la tabla, o las filas del dict), que es mucho más rápido
+        que serializarla; copiar=False la deja sin copiar (solo si se serializa antes del próximo update).
+
+        Retorna:
+        - (foto, filas): foto para serializar() y número de filas que incluye.
+        """
+        if compactar or not self._base_escrita:
+            return self._foto_compactacion(agent, etiqueta, meta, copiar), len(agent.q_table)
+
+        cambios = self._extraer_cambios(agent)
+        if ((self.compactar_cada is not None and self.registros + 1 >= self.compactar_cada)
+                or self.filas_en_log + len(cambios) >= self.proporcion_compactacion * len(agent.q_table)):
+            # El registro quedaría incluido en la base: se reescribe la base directamente
+            return self._foto_compactacion(agent, etiqueta, meta, copiar), len(agent.q_table)
+
+        registro = {"etiqueta": etiqueta, "epsilon": getattr(agent, "epsilon", None), "meta": meta,
+                    "cambios": cambios}
+        self.registros += 1
+        self.filas_en_log += len(cambios)
+        # Primer registro sobre una base sin log: va con la cabecera pendiente de reanudar()
+        cabecera, self._cabecera_log = self._cabecera_log, None
+        return ("registro", registro, cabecera), len(cambios)
+
+    def serializar(self, foto):
+        """Segunda mitad de preparar(): arma los bytes de una foto. No toca al agente. Retorna la lista para escribir()."""
+        tipo, contenido, cabecera = foto
+        if tipo == "base":
+            datos = pickle.dumps(contenido.a_dict() if hasattr(contenido, "a_dict") else contenido)
+            cabecera = pickle.dumps({"base_crc": zlib.crc32(datos), **cabecera})
+            return [(self.ruta, datos, True), (self.ruta_delta, cabecera, True)]
+        if cabecera is not None:
+            # Cabecera y registro en un solo archivo nuevo
+            return [(self.ruta_delta, pickle.dumps(cabecera) + pickle.dumps(contenido), True)]
+        return [(self.ruta_delta, pickle.dumps(contenido), False)]
+
+    def preparar(self, agent, etiqueta=None, compactar=False, meta=None):
+        """
+        Primera mitad de guardar(): arma los bytes del checkpoint. Debe llamarse con el
+        agente quieto (entre updates); la escritura puede quedar para otro hilo.
+        `meta` (cualquier objeto serializable) se guarda junto al checkpoint y vuelve en
+        info["meta"] al cargarlo (p. ej. hasta qué secuencia de un WAL incluye la Q-table).
+        Para soltar el agente antes de serializar, ver tomar_foto() + serializar().
+
+        Retorna:
+        - (escrituras, filas): lista para escribir() y número de filas que incluye.
+        """
+        foto, filas = self.tomar_foto(agent, etiqueta, compactar=compactar, meta=meta, copiar=False)
+        return self.serializar(foto), filas
+
+    def compactar(self, agent, etiqueta=None, meta=None):
+        """Reescribe la base con la Q-table completa y empieza un log vacío."""
+        escrituras, _ = self.preparar(agent, etiqueta, compactar=True, meta=meta)
+        self.escribir(escrituras)
+
+    def reanudar(self, agent, info):
+        """
+        Continúa un checkpoint existente: `agent` tiene la Q-table recién cargada con
+        cargar_checkpoint(self.ruta) e `info` es lo que devolvió. Los próximos guardados se
+        agregan a su log (o empiezan uno, si la base no tenía) en vez de reescribir la base.
+        Retorna False (y no hace nada) si la carga se cortó con `hasta`.
+        """
+        if info["cortado"] or info.get("base_crc") is None:
+            return False
+        self._iniciar_seguimiento(agent)
+        self._base_escrita = True
+        self.registros = info["registros"]
+        self.filas_en_log = info["filas"]
+        if not info["con_log"]:
+            self._cabecera_log = {"base_crc": info["base_crc"], "etiqueta": info["etiqueta"],
+                                  "epsilon": info["epsilon"], "meta": info["meta"]}
+        return True
+
+    def guardar(self, agent, etiqueta=None, meta=None):
+        """
+        Guarda un checkpoint: la primera vez (o al tocar compactar) la base completa;
+        después, un registro con las filas modificadas.
+
+        Retorna:
+        - número de filas escritas.
+        """
+        escrituras, filas = self.preparar(agent, etiqueta, meta=meta)
+        self.escribir(escrituras)
+        return filas
+
+    # -----------------------------
+    # Seguimiento de filas modificadas
+    # -----------------------------
+    def _iniciar_seguimiento(self, agent):
+        tabla = agent.q_table
+        if hasattr(tabla, "presente"):
+            tabla.seguir_cambios()
+        else:
+            agent.cambios = set()
+
+    def _extraer_cambios(self, agent):
+        tabla = agent.q_table
+        if not hasattr(tabla, "presente"):
+            estados, agent.cambios = agent.cambios, set()
+            # QTableCompilada.leer no vuelve a copiar al dict superpuesto una fila que se podó
+            leer = getattr(tabla, "leer", tabla.__getitem__)
+            # Un estado anotado que ya no está en la tabla se podó: se registra como borrado
+            return [(s, dict(leer(s)) if s in tabla else None) for s in estados]
+
+        # Matriz: las filas que la tabla marcó desde el checkpoint anterior
+        filas = tabla.tomar_cambios()
+        if filas is None:
+            # Tabla reemplazada (p. ej. agent.q_table = ...) desde el último checkpoint: van todas
+            filas = np.arange(len(tabla))
+            tabla.seguir_cambios()
+        q, presente = tabla.q, tabla.presente
+        estados, acciones = tabla.estados, tabla.acciones
+        valores = q[filas].tolist()
+        return [(estados[fila], {acciones[c]: valores[i][c] for c in np.flatnonzero(presente[fila])})
+                for i, fila in enumerate(filas)]
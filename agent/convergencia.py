@@ -0,0 +1,232 @@
+import json
+import time
+
+try:
+    from .diagnostico import diag, RESUMEN
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from diagnostico import diag, RESUMEN
+
+# =========================================================
+# Parada temprana por convergencia
+# =========================================================
+"""
+NUM_EPISODIOS fija cuántos episodios se corren aunque la Q-table ya no cambie. El
+MonitorConvergencia mide al final de cada episodio, contra la Q-table del episodio
+anterior:
+
+    delta_q_max       max |ΔQ| de las entradas de la Q-table
+    delta_q_media     media de |ΔQ| (una entrada que no existía cuenta desde Q=0)
+    cambio_politica   fracción de los estados ya conocidos cuya acción greedy cambió
+    media_recompensa  media móvil de la recompensa en `ventana_recompensa` episodios
+    cambio_recompensa cambio relativo de esa media respecto del episodio anterior
+
+y decide parar:
+
+    "convergencia"    todas las tolerancias configuradas se cumplen durante `paciencia`
+                      episodios seguidos (y ya se corrieron `min_episodios`)
+    "presupuesto"     el tiempo transcurrido más la duración media de un episodio supera
+                      `segundos_max` (no se empieza un episodio que no entra)
+    "max_episodios"   se llegó a NUM_EPISODIOS sin cumplir lo anterior
+
+Las tolerancias en None no se evalúan; sin ninguna tolerancia ni presupuesto el monitor
+queda inactivo y no copia nada. Activo, guarda una copia de la Q-table por episodio
+(los Q-valores, no las claves: con QTableArray es una copia de la matriz).
+
+El motivo, las tolerancias y las métricas por episodio se escriben con guardar(ruta)
+en `<ruta>.parada.json`, al lado del checkpoint.
+"""
+
+MOTIVOS = ("convergencia", "presupuesto", "max_episodios")
+
+CRITERIOS = (
+    ("tol_delta_q_max", "delta_q_max"),
+    ("tol_delta_q_media", "delta_q_media"),
+    ("tol_cambio_politica", "cambio_politica"),
+    ("tol_recompensa", "cambio_recompensa"),
+)
+
+
+def _foto_q_table(q_table):
+    # Copia de los Q-valores para comparar al final del episodio siguiente
+    if hasattr(q_table, "presente"):  # QTableArray: matriz Q y presencia
+        return ("matriz", q_table.q.copy(), q_table.presente.copy())
+    return ("dict", {s: dict(fila.items()) for s, fila in q_table.items()})
+
+
+def _greedy(fila):
+    # Acción greedy de una fila {accion: Q} (None si la fila no tiene acciones)
+    return max(fila, key=fila.get) if fila else None
+
+
+def _comparar_dict(anterior, q_table):
+    suma, n, maximo = 0.0, 0, 0.0
+    conocidos, cambiados = 0, 0
+    for state, fila in q_table.items():
+        fila = dict(fila.items())
+        previa = anterior.get(state)
+        for action, valor in fila.items():
+            delta = abs(valor - (previa.get(action, 0.0) if previa else 0.0))
+            suma += delta
+            n += 1
+            if delta > maximo:
+                maximo = delta
+        if previa and fila:
+            conocidos += 1
+            cambiados += _greedy(previa) != _greedy(fila)
+    return maximo, (suma / n if n else 0.0), (cambiados / conocidos if conocidos else 0.0)
+
+
+def _comparar_matriz(q_ant, presente_ant, q_table):
+    import numpy as np
+
+    q, presente = q_table.q, q_table.presente
+    n_ant, m_ant = q_ant.shape
+    previa = np.zeros(q.shape, dtype=q.dtype)
+    previa[:n_ant, :m_ant] = np.where(presente_ant, q_ant, 0.0)
+    deltas = np.abs(q - previa)[presente]
+    if deltas.size == 0:
+        return 0.0, 0.0, 0.0
+    if n_ant == 0 or m_ant == 0:
+        return float(deltas.max()), float(deltas.mean()), 0.0
+    # Acción greedy entre las acciones presentes, en los estados que ya tenían alguna
+    conocidos = presente_ant.any(axis=1) & presente[:n_ant, :m_ant].any(axis=1)
+    greedy_ant = np.where(presente_ant, q_ant, -np.inf).argmax(axis=1)
+    greedy = np.where(presente, q, -np.inf)[:n_ant].argmax(axis=1)
+    n_conocidos = int(conocidos.sum())
+    cambio = float((greedy_ant != greedy)[conocidos].sum()) / n_conocidos if n_conocidos else 0.0
+    return float(deltas.max()), float(deltas.mean()), cambio
+
+
+class MonitorConvergencia:
+    def __init__(self, tol_delta_q_max=None, tol_delta_q_media=None, tol_cambio_politica=None,
+                 tol_recompensa=None, ventana_recompensa=5, paciencia=2, min_episodios=1,
+                 segundos_max=None):
+        """
+        Parámetros:
+        - tol_delta_q_max: máximo |ΔQ| por episodio para considerar convergido (None = no se evalúa).
+        - tol_delta_q_media: media de |ΔQ| por episodio.
+        - tol_cambio_politica: fracción de estados conocidos con la acción greedy cambiada.
+        - tol_recompensa: cambio relativo de la media móvil de la recompensa.
+        - ventana_recompensa: episodios de la media móvil.
+        - paciencia: episodios seguidos que deben cumplir todas las tolerancias.
+        - min_episodios: episodios mínimos antes de parar por convergencia.
+        - segundos_max: presupuesto de tiempo del entrenamiento (None = sin presupuesto).
+        """
+        self.tolerancias = {"tol_delta_q_max": tol_delta_q_max, "tol_delta_q_media": tol_delta_q_media,
+                            "tol_cambio_politica": tol_cambio_politica, "tol_recompensa": tol_recompensa}
+        self.ventana_recompensa = ventana_recompensa
+        self.paciencia = paciencia
+        self.min_episodios = min_episodios
+        self.segundos_max = segundos_max
+        self.historial = []
+        self.recompensas = []
+        self.motivo = None
+        self.episodio = None
+        self.racha = 0
+        self._foto = None
+        self._inicio = None
+
+    @classmethod
+    def desde_config(cls, config):
+        """MonitorConvergencia desde un dict (las claves de __init__), o None si no hay criterio de parada."""
+        monitor = cls(**(config or {}))
+        return monitor if monitor.activo else None
+
+    @property
+    def activo(self):
+        return self.segundos_max is not None or any(v is not None for v in self.tolerancias.values())
+
+    # -----------------------------
+    # Seguimiento por episodio
+    # -----------------------------
+    def iniciar(self, agent=None):
+        """
+        Toma la Q-table inicial y arranca el reloj del presupuesto. Sin `agent` (p. ej. con
+        entrenar_hogwild, que crea el agente adentro) el primer episodio se mide desde Q=0.
+        """
+        self._inicio = time.time()
+        self._foto = _foto_q_table(agent.q_table) if agent is not None else None
+        return self
+
+    def _metricas_q(self, q_table):
+        foto = self._foto
+        if hasattr(q_table, "presente"):
+            if foto is None:
+                foto = ("matriz", q_table.q[:0, :0], q_table.presente[:0, :0])
+            return _comparar_matriz(foto[1], foto[2], q_table)
+        return _comparar_dict(foto[1] if foto is not None else {}, q_table)
+
+    def _cumple(self, metricas):
+        evaluados = [(tol, metricas[clave]) for nombre, clave in CRITERIOS
+                     if (tol := self.tolerancias[nombre]) is not None]
+        return bool(evaluados) and all(valor is not None and valor <= tol for tol, valor in evaluados)
+
+    def fin_episodio(self, ep, agent, recompensa):
+        """
+        Mide el episodio `ep` (base 0) recién terminado.
+
+        Retorna:
+        - el motivo de parada ("convergencia" o "presupuesto"), o None para seguir.
+        """
+        if self._inicio is None:
+            raise RuntimeError("MonitorConvergencia.iniciar(agent) antes del primer episodio")
+        delta_max, delta_media, cambio_politica = self._metricas_q(agent.q_table)
+        self._foto = _foto_q_table(agent.q_table)
+
+        self.recompensas.append(recompensa)
+        ventana = self.ventana_recompensa
+        media = sum(self.recompensas[-ventana:]) / len(self.recompensas[-ventana:])
+        cambio_recompensa = None
+        if len(self.recompensas) > ventana:
+            media_anterior = sum(self.recompensas[-ventana - 1:-1]) / ventana
+            cambio_recompensa = abs(media - media_anterior) / max(abs(media_anterior), 1e-9)
+
+        segundos = time.time() - self._inicio
+        metricas = {"episodio": ep + 1, "delta_q_max": delta_max, "delta_q_media": delta_media,
+                    "cambio_politica": cambio_politica, "recompensa": recompensa,
+                    "media_recompensa": media, "cambio_recompensa": cambio_recompensa,
+                    "estados": len(agent.q_table), "segundos": segundos}
+        self.historial.append(metricas)
+        self.racha = self.racha + 1 if self._cumple(metricas) else 0
+
+        diag(RESUMEN, lambda: f"[Convergencia] ep {ep + 1}: max|ΔQ| {delta_max:.4g}, media|ΔQ| {delta_media:.4g}, "
+                              f"política {cambio_politica:.1%}, media recompensa {media:.2f}, racha {self.racha}")
+
+        if self.racha >= self.paciencia and ep + 1 >= self.min_episodios:
+            return self._parar("convergencia", ep)
+        if self.segundos_max is not None and segundos + segundos / (ep + 1) > self.segundos_max:
+            return self._parar("presupuesto", ep)
+        return None
+
+    def _parar(self, motivo, ep):
+        self.motivo, self.episodio = motivo, ep + 1
+        diag(RESUMEN, "[Convergencia] Parada en el episodio {}: {}", ep + 1, motivo)
+        return motivo
+
+    def terminar(self, episodios):
+        """Cierra el seguimiento: sin parada anticipada el motivo es "max_episodios"."""
+        if self.motivo is None:
+            self.motivo, self.episodio = "max_episodios", episodios
+        return self.motivo
+
+    # -----------------------------
+    # Persistencia
+    # -----------------------------
+    def a_dict(self, historial=True):
+        """Motivo, episodio de parada, criterios y métricas (con `historial`, las de cada episodio)."""
+        datos = {"motivo": self.motivo, "episodio": self.episodio,
+                 "segundos": time.time() - self._inicio if self._inicio is not None else None,
+                 "criterios": dict(self.tolerancias, ventana_recompensa=self.ventana_recompensa,
+                                   paciencia=self.paciencia, min_episodios=self.min_episodios,
+                                   segundos_max=self.segundos_max),
+                 "ultimo": self.historial[-1] if self.historial else None}
+        if historial:
+            datos["historial"] = self.historial
+        return datos
+
+    def guardar(self, ruta):
+        """Escribe a_dict() en `<ruta>.parada.json` (al lado del checkpoint `ruta`). Retorna la ruta escrita."""
+        destino = f"{ruta}.parada.json"
+        with open(destino, "w", encoding="utf-8") as f:
+            json.dump(self.a_dict(), f, indent=2, ensure_ascii=False)
+        return destino
@@ -0,0 +1,372 @@
+import os
+import time
+import pickle
+import threading
+import collections
+from datetime import datetime
+
+try:
+    from .state_builder import estados_tick
+    from .rewards import calcular_recompensa
+    from .q_learning_agent import QLearningAgent
+    from .checkpoint_delta import CheckpointDelta, cargar_checkpoint
+    from .wal_decisiones import WalDecisiones
+    from .politica_compilada import cargar_politica
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from state_builder import estados_tick
+    from rewards import calcular_recompensa
+    from q_learning_agent import QLearningAgent
+    from checkpoint_delta import CheckpointDelta, cargar_checkpoint
+    from wal_decisiones import WalDecisiones
+    from politica_compilada import cargar_politica
+
+# =========================================================
+# Despacho en tiempo real con el agente residente en memoria
+# =========================================================
+"""
+La lógica de Ejecucion_Agente_RealTime.py (un tick por ejecución) separada del
+arranque, para que un proceso residente la aplique tick tras tick:
+
+    1. aplicar las decisiones pendientes del tick anterior (update con la recompensa
+       y el estado que se observan en el tick actual)
+    2. elegir una pala para cada camión "waiting for shovel"
+    3. guardar esas decisiones como pendientes para el próximo tick
+
+La Q-table queda en memoria y PersistenciaAsincrona la baja al disco cada cierto
+tiempo desde un hilo aparte (checkpoint incremental), sin frenar el procesamiento
+de los ticks. Las decisiones pendientes y los updates aplicados van al WAL
+(wal_decisiones.py) en cada tick, así un reinicio recupera exactamente el estado.
+
+ColaTicks conecta al lector de ticks (inbox o stdin) con el procesamiento y define
+qué pasa cuando los ticks llegan más rápido de lo que se procesan (POLITICAS).
+"""
+
+# Política de contrapresión cuando la cola de ticks está llena:
+# - "descartar_antiguos": se descarta el tick más viejo en espera (el despacho siempre usa la foto más reciente)
+# - "descartar_nuevos": se descarta el tick que llega
+# - "bloquear": el lector espera a que haya lugar (con stdin, el productor queda frenado)
+POLITICAS = ("descartar_antiguos", "descartar_nuevos", "bloquear")
+
+
+def fila_asignacion(truck_id, truck_info, action, exploracion=False):
+    """Fila de la tabla de asignaciones (mismas columnas que el resultado de Ejecucion_Agente_RealTime.py)."""
+    truck_etas = truck_info.get("ETA", {})
+    actual = truck_info.get("current_shovel", "NONE")
+    return {
+        "Truck": truck_id,
+        "Shovel": action,
+        "Slot": truck_info.get("slot", "NONE"),
+        "Status": truck_info.get("status", "NONE"),
+        "Cost": truck_etas.get(action, 0.0),
+        "Current": actual,
+        "ETA_reasignacion": truck_etas.get(action, 0.0),
+        "ETA_Current": truck_etas.get(actual, 0.0),
+        "Changed": action != actual,
+        "Exploracion": exploracion
+    }
+
+
+class ColaTicks:
+    def __init__(self, maximo=1, politica="descartar_antiguos"):
+        """
+        Parámetros:
+        - maximo: ticks en espera como máximo.
+        - politica: una de POLITICAS.
+        """
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de contrapresión no soportada: {politica}")
+        self.maximo = max(int(maximo), 1)
+        self.politica = politica
+        self.descartados = 0
+        self._items = collections.deque()
+        self._condicion = threading.Condition()
+        self._cerrada = False
+
+    def poner(self, item):
+        """Encola un tick. Retorna el tick descartado por la política (None si no se descartó ninguno)."""
+        with self._condicion:
+            if self.politica == "bloquear":
+                while len(self._items) >= self.maximo and not self._cerrada:
+                    self._condicion.wait()
+            descartado = None
+            if len(self._items) >= self.maximo:
+                self.descartados += 1
+                if self.politica == "descartar_nuevos":
+                    return item
+                descartado = self._items.popleft()
+            self._items.append(item)
+            self._condicion.notify_all()
+            return descartado
+
+    def sacar(self, timeout=None):
+        """Saca el próximo tick; None si la cola se cerró y quedó vacía (o venció el timeout)."""
+        with self._condicion:
+            if not self._condicion.wait_for(lambda: self._items or self._cerrada, timeout):
+                return None
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._condicion.notify_all()
+            return item
+
+    def cerrar(self):
+        """Los ticks en espera se siguen entregando; después sacar() retorna None."""
+        with self._condicion:
+            self._cerrada = True
+            self._condicion.notify_all()
+
+    @property
+    def cerrada(self):
+        return self._cerrada
+
+    def __len__(self):
+        return len(self._items)
+
+
+def inicializar_estado(agent, state, shovel_names):
+    """Estado nuevo con Q=0.0 para todas las palas (como el script); se anota para el checkpoint incremental."""
+    agent.q_table[state] = {a: 0.0 for a in shovel_names}
+    if getattr(agent, "cambios", None) is not None:
+        agent.cambios.add(state)
+
+
+def aplicar_update(agent, decision, reward, next_state, shovel_names):
+    """Update de una decisión pendiente (el mismo al despachar y al reaplicar el WAL)."""
+    if next_state not in agent.q_table:
+        inicializar_estado(agent, next_state, shovel_names)
+    agent.update(decision["state"], decision["action"], reward, next_state, decision["valid_actions"])
+
+
+def recuperar_estado(qtable_path, wal_path, shovel_names, decision_pickle=None, compactar_cada=50, fsync_cada=1,
+                     politica_path=None, clase=QLearningAgent):
+    """
+    Carga la Q-table y el WAL y los deja consistentes: reaplica los updates del WAL que
+    la Q-table guardada no incluye (meta "wal_seq" del checkpoint).
+
+    Parámetros:
+    - qtable_path: Q-table (checkpoint incremental o pickle dict).
+    - wal_path: WAL de decisiones pendientes.
+    - shovel_names: acciones del agente.
+    - decision_pickle: pickle de pendientes del formato anterior; si existe se pasa al WAL y se borra.
+    - compactar_cada, fsync_cada: para el CheckpointDelta y el WalDecisiones que se crean.
+      El CheckpointDelta escribe siempre con fsync: después de cada guardado el WAL se puede
+      compactar, y lo que sale del WAL tiene que estar ya en el disco en la Q-table.
+    - politica_path: política compilada (politica_compilada.py); si se da, la Q-table se abre
+      con mmap en vez de pickle.load.
+    - clase: clase del agente (QLearningAgent o q_table_compacta.CompactoQLearningAgent).
+
+    Retorna:
+    - (agent, wal, checkpoints, checkpoint_info): checkpoints sigue el log existente de la
+      Q-table (ya incluye las filas reaplicadas); checkpoint_info es None si no había Q-table.
+    """
+    agent = clase(actions=shovel_names)
+    checkpoints = CheckpointDelta(qtable_path, compactar_cada=compactar_cada, fsync=True)
+    info = None
+    if os.path.exists(qtable_path):
+        if politica_path:
+            agent.q_table, info = cargar_politica(qtable_path, politica_path, acciones=shovel_names)
+        else:
+            agent.q_table, info = cargar_checkpoint(qtable_path)
+        # Antes de reaplicar: así las filas que toca el replay van en el próximo registro del log
+        checkpoints.reanudar(agent, info)
+    wal = WalDecisiones(wal_path, fsync_cada=fsync_cada)
+
+    meta = (info or {}).get("meta") or {}
+    if info is None or "wal_seq" in meta:
+        # Sin Q-table guardada se reaplica el WAL completo
+        wal.reaplicar(lambda dec, r, s: aplicar_update(agent, dec, r, s, shovel_names), meta.get("wal_seq", 0))
+    elif wal.updates:
+        # Q-table escrita por otro proceso (entrenamiento, AllTicks, ...): ya no corresponde al
+        # WAL, así que sus updates no se reaplican; las decisiones sin update siguen pendientes
+        wal.compactar(wal.ultimo_update())
+
+    if decision_pickle is not None and os.path.exists(decision_pickle):
+        with open(decision_pickle, "rb") as f:
+            wal.registrar_decisiones([{k: v for k, v in d.items() if k not in ("seq", "tipo")}
+                                      for d in pickle.load(f)])
+        wal.sincronizar()
+        os.remove(decision_pickle)
+    return agent, wal, checkpoints, info
+
+
+class Despachador:
+    def __init__(self, agent, shovel_names, wal, espec=None, poda=None):
+        """
+        Parámetros:
+        - agent: QLearningAgent con la Q-table ya cargada (ver recuperar_estado).
+        - shovel_names: orden de las palas del estado (SHOVEL_NAMES).
+        - wal: WalDecisiones con las decisiones pendientes.
+        - espec: EspecDiscretizacion con la que se entrenó la Q-table (None = estado sin discretizar).
+        - poda: PodaQTable (poda_q_table.py) que mantiene la Q-table bajo su techo (None = sin techo).
+        """
+        self.agent = agent
+        self.shovel_names = shovel_names
+        self.wal = wal
+        self.espec = espec
+        self.poda = poda
+        self.pendientes = wal.pendientes()
+        # Secuencia del WAL hasta la que la Q-table en memoria incluye updates
+        self.aplicado_hasta = wal.ultimo_update()
+        # Lo toma procesar_tick; PersistenciaAsincrona lo toma para la foto del estado
+        self.lock = threading.Lock()
+        self.ticks_procesados = 0
+
+    def aplicar_pendientes(self, tick_data, estados, errores=None):
+        """Update de las decisiones pendientes con la recompensa y el estado del tick actual. Retorna cuántas aplicó."""
+        truck_states = tick_data["truck_states"]
+        shovels_info = tick_data["shovel_states"]
+        updates = []
+        for dec in self.pendientes:
+            truck_id = dec["truck_id"]
+            try:
+                recompensa = calcular_recompensa(
+                    status=truck_states.get(truck_id, {}).get("status", "N/A"),
+                    action=dec["action"],
+                    shovels_info=shovels_info,
+                    truck_etas=truck_states.get(truck_id, {}).get("ETA", {})
+                )
+                updates.append((dec, recompensa, estados[truck_id]))
+            except Exception as e:
+                # La decisión se descarta (como en el script); en el WAL queda resuelta sin update
+                updates.append((dec, None, None))
+                if errores is not None:
+                    errores.append(f"Error actualizando Q para camión {truck_id}: {e!r}")
+
+        # Primero al WAL, después a la Q-table en memoria
+        self.wal.registrar_updates([(dec["seq"], r, s) for dec, r, s in updates])
+        aplicadas = 0
+        for dec, recompensa, next_state in updates:
+            if recompensa is not None:
+                aplicar_update(self.agent, dec, recompensa, next_state, self.shovel_names)
+                aplicadas += 1
+            self.aplicado_hasta = max(self.aplicado_hasta, dec["seq"])
+        self.pendientes = []
+        return aplicadas
+
+    def decidir(self, tick_data, estados, errores=None):
+        """
+        Elige una pala para cada camión "waiting for shovel" y deja esas decisiones pendientes (en el WAL).
+        Retorna la lista de asignaciones (mismas columnas que el resultado del script).
+        """
+        truck_states = tick_data["truck_states"]
+        resultados = []
+        nuevas = []
+        for truck_id, truck_info in truck_states.items():
+            if truck_info.get("status") != "waiting for shovel":
+                continue
+            try:
+                state = estados[truck_id]
+                if state not in self.agent.q_table:
+                    inicializar_estado(self.agent, state, self.shovel_names)
+
+                truck_etas = truck_info.get("ETA", {})
+                # Las acciones validas serian solo las PALAS que estan disponibles en ETAS
+                valid_actions = list(truck_etas.keys())
+                if not valid_actions:
+                    continue
+
+                action = self.agent.choose_action(state, valid_actions)
+                nuevas.append({
+                    "tick_id": tick_data.get("tick_id", None),
+                    "truck_id": truck_id,
+                    "state": state,
+                    "action": action,
+                    "valid_actions": valid_actions,
+                    "timestamp": datetime.now().isoformat()
+                })
+                resultados.append(fila_asignacion(truck_id, truck_info, action,
+                                                  getattr(self.agent, "last_action_was_random", False)))
+            except Exception as e:
+                if errores is not None:
+                    errores.append(f"Error procesando camión {truck_id}: {e!r}")
+        # Una sola escritura (y a lo sumo un fsync) por tick
+        self.pendientes = self.wal.registrar_decisiones(nuevas)
+        return resultados
+
+    def procesar_tick(self, tick_data):
+        """
+        Un tick completo (pendientes + decisiones).
+
+        Retorna:
+        - dict con "tick_id", "asignaciones", "actualizadas" (pendientes aplicadas),
+          "podados" (estados sacados de la Q-table), "errores" y "segundos" (tiempo de proceso).
+        """
+        inicio = time.perf_counter()
+        errores = []
+        with self.lock:
+            # Estados de todos los camiones del tick en una sola pasada
+            estados = estados_tick(tick_data, self.shovel_names, self.espec)
+            actualizadas = self.aplicar_pendientes(tick_data, estados, errores)
+            asignaciones = self.decidir(tick_data, estados, errores)
+            podados = 0
+            if self.poda is not None:
+                # Los estados de las decisiones pendientes se necesitan en el próximo tick
+                podados = self.poda.podar_si_hace_falta(protegidos=[d["state"] for d in self.pendientes])
+            self.ticks_procesados += 1
+        return {"tick_id": tick_data.get("tick_id"), "asignaciones": asignaciones, "actualizadas": actualizadas,
+                "podados": podados, "errores": errores, "segundos": time.perf_counter() - inicio}
+
+
+class PersistenciaAsincrona:
+    def __init__(self, despachador, checkpoints, intervalo_segundos=5.0, wal_max_bytes=1 << 20):
+        """
+        Guarda la Q-table (checkpoint incremental) desde un hilo aparte; las decisiones
+        pendientes ya están en el WAL del despachador.
+
+        Parámetros:
+        - despachador: Despachador cuyo estado se persiste.
+        - checkpoints: CheckpointDelta de la Q-table (el de recuperar_estado; mismo archivo
+          que usa Ejecucion_Agente_RealTime.py).
+        - intervalo_segundos: cada cuánto se guarda (solo si se procesaron ticks nuevos).
+        - wal_max_bytes: después de un guardado, el WAL se compacta si supera este tamaño.
+        """
+        self.despachador = despachador
+        self.intervalo_segundos = intervalo_segundos
+        self.wal_max_bytes = wal_max_bytes
+        self.checkpoints = checkpoints
+        self.guardados = 0
+        self.ultimo_error = None
+        self._guardado_en_tick = -1
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._loop, name="persistencia", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def guardar(self, compactar=False):
+        """
+        Con el lock del despachador solo se toma la foto (filas modificadas o copia de la
+        Q-table); la serialización y la escritura van fuera del lock.
+        """
+        despachador = self.despachador
+        with despachador.lock:
+            tick = despachador.ticks_procesados
+            if tick == self._guardado_en_tick and not compactar:
+                return False
+            incluido_hasta = despachador.aplicado_hasta
+            foto, _ = self.checkpoints.tomar_foto(despachador.agent, etiqueta=tick, compactar=compactar,
+                                                  meta={"wal_seq": incluido_hasta})
+        self.checkpoints.escribir(self.checkpoints.serializar(foto))
+        if compactar or despachador.wal.tamano() > self.wal_max_bytes:
+            # Lo que la Q-table guardada ya incluye sale del WAL
+            with despachador.lock:
+                despachador.wal.compactar(incluido_hasta)
+        self._guardado_en_tick = tick
+        self.guardados += 1
+        return True
+
+    def _loop(self):
+        while not self._detener.wait(self.intervalo_segundos):
+            try:
+                self.guardar()
+            except Exception as e:  # un error de disco no debe tumbar el despacho; se reintenta en el próximo intervalo
+                self.ultimo_error = e
+
+    def detener(self):
+        """Detiene el hilo y deja la Q-table completa (compactada) y el WAL compactado en el disco."""
+        self._detener.set()
+        if self._hilo.is_alive():
+            self._hilo.join()
+        self.guardar(compactar=True)
+        self.despachador.wal.cerrar()
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+
+# =========================================================
+# Niveles de verbosidad / diagnósticos
+# =========================================================
+"""
+Un solo nivel global para el agente, los scripts de entrenamiento y los de ejecución:
+
+    SILENCIO (0)  nada
+    RESUMEN  (1)  una línea de agregados por episodio/tick (ResumenEpisodio)
+    NORMAL   (2)  los mensajes por camión de siempre (valor por defecto)
+    DETALLE  (3)  además, diagnósticos extra
+
+El nivel inicial sale de la variable de entorno RL_VERBOSIDAD (número o nombre,
+p. ej. RL_VERBOSIDAD=resumen) y se puede cambiar con configurar(). Un valor inválido en
+la variable de entorno no impide importar el módulo: se avisa y se usa NORMAL
+(configurar() sí rechaza un nivel inválido).
+
+Para que un diagnóstico desactivado no cueste nada, el mensaje no se formatea:
+
+    if activo(NORMAL):                       # en el loop caliente: ni f-strings ni get_decision_reason
+        print(f"Tick {t} | Camión: {camion} ...")
+    diag(NORMAL, "[Estado] Agregado: {}", state)   # formato perezoso
+    diag(NORMAL, lambda: explicar(...))            # o un callable que arma el texto
+"""
+
+SILENCIO, RESUMEN, NORMAL, DETALLE = 0, 1, 2, 3
+NIVELES = {"silencio": SILENCIO, "resumen": RESUMEN, "normal": NORMAL, "detalle": DETALLE}
+
+
+def a_nivel(valor):
+    """Convierte un número o nombre de nivel ("resumen", "2", ...) a int."""
+    if isinstance(valor, str):
+        valor = valor.strip().lower()
+        if valor in NIVELES:
+            return NIVELES[valor]
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValueError(f"Nivel de verbosidad inválido: {valor!r} ({', '.join(NIVELES)} o un número)") from None
+    return int(valor)
+
+
+def _nivel_de_entorno():
+    # Al importar no se puede levantar una excepción por un error de tipeo en la variable
+    valor = os.environ.get("RL_VERBOSIDAD", NORMAL)
+    try:
+        return a_nivel(valor)
+    except ValueError as e:
+        print(f"[Diagnóstico] Aviso: RL_VERBOSIDAD: {e}; se usa normal", file=sys.stderr)
+        return NORMAL
+
+
+_nivel = _nivel_de_entorno()
+_salida = print
+
+
+def configurar(nivel=None, salida=None):
+    """
+    Parámetros:
+    - nivel: nuevo nivel (número o nombre); None deja el actual.
+    - salida: función que recibe cada mensaje (print por defecto; p. ej. logging.info).
+    """
+    global _nivel, _salida
+    if nivel is not None:
+        _nivel = a_nivel(nivel)
+    if salida is not None:
+        _salida = salida
+
+
+def nivel():
+    return _nivel
+
+
+def activo(n):
+    """True si los diagnósticos de nivel `n` están habilitados."""
+    return _nivel >= n
+
+
+def diag(n, mensaje, *args):
+    """Emite `mensaje` si el nivel `n` está habilitado (formato con args o callable, solo en ese caso)."""
+    if _nivel < n:
+        return
+    if callable(mensaje):
+        mensaje = mensaje()
+    elif args:
+        mensaje = mensaje.format(*args)
+    _salida(mensaje)
+
+
+class ResumenEpisodio:
+    """
+    Acumula agregados (conteos y sumas) y los emite en una sola línea.
+
+    Parámetros:
+    - intervalo_segundos: mínimo de segundos entre dos líneas (0 = todas); las
+      emisiones que caen dentro del intervalo se omiten, salvo forzar=True.
+    - nivel: nivel a partir del cual se emite (RESUMEN por defecto).
+    """
+
+    def __init__(self, intervalo_segundos=0.0, nivel=RESUMEN):
+        self.intervalo_segundos = intervalo_segundos
+        self.nivel = nivel
+        self.valores = {}
+        self._ultima = None
+
+    def sumar(self, clave, valor=1):
+        self.valores[clave] = self.valores.get(clave, 0) + valor
+
+    def emitir(self, titulo, forzar=False, **extra):
+        """
+        Emite `titulo | clave: valor | ...` con los agregados y `extra`, y reinicia los contadores.
+        Si la línea se omite por el intervalo, los agregados se siguen acumulando para la próxima.
+        """
+        if _nivel < self.nivel:
+            self.valores = {}
+            return
+        ahora = time.monotonic()
+        if not forzar and self._ultima is not None and ahora - self._ultima < self.intervalo_segundos:
+            return
+        self._ultima = ahora
+        valores, self.valores = self.valores, {}
+        partes = [titulo]
+        for clave, valor in {**valores, **extra}.items():
+            partes.append(f"{clave}: {valor:.4g}" if isinstance(valor, float) else f"{clave}: {valor}")
+        _salida(" | ".join(partes))
@@ -0,0 +1,372 @@
+import os
+import json
+import hashlib
+from bisect import bisect_right
+
+try:
+    from .arranque import importar_perezoso
+    from .state_builder import estados_desde_matriz, tuplas_desde_matriz
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from arranque import importar_perezoso
+    from state_builder import estados_desde_matriz, tuplas_desde_matriz
+
+# numpy solo para las versiones por matriz y el ajuste por cuantiles (el camino de un tick usa bisect)
+np = importar_perezoso("numpy")
+
+# =========================================================
+# Discretización configurable del estado
+# =========================================================
+"""
+state_builder3 deja en el estado valores crudos: sobre todo Valor_tiempo_Nuevo
+(ETA - (shovel_spot_time + shovel_cycle)), un float por pala, con lo que casi cada
+(tick, camión) es una clave nueva de la Q-table. Una especificación declarativa dice,
+por grupo de características del estado, cómo discretizarlo:
+
+    {
+      "tiempo":      {"bordes": [-3, 0, 3, 6, 9, 12]},   # bins fijos
+      "coverage":    {"cuantiles": 4},                   # bordes aprendidos de un dataset (ajustar)
+      "queue_count": {"bordes": [1, 2, 4]},
+      "pos_x":       {"eliminar": true},                 # la característica sale del estado
+      "pos_y":       {"eliminar": true}
+    }
+
+Grupos (orden del estado de state_builder3; los de pala tienen una columna por pala):
+    pos_x, pos_y, status, fuel | eta, tiempo, main_state, queue_count, priority, coverage
+
+Con bordes [b0, ..., bk] un valor v pasa a bisect_right(bordes, v) (0..k+1, igual que
+discretizar_eta). -1 y None siguen siendo el valor de "sin dato / pala inactiva" (-1).
+Los grupos sin regla quedan como están: una especificación vacía no cambia nada, así
+que las Q-tables existentes siguen sirviendo.
+
+La misma especificación (un archivo JSON o YAML) se usa al entrenar (construcción de la
+tabla de transiciones) y en producción (state_builder3 / estados_tick); la huella de la
+especificación entra en la clave de la cache de transiciones.
+"""
+
+GRUPOS_CAMION = ["pos_x", "pos_y", "status", "fuel"]
+GRUPOS_PALA = ["eta", "tiempo", "main_state", "queue_count", "priority", "coverage"]
+GRUPOS = GRUPOS_CAMION + GRUPOS_PALA
+
+# Valores posibles de los grupos que state_builder3 ya discretiza (incluido -1 / 0 por defecto)
+CARDINALIDAD_BASE = {"status": 8, "fuel": 3, "eta": 6}
+
+# Punto de partida razonable: todas las columnas acotadas, tiempo en la misma escala que la ETA
+ESPEC_EJEMPLO = {
+    "pos_x": {"eliminar": True},
+    "pos_y": {"eliminar": True},
+    "tiempo": {"bordes": [-3, 0, 3, 6, 9, 12]},
+    "main_state": {"bordes": [1, 2, 3]},  # < 1 / activa (1) / 2 / detenida (3, 4); -1 (sin dato) queda -1
+    "queue_count": {"bordes": [1, 2, 4]},
+    "priority": {"bordes": [2, 3]},
+    "coverage": {"cuantiles": 4},
+}
+
+
+def columnas_estado(n_palas):
+    """Grupo de cada columna del estado de state_builder3 (4 + 6 * n_palas columnas)."""
+    return GRUPOS_CAMION + [g for g in GRUPOS_PALA for _ in range(n_palas)]
+
+
+def nombres_columnas(shovel_names):
+    """Nombre de cada columna del estado: pos_x, ..., eta_PH002, ..., coverage_CF002."""
+    return GRUPOS_CAMION + [f"{g}_{p}" for g in GRUPOS_PALA for p in shovel_names]
+
+
+class EspecDiscretizacion:
+    def __init__(self, caracteristicas=None):
+        """
+        Parámetros:
+        - caracteristicas: {grupo: regla}; regla = {"bordes": [...]} | {"cuantiles": k} | {"eliminar": true}.
+        """
+        self.caracteristicas = {}
+        for grupo, regla in (caracteristicas or {}).items():
+            if grupo not in GRUPOS:
+                raise ValueError(f"Grupo desconocido en la discretización: {grupo!r}. Grupos: {GRUPOS}")
+            regla = dict(regla or {})
+            desconocidas = set(regla) - {"bordes", "cuantiles", "eliminar"}
+            if desconocidas:
+                raise ValueError(f"Claves desconocidas en la regla de {grupo!r}: {sorted(desconocidas)}")
+            if "bordes" in regla:
+                regla["bordes"] = [float(b) for b in regla["bordes"]]
+                if regla["bordes"] != sorted(set(regla["bordes"])):
+                    raise ValueError(f"Los bordes de {grupo!r} deben ser crecientes y sin repetir")
+            self.caracteristicas[grupo] = regla
+        self._planes = {}
+
+    # -----------------------------
+    # Persistencia
+    # -----------------------------
+    @classmethod
+    def cargar(cls, ruta):
+        """Especificación desde un archivo JSON o YAML (.yaml / .yml)."""
+        with open(ruta, "r", encoding="utf-8") as f:
+            if ruta.endswith((".yaml", ".yml")):
+                import yaml
+                datos = yaml.safe_load(f)
+            else:
+                datos = json.load(f)
+        return cls((datos or {}).get("caracteristicas", datos))
+
+    def a_dict(self):
+        return {"caracteristicas": self.caracteristicas}
+
+    def guardar(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(self.a_dict(), f, indent=2)
+
+    def huella(self):
+        """Hash de la especificación (para invalidar caches que dependen de los estados)."""
+        texto = json.dumps(self.caracteristicas, sort_keys=True)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def vacia(self):
+        return not self.caracteristicas
+
+    @property
+    def ajustada(self):
+        """False si alguna regla de cuantiles todavía no tiene bordes (ver ajustar)."""
+        return all("bordes" in r or r.get("eliminar") for r in self.caracteristicas.values())
+
+    # -----------------------------
+    # Aplicación
+    # -----------------------------
+    def _plan(self, n_palas):
+        """Columnas que quedan, bordes de cada una (None = sin cambio) y cuáles son enteras."""
+        plan = self._planes.get(n_palas)
+        if plan is None:
+            if not self.ajustada:
+                faltan = [g for g, r in self.caracteristicas.items() if "cuantiles" in r and "bordes" not in r]
+                raise ValueError(f"Faltan los bordes de {faltan}: ajuste la especificación con ajustar() antes de usarla")
+            grupos = columnas_estado(n_palas)
+            quedan = [j for j, g in enumerate(grupos) if not self.caracteristicas.get(g, {}).get("eliminar")]
+            bordes = [self.caracteristicas.get(grupos[j], {}).get("bordes") for j in quedan]
+            # Enteras: las que state_builder3 ya discretiza (4 + n_palas primeras) y las que tienen bordes
+            enteras = [j < 4 + n_palas or b is not None for j, b in zip(quedan, bordes)]
+            plan = (quedan, bordes, enteras)
+            self._planes[n_palas] = plan
+        return plan
+
+    def aplicar_estado(self, state, n_palas):
+        """Estado de state_builder3 (tupla) -> estado discretizado."""
+        if self.vacia:
+            return state
+        quedan, bordes, _ = self._plan(n_palas)
+        nuevo = []
+        for j, b in zip(quedan, bordes):
+            v = state[j]
+            if b is not None:
+                v = -1 if v is None or v == -1 else bisect_right(b, v)
+            nuevo.append(v)
+        return tuple(nuevo)
+
+    def aplicar_matriz(self, X, n_palas):
+        """Matriz de construir_matriz_estados -> matriz discretizada (NaN y -1 -> -1 en las columnas con bordes)."""
+        if self.vacia:
+            return X
+        quedan, bordes, _ = self._plan(n_palas)
+        Y = np.asarray(X, dtype=np.float64)[:, quedan]
+        for k, b in enumerate(bordes):
+            if b is not None:
+                col = Y[:, k]
+                ausente = np.isnan(col) | (col == -1)
+                Y[:, k] = np.where(ausente, -1, np.searchsorted(b, np.where(ausente, 0, col), side="right"))
+        return Y
+
+    def estados_desde_matriz(self, X, n_palas):
+        """Tuplas discretizadas desde la matriz cruda; iguales a aplicar_estado sobre state_builder3."""
+        if self.vacia:
+            return estados_desde_matriz(X, n_palas)
+        return tuplas_desde_matriz(self.aplicar_matriz(X, n_palas), self._plan(n_palas)[2])
+
+    def columnas_enteras(self, n_palas):
+        """Máscara de columnas enteras del estado discretizado (para guardarlo como matriz)."""
+        if self.vacia:
+            return [j < 4 + n_palas for j in range(4 + 6 * n_palas)]
+        return list(self._plan(n_palas)[2])
+
+    # -----------------------------
+    # Tamaño del espacio de estados
+    # -----------------------------
+    def cardinalidades(self, n_palas):
+        """Valores posibles de cada columna que queda (None = no acotada: valores crudos)."""
+        grupos = columnas_estado(n_palas)
+        if self.vacia:
+            quedan, bordes = list(range(len(grupos))), [None] * len(grupos)
+        else:
+            quedan, bordes, _ = self._plan(n_palas)
+        return [len(b) + 2 if b is not None else CARDINALIDAD_BASE.get(grupos[j])
+                for j, b in zip(quedan, bordes)]
+
+    def cota_estados(self, n_palas):
+        """Máximo de estados distintos (producto de cardinalidades) o None si alguna columna no está acotada."""
+        total = 1
+        for c in self.cardinalidades(n_palas):
+            if c is None:
+                return None
+            total *= c
+        return total
+
+    # -----------------------------
+    # Ajuste por cuantiles
+    # -----------------------------
+    def ajustar(self, matrices, n_palas):
+        """
+        Aprende los bordes de las reglas {"cuantiles": k} a partir de matrices crudas
+        (construir_matriz_estados / TicksCompilados.matriz_estados), ignorando -1 y NaN.
+
+        Retorna:
+        - EspecDiscretizacion nueva con esos bordes (las demás reglas no cambian).
+        """
+        por_cuantiles = {g: r["cuantiles"] for g, r in self.caracteristicas.items() if "cuantiles" in r}
+        if not por_cuantiles:
+            return EspecDiscretizacion(self.caracteristicas)
+        grupos = columnas_estado(n_palas)
+        columnas = {g: [j for j, gj in enumerate(grupos) if gj == g] for g in por_cuantiles}
+        valores = {g: [] for g in por_cuantiles}
+        for X in matrices:
+            X = np.asarray(X, dtype=np.float64)
+            for g, cols in columnas.items():
+                v = X[:, cols].ravel()
+                valores[g].append(v[~np.isnan(v) & (v != -1)])
+
+        caracteristicas = {g: dict(r) for g, r in self.caracteristicas.items()}
+        for g, k in por_cuantiles.items():
+            v = np.concatenate(valores[g]) if valores[g] else np.empty(0)
+            if v.size == 0:
+                raise ValueError(f"Sin valores válidos para ajustar los cuantiles de {g!r}")
+            cortes = np.quantile(v, np.linspace(0, 1, int(k) + 1)[1:-1])
+            caracteristicas[g]["bordes"] = np.unique(np.round(cortes, 6)).tolist()
+        return EspecDiscretizacion(caracteristicas)
+
+    def ajustar_con_ticks(self, datos, shovel_names, max_ticks=None):
+        """ajustar() con los ticks compilados de un dataset (todos o los primeros max_ticks)."""
+        n = datos.n_ticks if max_ticks is None else min(max_ticks, datos.n_ticks)
+        return self.ajustar((datos.matriz_estados(t, shovel_names) for t in range(n)), len(shovel_names))
+
+
+def cargar_discretizacion(ruta):
+    """EspecDiscretizacion desde `ruta`, o None si ruta es None/vacía (estado sin cambios)."""
+    if not ruta:
+        return None
+    espec = EspecDiscretizacion.cargar(ruta)
+    return None if espec.vacia else espec
+
+
+def discretizacion_para_entrenar(ruta, datos, shovel_names):
+    """
+    cargar_discretizacion para los scripts de entrenamiento: si la especificación tiene reglas
+    por cuantiles sin ajustar, las ajusta con `datos` y guarda la versión ajustada en
+    <ruta>_ajustada.json, que es la que hay que usar en producción.
+    """
+    espec = cargar_discretizacion(ruta)
+    if espec is None or espec.ajustada:
+        return espec
+    espec = espec.ajustar_con_ticks(datos, shovel_names)
+    destino = os.path.splitext(ruta)[0] + "_ajustada.json"
+    espec.guardar(destino)
+    print(f"Discretización ajustada con el dataset y guardada en {destino} (úsela en producción)")
+    return espec
+
+
+# =========================================================
+# Reporte: tamaño de la tabla y tasa de aciertos
+# =========================================================
+def reporte_discretizacion(datos, shovel_names, espec=None, q_table=None, fraccion_entrenamiento=0.8):
+    """
+    Recorre un dataset de ticks compilados con una especificación y mide:
+    - estados: claves distintas que tendría la Q-table; cota: máximo teórico (None = no acotado).
+    - aciertos_en_linea: fracción de (tick, camión) cuyo estado ya había aparecido antes.
+    - aciertos_validacion: fracción de los (tick, camión) del último tramo del dataset
+      (1 - fraccion_entrenamiento) cuyo estado aparece en el primer tramo.
+    - aciertos_qtable: fracción de (tick, camión) cuyo estado está en `q_table` (si se pasa).
+    - distintos_por_columna: valores distintos observados en cada columna que queda.
+    """
+    espec = espec or EspecDiscretizacion()
+    n_palas = len(shovel_names)
+    grupos = columnas_estado(n_palas)
+    nombres = nombres_columnas(shovel_names)
+    quedan = espec._plan(n_palas)[0] if not espec.vacia else list(range(len(grupos)))
+    corte = int(datos.n_ticks * fraccion_entrenamiento)
+
+    vistos, entrenamiento = set(), set()
+    distintos = [set() for _ in quedan]
+    n = en_linea = n_validacion = en_validacion = en_qtable = 0
+    for t in range(datos.n_ticks):
+        estados = espec.estados_desde_matriz(datos.matriz_estados(t, shovel_names), n_palas)
+        for s in estados:
+            n += 1
+            en_linea += s in vistos
+            vistos.add(s)
+            if t < corte:
+                entrenamiento.add(s)
+            else:
+                n_validacion += 1
+                en_validacion += s in entrenamiento
+            if q_table is not None:
+                en_qtable += s in q_table
+            for k, v in enumerate(s):
+                distintos[k].add(v)
+
+    return {
+        "espec": espec.caracteristicas,
+        "ticks": datos.n_ticks,
+        "transiciones": n,
+        "columnas": len(quedan),
+        "estados": len(vistos),
+        "cota": espec.cota_estados(n_palas),
+        "aciertos_en_linea": en_linea / n if n else 0.0,
+        "aciertos_validacion": en_validacion / n_validacion if n_validacion else None,
+        "aciertos_qtable": en_qtable / n if q_table is not None and n else None,
+        "estados_qtable": len(q_table) if q_table is not None else None,
+        "distintos_por_columna": {nombres[j]: len(d) for j, d in zip(quedan, distintos)},
+    }
+
+
+def imprimir_reporte(r, titulo="Discretización"):
+    cota = f"{r['cota']:,}" if r["cota"] is not None else "no acotada"
+    print(f"--- {titulo} ---")
+    print(f"  Ticks / transiciones:      {r['ticks']} / {r['transiciones']}")
+    print(f"  Columnas del estado:       {r['columnas']}")
+    print(f"  Estados distintos:         {r['estados']} (cota: {cota})")
+    print(f"  Aciertos en línea:         {r['aciertos_en_linea']:.1%}")
+    if r["aciertos_validacion"] is not None:
+        print(f"  Aciertos en validación:    {r['aciertos_validacion']:.1%}")
+    if r["aciertos_qtable"] is not None:
+        print(f"  Aciertos en la Q-table:    {r['aciertos_qtable']:.1%} ({r['estados_qtable']} estados en la tabla)")
+    mayores = sorted(r["distintos_por_columna"].items(), key=lambda kv: -kv[1])[:5]
+    print("  Columnas con más valores:  " + ", ".join(f"{c} ({n})" for c, n in mayores))
+
+
+if __name__ == "__main__":
+    import argparse
+    try:
+        from .tick_cache import compilar_o_cargar, TicksCompilados
+        from .checkpoint_delta import cargar_checkpoint
+    except ImportError:
+        from tick_cache import compilar_o_cargar, TicksCompilados
+        from checkpoint_delta import cargar_checkpoint
+
+    parser = argparse.ArgumentParser(description="Tamaño de la Q-table y tasa de aciertos con una discretización")
+    parser.add_argument("ticks", help="archivo JSON de ticks o directorio de ticks compilados")
+    parser.add_argument("--espec", help="especificación JSON/YAML (sin ella: el estado sin discretizar)")
+    parser.add_argument("--palas", default="PH002,EX004,PH003,PH001,CF001,CF002")
+    parser.add_argument("--ajustar", help="aprende los bordes de las reglas por cuantiles y guarda la especificación aquí")
+    parser.add_argument("--qtable", help="Q-table o checkpoint (base + .delta) para medir cuántos estados ya tienen valores")
+    parser.add_argument("--comparar", action="store_true", help="reporta también el estado sin discretizar")
+    args = parser.parse_args()
+
+    palas = args.palas.split(",")
+    datos = TicksCompilados.cargar(args.ticks) if os.path.isdir(args.ticks) else compilar_o_cargar(args.ticks)
+    espec = EspecDiscretizacion.cargar(args.espec) if args.espec else EspecDiscretizacion()
+    if args.ajustar:
+        espec = espec.ajustar_con_ticks(datos, palas)
+        espec.guardar(args.ajustar)
+        print(f"Especificación ajustada guardada en {args.ajustar}")
+    q_table = None
+    if args.qtable:
+        # Con un checkpoint incremental también se aplica su log .delta (sin él, solo la base)
+        q_table, _ = cargar_checkpoint(args.qtable)
+    if args.comparar:
+        imprimir_reporte(reporte_discretizacion(datos, palas, None, q_table), "Sin discretización")
+    imprimir_reporte(reporte_discretizacion(datos, palas, espec, q_table), args.espec or "Sin discretización")
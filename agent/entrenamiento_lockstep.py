@@ -0,0 +1,104 @@
+import numpy as np
+
+try:
+    from .q_table_array import ArrayQLearningAgent
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from q_table_array import ArrayQLearningAgent
+
+# =========================================================
+# Entrenamiento de K configuraciones en paralelo (lockstep)
+# =========================================================
+"""
+Las configuraciones del tuning solo difieren en alpha/gamma/epsilon: los estados,
+siguientes estados y recompensas de cada transición son los mismos. En vez de
+recorrer la tabla de transiciones una vez por configuración, se recorre una sola
+vez y en cada transición se avanzan las K configuraciones con operaciones
+vectorizadas sobre una Q apilada:
+
+    q[s] -> matriz (K, n_acciones) con la fila del estado s de cada configuración
+
+(internamente el tensor es (estados, K, acciones) para que q[s] sea contiguo;
+`q_por_config` lo expone como (K, estados, acciones)). Cada configuración tiene
+su propio sorteo ε-greedy en cada transición.
+"""
+
+
+class EntrenadorLockstep:
+    def __init__(self, tabla, configs, semilla=None, dtype=np.float64):
+        """
+        Parámetros:
+        - tabla: TablaTransiciones del dataset.
+        - configs: lista de dicts con alpha, gamma, epsilon_decay y opcionalmente epsilon (1.0) y epsilon_min (0.01).
+        - semilla: semilla de los sorteos ε-greedy (np.random.Generator).
+        - dtype: tipo de la Q apilada.
+        """
+        self.tabla = tabla
+        self.configs = list(configs)
+        self.alpha = np.array([c["alpha"] for c in self.configs], dtype=np.float64)
+        self.gamma = np.array([c["gamma"] for c in self.configs], dtype=np.float64)
+        self.epsilon = np.array([c.get("epsilon", 1.0) for c in self.configs], dtype=np.float64)
+        self.epsilon_min = np.array([c.get("epsilon_min", 0.01) for c in self.configs], dtype=np.float64)
+        self.epsilon_decay = np.array([c["epsilon_decay"] for c in self.configs], dtype=np.float64)
+        self.q = np.zeros((tabla.n_estados, len(self.configs), len(tabla.acciones)), dtype=dtype)
+        self.rng = np.random.default_rng(semilla)
+
+    @property
+    def n_configs(self):
+        return len(self.configs)
+
+    @property
+    def q_por_config(self):
+        """Vista (K, estados, acciones) de la Q apilada."""
+        return np.moveaxis(self.q, 1, 0)
+
+    def episodio(self):
+        """Un episodio de las K configuraciones. Retorna la recompensa total de cada una (K,)."""
+        tabla = self.tabla
+        q = self.q
+        K, n_acciones = self.n_configs, q.shape[2]
+        configs = np.arange(K)
+        alpha, gamma, epsilon = self.alpha, self.gamma, self.epsilon
+        estado, siguiente, recompensas = tabla.estado, tabla.siguiente, tabla.recompensas
+        total = np.zeros(K, dtype=np.float64)
+
+        for t in range(len(tabla.offsets) - 1):
+            rango = tabla.filas(t)
+            n = rango.stop - rango.start
+            if n == 0:
+                continue
+            # Sorteos ε-greedy del tick para todas las configuraciones
+            explora = self.rng.random((n, K)) < epsilon
+            azar = self.rng.integers(n_acciones, size=(n, K))
+            s_tick = estado[rango].tolist()
+            s_next_tick = siguiente[rango].tolist()
+
+            for i, k in enumerate(range(rango.start, rango.stop)):
+                q_s = q[s_tick[i]]                                   # (K, A), vista
+                a = np.where(explora[i], azar[i], q_s.argmax(axis=1))
+                r = recompensas[k][a]                                # recompensa de la acción de cada config
+                q_predict = q_s[configs, a]
+                q_target = r + gamma * q[s_next_tick[i]].max(axis=1)
+                q_s[configs, a] = q_predict + alpha * (q_target - q_predict)
+                total += r
+
+        # decay_epsilon de cada configuración
+        self.epsilon = np.where(epsilon > self.epsilon_min, epsilon * self.epsilon_decay, epsilon)
+        return total
+
+    def entrenar(self, num_episodios):
+        """Retorna la matriz (num_episodios, K) de recompensas por episodio."""
+        return np.array([self.episodio() for _ in range(num_episodios)]).reshape(num_episodios, self.n_configs)
+
+    def agente(self, i, actions):
+        """
+        ArrayQLearningAgent con la Q-table de la configuración i (p. ej. para guardar la mejor).
+        Los estados de la tabla deben ser las tuplas (no ids) para que la Q-table sea reutilizable.
+        """
+        c = self.configs[i]
+        agent = ArrayQLearningAgent(actions=actions, alpha=c["alpha"], gamma=c["gamma"],
+                                    epsilon=float(self.epsilon[i]), epsilon_min=float(self.epsilon_min[i]),
+                                    epsilon_decay=c["epsilon_decay"])
+        filas = agent.q_table.filas_de(self.tabla.estados, self.tabla.acciones)
+        cols = agent.q_table.columnas(self.tabla.acciones)
+        agent.q_table._q[filas[:, None], cols] = self.q[:, i, :]
+        return agent
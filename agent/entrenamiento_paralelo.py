@@ -0,0 +1,194 @@
+import time
+import queue
+import random
+import numpy as np
+import multiprocessing as mp
+
+try:
+    from .memoria_compartida import crear_array, publicar, adjuntar, descriptor, liberar
+    from .q_table_array import ArrayQLearningAgent
+    from .transiciones import preparar_agente
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from memoria_compartida import crear_array, publicar, adjuntar, descriptor, liberar
+    from q_table_array import ArrayQLearningAgent
+    from transiciones import preparar_agente
+
+# =========================================================
+# Entrenamiento multiproceso sobre una Q-table compartida
+# =========================================================
+"""
+Q-learning estilo Hogwild: la matriz Q vive en memoria compartida y N procesos
+la actualizan sin locks, cada uno recorriendo un rango disjunto de ticks de la
+tabla de transiciones precomputada (transiciones.TablaTransiciones).
+
+- La tabla (estado, siguiente, recompensas) también se publica una sola vez en
+  memoria compartida: los workers no la copian ni la reconstruyen.
+- Todos los workers usan el mismo epsilon por episodio (calendario_epsilon),
+  igual al que daría decay_epsilon() en el entrenamiento de un solo proceso.
+- Al final de cada episodio el padre espera a todos los workers (barrera), así
+  los checkpoints y logs por episodio ven la Q-table del episodio completo.
+
+Las escrituras concurrentes a un mismo par (s,a) pueden perder una actualización;
+con muchos estados y rangos de ticks distintos es poco frecuente y no afecta la
+convergencia en la práctica. Con n_procesos=1 el resultado es determinista.
+"""
+
+
+def calendario_epsilon(epsilon, epsilon_min, epsilon_decay, num_episodios):
+    """Epsilon usado en cada episodio (misma regla que QLearningAgent.decay_epsilon)."""
+    valores = []
+    for _ in range(num_episodios):
+        valores.append(epsilon)
+        if epsilon > epsilon_min:
+            epsilon *= epsilon_decay
+    return valores, epsilon
+
+
+def repartir_ticks(offsets, n_partes):
+    """
+    Divide los ticks en `n_partes` rangos contiguos con un número de filas parecido.
+    Retorna una lista de (fila_inicio, fila_fin); los cortes siempre caen entre ticks.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_filas = int(offsets[-1])
+    objetivos = [n_filas * i // n_partes for i in range(n_partes + 1)]
+    cortes = [int(offsets[min(np.searchsorted(offsets, o), len(offsets) - 1)]) for o in objetivos]
+    cortes[0], cortes[-1] = 0, n_filas
+    return [(cortes[i], cortes[i + 1]) for i in range(n_partes)]
+
+
+def _worker(wid, descriptores, inicio, fin, alpha, gamma, semilla, tareas, resultados):
+    """Proceso worker: replay de las filas [inicio, fin) con updates directos sobre la Q compartida."""
+    bloques, arr = adjuntar(descriptores)
+    try:
+        q = arr["q"]
+        recompensas = arr["recompensas"]
+        estado = arr["estado"][inicio:fin].tolist()
+        siguiente = arr["siguiente"][inicio:fin].tolist()
+        n_acciones = q.shape[1]
+        rnd = random.Random(None if semilla is None else semilla + wid)
+
+        while True:
+            tarea = tareas.get()
+            if tarea is None:
+                break
+            ep, epsilon = tarea
+            total_reward = 0.0
+            for k, (fila, fila_next) in enumerate(zip(estado, siguiente), start=inicio):
+                fila_q = q[fila]
+                # ε-greedy
+                if rnd.random() < epsilon:
+                    a = rnd.randrange(n_acciones)
+                else:
+                    a = int(fila_q.argmax())
+                reward = float(recompensas[k, a])
+                # Q(s,a) ← Q(s,a) + α [r + γ max Q(s',a') − Q(s,a)]
+                q_predict = float(fila_q[a])
+                q_target = reward + gamma * float(q[fila_next].max())
+                fila_q[a] = q_predict + alpha * (q_target - q_predict)
+                total_reward += reward
+            resultados.put((wid, ep, total_reward))
+    except Exception as e:
+        resultados.put((wid, None, repr(e)))
+    finally:
+        q = recompensas = fila_q = arr = None
+        liberar(bloques)
+
+
+def _esperar(resultados, procesos, n):
+    # Espera n resultados; si un worker muere sin responder, falla en vez de colgarse
+    recibidos = []
+    while len(recibidos) < n:
+        try:
+            wid, ep, valor = resultados.get(timeout=1.0)
+        except queue.Empty:
+            muertos = [p.name for p in procesos if not p.is_alive()]
+            if muertos:
+                raise RuntimeError(f"Workers terminados inesperadamente: {muertos}")
+            continue
+        if ep is None:
+            raise RuntimeError(f"Error en el worker {wid}: {valor}")
+        recibidos.append(valor)
+    return recibidos
+
+
+def entrenar_hogwild(tabla, actions, num_episodios, n_procesos, alpha=0.1, gamma=0.9, epsilon=0.7,
+                     epsilon_decay=0.995, epsilon_min=0.01, semilla=None, al_episodio=None):
+    """
+    Entrena un ArrayQLearningAgent con `n_procesos` workers sobre una Q-table compartida.
+
+    Parámetros:
+    - tabla: TablaTransiciones del dataset.
+    - actions: acciones del agente (SHOVEL_NAMES).
+    - num_episodios, n_procesos: episodios y procesos worker.
+    - alpha, gamma, epsilon, epsilon_decay, epsilon_min: hiperparámetros (los de QLearningAgent).
+    - semilla: semilla de la exploración (cada worker usa semilla + id).
+    - al_episodio(ep, recompensa, agent): se llama al terminar cada episodio, con la
+      Q-table del agente ya sincronizada (p. ej. para guardar checkpoints). Si retorna
+      algo verdadero (p. ej. el motivo de una parada temprana) no se corren más episodios.
+
+    Retorna:
+    - (agent, rewards_por_episodio, resumen_episodios)
+    """
+    agent = ArrayQLearningAgent(actions=actions, alpha=alpha, gamma=gamma, epsilon=epsilon,
+                                epsilon_decay=epsilon_decay, epsilon_min=epsilon_min)
+    filas = preparar_agente(agent, tabla)
+    cols = agent.q_table.columnas(tabla.acciones)
+    epsilons, epsilon_final = calendario_epsilon(epsilon, epsilon_min, epsilon_decay, num_episodios)
+
+    # Q compartida: una fila por estado de la tabla, columnas en el orden de tabla.acciones
+    bloque_q, q = crear_array((tabla.n_estados, len(tabla.acciones)), np.float64)
+    bloques, descriptores = publicar({
+        "estado": tabla.estado,
+        "siguiente": tabla.siguiente,
+        "recompensas": tabla.recompensas,
+    })
+    descriptores["q"] = descriptor(bloque_q, q)
+
+    ctx = mp.get_context()
+    resultados = ctx.Queue()
+    tareas = [ctx.Queue() for _ in range(n_procesos)]
+    procesos = [
+        ctx.Process(target=_worker, name=f"hogwild-{wid}", daemon=True,
+                    args=(wid, descriptores, inicio, fin, alpha, gamma, semilla, tareas[wid], resultados))
+        for wid, (inicio, fin) in enumerate(repartir_ticks(tabla.offsets, n_procesos))
+    ]
+
+    def sincronizar():
+        tabla = agent.q_table
+        if tabla._sucias is not None:  # checkpoint incremental: solo las filas que cambiaron
+            tabla.marcar(filas[(tabla._q[filas[:, None], cols] != q).any(axis=1)])
+        tabla._q[filas[:, None], cols] = q
+
+    rewards_por_episodio, resumen = [], []
+    try:
+        for p in procesos:
+            p.start()
+        for ep in range(num_episodios):
+            inicio_episodio = time.time()
+            for t in tareas:
+                t.put((ep, epsilons[ep]))
+            total_reward = sum(_esperar(resultados, procesos, n_procesos))
+            rewards_por_episodio.append(total_reward)
+            resumen.append({"episodio": ep + 1, "recompensa": total_reward, "epsilon": epsilons[ep],
+                            "tiempo": time.time() - inicio_episodio})
+            if al_episodio is not None:
+                sincronizar()
+                agent.epsilon = epsilons[ep + 1] if ep + 1 < num_episodios else epsilon_final
+                if al_episodio(ep, total_reward, agent):
+                    epsilon_final = agent.epsilon
+                    break
+        for t in tareas:
+            t.put(None)
+        for p in procesos:
+            p.join()
+        sincronizar()
+    finally:
+        for p in procesos:
+            if p.is_alive():
+                p.terminate()
+        q = None
+        liberar(bloques + [bloque_q], destruir=True)
+
+    agent.epsilon = epsilon_final
+    return agent, rewards_por_episodio, resumen
@@ -0,0 +1,371 @@
+import os
+import json
+import numpy as np
+
+try:
+    from .tick_cache import EscritorTicksCompilados, TicksCompilados
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from tick_cache import EscritorTicksCompilados, TicksCompilados
+
+# =========================================================
+# Generador sintético de ticks con dinámica de flota
+# =========================================================
+"""
+A diferencia de generar_tick_json_artificial (ticks independientes, campos sorteados
+uno a uno y sin ETA / main_state / priority / coverage), simula la flota con arrays
+NumPy, un paso por tick, y emite el esquema completo de producción:
+
+- Camiones: ciclo de status  moving unload -> waiting for shovel -> reverse -> loading
+  -> moving load -> waiting for dumper -> unloading -> moving unload ...
+  La posición avanza en línea recta entre pala y botadero; tank_fuel_level baja con
+  el uso y se recarga en el botadero. ETA (solo hacia palas activas) sale de la
+  distancia y del ciclo pendiente, con ruido. current_shovel = pala asignada.
+- Palas: main_state/state con cambios de estado (1 = activa; 3, 4 = detenida) como
+  cadena de Markov, cola FIFO (queue_count = camiones esperando), priority y coverage
+  que cambian de a poco, shovel_spot_time y shovel_cycle() propios de cada pala.
+  Los camiones asignados a una pala que se detiene se reasignan a otra activa.
+
+Un tick = un minuto (ETAs, tiempos de carga y velocidades están en esa unidad).
+Con la misma semilla la secuencia es idéntica. Los ticks se generan de a uno, así que
+la salida (JSON o formato compilado de tick_cache) se escribe por streaming y la
+memoria no crece con el número de ticks:
+
+    gen = GeneradorTicks(SHOVEL_NAMES, num_trucks=2000, semilla=0)
+    gen.escribir_json("ticks.json", num_ticks=100_000)
+    datos = gen.escribir_compilado("ticks_compilados/", num_ticks=1_000_000)
+"""
+
+# Status en el orden del ciclo (los nombres son los del JSON de producción)
+STATUS = ["moving unload", "waiting for shovel", "reverse", "loading",
+          "moving load", "waiting for dumper", "unloading"]
+VACIO, ESPERA_PALA, REVERSA, CARGA, CARGADO, ESPERA_BOTADERO, DESCARGA = range(len(STATUS))
+
+PALA_ACTIVA = 1
+ESTADOS_DETENIDA = (3, 4)
+
+
+class GeneradorTicks:
+    def __init__(self, shovel_names, num_trucks=5, semilla=None, num_botaderos=2,
+                 area=((200000.0, 205000.0), (8392000.0, 8397000.0)),
+                 velocidad_vacio=450.0, velocidad_cargado=300.0,
+                 prob_detencion=0.002, prob_reactivacion=0.03, calentamiento=60):
+        """
+        Parámetros:
+        - shovel_names: palas de la mina (fijan el orden de las columnas por pala).
+        - num_trucks: camiones (CM01, CM02, ...).
+        - semilla: semilla del np.random.Generator (None = aleatoria).
+        - num_botaderos: botaderos donde descargan los camiones.
+        - area: ((x_min, x_max), (y_min, y_max)) en metros, donde se ubican palas y botaderos.
+        - velocidad_vacio, velocidad_cargado: metros por tick.
+        - prob_detencion, prob_reactivacion: probabilidad por tick de que una pala activa se
+          detenga y de que una detenida vuelva a operar.
+        - calentamiento: ticks simulados antes del primero emitido (la flota se reparte en el ciclo).
+        """
+        self.palas = list(shovel_names)
+        self.rng = np.random.default_rng(semilla)
+        self.velocidad_vacio = velocidad_vacio
+        self.velocidad_cargado = velocidad_cargado
+        self.prob_detencion = prob_detencion
+        self.prob_reactivacion = prob_reactivacion
+        self.tick = 0
+        rng = self.rng
+        P, N = len(self.palas), num_trucks
+        (x0, x1), (y0, y1) = area
+
+        # Palas
+        self.pos_pala = np.column_stack([rng.uniform(x0, x1, P), rng.uniform(y0, y1, P)]).round(2)
+        self.main_state = np.full(P, PALA_ACTIVA, dtype=np.int64)
+        self.priority = rng.integers(1, 4, P)
+        self.coverage = rng.choice(np.arange(50, 96, 5), P)
+        self.spot_time = rng.uniform(0.5, 1.5, P).round(2)
+        self.cycle = rng.uniform(2.0, 4.0, P).round(2)
+        self.pos_botadero = np.column_stack([rng.uniform(x0, x1, num_botaderos),
+                                             rng.uniform(y0, y1, num_botaderos)])
+
+        # Camiones: todos parten de un botadero hacia una pala, con avance al azar
+        self.nombres = [f"CM{str(i + 1).zfill(2)}" for i in range(N)]
+        self.status = np.full(N, VACIO, dtype=np.int64)
+        self.pala = rng.integers(0, P, N)
+        self.botadero = rng.integers(0, num_botaderos, N)
+        self.origen = self.pos_botadero[self.botadero].copy()
+        self.destino = self.pos_pala[self.pala].copy()
+        self.duracion = self._distancia(self.origen, self.destino) / velocidad_vacio
+        self.restante = self.duracion * rng.uniform(0.0, 1.0, N)
+        self.llegada = np.zeros(N)
+        self.fuel = rng.uniform(30.0, 100.0, N)
+
+        for _ in range(calentamiento):
+            self._paso()
+        self.tick = 0
+
+    # -----------------------------
+    # Simulación
+    # -----------------------------
+    @staticmethod
+    def _distancia(a, b):
+        return np.hypot(a[..., 0] - b[..., 0], a[..., 1] - b[..., 1])
+
+    def _elegir_palas(self, n):
+        """
+        Palas para n camiones, entre las activas: más peso a las de mayor prioridad (1) y
+        menos a las que ya tienen muchos camiones asignados (un despacho simple).
+        """
+        activas = self.main_state == PALA_ACTIVA
+        if not activas.any():
+            return None
+        asignados = np.bincount(self.pala, minlength=len(self.palas))
+        pesos = np.where(activas, 1.0 / (self.priority * (1.0 + asignados)), 0.0)
+        return self.rng.choice(len(self.palas), size=n, p=pesos / pesos.sum())
+
+    def _ir_a_pala(self, idx, palas):
+        """Los camiones idx salen vacíos desde donde están hacia `palas`."""
+        self.pala[idx] = palas
+        self.status[idx] = VACIO
+        self.origen[idx] = self._posicion()[idx]
+        self.destino[idx] = self.pos_pala[palas]
+        self.duracion[idx] = self._distancia(self.origen[idx], self.destino[idx]) / self.velocidad_vacio
+        self.restante[idx] = self.duracion[idx]
+
+    def _posicion(self):
+        en_ruta = (self.status == VACIO) | (self.status == CARGADO)
+        avance = np.where(en_ruta & (self.duracion > 0),
+                          1.0 - self.restante / np.maximum(self.duracion, 1e-9), 1.0)
+        avance = np.clip(avance, 0.0, 1.0)[:, None]
+        return self.origen + (self.destino - self.origen) * avance
+
+    def _paso(self):
+        rng = self.rng
+        st = self.status
+
+        # 1. Palas: detenciones / reactivaciones, prioridad y cobertura (un sorteo por pala y tick)
+        sorteo = rng.random((3, len(self.palas)))
+        activa = self.main_state == PALA_ACTIVA
+        se_detiene = activa & (sorteo[0] < self.prob_detencion)
+        se_reactiva = ~activa & (sorteo[0] < self.prob_reactivacion)
+        if se_detiene.any() or se_reactiva.any():
+            self.main_state[se_detiene] = rng.choice(ESTADOS_DETENIDA, int(se_detiene.sum()))
+            self.main_state[se_reactiva] = PALA_ACTIVA
+
+            # 2. Camiones que van o esperan en una pala detenida: a otra pala activa
+            detenida = self.main_state != PALA_ACTIVA
+            idx = np.flatnonzero(((st == VACIO) | (st == ESPERA_PALA)) & detenida[self.pala])
+            palas = self._elegir_palas(idx.size) if idx.size else None
+            if palas is not None:
+                self._ir_a_pala(idx, palas)
+        cambia = sorteo[1] < 0.01
+        if cambia.any():
+            self.coverage[cambia] = np.clip(self.coverage[cambia] + rng.choice([-5, 5], int(cambia.sum())), 50, 95)
+        cambia = sorteo[2] < 0.001
+        if cambia.any():
+            self.priority[cambia] = rng.integers(1, 4, int(cambia.sum()))
+
+        # 3. Avance del tiempo y consumo
+        self.restante -= 1.0
+        self.fuel -= self._CONSUMO[st]
+
+        # 4. Fin de cada etapa (status del comienzo del tick: un cambio por camión y tick)
+        terminan = np.flatnonzero((self.restante <= 0) & (st != ESPERA_PALA))
+        if terminan.size:
+            anterior = st[terminan]
+            for etapa in np.unique(anterior).tolist():
+                self._terminar(etapa, terminan[anterior == etapa])
+
+        # 5. Cola FIFO: cada pala activa libre atiende al camión que llegó primero
+        ocupada = np.zeros(len(self.palas), dtype=bool)
+        ocupada[self.pala[(st == REVERSA) | (st == CARGA)]] = True
+        libre = (self.main_state == PALA_ACTIVA) & ~ocupada
+        candidatos = np.flatnonzero((st == ESPERA_PALA) & libre[self.pala])
+        if candidatos.size:
+            orden = candidatos[np.lexsort((self.llegada[candidatos], self.pala[candidatos]))]
+            _, primeros = np.unique(self.pala[orden], return_index=True)
+            elegidos = orden[primeros]
+            st[elegidos] = REVERSA
+            self.restante[elegidos] = self.spot_time[self.pala[elegidos]]
+
+        self.tick += 1
+
+    # Consumo de combustible por tick según el status (cargado > vacío > detenido)
+    _CONSUMO = np.array([0.05, 0.01, 0.01, 0.01, 0.08, 0.01, 0.01])
+
+    def _terminar(self, etapa, idx):
+        """Pasa los camiones idx, que terminaron `etapa`, a la etapa siguiente del ciclo."""
+        rng = self.rng
+        st = self.status
+        if etapa == VACIO:
+            st[idx] = ESPERA_PALA
+            self.llegada[idx] = self.tick
+        elif etapa == REVERSA:
+            st[idx] = CARGA
+            self.restante[idx] = self.cycle[self.pala[idx]] * rng.uniform(0.8, 1.2, idx.size)
+        elif etapa == CARGA:
+            st[idx] = CARGADO
+            self.origen[idx] = self.pos_pala[self.pala[idx]]
+            self.destino[idx] = self.pos_botadero[self.botadero[idx]]
+            self.duracion[idx] = self._distancia(self.origen[idx], self.destino[idx]) / self.velocidad_cargado
+            self.restante[idx] = self.duracion[idx]
+        elif etapa == CARGADO:
+            st[idx] = ESPERA_BOTADERO
+            self.restante[idx] = rng.exponential(0.7, idx.size)
+        elif etapa == ESPERA_BOTADERO:
+            st[idx] = DESCARGA
+            self.restante[idx] = rng.uniform(1.0, 2.0, idx.size)
+        elif etapa == DESCARGA:
+            self.fuel[idx] = np.where(self.fuel[idx] < 20.0, 100.0, self.fuel[idx])  # recarga en el botadero
+            self.botadero[idx] = rng.integers(0, len(self.pos_botadero), idx.size)
+            palas = self._elegir_palas(idx.size)
+            self._ir_a_pala(idx, self.pala[idx] if palas is None else palas)
+
+    def _etas(self, posicion):
+        """ETA (ticks) de cada camión a cada pala activa; NaN hacia las detenidas."""
+        st = self.status
+        hacia_pala = self._distancia(posicion[:, None, :], self.pos_pala[None, :, :]) / self.velocidad_vacio
+        # Con carga: terminar el ciclo (carga, viaje y descarga) y luego ir del botadero a la pala
+        botadero = self.pos_botadero[self.botadero]
+        desde_botadero = self._distancia(botadero[:, None, :], self.pos_pala[None, :, :]) / self.velocidad_vacio
+        al_botadero = self._distancia(posicion, botadero) / self.velocidad_cargado
+        ciclo = np.select(
+            [(st == REVERSA) | (st == CARGA), st == CARGADO, (st == ESPERA_BOTADERO) | (st == DESCARGA)],
+            [self.restante + self.cycle[self.pala] + al_botadero + 1.5, al_botadero + 1.5, self.restante + 1.0],
+            default=-1.0)
+        eta = np.where((ciclo >= 0)[:, None], np.maximum(ciclo, 0)[:, None] + desde_botadero, hacia_pala)
+        eta *= self.rng.lognormal(0.0, 0.05, eta.shape)
+        return np.where((self.main_state == PALA_ACTIVA)[None, :], eta.round(2), np.nan)
+
+    def siguiente(self):
+        """
+        Avanza un tick. Retorna una instantánea en arrays (la usan tick_dict y escribir_compilado):
+        tick, status, pala, pos (n, 2), fuel, eta (n, n_palas) y las columnas de pala.
+        """
+        self._paso()
+        posicion = self._posicion()
+        jitter = self.rng.normal(0.0, 5.0, posicion.shape)  # ruido de GPS
+        return {
+            "tick": self.tick - 1,
+            "status": self.status.copy(),
+            "pala": self.pala.copy(),
+            "pos": (posicion + jitter).round(2),
+            "fuel": self.fuel.round(1),
+            "eta": self._etas(posicion),
+            "main_state": self.main_state.copy(),
+            "queue_count": np.bincount(self.pala[self.status == ESPERA_PALA], minlength=len(self.palas)),
+            "priority": self.priority.copy(),
+            "coverage": self.coverage.copy(),
+        }
+
+    # -----------------------------
+    # Salidas
+    # -----------------------------
+    def tick_dict(self, inst):
+        """Instantánea -> dict de un tick con el esquema del JSON de producción."""
+        t = inst["tick"]
+        activas = [i for i, m in enumerate(inst["main_state"].tolist()) if m == PALA_ACTIVA]
+        eta = inst["eta"].tolist()
+        truck_states = {}
+        for k, (nombre, status, pala, pos, fuel) in enumerate(zip(
+                self.nombres, inst["status"].tolist(), inst["pala"].tolist(),
+                inst["pos"].tolist(), inst["fuel"].tolist())):
+            truck_states[nombre] = {
+                "name": nombre,
+                "time": t,
+                "state": "READY",
+                "status": STATUS[status],
+                "position": pos,
+                "tank_fuel_level": fuel,
+                "type": "interp" if status in (VACIO, CARGADO) else "NODE",
+                "current_shovel": self.palas[pala],
+                "ETA": {self.palas[i]: eta[k][i] for i in activas},
+            }
+        shovel_states = {}
+        for i, nombre in enumerate(self.palas):
+            main_state = int(inst["main_state"][i])
+            shovel_states[nombre] = {
+                "name": nombre,
+                "time": t,
+                "main_state": main_state,
+                "state": main_state,
+                "position": self.pos_pala[i].tolist(),
+                "queue_count": int(inst["queue_count"][i]),
+                "priority": int(inst["priority"][i]),
+                "coverage": int(inst["coverage"][i]),
+                "shovel_spot_time": float(self.spot_time[i]),
+                "shovel_cycle()": float(self.cycle[i]),
+            }
+        return {"tick": t, "truck_states": truck_states, "shovel_states": shovel_states}
+
+    def iterar_ticks(self, num_ticks):
+        """Genera (tick_key, tick_dict) de a uno."""
+        for _ in range(num_ticks):
+            inst = self.siguiente()
+            yield str(inst["tick"]), self.tick_dict(inst)
+
+    def escribir_json(self, ruta, num_ticks):
+        """Escribe num_ticks al formato JSON de producción ({"0": {...}, "1": {...}}) por streaming."""
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write("{")
+            for n, (clave, tick_data) in enumerate(self.iterar_ticks(num_ticks)):
+                f.write(("," if n else "") + json.dumps(clave) + ": " + json.dumps(tick_data))
+            f.write("}")
+        return ruta
+
+    def escribir_compilado(self, destino, num_ticks, filas_por_bloque=65536):
+        """
+        Escribe num_ticks directo al formato compilado de tick_cache (sin armar dicts ni JSON)
+        y lo retorna abierto (TicksCompilados con memory-map). Equivale a compilar la salida de escribir_json.
+        """
+        escritor = EscritorTicksCompilados(destino, self.palas, filas_por_bloque=filas_por_bloque)
+        camion = escritor.codigos("camiones", self.nombres)
+        codigos_status = escritor.codigos("status", STATUS)
+        n, P = len(self.nombres), len(self.palas)
+        uno = np.ones(P, dtype=bool)
+        for _ in range(num_ticks):
+            inst = self.siguiente()
+            activa = inst["main_state"] == PALA_ACTIVA
+            escritor.agregar_tick_columnas(inst["tick"], filas={
+                "camion": camion,
+                "status": codigos_status[inst["status"]],
+                "pos_x": inst["pos"][:, 0],
+                "pos_y": inst["pos"][:, 1],
+                "fuel": inst["fuel"],
+                "current_shovel": inst["pala"],
+                "eta": inst["eta"],
+                "eta_presente": np.broadcast_to(activa, (n, P)),
+            }, palas={
+                "pala_presente": uno,
+                "main_state": inst["main_state"],
+                "state": inst["main_state"],
+                "queue_count": inst["queue_count"],
+                "queue_presente": uno,
+                "priority": inst["priority"],
+                "coverage": inst["coverage"],
+                "spot_time": self.spot_time,
+                "cycle": self.cycle,
+            })
+        escritor.cerrar(generador="GeneradorTicks", num_trucks=n)
+        return TicksCompilados.cargar(destino)
+
+
+def generar_tick_json_sintetico(shovel_names, num_ticks=100, num_trucks=5, semilla=None, **opciones):
+    """Como generar_tick_json_artificial (dict en memoria, para volúmenes chicos) pero con GeneradorTicks."""
+    gen = GeneradorTicks(shovel_names, num_trucks=num_trucks, semilla=semilla, **opciones)
+    return dict(gen.iterar_ticks(num_ticks))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Genera ticks sintéticos con dinámica de flota")
+    parser.add_argument("--camiones", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--palas", default="PH002,EX004,PH003,PH001,CF001,CF002")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="archivo JSON de salida")
+    parser.add_argument("--compilado", help="directorio de salida en formato compilado (tick_cache)")
+    args = parser.parse_args()
+    if not (args.json or args.compilado):
+        parser.error("Indique --json y/o --compilado")
+    palas = args.palas.split(",")
+    if args.json:
+        GeneradorTicks(palas, args.camiones, semilla=args.semilla).escribir_json(args.json, args.ticks)
+        print(f"Ticks guardados en {os.path.abspath(args.json)}")
+    if args.compilado:
+        GeneradorTicks(palas, args.camiones, semilla=args.semilla).escribir_compilado(args.compilado, args.ticks)
+        print(f"Ticks compilados en {os.path.abspath(args.compilado)}")
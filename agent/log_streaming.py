@@ -0,0 +1,233 @@
+import os
+import csv
+import glob
+import random
+import numpy as np
+import pandas as pd
+
+try:
+    from .diagnostico import diag, RESUMEN
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from diagnostico import diag, RESUMEN
+
+try:
+    import pyarrow  # opcional: solo para formato="parquet"
+except ImportError:
+    pyarrow = None
+
+# =========================================================
+# Log de entrenamiento en streaming (memoria acotada)
+# =========================================================
+"""
+Reemplaza el patrón `logs.append({...})` + `pd.DataFrame(logs).to_csv(...)` al final:
+las filas se acumulan solo hasta `filas_por_bloque` y se escriben al disco por bloques,
+así la memoria no crece con episodios × ticks × camiones y, si el proceso se corta,
+los bloques ya escritos quedan en el disco.
+
+Las columnas anidadas se aplanan con punto:
+
+    {"recompensas_posibles": {"PH002": -10, "EX004": 5}}
+    -> recompensas_posibles.PH002 = -10, recompensas_posibles.EX004 = 5
+
+Tuplas/listas (p. ej. el estado) se guardan como texto. Las columnas se pueden declarar
+de entrada (`columnas`, p. ej. con columnas_por_pala); si no, salen del primer bloque. El tipo
+de cada columna (bool, entero, decimal o texto) se fija con el primer bloque que trae valores.
+Una clave que aparece recién en un bloque posterior (p. ej. la ETA de una pala que estuvo
+inactiva al principio) amplía el esquema con un aviso: las filas anteriores quedan vacías en
+esa columna y se cuenta en `columnas_agregadas`.
+
+Formatos:
+- "csv": un solo archivo; cada bloque se agrega al final (flush por bloque). Si el esquema
+  se amplía, el archivo se reescribe una vez con la cabecera nueva.
+- "parquet" (requiere pyarrow): un directorio con un archivo por bloque
+  (parte-00000.parquet, ...). Si el esquema se amplía, las partes siguientes traen las columnas
+  nuevas; leer_parquet(directorio) las une (pd.read_parquet toma el esquema de la primera parte).
+"""
+
+
+def aplanar(fila, prefijo=""):
+    """Aplana dicts anidados a {"a.b": valor}; tuplas/listas/sets pasan a texto."""
+    plana = {}
+    for clave, valor in fila.items():
+        nombre = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            plana.update(aplanar(valor, nombre + "."))
+        elif isinstance(valor, (tuple, list, set)):
+            plana[nombre] = str(valor)
+        elif isinstance(valor, np.generic):
+            plana[nombre] = valor.item()
+        else:
+            plana[nombre] = valor
+    return plana
+
+
+def columnas_por_pala(palas, prefijos=("recompensas_posibles", "q_valores", "truck_etas"),
+                      campos_pala=("state", "queue_count")):
+    """
+    Columnas aplanadas de los dicts por pala del log de entrenamiento, para declararlas
+    de entrada en LogStreaming aunque una pala no aparezca en el primer bloque.
+    """
+    columnas = [f"{p}.{pala}" for p in prefijos for pala in palas]
+    columnas += [f"palas_info.{pala}.{campo}" for pala in palas for campo in campos_pala]
+    return columnas
+
+
+def leer_parquet(directorio):
+    """DataFrame con todas las partes de un log parquet, aunque el esquema se haya ampliado entre partes."""
+    partes = sorted(glob.glob(os.path.join(directorio, "parte-*.parquet")))
+    if not partes:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(p) for p in partes], ignore_index=True)
+
+
+def _tipo_columna(serie):
+    valores = serie.dropna()
+    if len(valores) and all(isinstance(v, (bool, np.bool_)) for v in valores):
+        return "boolean"
+    if len(valores) and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in valores):
+        return "Int64"
+    if all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in valores):
+        return "float64"
+    return "string"
+
+
+def _convertir(serie, tipo):
+    # Valores que no encajan en el tipo fijado por el primer bloque quedan vacíos (no rompen el log)
+    if tipo == "Int64":
+        numeros = pd.to_numeric(serie, errors="coerce")
+        try:
+            return numeros.astype("Int64")
+        except (TypeError, ValueError):  # llegaron decimales en una columna entera
+            return numeros.astype("float64")
+    if tipo == "float64":
+        return pd.to_numeric(serie, errors="coerce").astype("float64")
+    if tipo == "boolean":
+        return serie.map(lambda v: bool(v) if isinstance(v, (bool, np.bool_)) else pd.NA).astype("boolean")
+    return serie.map(lambda v: None if v is None or (isinstance(v, float) and np.isnan(v)) else str(v))
+
+
+class LogStreaming:
+    def __init__(self, ruta, formato="csv", filas_por_bloque=10000, muestreo=1.0, cada_n=1, semilla=None,
+                 columnas=None):
+        """
+        Parámetros:
+        - ruta: archivo .csv (formato "csv") o directorio (formato "parquet").
+        - formato: "csv" o "parquet".
+        - filas_por_bloque: filas en memoria antes de escribir un bloque.
+        - muestreo: fracción de filas que se guarda (1.0 = todas), con su propio generador
+          aleatorio (no altera la secuencia de `random` del agente).
+        - cada_n: además, guarda solo una de cada n filas candidatas.
+        - semilla: semilla del muestreo.
+        - columnas: columnas (aplanadas) que se declaran de entrada; las que no vengan en el
+          primer bloque van después de las de ese bloque. None = solo las del primer bloque.
+        """
+        if formato not in ("csv", "parquet"):
+            raise ValueError(f"Formato de log no soportado: {formato}")
+        if formato == "parquet" and pyarrow is None:
+            raise ImportError("El formato parquet requiere pyarrow (pip install pyarrow)")
+        self.ruta = ruta
+        self.formato = formato
+        self.filas_por_bloque = max(int(filas_por_bloque), 1)
+        self.muestreo = muestreo
+        self.cada_n = max(int(cada_n), 1)
+        self._rnd = random.Random(semilla)
+        self._contador = 0
+        self._filas = []
+        self._columnas = list(columnas or [])
+        self._tipos = dict.fromkeys(self._columnas)  # None = tipo todavía sin fijar
+        self.filas_escritas = 0
+        self.bloques_escritos = 0
+        self.columnas_agregadas = set()
+
+        # Se empieza un log nuevo (igual que to_csv sobrescribía el archivo anterior)
+        if formato == "csv":
+            carpeta = os.path.dirname(os.path.abspath(ruta))
+            os.makedirs(carpeta, exist_ok=True)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        else:
+            os.makedirs(ruta, exist_ok=True)
+            for parte in glob.glob(os.path.join(ruta, "parte-*.parquet")):
+                os.remove(parte)
+
+    def debe_registrar(self):
+        """
+        Decide si la próxima fila se guarda. Llamarlo antes de armar el dict de la fila
+        permite no construir (ni formatear) las filas que el muestreo descarta.
+        """
+        self._contador += 1
+        if self._contador % self.cada_n:
+            return False
+        return self.muestreo >= 1.0 or self._rnd.random() < self.muestreo
+
+    def registrar(self, fila, muestreada=False):
+        """
+        Agrega una fila (dict, puede tener dicts anidados).
+        Con muestreada=True la fila ya pasó por debe_registrar().
+        """
+        if not muestreada and not self.debe_registrar():
+            return
+        self._filas.append(aplanar(fila))
+        if len(self._filas) >= self.filas_por_bloque:
+            self.flush()
+
+    def flush(self):
+        """Escribe al disco las filas pendientes."""
+        if not self._filas:
+            return
+        df = pd.DataFrame(self._filas)
+        self._filas = []
+
+        nuevas = [c for c in df.columns if c not in self._tipos]
+        if not self.bloques_escritos:
+            # Orden del primer bloque; las declaradas que no trae van al final
+            self._columnas = list(df.columns) + [c for c in self._columnas if c not in df.columns]
+        elif nuevas:
+            self._ampliar(nuevas)
+            self._columnas += nuevas
+        self._tipos.update(dict.fromkeys(nuevas))
+        for c in df.columns:
+            if self._tipos[c] is None and df[c].notna().any():
+                self._tipos[c] = _tipo_columna(df[c])
+        df = df.reindex(columns=self._columnas)
+        for c, tipo in self._tipos.items():
+            if tipo is not None:
+                df[c] = _convertir(df[c], tipo)
+
+        if self.formato == "csv":
+            df.to_csv(self.ruta, mode="a", header=self.bloques_escritos == 0, index=False)
+        else:
+            df.to_parquet(os.path.join(self.ruta, f"parte-{self.bloques_escritos:05d}.parquet"), index=False)
+        self.filas_escritas += len(df)
+        self.bloques_escritos += 1
+
+    def _ampliar(self, nuevas):
+        # Columnas que no estaban en los bloques ya escritos: se agregan (no se descartan)
+        self.columnas_agregadas.update(nuevas)
+        diag(RESUMEN, lambda: f"[Log] Aviso: {len(nuevas)} columnas nuevas en el bloque {self.bloques_escritos + 1} "
+                              f"({', '.join(nuevas[:5])}{', ...' if len(nuevas) > 5 else ''}); se amplía el esquema")
+        if self.formato != "csv":
+            return  # parquet: las partes siguientes ya se escriben con el esquema ampliado
+        # CSV: se reescribe el archivo con la cabecera ampliada y las columnas nuevas vacías
+        temporal = self.ruta + ".tmp"
+        relleno = [""] * len(nuevas)
+        with open(self.ruta, newline="", encoding="utf-8") as origen, \
+                open(temporal, "w", newline="", encoding="utf-8") as destino:
+            lector = csv.reader(origen)
+            escritor = csv.writer(destino, lineterminator=os.linesep)
+            next(lector, None)
+            escritor.writerow(self._columnas + nuevas)
+            for fila in lector:
+                escritor.writerow(fila + relleno)
+        os.replace(temporal, self.ruta)
+
+    def cerrar(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # También al salir por una excepción: lo acumulado hasta el error queda escrito
+        self.cerrar()
+        return False
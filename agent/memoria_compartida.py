@@ -0,0 +1,92 @@
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+
+# =========================================================
+# Arrays NumPy en memoria compartida entre procesos
+# =========================================================
+"""
+El proceso padre publica arrays en bloques de `multiprocessing.shared_memory`
+y pasa a los workers solo los descriptores (nombre del bloque, shape, dtype),
+que son pequeños y se pueden pickear. Cada worker se adjunta a los mismos
+bloques sin copiar los datos:
+
+    bloques, descriptores = publicar({"q": q, "recompensas": recompensas})
+    ...                                        # en el worker:
+    bloques_w, arrays = adjuntar(descriptores) # arrays["q"] es una vista del bloque
+    ...
+    liberar(bloques_w)                         # worker: solo cierra
+    liberar(bloques, destruir=True)            # padre: cierra y elimina los bloques
+
+Mientras exista una vista sobre un bloque, el bloque debe seguir abierto.
+"""
+
+
+def crear_array(shape, dtype):
+    """Crea un bloque compartido para un array (inicializado en 0). Retorna (bloque, vista)."""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    bloque = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    vista = np.ndarray(shape, dtype=dtype, buffer=bloque.buf)
+    vista.fill(0)
+    return bloque, vista
+
+
+def adjuntar_array(descriptor):
+    """Se adjunta a un bloque publicado. Retorna (bloque, vista)."""
+    nombre, shape, dtype = descriptor
+    if sys.version_info >= (3, 13):
+        # El worker no es dueño del bloque: que su resource tracker no lo elimine al salir
+        bloque = shared_memory.SharedMemory(name=nombre, track=False)
+    else:
+        bloque = shared_memory.SharedMemory(name=nombre)
+    return bloque, np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=bloque.buf)
+
+
+def publicar(arreglos):
+    """
+    Copia cada array a un bloque compartido.
+
+    Parámetros:
+    - arreglos: dict nombre -> array (o memmap).
+
+    Retorna:
+    - (bloques, descriptores): lista de bloques (para liberar) y dict nombre -> descriptor.
+    """
+    bloques, descriptores = [], {}
+    for nombre, arr in arreglos.items():
+        arr = np.asarray(arr)
+        bloque, vista = crear_array(arr.shape, arr.dtype)
+        vista[...] = arr
+        bloques.append(bloque)
+        descriptores[nombre] = (bloque.name, arr.shape, arr.dtype.str)
+    return bloques, descriptores
+
+
+def descriptor(bloque, vista):
+    """Descriptor (nombre, shape, dtype) de una vista creada con crear_array."""
+    return (bloque.name, vista.shape, vista.dtype.str)
+
+
+def adjuntar(descriptores):
+    """Se adjunta a todos los bloques de `descriptores`. Retorna (bloques, dict nombre -> vista)."""
+    bloques, arrays = [], {}
+    for nombre, desc in descriptores.items():
+        bloque, vista = adjuntar_array(desc)
+        bloques.append(bloque)
+        arrays[nombre] = vista
+    return bloques, arrays
+
+
+def liberar(bloques, destruir=False):
+    """
+    Cierra los bloques; con destruir=True además los elimina (solo el proceso dueño).
+    Antes hay que soltar las vistas NumPy sobre ellos (del arrays), si no close() falla.
+    """
+    for bloque in bloques:
+        bloque.close()
+        if destruir:
+            try:
+                bloque.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# =========================================================
+# Tiempos por fase y perfilado opcional del entrenamiento
+# =========================================================
+"""
+TiemposFases acumula tiempo y número de llamadas por fase de un loop. Las fases
+de un paso se cierran en orden con vuelta(), que mide desde la vuelta anterior:
+
+    fases.iniciar()
+    for ...:
+        state = ...;                    fases.vuelta("estado")
+        action = agent.choose_action(); fases.vuelta("accion")
+        ...
+
+Las fases gruesas (checkpoint, carga de datos) se miden con `with fases.medir("checkpoint"):`.
+Los scripts de entrenamiento miden siempre las gruesas; las de cada paso (cuestan un
+perf_counter por fase) solo con MEDIR_FASES o la variable de entorno RL_FASES=1.
+
+Perfilador: cProfile y/o un perfilador por muestreo, activado desde el entorno sin
+tocar los scripts:
+
+    RL_PERFIL=cprofile | muestreo | ambos   (vacío o 0: apagado; 1: ambos)
+    RL_PERFIL_DIR=perfiles                  carpeta de salida
+    RL_PERFIL_INTERVALO_MS=5                intervalo del muestreo
+
+Por corrida escribe <nombre>_<fecha>.pstats (+ _cprofile.txt con las funciones más
+costosas) y/o <nombre>_<fecha>.collapsed (pilas colapsadas "a;b;c N", el formato de
+flamegraph.pl y speedscope). Solo perfila el proceso (y el hilo) que lo inicia.
+"""
+
+_MODOS = {"cprofile": ("cprofile",), "muestreo": ("muestreo",), "ambos": ("cprofile", "muestreo"),
+          "1": ("cprofile", "muestreo")}
+
+
+class TiemposFases:
+    def __init__(self):
+        self.segundos = {}
+        self.llamadas = {}
+        self._ultimo = None
+
+    def iniciar(self):
+        """Punto de partida de la próxima vuelta()."""
+        self._ultimo = time.perf_counter()
+
+    def vuelta(self, fase):
+        """Cierra `fase`: suma el tiempo desde la vuelta anterior (o iniciar())."""
+        ahora = time.perf_counter()
+        self.segundos[fase] = self.segundos.get(fase, 0.0) + (ahora - self._ultimo)
+        self.llamadas[fase] = self.llamadas.get(fase, 0) + 1
+        self._ultimo = ahora
+
+    def sumar(self, fase, segundos, llamadas=1):
+        self.segundos[fase] = self.segundos.get(fase, 0.0) + segundos
+        self.llamadas[fase] = self.llamadas.get(fase, 0) + llamadas
+
+    @contextmanager
+    def medir(self, fase):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar(fase, time.perf_counter() - inicio)
+
+    def combinar(self, otro):
+        """Suma los acumulados de `otro` (p. ej. los de un episodio al total de la corrida)."""
+        for fase, segundos in otro.segundos.items():
+            self.sumar(fase, segundos, otro.llamadas[fase])
+
+    def total(self):
+        return sum(self.segundos.values())
+
+    def a_dict(self):
+        return {fase: {"segundos": s, "llamadas": self.llamadas[fase]} for fase, s in self.segundos.items()}
+
+    def resumen(self, titulo=None):
+        """Una línea: 'titulo | accion 1.20 s (45000×, 26.7 µs, 41%) | ... | total 2.93 s'."""
+        total = self.total()
+        partes = [titulo] if titulo else []
+        for fase, segundos in self.segundos.items():
+            n = self.llamadas[fase]
+            partes.append(f"{fase} {segundos:.3f} s ({n}×, {segundos / n * 1e6:.1f} µs, "
+                          f"{segundos / total if total else 0.0:.0%})")
+        partes.append(f"total {total:.3f} s")
+        return " | ".join(partes)
+
+
+# =========================================================
+# Perfilador opcional (cProfile / muestreo)
+# =========================================================
+class _Muestreador(threading.Thread):
+    """Hilo que toma la pila del hilo perfilado cada `intervalo` segundos."""
+
+    def __init__(self, hilo_id, intervalo):
+        super().__init__(daemon=True)
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                frame = frame.f_back
+            if pila:
+                self.pilas[";".join(reversed(pila))] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+class Perfilador:
+    def __init__(self, nombre, modos=(), directorio="perfiles", intervalo_ms=5.0):
+        """
+        Parámetros:
+        - nombre: prefijo de los archivos de salida (p. ej. el script).
+        - modos: "cprofile" y/o "muestreo"; vacío = no hace nada.
+        - directorio: carpeta de salida (se crea si no existe).
+        - intervalo_ms: intervalo entre muestras del perfilador por muestreo.
+        """
+        self.nombre = nombre
+        self.modos = tuple(modos)
+        self.directorio = directorio
+        self.intervalo_ms = intervalo_ms
+        self.archivos = []
+        self._perfil = None
+        self._muestreador = None
+
+    @property
+    def activo(self):
+        return bool(self.modos)
+
+    def iniciar(self):
+        if "muestreo" in self.modos:
+            self._muestreador = _Muestreador(threading.get_ident(), self.intervalo_ms / 1000.0)
+            self._muestreador.start()
+        if "cprofile" in self.modos:
+            import cProfile
+            self._perfil = cProfile.Profile()
+            self._perfil.enable()
+        return self
+
+    def detener(self):
+        """Detiene el perfilado y escribe los archivos. Retorna la lista de archivos escritos."""
+        if not self.activo:
+            return []
+        if self._perfil is not None:
+            self._perfil.disable()
+        if self._muestreador is not None:
+            self._muestreador.parar()
+
+        os.makedirs(self.directorio, exist_ok=True)
+        base = os.path.join(self.directorio, f"{self.nombre}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        if self._perfil is not None:
+            import io
+            import pstats
+            self._perfil.dump_stats(base + ".pstats")
+            texto = io.StringIO()
+            pstats.Stats(self._perfil, stream=texto).sort_stats("cumulative").print_stats(40)
+            with open(base + "_cprofile.txt", "w", encoding="utf-8") as f:
+                f.write(texto.getvalue())
+            self.archivos += [base + ".pstats", base + "_cprofile.txt"]
+            self._perfil = None
+        if self._muestreador is not None:
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for pila, n in sorted(self._muestreador.pilas.items()):
+                    f.write(f"{pila} {n}\n")
+            self.archivos.append(base + ".collapsed")
+            self._muestreador = None
+        return self.archivos
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+        return False
+
+
+def medir_fases(valor=None):
+    """True si se piden los tiempos por paso: `valor` o, si es None, la variable de entorno RL_FASES."""
+    if valor is None:
+        valor = os.environ.get("RL_FASES", "")
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("1", "si", "sí", "true")
+    return bool(valor)
+
+
+def perfilador_desde_entorno(nombre):
+    """Perfilador configurado con RL_PERFIL / RL_PERFIL_DIR / RL_PERFIL_INTERVALO_MS (apagado por defecto)."""
+    valor = os.environ.get("RL_PERFIL", "").strip().lower()
+    if valor in ("", "0", "no"):
+        modos = ()
+    elif valor in _MODOS:
+        modos = _MODOS[valor]
+    else:
+        raise ValueError(f"RL_PERFIL={valor!r}: use cprofile, muestreo o ambos")
+    return Perfilador(nombre, modos,
+                      directorio=os.environ.get("RL_PERFIL_DIR", "perfiles"),
+                      intervalo_ms=float(os.environ.get("RL_PERFIL_INTERVALO_MS", 5.0)))
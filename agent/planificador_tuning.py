@@ -0,0 +1,159 @@
+import math
+import random
+import itertools
+
+# =========================================================
+# Planificador de tuning: successive halving / Hyperband
+# =========================================================
+"""
+En vez de entrenar cada configuración hasta el final, se reparte el presupuesto
+de episodios por "rungs":
+
+    rung 0: n configuraciones con r episodios cada una
+    rung 1: el mejor 1/eta sigue, hasta r·eta episodios (continúa su agente, no empieza de cero)
+    rung 2: el mejor 1/eta de esas, hasta r·eta² episodios
+    ...
+
+Hyperband corre varios successive halving ("brackets") con distinto equilibrio
+entre cantidad de configuraciones y episodios iniciales.
+
+El entrenamiento en sí lo hace una función `ejecutar(trabajos)` que recibe la
+lista de trabajos del rung [(id, config, estado, n_episodios), ...] y devuelve
+[(id, estado, recompensas_de_esos_episodios), ...]. `estado` es lo que haga
+falta para continuar el entrenamiento (p. ej. el agente); None en el rung 0.
+Así el planificador no depende de si los trabajos corren en serie o en un Pool.
+"""
+
+
+# -----------------------------
+# Espacios de búsqueda
+# -----------------------------
+def espacio_grilla(espacio):
+    """
+    Todas las combinaciones de una grilla.
+
+    Parámetros:
+    - espacio: dict parametro -> lista de valores, p. ej. {"alpha": [0.1, 0.3], "gamma": [0.9, 0.99]}
+
+    Retorna:
+    - lista de dicts de configuración
+    """
+    nombres = list(espacio)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*(espacio[n] for n in nombres))]
+
+
+def espacio_aleatorio(espacio, n, semilla=None):
+    """
+    n configuraciones muestreadas al azar.
+
+    Parámetros:
+    - espacio: dict parametro -> lista (se elige un valor) o tupla (min, max) (uniforme en el rango).
+    - n: número de configuraciones.
+    - semilla: semilla del muestreo.
+    """
+    rnd = random.Random(semilla)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for nombre, valores in espacio.items():
+            if isinstance(valores, tuple):
+                config[nombre] = rnd.uniform(*valores)
+            else:
+                config[nombre] = rnd.choice(list(valores))
+        configs.append(config)
+    return configs
+
+
+# -----------------------------
+# Successive halving
+# -----------------------------
+def successive_halving(configs, ejecutar, episodios_min, eta=3, episodios_max=None, registrar=None, primer_id=0):
+    """
+    Parámetros:
+    - configs: lista de dicts de configuración.
+    - ejecutar: función de los trabajos de un rung (ver docstring del módulo).
+    - episodios_min: episodios de cada configuración en el primer rung.
+    - eta: en cada rung sigue el mejor 1/eta (y los episodios se multiplican por eta).
+    - episodios_max: tope de episodios por configuración (por defecto, hasta que quede una).
+    - registrar(filas): se llama al final de cada rung con sus filas de historial.
+    - primer_id: id de la primera configuración (para ids únicos entre brackets).
+
+    Retorna:
+    - (ranking, historial): ranking de las configuraciones del último rung (mejor primero)
+      y lista de filas {"rung", "id", parámetros..., "episodios", "puntaje"} de todos los rungs.
+    """
+    vivos = [{"id": primer_id + i, "config": c, "estado": None, "episodios": 0, "puntaje": None}
+             for i, c in enumerate(configs)]
+    historial = []
+    objetivo = episodios_min if episodios_max is None else min(episodios_min, episodios_max)
+    rung = 0
+
+    while vivos:
+        trabajos = [(v["id"], v["config"], v["estado"], objetivo - v["episodios"]) for v in vivos]
+        por_id = {v["id"]: v for v in vivos}
+        for id_config, estado, recompensas in ejecutar(trabajos):
+            v = por_id[id_config]
+            v["estado"] = estado
+            v["episodios"] = objetivo
+            # Puntaje: recompensa media de los episodios de este rung (la política actual)
+            v["puntaje"] = sum(recompensas) / len(recompensas) if recompensas else float("-inf")
+
+        vivos.sort(key=lambda v: v["puntaje"], reverse=True)
+        filas = [{"rung": rung, "id": v["id"], **v["config"], "episodios": v["episodios"], "puntaje": v["puntaje"]}
+                 for v in vivos]
+        historial.extend(filas)
+        if registrar is not None:
+            registrar(filas)
+
+        if len(vivos) == 1 or (episodios_max is not None and objetivo >= episodios_max):
+            break
+        vivos = vivos[:max(1, len(vivos) // eta)]
+        objetivo *= eta
+        if episodios_max is not None:
+            objetivo = min(objetivo, episodios_max)
+        rung += 1
+
+    return vivos, historial
+
+
+# -----------------------------
+# Hyperband
+# -----------------------------
+def hyperband(muestrear, ejecutar, episodios_max, eta=3, episodios_min=1, registrar=None):
+    """
+    Parámetros:
+    - muestrear(n): devuelve n configuraciones nuevas (p. ej. con espacio_aleatorio).
+    - ejecutar: función de los trabajos de un rung (ver docstring del módulo).
+    - episodios_max: episodios máximos por configuración (R).
+    - eta: factor de reducción entre rungs.
+    - episodios_min: episodios mínimos del primer rung del bracket más agresivo.
+    - registrar(filas): como en successive_halving (las filas incluyen "bracket").
+
+    Retorna:
+    - (mejor, historial): mejor fila del último rung de todos los brackets y el historial completo.
+    """
+    s_max = int(math.floor(math.log(episodios_max / episodios_min, eta) + 1e-9))
+    historial = []
+    finalistas = []
+    siguiente_id = 0
+
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        r = max(episodios_min, int(round(episodios_max / eta ** s)))
+        configs = muestrear(n)
+
+        def registrar_bracket(filas, s=s):
+            for f in filas:
+                f["bracket"] = s
+            if registrar is not None:
+                registrar(filas)
+
+        ranking, filas = successive_halving(configs, ejecutar, r, eta=eta, episodios_max=episodios_max,
+                                            registrar=registrar_bracket, primer_id=siguiente_id)
+        siguiente_id += len(configs)
+        historial.extend(filas)
+        mejor = ranking[0]
+        finalistas.append({"bracket": s, "id": mejor["id"], **mejor["config"],
+                           "episodios": mejor["episodios"], "puntaje": mejor["puntaje"]})
+
+    return max(finalistas, key=lambda f: f["puntaje"]), historial
@@ -0,0 +1,289 @@
+import sys
+import time
+from itertools import islice
+from collections import OrderedDict
+
+try:
+    from .diagnostico import diag, RESUMEN
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from diagnostico import diag, RESUMEN
+
+# =========================================================
+# Visitas por estado y poda de la Q-table
+# =========================================================
+"""
+QLearningAgent agrega con Q=0 cada estado nuevo (en choose_action y, para el siguiente
+estado, en update), así que un despachador que corre semanas tiene una Q-table que
+solo crece. Aquí:
+
+- RegistroVisitas: visitas y último momento visto por estado. Se activa como
+  `agent.visitas` (igual que `agent.cambios` del checkpoint incremental): choose_action
+  cuenta una visita y update marca como vistos el estado y el siguiente estado.
+- PodaQTable: un techo de memoria (en estados y/o MB) y una política que elige qué
+  estados sacar cuando se supera:
+
+    "lru"          los vistos hace más tiempo
+    "min_visitas"  los menos visitados (a igualdad, los vistos hace más tiempo)
+    "ceros"        las filas que nunca se actualizaron (todas las Q en 0.0), las más
+                   viejas primero; si no alcanzan, sigue por LRU
+
+Al superar el techo se poda hasta `fraccion_objetivo` del techo, para no podar en cada
+tick. Los estados sin registro (cargados del disco y no vistos desde entonces) son los
+primeros candidatos de cualquier política. Los estados con decisiones pendientes se
+pueden proteger.
+
+Los estados podados quedan anotados en `agent.cambios`, así el checkpoint incremental
+los borra también del archivo. Funciona con Q-tables que se pueden borrar por estado:
+dict (QLearningAgent) y TablaCompacta; no con QTableArray.
+
+Con QTableCompilada (politica_compilada.py) las filas del archivo están en el mmap y no
+ocupan heap: el techo cuenta y la poda saca solo las filas del dict superpuesto (leídas,
+modificadas o nuevas). Una fila del archivo podada vuelve a sus valores del archivo; un
+estado nuevo podado deja de existir. Nunca se marcan filas del archivo como borradas.
+"""
+
+POLITICAS = ("lru", "min_visitas", "ceros")
+
+
+class RegistroVisitas:
+    """
+    Visitas y último momento visto (time.time()) por estado, en orden LRU:
+    el primero de `estados` es el visto hace más tiempo.
+    """
+
+    def __init__(self):
+        self.estados = OrderedDict()  # estado -> (visitas, ultimo_visto)
+
+    def visitar(self, state):
+        """Una visita (el agente eligió una acción en `state`)."""
+        visitas, _ = self.estados.pop(state, (0, 0.0))
+        self.estados[state] = (visitas + 1, time.time())
+
+    def ver(self, state):
+        """Marca `state` como visto ahora, sin contar una visita."""
+        visitas, _ = self.estados.pop(state, (0, 0.0))
+        self.estados[state] = (visitas, time.time())
+
+    def olvidar(self, state):
+        self.estados.pop(state, None)
+
+    def visitas(self, state):
+        return self.estados.get(state, (0, 0.0))[0]
+
+    def ultimo_visto(self, state):
+        """time.time() de la última vez que se vio `state` (None si no tiene registro)."""
+        registro = self.estados.get(state)
+        return None if registro is None else registro[1]
+
+    def __len__(self):
+        return len(self.estados)
+
+
+def _fila_en_ceros(fila):
+    return all(v == 0.0 for v in fila.values())
+
+
+def _lector(q_table):
+    # QTableCompilada.leer no copia la fila al dict superpuesto; las demás tablas se indexan directo
+    return getattr(q_table, "leer", q_table.__getitem__)
+
+
+def _estados_en_memoria(q_table):
+    # Estados que ocupan heap: el dict superpuesto de QTableCompilada, o toda la tabla
+    en_memoria = getattr(q_table, "en_memoria", None)
+    return en_memoria() if en_memoria is not None else q_table
+
+
+class PodaQTable:
+    def __init__(self, agent, max_estados=None, max_mb=None, politica="lru", fraccion_objetivo=0.9):
+        """
+        Parámetros:
+        - agent: QLearningAgent (o CompactoQLearningAgent); se le activa `agent.visitas`.
+        - max_estados: techo de estados en la Q-table (None = sin techo por estados).
+        - max_mb: techo de memoria de la Q-table en MB, estimado con los bytes por estado
+          de una muestra (filas, claves y registro de visitas). None = sin techo por memoria.
+        - politica: "lru", "min_visitas" o "ceros".
+        - fraccion_objetivo: al superar el techo se poda hasta esta fracción de él.
+        """
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de poda desconocida: {politica!r}. Use una de {POLITICAS}")
+        if hasattr(agent.q_table, "presente"):
+            raise TypeError("La poda necesita una Q-table que se pueda borrar por estado (no QTableArray ni QAproximada)")
+        self.agent = agent
+        self.max_estados = max_estados
+        self.max_mb = max_mb
+        self.politica = politica
+        self.fraccion_objetivo = fraccion_objetivo
+        if getattr(agent, "visitas", None) is None:
+            agent.visitas = RegistroVisitas()
+        self.registro = agent.visitas
+        self.bytes_por_estado = None
+        self.podas = 0
+        self.eliminados = 0
+        self.eliminados_en_ceros = 0
+        self.ultima_poda = None  # (momento, eliminados, segundos)
+
+    @classmethod
+    def desde_config(cls, agent, config):
+        """PodaQTable desde un dict de config (max_estados, max_mb, politica, fraccion_objetivo), o None si no hay techo."""
+        config = config or {}
+        if config.get("max_estados") is None and config.get("max_mb") is None:
+            return None
+        return cls(agent, max_estados=config.get("max_estados"), max_mb=config.get("max_mb"),
+                   politica=config.get("politica", "lru"),
+                   fraccion_objetivo=config.get("fraccion_objetivo", 0.9))
+
+    # -----------------------------
+    # Techo
+    # -----------------------------
+    def estimar_bytes_por_estado(self, muestra=256):
+        """Bytes por estado de una muestra de la Q-table (fila + clave + registro de visitas)."""
+        total, n = 0, 0
+        q_table = self.agent.q_table
+        leer = _lector(q_table)
+        for state in islice(_estados_en_memoria(q_table), muestra):
+            fila = leer(state)
+            valores = getattr(fila, "_valores", None)
+            if valores is not None:  # FilaQ de TablaCompacta: se mide el array, no la vista
+                total += sys.getsizeof(valores)
+            else:
+                total += sys.getsizeof(fila) + sum(sys.getsizeof(v) for v in fila.values())
+            total += sys.getsizeof(state) + sum(sys.getsizeof(v) for v in state)
+            n += 1
+        if n == 0:
+            return None
+        # Entrada del dict de la tabla y del registro de visitas (tupla + float)
+        extra = 3 * 8 + 2 * 8 * 2 + sys.getsizeof((0, 0.0)) + sys.getsizeof(0.0)
+        self.bytes_por_estado = total / n + extra
+        return self.bytes_por_estado
+
+    def techo_estados(self):
+        """Máximo de estados permitido por max_estados y max_mb (None = sin techo)."""
+        techos = []
+        if self.max_estados is not None:
+            techos.append(int(self.max_estados))
+        if self.max_mb is not None:
+            por_estado = self.bytes_por_estado or self.estimar_bytes_por_estado()
+            if por_estado:
+                techos.append(int(self.max_mb * 2**20 / por_estado))
+        return min(techos) if techos else None
+
+    # -----------------------------
+    # Poda
+    # -----------------------------
+    def _candidatos(self, protegidos):
+        """Estados en orden de poda según la política (generador)."""
+        q_table = _estados_en_memoria(self.agent.q_table)
+        leer = _lector(self.agent.q_table)
+        registro = self.registro.estados
+        # Sin registro: cargados del disco y no vistos desde entonces
+        sin_registro = [s for s in q_table if s not in registro and s not in protegidos]
+        if self.politica == "ceros":
+            yield from (s for s in sin_registro if _fila_en_ceros(leer(s)))
+            yield from (s for s in registro if s not in protegidos and s in q_table and _fila_en_ceros(leer(s)))
+            # Si no alcanzan las filas en cero, LRU con el resto
+            yield from sin_registro
+            yield from (s for s in registro if s not in protegidos and s in q_table)
+        elif self.politica == "min_visitas":
+            yield from sin_registro
+            # sorted es estable: a igualdad de visitas queda el orden LRU del registro
+            orden = sorted(registro.items(), key=lambda item: item[1][0])
+            yield from (s for s, _ in orden if s not in protegidos and s in q_table)
+        else:
+            yield from sin_registro
+            yield from (s for s in registro if s not in protegidos and s in q_table)
+
+    def podar(self, objetivo=None, protegidos=()):
+        """
+        Saca estados de la Q-table hasta dejar `objetivo` (por defecto fraccion_objetivo del techo).
+
+        Parámetros:
+        - objetivo: número de estados a dejar.
+        - protegidos: estados que no se podan (p. ej. los de decisiones pendientes).
+
+        Retorna:
+        - número de estados podados.
+        """
+        q_table = self.agent.q_table
+        if objetivo is None:
+            techo = self.techo_estados()
+            if techo is None:
+                return 0
+            objetivo = int(techo * self.fraccion_objetivo)
+        exceso = len(_estados_en_memoria(q_table)) - max(int(objetivo), 0)
+        if exceso <= 0:
+            return 0
+
+        inicio = time.perf_counter()
+        protegidos = set(protegidos)
+        a_podar = []
+        vistos = set()
+        for state in self._candidatos(protegidos):
+            if state in vistos:
+                continue
+            vistos.add(state)
+            a_podar.append(state)
+            if len(a_podar) >= exceso:
+                break
+
+        cambios = getattr(self.agent, "cambios", None)
+        leer = _lector(q_table)
+        descartar = getattr(q_table, "descartar", None)
+        en_ceros = 0
+        for state in a_podar:
+            en_ceros += _fila_en_ceros(leer(state))
+            if descartar is not None:
+                cambio = descartar(state)  # QTableCompilada: solo sale del dict superpuesto
+            else:
+                del q_table[state]
+                cambio = True
+            self.registro.olvidar(state)
+            if cambios is not None and cambio:
+                cambios.add(state)  # el checkpoint incremental lo registra como borrado (o con la fila del archivo)
+
+        segundos = time.perf_counter() - inicio
+        self.podas += 1
+        self.eliminados += len(a_podar)
+        self.eliminados_en_ceros += en_ceros
+        self.ultima_poda = (time.time(), len(a_podar), segundos)
+        diag(RESUMEN, "[Poda] {} estados podados ({} en cero, política {}) en {:.3f} s; quedan {}",
+             len(a_podar), en_ceros, self.politica, segundos, len(_estados_en_memoria(q_table)))
+        return len(a_podar)
+
+    def podar_si_hace_falta(self, protegidos=()):
+        """Poda solo si la Q-table supera el techo. Retorna el número de estados podados."""
+        techo = self.techo_estados()
+        if techo is None or len(_estados_en_memoria(self.agent.q_table)) <= techo:
+            return 0
+        return self.podar(int(techo * self.fraccion_objetivo), protegidos)
+
+    # -----------------------------
+    # Estadísticas
+    # -----------------------------
+    def estadisticas(self):
+        """
+        Estados, techo, memoria estimada y acumulados de poda (para logs o un endpoint de estado).
+        Con QTableCompilada, "estados" son los del dict superpuesto (los del archivo no cuentan).
+        """
+        n = len(_estados_en_memoria(self.agent.q_table))
+        por_estado = self.bytes_por_estado or self.estimar_bytes_por_estado()
+        return {
+            "estados": n,
+            "techo_estados": self.techo_estados(),
+            "max_estados": self.max_estados,
+            "max_mb": self.max_mb,
+            "politica": self.politica,
+            "mb_estimados": n * por_estado / 2**20 if por_estado else 0.0,
+            "con_registro": len(self.registro),
+            "podas": self.podas,
+            "eliminados": self.eliminados,
+            "eliminados_en_ceros": self.eliminados_en_ceros,
+            "ultima_poda": self.ultima_poda,
+        }
+
+    def resumen(self):
+        e = self.estadisticas()
+        techo = e["techo_estados"] if e["techo_estados"] is not None else "sin techo"
+        return (f"Q-table: {e['estados']} estados (techo {techo}, ~{e['mb_estimados']:.1f} MB) | "
+                f"podas: {e['podas']}, estados podados: {e['eliminados']} ({e['eliminados_en_ceros']} en cero) | "
+                f"política {e['politica']}")
@@ -0,0 +1,386 @@
+import os
+import json
+import mmap
+import struct
+from array import array
+
+try:
+    from .checkpoint_delta import _leer_base, _leer_registros, _aplicar_registros
+    from .diagnostico import diag, RESUMEN
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from checkpoint_delta import _leer_base, _leer_registros, _aplicar_registros
+    from diagnostico import diag, RESUMEN
+
+# =========================================================
+# Política compilada: Q-table binaria cargada con memory map
+# =========================================================
+"""
+pickle.load de la Q-table arma todos los dicts en memoria antes de la primera
+decisión, y eso crece con la tabla. El archivo compilado guarda la base del checkpoint
+en un formato binario que se abre con mmap en tiempo constante; solo se leen las filas
+de los estados que se consultan:
+
+    prefijo    "QPOL", versión, largo de la cabecera
+    cabecera   JSON: n, largo máximo del estado, acciones, tamaño del índice, offsets, origen
+    claves     n × largo float64 (None se guarda como NaN; relleno NaN en estados más cortos)
+    q          n × acciones float64
+    indice     tabla hash (direccionamiento abierto) int64: fila o -1
+    presente   n × acciones bytes (qué pares estado/acción existen en el dict)
+    largos     n uint16 (largo de cada estado)
+
+QTableCompilada se usa como la Q-table en dict de QLearningAgent: las filas que se
+leen o modifican se copian a un dict superpuesto (el archivo nunca se escribe), y los
+estados nuevos van solo al dict. Para CheckpointDelta es una Q-table en dict más
+(a_dict() para compactar).
+
+El archivo compilado corresponde a una base (tamaño, fecha y CRC de `ruta`): el log
+.delta de la base se aplica encima al cargar. Cuando la base cambia (compactación),
+cargar_politica carga el pickle como siempre y vuelve a compilar para la próxima vez.
+"""
+
+MAGIA = b"QPOL"
+VERSION = 1
+_PREFIJO = struct.Struct("<4sII")
+
+_HASH_NONE = 0x2545F491
+_MULTIPLICADOR = 1000003
+_MASCARA = (1 << 63) - 1
+
+
+def _hash_estado(estado):
+    """Hash estable entre procesos (hash(None) no lo es en Python < 3.12); igual para 1 y 1.0."""
+    h = 0x345678
+    for v in estado:
+        h = ((h ^ (_HASH_NONE if v is None else hash(v))) * _MULTIPLICADOR) & _MASCARA
+    return h
+
+
+# Cambia si cambia el hash de los números entre versiones de Python: el archivo ya no sirve
+_HASH_PRUEBA = _hash_estado((1, 2.5, None, -1))
+
+
+def _decodificar(valores):
+    return tuple(None if v != v else (int(v) if v.is_integer() else v) for v in valores)
+
+
+def _firma_origen(ruta):
+    st = os.stat(ruta)
+    return {"tamano": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def compilar_politica(q_table, ruta_politica, acciones=(), origen=None):
+    """
+    Escribe la Q-table (dict {estado: {accion: Q}}) en formato compilado.
+
+    Parámetros:
+    - q_table: Q-table en dict. Los estados deben ser tuplas de números o None
+      (como los de state_builder3).
+    - ruta_politica: archivo de salida (se reemplaza de forma atómica).
+    - acciones: orden preferido de las columnas (las demás acciones se agregan al final).
+    - origen: dict guardado en la cabecera para saber de qué base viene (ver cargar_politica).
+
+    Retorna:
+    - número de estados compilados. ValueError si algún estado no se puede representar.
+    """
+    estados = list(q_table)
+    if not all(isinstance(estado, tuple) for estado in estados):
+        raise ValueError("Los estados deben ser tuplas")
+    largo = max((len(estado) for estado in estados), default=0)
+    if largo > 0xFFFF:
+        raise ValueError(f"Estados demasiado largos ({largo})")
+    columnas = {a: i for i, a in enumerate(acciones)}
+    for fila in q_table.values():
+        for a in fila:
+            columnas.setdefault(a, len(columnas))
+    n, n_acciones = len(estados), len(columnas)
+
+    claves = array("d")
+    largos = array("H", [len(estado) for estado in estados])
+    relleno = [float("nan")] * largo
+    for estado in estados:
+        try:
+            codificado = [float("nan") if v is None else float(v) for v in estado]
+        except (TypeError, ValueError):
+            raise ValueError(f"Estado no numérico: {estado!r}") from None
+        if _decodificar(codificado) != estado:
+            raise ValueError(f"Estado no representable en float64: {estado!r}")
+        claves.extend(codificado)
+        claves.extend(relleno[len(codificado):])
+
+    q = array("d", bytes(8 * n * n_acciones))
+    presente = bytearray(n * n_acciones)
+    for i, estado in enumerate(estados):
+        for a, valor in q_table[estado].items():
+            q[i * n_acciones + columnas[a]] = valor
+            presente[i * n_acciones + columnas[a]] = 1
+
+    slots = 8
+    while slots < 2 * n:
+        slots *= 2
+    indice = array("q", [-1]) * slots
+    for i, estado in enumerate(estados):
+        slot = _hash_estado(estado) & (slots - 1)
+        while indice[slot] >= 0:
+            slot = (slot + 1) & (slots - 1)
+        indice[slot] = i
+
+    secciones = [claves.tobytes(), q.tobytes(), indice.tobytes(), bytes(presente), largos.tobytes()]
+    cabecera = {"n": n, "largo": largo, "acciones": list(columnas), "slots": slots,
+                "hash_prueba": _HASH_PRUEBA, "origen": origen, "offsets": []}
+    # Los offsets dependen del largo de la cabecera: se fija con un relleno de 8 bytes
+    cuerpo_cabecera = json.dumps(cabecera).encode("utf-8")
+    inicio = _PREFIJO.size + len(cuerpo_cabecera) + 32 * len(secciones)
+    inicio += -inicio % 8
+    for seccion in secciones:
+        cabecera["offsets"].append(inicio)
+        inicio += len(seccion) + (-len(seccion) % 8)
+    cuerpo_cabecera = json.dumps(cabecera).encode("utf-8")
+    cuerpo_cabecera += b" " * (cabecera["offsets"][0] - _PREFIJO.size - len(cuerpo_cabecera))
+
+    with open(ruta_politica + ".tmp", "wb") as f:
+        f.write(_PREFIJO.pack(MAGIA, VERSION, len(cuerpo_cabecera)))
+        f.write(cuerpo_cabecera)
+        for seccion in secciones:
+            f.write(seccion)
+            f.write(b"\0" * (-len(seccion) % 8))
+    os.replace(ruta_politica + ".tmp", ruta_politica)
+    return n
+
+
+class PoliticaCompilada:
+    def __init__(self, ruta_politica):
+        """Abre (mmap, solo lectura) un archivo de compilar_politica. ValueError si no es válido."""
+        self.ruta = ruta_politica
+        self._archivo = open(ruta_politica, "rb")
+        try:
+            self._mapa = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            magia, version, largo_cabecera = _PREFIJO.unpack_from(self._mapa, 0)
+            if magia != MAGIA or version != VERSION:
+                raise ValueError(f"{ruta_politica} no es una política compilada (versión {VERSION})")
+            self.cabecera = json.loads(self._mapa[_PREFIJO.size:_PREFIJO.size + largo_cabecera])
+        except (ValueError, struct.error, OSError):
+            self.cerrar()
+            raise
+
+        c = self.cabecera
+        self.n, self.largo, self.acciones = c["n"], c["largo"], c["acciones"]
+        n_acciones = len(self.acciones)
+        vista = memoryview(self._mapa)
+        o_claves, o_q, o_indice, o_presente, o_largos = c["offsets"]
+        self._claves = vista[o_claves:o_claves + 8 * self.n * self.largo].cast("d")
+        self._q = vista[o_q:o_q + 8 * self.n * n_acciones].cast("d")
+        self._indice = vista[o_indice:o_indice + 8 * c["slots"]].cast("q")
+        self._presente = vista[o_presente:o_presente + self.n * n_acciones]
+        self._largos = vista[o_largos:o_largos + 2 * self.n].cast("H")
+        self._vistas = [vista, self._claves, self._q, self._indice, self._presente, self._largos]
+
+    def vigente(self, origen):
+        """True si el archivo es de la base `origen` (_firma_origen) y de este Python (mismo hash)."""
+        compilado = self.cabecera.get("origen") or {}
+        return (all(compilado.get(k) == v for k, v in origen.items())
+                and self.cabecera.get("hash_prueba") == _HASH_PRUEBA)
+
+    def estado(self, fila):
+        inicio = fila * self.largo
+        return _decodificar(self._claves[inicio:inicio + self._largos[fila]].tolist())
+
+    def fila(self, estado):
+        """Fila del estado (-1 si no está)."""
+        if not self.n or not isinstance(estado, tuple) or len(estado) > self.largo:
+            return -1
+        try:
+            h = _hash_estado(estado)
+        except TypeError:
+            return -1
+        mascara = len(self._indice) - 1
+        slot = h & mascara
+        while True:
+            fila = self._indice[slot]
+            if fila < 0:
+                return -1
+            if self.estado(fila) == estado:
+                return fila
+            slot = (slot + 1) & mascara
+
+    def valores(self, fila):
+        """{accion: Q} de la fila (solo las acciones presentes)."""
+        n_acciones = len(self.acciones)
+        q = self._q[fila * n_acciones:(fila + 1) * n_acciones].tolist()
+        presente = self._presente[fila * n_acciones:(fila + 1) * n_acciones]
+        return {a: q[i] for i, a in enumerate(self.acciones) if presente[i]}
+
+    def cerrar(self):
+        for vista in getattr(self, "_vistas", []):
+            vista.release()
+        self._vistas = []
+        if getattr(self, "_mapa", None) is not None:
+            self._mapa.close()
+            self._mapa = None
+        self._archivo.close()
+
+
+class QTableCompilada:
+    """
+    Q-table con la interfaz de dict: PoliticaCompilada de solo lectura + dict superpuesto
+    con las filas leídas, modificadas o nuevas.
+    """
+
+    def __init__(self, politica):
+        self.politica = politica
+        self._superpuestas = {}
+        self._nuevas = 0        # estados del dict superpuesto que no están en el archivo
+        self._borradas = set()  # estados del archivo borrados (poda_q_table.py)
+
+    def _indice(self, state):
+        # Fila del estado en el archivo, o -1 si no está (o se borró)
+        if self._borradas and state in self._borradas:
+            return -1
+        return self.politica.fila(state)
+
+    def __contains__(self, state):
+        return state in self._superpuestas or self._indice(state) >= 0
+
+    def __getitem__(self, state):
+        fila = self._superpuestas.get(state)
+        if fila is not None:
+            return fila
+        indice = self._indice(state)
+        if indice < 0:
+            raise KeyError(state)
+        # Se copia al dict superpuesto para que q_table[state][action] = ... quede guardado
+        fila = self._superpuestas[state] = self.politica.valores(indice)
+        return fila
+
+    def leer(self, state):
+        """Como q_table[state], pero sin copiar la fila al dict superpuesto (solo lectura)."""
+        fila = self._superpuestas.get(state)
+        if fila is not None:
+            return fila
+        indice = self._indice(state)
+        if indice < 0:
+            raise KeyError(state)
+        return self.politica.valores(indice)
+
+    def __setitem__(self, state, valores):
+        if state not in self._superpuestas and self._indice(state) < 0:
+            self._nuevas += 1
+        self._superpuestas[state] = valores
+
+    def __delitem__(self, state):
+        en_archivo = self._indice(state) >= 0
+        if state in self._superpuestas:
+            del self._superpuestas[state]
+            if not en_archivo:
+                self._nuevas -= 1
+        elif not en_archivo:
+            raise KeyError(state)
+        if en_archivo:
+            self._borradas.add(state)
+
+    def en_memoria(self):
+        """Estados con fila en el dict superpuesto (leídos, modificados o nuevos): lo único que ocupa heap."""
+        return self._superpuestas.keys()
+
+    def descartar(self, state):
+        """
+        Saca la fila de `state` del dict superpuesto sin marcar nada en el archivo: un estado
+        nuevo deja de existir y uno del archivo vuelve a los valores del archivo.
+
+        Retorna:
+        - True si el valor visible del estado cambió (estado nuevo, o fila del archivo modificada).
+        """
+        fila = self._superpuestas.pop(state)
+        indice = self._indice(state)
+        if indice < 0:
+            self._nuevas -= 1
+            return True
+        return dict(fila) != self.politica.valores(indice)
+
+    def get(self, state, default=None):
+        try:
+            return self[state]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self.politica.n + self._nuevas - len(self._borradas)
+
+    def __iter__(self):
+        yield from self._superpuestas
+        for fila in range(self.politica.n):
+            estado = self.politica.estado(fila)
+            if estado not in self._superpuestas and estado not in self._borradas:
+                yield estado
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        """(estado, fila) sin copiar al dict superpuesto las filas que solo se leen."""
+        yield from self._superpuestas.items()
+        for fila in range(self.politica.n):
+            estado = self.politica.estado(fila)
+            if estado not in self._superpuestas and estado not in self._borradas:
+                yield estado, self.politica.valores(fila)
+
+    def a_dict(self):
+        return dict(self.items())
+
+    def copy(self):
+        return self.a_dict()
+
+    def foto(self):
+        """Copia que no ve los updates siguientes: copia solo el dict superpuesto; el archivo es de solo lectura."""
+        tabla = QTableCompilada(self.politica)
+        tabla._superpuestas = {s: dict(fila) for s, fila in self._superpuestas.items()}
+        tabla._nuevas = self._nuevas
+        tabla._borradas = set(self._borradas)
+        return tabla
+
+    def __reduce__(self):
+        # Se serializa como el dict de siempre (q_table_*.pkl)
+        return dict, (self.a_dict(),)
+
+
+def cargar_politica(ruta, ruta_politica=None, acciones=(), hasta=None):
+    """
+    Como cargar_checkpoint(ruta), pero la base se abre desde la política compilada
+    (mmap) si está vigente. Si no existe o es de otra base, se carga el pickle y se
+    compila para la próxima ejecución.
+
+    Parámetros:
+    - ruta: Q-table (base del checkpoint incremental o pickle dict).
+    - ruta_politica: archivo compilado (por defecto ruta + ".politica").
+    - acciones: orden de columnas al compilar (SHOVEL_NAMES).
+    - hasta: igual que en cargar_checkpoint.
+
+    Retorna:
+    - (q_table, info): QTableCompilada o dict, e info de cargar_checkpoint con "compilada"
+      (True si se usó el archivo compilado).
+    """
+    ruta_politica = ruta_politica or ruta + ".politica"
+    origen = _firma_origen(ruta)
+    if os.path.exists(ruta_politica):
+        try:
+            politica = PoliticaCompilada(ruta_politica)
+        except (ValueError, OSError) as e:
+            diag(RESUMEN, "[Política] No se pudo abrir {}: {!r}", ruta_politica, e)
+        else:
+            if politica.vigente(origen):
+                q_table = QTableCompilada(politica)
+                crc = politica.cabecera["origen"]["crc"]
+                cabecera, registros = _leer_registros(ruta + ".delta", crc)
+                info = _aplicar_registros(q_table, crc, cabecera, registros, hasta)
+                info["compilada"] = True
+                return q_table, info
+            politica.cerrar()
+
+    base, crc = _leer_base(ruta)
+    try:
+        compilar_politica(base, ruta_politica, acciones, origen={**origen, "crc": crc})
+    except (ValueError, OSError) as e:
+        diag(RESUMEN, "[Política] No se pudo compilar {}: {!r}", ruta_politica, e)
+    cabecera, registros = _leer_registros(ruta + ".delta", crc)
+    info = _aplicar_registros(base, crc, cabecera, registros, hasta)
+    info["compilada"] = False
+    return base, info
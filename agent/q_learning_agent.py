@@ -1,5 +1,9 @@
-import numpy as np
 import random
+
+try:
+    from .diagnostico import diag, NORMAL
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from diagnostico import diag, NORMAL
 # =========================
 # Clase del agente Q-Learning
 # =========================
@@ -57,6 +61,14 @@ class QLearningAgent:
         # Evita que el agente deje de explorar completamente.
         self.epsilon_min = epsilon_min
 
+        # Estados cuya fila cambió desde el último checkpoint incremental (checkpoint_delta).
+        # None = sin seguimiento (no cuesta nada hasta que un CheckpointDelta lo activa).
+        self.cambios = None
+
+        # Visitas y último momento visto por estado (poda_q_table.RegistroVisitas).
+        # None = sin seguimiento (lo activa una PodaQTable).
+        self.visitas = None
+
 
     """
     1. Convierte un estado representado como diccionario (dict) en una tupla,
@@ -95,6 +107,10 @@ class QLearningAgent:
         #Si el estado no se ha sido visto nunca antes, lo agrega a la tabla Q, pero le asigna Q-valores 0.0 para todas las acciones válidas
         if key not in self.q_table:
             self.q_table[key] = {a: 0.0 for a in valid_actions}
+            if self.cambios is not None:
+                self.cambios.add(key)
+        if self.visitas is not None:
+            self.visitas.visitar(key)
 
         # Exploración (Nos permite que el agente explore todo el entorno sin importar si obtiene recompensas)
         if random.random() < self.epsilon:
@@ -133,7 +149,7 @@ class QLearningAgent:
         # Paso 1: Inicializar el estado actual si no existe en la Q-table
         # Si el estado no existe, se inicializa con todas las acciones posibles (self.actions) y valor Q = 0.0
         if state_key not in self.q_table:
-            print(f"[Estado] Agregado: {state_key}")
+            diag(NORMAL, "[Estado] Agregado: {}", state_key)
             self.q_table[state_key] = {a: 0.0 for a in self.actions}
         
         # Paso 2: Inicializar el siguiente estado si no existe en la Q-table
@@ -144,11 +160,11 @@ class QLearningAgent:
 
         if next_key not in self.q_table:
             if next_valid_actions:
-                print(f"[Siguiente Estado] Agregado: {next_key}")
+                diag(NORMAL, "[Siguiente Estado] Agregado: {}", next_key)
                 self.q_table[next_key] = {a: 0.0 for a in next_valid_actions}
             else:
                 # Asegura que el estado al menos exista (sin acciones válidas)
-                print(f"[Siguiente Estado sin acciones válidas: {next_key}")
+                diag(NORMAL, "[Siguiente Estado sin acciones válidas: {}", next_key)
                 self.q_table[next_key] = {}
 
         
@@ -170,6 +186,12 @@ class QLearningAgent:
 
         # Actualización del valor Q(s,a) en la tabla
         self.q_table[state_key][action] = q_predict + self.alpha * (q_target - q_predict)
+        if self.cambios is not None:
+            self.cambios.add(state_key)
+            self.cambios.add(next_key)  # puede ser un estado recién agregado
+        if self.visitas is not None:
+            self.visitas.ver(state_key)
+            self.visitas.ver(next_key)
 
     
     """
@@ -0,0 +1,512 @@
+import random
+import pickle
+import numpy as np
+
+try:
+    from .q_learning_agent import QLearningAgent
+    from .diagnostico import diag, NORMAL
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from q_learning_agent import QLearningAgent
+    from diagnostico import diag, NORMAL
+
+# =========================================================
+# Motor de Q-table respaldado por una matriz NumPy
+# =========================================================
+"""
+Alternativa a la Q-table en diccionarios de QLearningAgent.
+
+Cada estado (tupla) se interna a una fila entera y cada acción (nombre de pala)
+a una columna de una matriz float32/float64 que crece por duplicación:
+
+    estados:  {(404, 16788, 0, 2, ...): 0, (405, 16788, 1, 2, ...): 1, ...}
+    acciones: {"PH002": 0, "EX004": 1, ...}
+    q:        [[0.3, -1.1, ...],
+               [1.2,  0.5, ...]]
+
+Una matriz booleana paralela (`presente`) recuerda qué pares (estado, acción)
+existen en el formato de diccionario, para que la conversión ida y vuelta con
+los `q_table_real.pkl` existentes sea exacta.
+
+Con seguir_cambios() la tabla además marca las filas que se escriben (estados nuevos,
+updates, updates por lote); tomar_cambios() las devuelve y limpia las marcas. Es el
+equivalente de `agent.cambios` del agente de diccionarios, para el checkpoint incremental.
+"""
+
+
+class _FilaQ:
+    """
+    Vista de una fila de la matriz con la interfaz de dict {accion: Q}.
+    Permite que el código existente siga usando q_table[state][action],
+    q_table[state].get(a, 0.0), .items(), .values(), etc.
+    """
+    __slots__ = ("_tabla", "_fila")
+
+    def __init__(self, tabla, fila):
+        self._tabla = tabla
+        self._fila = fila
+
+    def _columnas_presentes(self):
+        return np.flatnonzero(self._tabla._presente[self._fila, :len(self._tabla.acciones)])
+
+    def __getitem__(self, action):
+        col = self._tabla._indice_acciones.get(action)
+        if col is None or not self._tabla._presente[self._fila, col]:
+            raise KeyError(action)
+        return float(self._tabla._q[self._fila, col])
+
+    def __setitem__(self, action, value):
+        col = self._tabla.columna(action)
+        self._tabla._q[self._fila, col] = value
+        self._tabla._presente[self._fila, col] = True
+        if self._tabla._sucias is not None:
+            self._tabla._sucias[self._fila] = True
+
+    def __contains__(self, action):
+        col = self._tabla._indice_acciones.get(action)
+        return col is not None and bool(self._tabla._presente[self._fila, col])
+
+    def get(self, action, default=None):
+        col = self._tabla._indice_acciones.get(action)
+        if col is None or not self._tabla._presente[self._fila, col]:
+            return default
+        return float(self._tabla._q[self._fila, col])
+
+    def keys(self):
+        acciones = self._tabla.acciones
+        return [acciones[c] for c in self._columnas_presentes()]
+
+    def values(self):
+        return [float(v) for v in self._tabla._q[self._fila, self._columnas_presentes()]]
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return int(self._columnas_presentes().size)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class QTableArray:
+    """
+    Q-table con estados internados a filas y acciones a columnas.
+
+    Parámetros:
+    - actions: acciones conocidas de antemano (orden de columnas inicial).
+    - dtype: np.float64 (por defecto, resultados idénticos al dict) o np.float32 (mitad de memoria).
+    - capacidad_inicial: filas reservadas; la matriz se duplica al llenarse.
+    """
+
+    def __init__(self, actions=(), dtype=np.float64, capacidad_inicial=1024):
+        self.dtype = np.dtype(dtype)
+        self._indice_estados = {}   # estado (tuple) -> fila
+        self._estados = []          # fila -> estado (tuple)
+        self._indice_acciones = {}  # accion -> columna
+        self.acciones = []          # columna -> accion
+        capacidad_inicial = max(int(capacidad_inicial), 1)
+        self._q = np.zeros((capacidad_inicial, max(len(actions), 1)), dtype=self.dtype)
+        self._presente = np.zeros(self._q.shape, dtype=bool)
+        self._sucias = None         # filas escritas desde tomar_cambios() (None = sin seguimiento)
+        for a in actions:
+            self.columna(a)
+
+    # -----------------------------
+    # Internado de acciones/estados
+    # -----------------------------
+    def columna(self, action):
+        """Devuelve la columna de una acción, creándola si es nueva."""
+        col = self._indice_acciones.get(action)
+        if col is None:
+            col = len(self.acciones)
+            if col >= self._q.shape[1]:
+                self._redimensionar(self._q.shape[0], max(2 * self._q.shape[1], col + 1))
+            self._indice_acciones[action] = col
+            self.acciones.append(action)
+        return col
+
+    def columnas(self, actions):
+        """Array de columnas para una lista de acciones (en el mismo orden)."""
+        return np.fromiter((self.columna(a) for a in actions), dtype=np.intp, count=len(actions))
+
+    def fila(self, state):
+        """Fila de un estado o None si no existe."""
+        return self._indice_estados.get(state)
+
+    def agregar_estado(self, state, actions=()):
+        """
+        Agrega un estado nuevo con Q=0.0 para `actions` (equivale a
+        q_table[state] = {a: 0.0 for a in actions}). Si ya existe, devuelve su fila sin modificarla.
+        """
+        fila = self._indice_estados.get(state)
+        if fila is not None:
+            return fila
+        fila = len(self._estados)
+        if fila >= self._q.shape[0]:
+            self._redimensionar(2 * self._q.shape[0], self._q.shape[1])
+        self._indice_estados[state] = fila
+        self._estados.append(state)
+        cols = self.columnas(actions)
+        self._q[fila, cols] = 0.0
+        self._presente[fila, cols] = True
+        if self._sucias is not None:
+            self._sucias[fila] = True
+        return fila
+
+    def filas_de(self, states, actions=()):
+        """Filas de una lista de estados; los que no existen se agregan con Q=0.0 para `actions`."""
+        return np.fromiter((self.agregar_estado(s, actions) for s in states), dtype=np.intp, count=len(states))
+
+    def _redimensionar(self, filas, cols):
+        q = np.zeros((filas, cols), dtype=self.dtype)
+        presente = np.zeros((filas, cols), dtype=bool)
+        f, c = self._q.shape
+        q[:f, :c] = self._q
+        presente[:f, :c] = self._presente
+        self._q, self._presente = q, presente
+        if self._sucias is not None and filas != f:
+            sucias = np.zeros(filas, dtype=bool)
+            sucias[:f] = self._sucias
+            self._sucias = sucias
+
+    # -----------------------------
+    # Seguimiento de filas modificadas (checkpoint incremental)
+    # -----------------------------
+    def seguir_cambios(self):
+        """Empieza (o reinicia) el seguimiento de filas escritas, sin ninguna marcada."""
+        self._sucias = np.zeros(self._q.shape[0], dtype=bool)
+
+    def marcar(self, filas):
+        """Marca filas escritas por fuera de la tabla (p. ej. copiadas desde una Q compartida)."""
+        if self._sucias is not None:
+            self._sucias[filas] = True
+
+    def tomar_cambios(self):
+        """
+        Filas escritas desde la llamada anterior (o desde seguir_cambios) y limpia las marcas.
+        Retorna None si el seguimiento no está activo.
+        """
+        if self._sucias is None:
+            return None
+        filas = np.flatnonzero(self._sucias[:len(self._estados)])
+        self._sucias[filas] = False
+        return filas
+
+    # -----------------------------
+    # Vistas de la matriz
+    # -----------------------------
+    @property
+    def q(self):
+        """Matriz Q recortada a (n_estados, n_acciones). Es una vista, no una copia."""
+        return self._q[:len(self._estados), :len(self.acciones)]
+
+    @property
+    def presente(self):
+        return self._presente[:len(self._estados), :len(self.acciones)]
+
+    @property
+    def estados(self):
+        return self._estados
+
+    @property
+    def nbytes(self):
+        """Memoria reservada por las matrices (incluye la capacidad libre)."""
+        return self._q.nbytes + self._presente.nbytes
+
+    # -----------------------------
+    # Interfaz tipo dict (compatibilidad)
+    # -----------------------------
+    def __contains__(self, state):
+        return state in self._indice_estados
+
+    def __len__(self):
+        return len(self._estados)
+
+    def __iter__(self):
+        return iter(self._estados)
+
+    def __getitem__(self, state):
+        return _FilaQ(self, self._indice_estados[state])
+
+    def __setitem__(self, state, valores):
+        fila = self.agregar_estado(state)
+        self._q[fila, :] = 0.0
+        self._presente[fila, :] = False
+        for a, v in valores.items():
+            col = self.columna(a)
+            self._q[fila, col] = v
+            self._presente[fila, col] = True
+        self.marcar(fila)
+
+    def get(self, state, default=None):
+        fila = self._indice_estados.get(state)
+        return default if fila is None else _FilaQ(self, fila)
+
+    def keys(self):
+        return list(self._estados)
+
+    def items(self):
+        return [(s, _FilaQ(self, f)) for f, s in enumerate(self._estados)]
+
+    def copy(self):
+        """Copia en el formato de diccionario original."""
+        return self.a_dict()
+
+    def foto(self):
+        """Copia que no ve los updates siguientes (copia de las matrices recortadas, sin convertir a dict)."""
+        tabla = QTableArray.__new__(QTableArray)
+        tabla.__dict__.update(self.__getstate__())
+        tabla._indice_estados = dict(self._indice_estados)
+        tabla._estados = list(self._estados)
+        tabla._indice_acciones = dict(self._indice_acciones)
+        tabla.acciones = list(self.acciones)
+        return tabla
+
+    # -----------------------------
+    # Conversión con el formato pickle existente
+    # -----------------------------
+    def a_dict(self):
+        """Convierte a {estado: {accion: Q}} (formato de q_table_real.pkl)."""
+        q = self.q.tolist()
+        presente = self.presente
+        acciones = self.acciones
+        return {
+            state: {acciones[c]: q[f][c] for c in np.flatnonzero(presente[f])}
+            for f, state in enumerate(self._estados)
+        }
+
+    @classmethod
+    def desde_dict(cls, q_table, actions=(), dtype=np.float64):
+        """Construye la tabla a partir de {estado: {accion: Q}}."""
+        tabla = cls(actions, dtype=dtype, capacidad_inicial=max(len(q_table), 1))
+        for state, valores in q_table.items():
+            fila = tabla.agregar_estado(state)
+            for a, v in valores.items():
+                col = tabla.columna(a)
+                tabla._q[fila, col] = v
+                tabla._presente[fila, col] = True
+        return tabla
+
+    def __getstate__(self):
+        # Se descarta la capacidad libre al serializar
+        estado = self.__dict__.copy()
+        estado["_q"] = self.q.copy()
+        estado["_presente"] = self.presente.copy()
+        estado["_sucias"] = None  # el seguimiento es del proceso que escribe los checkpoints
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self.__dict__.setdefault("_sucias", None)  # pickles anteriores al seguimiento de cambios
+        if self._q.shape[0] == 0 or self._q.shape[1] == 0:
+            self._redimensionar(max(self._q.shape[0], 1), max(self._q.shape[1], 1))
+
+
+def cargar_q_table_pickle(path, actions=(), dtype=np.float64):
+    """Carga un q_table_*.pkl (dict) y lo convierte a QTableArray."""
+    with open(path, "rb") as f:
+        return QTableArray.desde_dict(pickle.load(f), actions, dtype=dtype)
+
+
+def guardar_q_table_pickle(tabla, path):
+    """Guarda una QTableArray en el formato dict original (legible por QLearningAgent)."""
+    with open(path, "wb") as f:
+        pickle.dump(tabla.a_dict(), f)
+
+
+# =========================================================
+# Agente Q-Learning con la Q-table en matriz
+# =========================================================
+class ArrayQLearningAgent(QLearningAgent):
+    """
+    Misma API que QLearningAgent (choose_action / update / decay_epsilon) pero
+    con la Q-table en QTableArray. Con dtype=np.float64 y la misma semilla de
+    `random` produce exactamente las mismas decisiones y Q-valores.
+
+    `agent.q_table = pickle.load(f)` sigue funcionando: el dict se convierte al vuelo.
+    """
+
+    def __init__(self, actions, alpha=0.1, gamma=0.9, epsilon=0.7, epsilon_decay=0.995,
+                 epsilon_min=0.01, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self._cache_columnas = {}
+        super().__init__(actions, alpha=alpha, gamma=gamma, epsilon=epsilon,
+                         epsilon_decay=epsilon_decay, epsilon_min=epsilon_min)
+
+    @property
+    def q_table(self):
+        return self._tabla
+
+    @q_table.setter
+    def q_table(self, valor):
+        if isinstance(valor, QTableArray):
+            self._tabla = valor
+        else:
+            self._tabla = QTableArray.desde_dict(valor, self.actions, dtype=self.dtype)
+        self._cache_columnas = {}
+
+    def _columnas(self, actions):
+        # Las columnas de acciones existentes nunca cambian: se cachean por lista de acciones
+        clave = tuple(actions)
+        cols = self._cache_columnas.get(clave)
+        if cols is None:
+            cols = self._tabla.columnas(actions)
+            self._cache_columnas[clave] = cols
+        return cols
+
+    def choose_action(self, state, valid_actions):
+        tabla = self._tabla
+        fila = tabla._indice_estados.get(state)
+        if fila is None:
+            fila = tabla.agregar_estado(state, valid_actions)
+
+        # Exploración
+        if random.random() < self.epsilon:
+            self.last_action_was_random = True
+            return random.choice(valid_actions)
+
+        # Explotación: argmax devuelve el primer máximo, igual que max() sobre el dict
+        self.last_action_was_random = False
+        cols = self._columnas(valid_actions)
+        return valid_actions[int(np.argmax(tabla._q[fila, cols]))]
+
+    def update(self, state, action, reward, next_state, next_valid_actions):
+        tabla = self._tabla
+
+        # Paso 1 y 2: inicializar estados inexistentes (mismas reglas que QLearningAgent)
+        fila = tabla._indice_estados.get(state)
+        if fila is None:
+            diag(NORMAL, "[Estado] Agregado: {}", state)
+            fila = tabla.agregar_estado(state, self.actions)
+
+        fila_next = tabla._indice_estados.get(next_state)
+        if fila_next is None:
+            if next_valid_actions:
+                diag(NORMAL, "[Siguiente Estado] Agregado: {}", next_state)
+                fila_next = tabla.agregar_estado(next_state, next_valid_actions)
+            else:
+                diag(NORMAL, "[Siguiente Estado sin acciones válidas: {}", next_state)
+                fila_next = tabla.agregar_estado(next_state, ())
+
+        # Paso 3 y 4: Q(s,a) y objetivo r + γ·max Q(s',a')
+        col = tabla.columna(action)
+        q = tabla._q  # se lee después de agregar filas/columnas (la matriz puede haberse reasignado)
+        q_predict = float(q[fila, col])
+        q_target = reward
+        if next_valid_actions:
+            q_target += self.gamma * float(q[fila_next, self._columnas(next_valid_actions)].max())
+
+        q[fila, col] = q_predict + self.alpha * (q_target - q_predict)
+        tabla._presente[fila, col] = True
+        if tabla._sucias is not None:
+            tabla._sucias[fila] = True
+
+    # -----------------------------
+    # Ruta rápida por índices (estados ya internados, acciones como columnas)
+    # -----------------------------
+    def elegir_accion_fila(self, fila, cols):
+        """
+        choose_action para un estado ya internado. `cols` son las columnas de las acciones válidas;
+        devuelve la posición elegida dentro de `cols`. Consume `random` igual que choose_action.
+        """
+        if random.random() < self.epsilon:
+            self.last_action_was_random = True
+            return random.randrange(len(cols))
+        self.last_action_was_random = False
+        return int(np.argmax(self._tabla._q[fila, cols]))
+
+    def actualizar_fila(self, fila, col, reward, fila_next, cols_next):
+        """update para estados ya internados (fila, fila_next) y acción como columna."""
+        q = self._tabla._q
+        q_predict = float(q[fila, col])
+        q_target = reward
+        if len(cols_next):
+            q_target += self.gamma * float(q[fila_next, cols_next].max())
+        q[fila, col] = q_predict + self.alpha * (q_target - q_predict)
+        self._tabla._presente[fila, col] = True
+        if self._tabla._sucias is not None:
+            self._tabla._sucias[fila] = True
+
+    # -----------------------------
+    # Ruta por lotes (experience replay)
+    # -----------------------------
+    def elegir_acciones_filas(self, filas, cols, rng):
+        """
+        ε-greedy vectorizado para varios estados ya internados.
+        `rng` es un np.random.Generator (no consume el módulo `random`).
+        Devuelve las posiciones elegidas dentro de `cols`.
+        """
+        filas = np.asarray(filas, dtype=np.int64)
+        n = len(filas)
+        explora = rng.random(n) < self.epsilon
+        azar = rng.integers(len(cols), size=n)
+        greedy = np.argmax(self._tabla._q[filas][:, cols], axis=1) if n else azar
+        return np.where(explora, azar, greedy)
+
+    def update_lote(self, filas, cols, recompensas, filas_next, mascaras):
+        r"""
+        Aplica un mini-lote de transiciones con operaciones vectorizadas.
+
+        Los objetivos r + γ·max Q(s',a') se calculan con la Q-table al inicio del lote
+        (máscara sin acciones válidas -> solo r). Si un mismo par (s,a) aparece k veces,
+        el resultado equivale a aplicar sus k actualizaciones en orden (salvo redondeo):
+
+            Q ← (1-α)^k·Q + Σ_i α·(1-α)^(k-1-i)·objetivo_i
+
+        Parámetros:
+        - filas, cols: filas de estado y columnas de acción (n,).
+        - recompensas: (n,).
+        - filas_next: filas del siguiente estado (n,).
+        - mascaras: bool (n, n_acciones) con las acciones válidas del siguiente estado.
+
+        Retorna:
+        - array con |ΔQ| de cada par (s,a) distinto actualizado.
+        """
+        filas = np.asarray(filas, dtype=np.int64)
+        n = len(filas)
+        if n == 0:
+            return np.zeros(0)
+        cols = np.asarray(cols, dtype=np.int64)
+        mascaras = np.asarray(mascaras, dtype=bool)
+        tabla = self._tabla
+        q = tabla._q
+
+        # Objetivos con la Q-table antes del lote
+        q_next = q[np.asarray(filas_next, dtype=np.int64), :mascaras.shape[1]]
+        con_acciones = mascaras.any(axis=1)
+        max_next = np.where(mascaras, q_next, -np.inf).max(axis=1)
+        objetivo = np.asarray(recompensas, dtype=np.float64) + self.gamma * np.where(con_acciones, max_next, 0.0)
+
+        # Agrupar pares (s,a) repetidos; `pos` es el orden de llegada dentro de cada grupo
+        plano = filas * q.shape[1] + cols
+        unicos, inverso, conteos = np.unique(plano, return_inverse=True, return_counts=True)
+        orden = np.argsort(plano, kind="stable")
+        inicio_grupo = np.cumsum(conteos) - conteos
+        pos = np.empty(n, dtype=np.int64)
+        pos[orden] = np.arange(n) - np.repeat(inicio_grupo, conteos)
+
+        beta = 1.0 - self.alpha
+        pesos = self.alpha * beta ** (conteos[inverso] - 1 - pos)
+        acumulado = np.bincount(inverso, weights=pesos * objetivo, minlength=len(unicos))
+
+        q_plano = q.reshape(-1)  # vista de la matriz (contigua)
+        anterior = q_plano[unicos].astype(np.float64)
+        nuevo = beta ** conteos * anterior + acumulado
+        q_plano[unicos] = nuevo
+        tabla._presente.reshape(-1)[unicos] = True
+        tabla.marcar(filas)
+        return np.abs(nuevo - anterior)
+
+    def cargar_pickle(self, path):
+        """Carga un q_table_*.pkl en formato dict."""
+        self.q_table = cargar_q_table_pickle(path, self.actions, dtype=self.dtype)
+
+    def guardar_pickle(self, path):
+        """Guarda la Q-table en formato dict, compatible con QLearningAgent."""
+        guardar_q_table_pickle(self._tabla, path)
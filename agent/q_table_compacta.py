@@ -0,0 +1,330 @@
+import sys
+import math
+from array import array
+
+try:
+    from .q_learning_agent import QLearningAgent
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from q_learning_agent import QLearningAgent
+
+# =========================================================
+# Q-table compacta: una fila array('d') por estado
+# =========================================================
+"""
+En la Q-table de QLearningAgent cada estado guarda un dict {accion: Q}: con 6 palas
+son ~270 bytes del dict más 24 por cada float (~400 bytes por estado, sin contar la
+clave). TablaCompacta guarda por estado un solo array('d') con los Q-valores en el
+orden de columnas de las acciones (8 bytes por acción más la cabecera del array):
+
+    acciones: ["PH002", "EX004", ...]         (compartidas por toda la tabla)
+    filas:    {(404, 16788, 0, 2, ...): array('d', [0.3, nan, -1.1, ...]), ...}
+
+NaN marca una acción que no está en la fila (en el dict original esa clave no existe),
+así que la conversión ida y vuelta con los q_table_*.pkl es exacta. Una fila más corta
+que la lista de acciones (acción agregada después) tiene las acciones que faltan ausentes.
+
+q_table[state] devuelve una FilaQ (vista con __slots__ sobre el array) con la interfaz
+de dict: q_table[state][action], .get(a, 0.0), .items(), .values(), `in`, len, ...
+Asignar un dict (q_table[state] = {a: 0.0 for a in acciones}) lo convierte a array.
+Al serializar con pickle se escribe el dict de siempre.
+"""
+
+_AUSENTE = math.nan
+
+
+class FilaQ:
+    """Vista de la fila de un estado con la interfaz de dict {accion: Q}."""
+    __slots__ = ("_tabla", "_valores")
+
+    def __init__(self, tabla, valores):
+        self._tabla = tabla
+        self._valores = valores
+
+    def _columna(self, action):
+        # Columna de la acción si está presente en la fila, si no None
+        col = self._tabla._indice_acciones.get(action)
+        if col is None or col >= len(self._valores) or self._valores[col] != self._valores[col]:
+            return None
+        return col
+
+    def __getitem__(self, action):
+        col = self._columna(action)
+        if col is None:
+            raise KeyError(action)
+        return self._valores[col]
+
+    def __setitem__(self, action, value):
+        col = self._tabla.columna(action)
+        valores = self._valores
+        if col >= len(valores):
+            valores.extend([_AUSENTE] * (col + 1 - len(valores)))
+        valores[col] = value
+
+    def __delitem__(self, action):
+        col = self._columna(action)
+        if col is None:
+            raise KeyError(action)
+        self._valores[col] = _AUSENTE
+
+    def __contains__(self, action):
+        return self._columna(action) is not None
+
+    def get(self, action, default=None):
+        col = self._columna(action)
+        return default if col is None else self._valores[col]
+
+    def keys(self):
+        acciones = self._tabla.acciones
+        return [acciones[c] for c, v in enumerate(self._valores) if v == v]
+
+    def values(self):
+        return [v for v in self._valores if v == v]
+
+    def items(self):
+        acciones = self._tabla.acciones
+        return [(acciones[c], v) for c, v in enumerate(self._valores) if v == v]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for v in self._valores if v == v)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, otra):
+        if isinstance(otra, (FilaQ, dict)):
+            return self.copy() == dict(otra.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def __reduce__(self):
+        # Una fila suelta (p. ej. en los registros del checkpoint incremental) se guarda como dict
+        return dict, (self.copy(),)
+
+
+class TablaCompacta:
+    """
+    Q-table {estado: FilaQ} con una fila array('d') por estado.
+
+    Parámetros:
+    - actions: acciones conocidas de antemano (orden de columnas inicial).
+    """
+
+    def __init__(self, actions=()):
+        self._filas = {}            # estado (tuple) -> array('d')
+        self._indice_acciones = {}  # accion -> columna
+        self.acciones = []          # columna -> accion
+        for a in actions:
+            self.columna(a)
+
+    def columna(self, action):
+        """Devuelve la columna de una acción, creándola si es nueva."""
+        col = self._indice_acciones.get(action)
+        if col is None:
+            col = len(self.acciones)
+            self._indice_acciones[action] = col
+            self.acciones.append(action)
+        return col
+
+    def _fila_desde(self, valores):
+        # {accion: Q} (o FilaQ) -> array('d') con NaN en las acciones ausentes
+        fila = array("d", [_AUSENTE]) * len(self.acciones)
+        for a, v in valores.items():
+            col = self.columna(a)
+            if col >= len(fila):
+                fila.extend([_AUSENTE] * (col + 1 - len(fila)))
+            fila[col] = v
+        return fila
+
+    # -----------------------------
+    # Interfaz tipo dict
+    # -----------------------------
+    def __contains__(self, state):
+        return state in self._filas
+
+    def __getitem__(self, state):
+        return FilaQ(self, self._filas[state])
+
+    def __setitem__(self, state, valores):
+        self._filas[state] = self._fila_desde(valores)
+
+    def __delitem__(self, state):
+        del self._filas[state]
+
+    def get(self, state, default=None):
+        fila = self._filas.get(state)
+        return default if fila is None else FilaQ(self, fila)
+
+    def __len__(self):
+        return len(self._filas)
+
+    def __iter__(self):
+        return iter(self._filas)
+
+    def keys(self):
+        return self._filas.keys()
+
+    def values(self):
+        return [FilaQ(self, fila) for fila in self._filas.values()]
+
+    def items(self):
+        return [(s, FilaQ(self, fila)) for s, fila in self._filas.items()]
+
+    # -----------------------------
+    # Conversión con el formato pickle existente
+    # -----------------------------
+    def a_dict(self):
+        """Convierte a {estado: {accion: Q}} (formato de q_table_real.pkl)."""
+        acciones = self.acciones
+        return {s: {acciones[c]: v for c, v in enumerate(fila) if v == v} for s, fila in self._filas.items()}
+
+    def copy(self):
+        return self.a_dict()
+
+    def foto(self):
+        """Copia que no ve los updates siguientes (copia de los arrays, sin convertir a dict)."""
+        tabla = TablaCompacta(self.acciones)
+        tabla._filas = {s: array("d", fila) for s, fila in self._filas.items()}
+        return tabla
+
+    @classmethod
+    def desde_dict(cls, q_table, actions=()):
+        """Construye la tabla a partir de {estado: {accion: Q}}."""
+        tabla = cls(actions)
+        for state, valores in q_table.items():
+            tabla[state] = valores
+        return tabla
+
+    def __reduce__(self):
+        # Se serializa como el dict de siempre (q_table_*.pkl)
+        return dict, (self.a_dict(),)
+
+
+# =========================================================
+# Agente Q-Learning con la Q-table compacta
+# =========================================================
+class CompactoQLearningAgent(QLearningAgent):
+    """
+    Misma API y mismas decisiones que QLearningAgent (choose_action / update usan
+    q_table[state] como dict), con la Q-table en TablaCompacta.
+
+    `agent.q_table = pickle.load(f)` sigue funcionando: el dict se convierte al vuelo.
+    Otras Q-tables con interfaz de dict (p. ej. la QTableCompilada de politica_compilada.py,
+    ya abierta con mmap) se usan tal cual.
+    """
+
+    @property
+    def q_table(self):
+        return self._tabla
+
+    @q_table.setter
+    def q_table(self, valor):
+        if isinstance(valor, dict):
+            valor = TablaCompacta.desde_dict(valor, self.actions)
+        self._tabla = valor
+
+
+# =========================================================
+# Reporte de memoria por estado
+# =========================================================
+def _bytes_profundos(obj, vistos):
+    # sys.getsizeof recursivo sobre dicts, tuplas y listas; cada objeto cuenta una sola vez
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    total = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        total += sum(_bytes_profundos(k, vistos) + _bytes_profundos(v, vistos) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list)):
+        total += sum(_bytes_profundos(v, vistos) for v in obj)
+    return total
+
+
+def memoria_q_table(q_table):
+    """
+    Bytes de una Q-table (dict, TablaCompacta o QTableArray), separados en:
+    - filas: los Q-valores de los estados (dicts + floats, arrays o la matriz).
+    - indice: el dict estado -> fila y las tuplas de estado (iguales en los tres formatos).
+
+    Retorna:
+    - dict con estados, bytes_filas, bytes_indice, bytes_total y bytes_por_estado (solo filas).
+    """
+    vistos = set()
+    if isinstance(q_table, TablaCompacta):
+        filas = q_table._filas
+        bytes_filas = sum(sys.getsizeof(f) for f in filas.values())
+        bytes_indice = sys.getsizeof(filas) + sum(_bytes_profundos(s, vistos) for s in filas)
+    elif hasattr(q_table, "nbytes"):
+        # QTableArray: matrices Q y presente (con la capacidad libre) + lista de estados
+        bytes_filas = q_table.nbytes
+        bytes_indice = (sys.getsizeof(q_table._indice_estados) + sys.getsizeof(q_table._estados)
+                        + sum(_bytes_profundos(s, vistos) for s in q_table._estados))
+    else:
+        bytes_indice = sys.getsizeof(q_table) + sum(_bytes_profundos(s, vistos) for s in q_table)
+        bytes_filas = sum(_bytes_profundos(f, vistos) for f in q_table.values())
+    n = len(q_table)
+    return {"estados": n, "bytes_filas": bytes_filas, "bytes_indice": bytes_indice,
+            "bytes_total": bytes_filas + bytes_indice, "bytes_por_estado": bytes_filas / n if n else 0.0}
+
+
+def reporte_memoria(q_table, actions=()):
+    """
+    Memoria de la misma Q-table en formato dict, TablaCompacta y (si hay numpy) QTableArray.
+
+    Parámetros:
+    - q_table: {estado: {accion: Q}} (p. ej. pickle.load de q_table_real.pkl).
+    - actions: orden de columnas (SHOVEL_NAMES).
+
+    Retorna:
+    - {formato: memoria_q_table(...)}
+    """
+    reporte = {"dict": memoria_q_table(q_table),
+               "compacta": memoria_q_table(TablaCompacta.desde_dict(q_table, actions))}
+    try:
+        from .q_table_array import QTableArray
+    except ImportError:
+        try:
+            from q_table_array import QTableArray
+        except ImportError:  # sin numpy
+            QTableArray = None
+    if QTableArray is not None:
+        reporte["matriz"] = memoria_q_table(QTableArray.desde_dict(q_table, actions))
+    return reporte
+
+
+def imprimir_reporte_memoria(reporte):
+    base = reporte["dict"]["bytes_por_estado"]
+    print(f"{'formato':10} {'estados':>10} {'B/estado':>10} {'filas MB':>10} {'total MB':>10} {'vs dict':>8}")
+    for formato, r in reporte.items():
+        relacion = base / r["bytes_por_estado"] if r["bytes_por_estado"] else 0.0
+        print(f"{formato:10} {r['estados']:>10} {r['bytes_por_estado']:>10.1f} "
+              f"{r['bytes_filas'] / 2**20:>10.2f} {r['bytes_total'] / 2**20:>10.2f} {relacion:>7.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    try:
+        from .checkpoint_delta import cargar_checkpoint
+    except ImportError:
+        from checkpoint_delta import cargar_checkpoint
+
+    parser = argparse.ArgumentParser(description="Bytes por estado de una Q-table: dict vs compacta vs matriz")
+    parser.add_argument("qtable", nargs="?", help="q_table_*.pkl o checkpoint (base + .delta); sin él, una tabla sintética")
+    parser.add_argument("--estados", type=int, default=100_000, help="estados de la tabla sintética")
+    parser.add_argument("--palas", default="PH002,EX004,PH003,PH001,CF001,CF002")
+    args = parser.parse_args()
+
+    palas = args.palas.split(",")
+    if args.qtable:
+        # Con un checkpoint incremental también se aplica su log .delta (sin él, solo la base)
+        q_table, _ = cargar_checkpoint(args.qtable)
+    else:
+        rng = random.Random(0)
+        q_table = {(i, rng.randrange(8), rng.randrange(3)) + tuple(rng.randrange(-1, 5) for _ in palas):
+                   {a: rng.uniform(-20, 10) for a in palas} for i in range(args.estados)}
+    imprimir_reporte_memoria(reporte_memoria(q_table, palas))
@@ -0,0 +1,118 @@
+import numpy as np
+
+# =========================================================
+# Buffer de experiencias (experience replay) en arrays
+# =========================================================
+"""
+Buffer circular de capacidad fija con las transiciones del agente:
+
+    estado[k]     -> fila del estado en la Q-table (QTableArray)
+    accion[k]     -> columna de la acción tomada
+    recompensa[k] -> recompensa obtenida
+    siguiente[k]  -> fila del siguiente estado
+    mascara[k]    -> bool (n_acciones,): acciones válidas en el siguiente estado
+
+Cuando se llena, cada transición nueva reemplaza a la más antigua. Los lotes
+que devuelve (`muestrear` / `extraer`) tienen el formato que espera
+ArrayQLearningAgent.update_lote.
+"""
+
+
+class ReplayBuffer:
+    def __init__(self, capacidad, n_acciones):
+        """
+        Parámetros:
+        - capacidad: número máximo de transiciones guardadas.
+        - n_acciones: columnas de la Q-table (ancho de la máscara de acciones válidas).
+        """
+        if capacidad <= 0:
+            raise ValueError("La capacidad del buffer debe ser mayor que 0")
+        self.capacidad = int(capacidad)
+        self.n_acciones = int(n_acciones)
+        self.estado = np.zeros(self.capacidad, dtype=np.int64)
+        self.accion = np.zeros(self.capacidad, dtype=np.int64)
+        self.recompensa = np.zeros(self.capacidad, dtype=np.float64)
+        self.siguiente = np.zeros(self.capacidad, dtype=np.int64)
+        self.mascara = np.zeros((self.capacidad, self.n_acciones), dtype=bool)
+        self._pos = 0      # próxima posición a escribir
+        self._n = 0        # transiciones guardadas
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def llena(self):
+        return self._n == self.capacidad
+
+    def agregar(self, estado, accion, recompensa, siguiente, mascara):
+        """Agrega una transición (la más antigua se descarta si el buffer está lleno)."""
+        i = self._pos
+        self.estado[i] = estado
+        self.accion[i] = accion
+        self.recompensa[i] = recompensa
+        self.siguiente[i] = siguiente
+        self.mascara[i] = mascara
+        self._pos = (i + 1) % self.capacidad
+        self._n = min(self._n + 1, self.capacidad)
+
+    def agregar_lote(self, estados, acciones, recompensas, siguientes, mascaras):
+        """
+        Agrega n transiciones de una vez. `mascaras` puede ser (n, n_acciones) o
+        una sola máscara (n_acciones,) común a todas.
+        """
+        estados = np.asarray(estados, dtype=np.int64)
+        n = len(estados)
+        if n == 0:
+            return
+        mascaras = np.broadcast_to(np.asarray(mascaras, dtype=bool), (n, self.n_acciones))
+        # Si llegan más transiciones que la capacidad, solo sobreviven las últimas
+        inicio = max(0, n - self.capacidad)
+        idx = (self._pos + np.arange(inicio, n)) % self.capacidad
+        self.estado[idx] = estados[inicio:]
+        self.accion[idx] = np.asarray(acciones, dtype=np.int64)[inicio:]
+        self.recompensa[idx] = np.asarray(recompensas, dtype=np.float64)[inicio:]
+        self.siguiente[idx] = np.asarray(siguientes, dtype=np.int64)[inicio:]
+        self.mascara[idx] = mascaras[inicio:]
+        self._pos = int((self._pos + n) % self.capacidad)
+        self._n = min(self._n + n, self.capacidad)
+
+    def ajustar_acciones(self, n_acciones):
+        """Ensancha las máscaras si la Q-table agregó columnas (acciones nuevas quedan en False)."""
+        if n_acciones > self.n_acciones:
+            mascara = np.zeros((self.capacidad, n_acciones), dtype=bool)
+            mascara[:, :self.n_acciones] = self.mascara
+            self.mascara = mascara
+            self.n_acciones = int(n_acciones)
+
+    def _lote(self, idx):
+        return (self.estado[idx], self.accion[idx], self.recompensa[idx],
+                self.siguiente[idx], self.mascara[idx])
+
+    def _indices_en_orden(self):
+        # Posiciones ocupadas desde la más antigua a la más reciente
+        inicio = (self._pos - self._n) % self.capacidad
+        return (inicio + np.arange(self._n)) % self.capacidad
+
+    def muestrear(self, tamano, rng=None):
+        """
+        Lote aleatorio uniforme (con reemplazo) de `tamano` transiciones.
+        `rng` es un np.random.Generator (por defecto uno nuevo sin semilla).
+
+        Retorna:
+        - (estados, acciones, recompensas, siguientes, mascaras)
+        """
+        if self._n == 0:
+            raise ValueError("El buffer está vacío")
+        rng = rng if rng is not None else np.random.default_rng()
+        pos = rng.integers(self._n, size=int(tamano))
+        return self._lote(self._indices_en_orden()[pos])
+
+    def extraer(self):
+        """Devuelve todas las transiciones en orden de llegada y vacía el buffer."""
+        lote = self._lote(self._indices_en_orden())
+        self.vaciar()
+        return lote
+
+    def vaciar(self):
+        self._pos = 0
+        self._n = 0
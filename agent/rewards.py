@@ -5,6 +5,15 @@ Este módulo define la función de recompensa que utiliza el agente RL.
 Puedes modificar esta función para ajustar las penalizaciones o premios según tu dominio.
 
 """
+try:
+    from .arranque import importar_perezoso
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from arranque import importar_perezoso
+
+# numpy solo lo usan las versiones por lote; calcular_recompensa no lo necesita
+np = importar_perezoso("numpy")
+
+
 def calcular_recompensa(status, action, shovels_info, truck_etas=None):
     """
     Calcula la recompensa para una acción del agente RL.
@@ -83,6 +92,104 @@ def calcular_recompensa(status, action, shovels_info, truck_etas=None):
 
     return reward
 
+
+#=================================================
+# Versión vectorizada: matriz camión x pala en una llamada
+#=================================================
+ESTADOS_EN_MOVIMIENTO = ("loading", "moving load", "moving unload")
+
+
+def calcular_recompensa_lote(status, shovel_state, queue_count, etas, pala_presente=True):
+    """
+    Calcula de una vez la recompensa de todos los camiones hacia todas las palas.
+    Da exactamente los mismos valores que calcular_recompensa (que se mantiene como referencia).
+
+    Parámetros:
+    - status: secuencia (n_camiones,) con el status de cada camión (str o None).
+    - shovel_state: "state" de cada pala, (n_palas,) o (n_camiones, n_palas); -1 si falta.
+    - queue_count: "queue_count" de cada pala, misma forma; 0 si falta (igual que .get("queue_count", 0)).
+    - etas: matriz (n_camiones, n_palas) con la ETA de cada camión a cada pala; NaN si no hay ETA o es None.
+    - pala_presente: bool, misma forma que shovel_state; False -> la pala no está en shovels_info (-20).
+
+    Importante: el bonus por "pala más cercana" se calcula sobre TODAS las columnas de `etas`,
+    así que deben estar todas las palas del dict ETA del camión (no solo las acciones del agente).
+
+    Retorna:
+    - Matriz int64 (n_camiones, n_palas); la celda [i, j] = calcular_recompensa(status[i], pala_j, ...).
+    """
+    etas = np.asarray(etas, dtype=np.float64)
+    n, n_palas = etas.shape
+    state = np.broadcast_to(np.asarray(shovel_state, dtype=np.float64), (n, n_palas))
+    cola = np.broadcast_to(np.asarray(queue_count, dtype=np.float64), (n, n_palas))
+    presente = np.broadcast_to(np.asarray(pala_presente, dtype=bool), (n, n_palas))
+    status = list(status)
+    esperando = np.array([s == "waiting for shovel" for s in status], dtype=bool).reshape(n, 1)
+    moviendo = np.array([s in ESTADOS_EN_MOVIMIENTO for s in status], dtype=bool).reshape(n, 1)
+
+    activa = state == 1
+    reward = np.zeros((n, n_palas), dtype=np.int64)
+
+    # 1. Pala no activa
+    reward -= 10 * ~activa
+
+    # 2. Colas
+    reward += np.select([cola >= 3, cola == 2, cola == 1], [-4, -2, 1], default=3)
+
+    # 3. Camión esperando y pala activa
+    reward += 8 * (esperando & activa)
+
+    # 4. Camión en movimiento
+    reward -= 3 * moviendo
+
+    # 5. "Hang time": pala activa, sin cola y camión esperando
+    reward += 5 * (activa & (cola == 0) & esperando)
+
+    # 6. ETA (solo ETAs conocidas y >= 0)
+    eta_valida = ~np.isnan(etas) & (etas >= 0)
+    reward += np.where(eta_valida,
+                       np.select([etas < 3, etas < 6, etas < 9, etas < 12], [8, 5, 2, -1], default=-3),
+                       0)
+
+    # Bonus respecto a la mejor ETA entre palas activas (una sola reducción por camión)
+    min_eta = np.where(activa & eta_valida, etas, np.inf).min(axis=1, keepdims=True)
+    con_bonus = eta_valida & activa & np.isfinite(min_eta)
+    reward += np.where(con_bonus & (etas == min_eta), 4,
+                       np.where(con_bonus & (etas <= min_eta * 1.2), 2, 0))
+
+    # Acción completamente inválida
+    return np.where(presente, reward, -20)
+
+
+def calcular_recompensa_dict_lote(statuses, shovels_info, truck_etas_list, acciones):
+    """
+    Envoltorio de calcular_recompensa_lote para los dicts de un tick.
+
+    Parámetros:
+    - statuses: status de cada camión.
+    - shovels_info: dict de palas del tick ({pala: {"state": ..., "queue_count": ...}}).
+    - truck_etas_list: dict ETA de cada camión (o None).
+    - acciones: palas cuyas recompensas se devuelven (columnas del resultado).
+
+    Retorna:
+    - Matriz (n_camiones, len(acciones)).
+    """
+    palas = list(acciones)
+    vistas = set(palas)
+    for etas in truck_etas_list:
+        for name in (etas or {}):
+            if name not in vistas:
+                vistas.add(name)
+                palas.append(name)
+
+    infos = [shovels_info.get(name) for name in palas]
+    state = [np.nan if i is None or i.get("state", -1) is None else i.get("state", -1) for i in infos]
+    cola = [0 if i is None else i.get("queue_count", 0) for i in infos]
+    presente = [i is not None for i in infos]
+    etas = [[np.nan if (etas or {}).get(name) is None else etas[name] for name in palas] for etas in truck_etas_list]
+    matriz = calcular_recompensa_lote(statuses, state, cola, np.asarray(etas, dtype=np.float64).reshape(-1, len(palas)),
+                                      presente)
+    return matriz[:, :len(acciones)]
+
 """
 
 #=================================================
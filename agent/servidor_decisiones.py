@@ -0,0 +1,352 @@
+import json
+import socket
+import asyncio
+import http.client
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .state_builder import estados_tick
+    from .q_table_array import QTableArray
+    from .despacho import fila_asignacion
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from state_builder import estados_tick
+    from q_table_array import QTableArray
+    from despacho import fila_asignacion
+
+# =========================================================
+# API HTTP local de decisiones (asyncio + lotes)
+# =========================================================
+"""
+Servidor HTTP mínimo (solo biblioteca estándar) para que otros componentes del
+despacho pidan asignaciones sin lanzar un proceso de Python por tick:
+
+    POST /decidir     cuerpo: tick JSON (truck_states + shovel_states)
+                      respuesta: {"tick_id", "asignaciones": [{Truck, Shovel, Cost, Changed, ...}]}
+    POST /recargar    vuelve a leer la Q-table del disco (p. ej. después de un guardado del despachador)
+    GET  /salud       {"estado": "ok", "estados": n, "solicitudes": n, "lotes": n}
+
+Escucha en TCP (host, puerto) o en un socket Unix (ruta_unix).
+
+Las solicitudes que llegan juntas se agrupan: el loop de asyncio junta hasta
+`lote_max` ticks (esperando a lo sumo `espera_lote` segundos desde el primero) y
+decide todos los camiones de esos ticks en una sola pasada vectorizada
+(decidir_lote), que corre en un pool de hilos para no bloquear el loop.
+
+El servidor solo decide (no aprende): la Q-table es de solo lectura y los estados
+desconocidos se evalúan con Q=0 sin agregarse.
+
+Los estados se arman y validan tick por tick: un tick mal formado falla solo su
+solicitud, no las demás del lote.
+"""
+
+
+def _camiones_tick(i, tick, shovel_names, espec):
+    # (tick, truck_id, truck_info, estado, acciones_validas) de los camiones que esperan pala
+    estados = estados_tick(tick, shovel_names, espec)
+    camiones = []
+    for truck_id, truck_info in tick["truck_states"].items():
+        if truck_info.get("status") != "waiting for shovel":
+            continue
+        valid_actions = list(truck_info.get("ETA", {}).keys())
+        if valid_actions:
+            state = estados[truck_id]
+            hash(state)  # la pasada vectorizada busca el estado en la Q-table: debe ser una clave válida
+            camiones.append((i, truck_id, truck_info, state, valid_actions))
+    return camiones
+
+
+def decidir_lote(tabla, ticks, shovel_names, epsilon=0.0, rng=None, espec=None):
+    """
+    Decide los camiones "waiting for shovel" de varios ticks en una pasada.
+
+    Parámetros:
+    - tabla: QTableArray (solo lectura).
+    - ticks: lista de ticks (dicts con truck_states y shovel_states).
+    - shovel_names: orden de las palas del estado.
+    - epsilon: probabilidad de exploración (0.0 = siempre la acción de mayor Q).
+    - rng: np.random.Generator para la exploración.
+    - espec: EspecDiscretizacion de la Q-table (None = estado sin discretizar).
+
+    Retorna:
+    - una lista por tick: sus asignaciones (filas de despacho.fila_asignacion), o la
+      excepción que levantó ese tick si está mal formado (los demás se deciden igual).
+    """
+    camiones = []  # (tick, truck_id, truck_info, estado, acciones_validas)
+    errores = {}   # tick -> excepción
+    for i, tick in enumerate(ticks):
+        try:
+            camiones.extend(_camiones_tick(i, tick, shovel_names, espec))
+        except Exception as e:  # el tick queda fuera del lote; su solicitud recibe el error
+            errores[i] = e
+
+    resultados = [[] for _ in ticks]
+    n = len(camiones)
+    if n == 0:
+        return _con_errores(resultados, errores)
+
+    # Matriz (camiones, acciones válidas) en el orden de ETA de cada camión: argmax toma el primer
+    # máximo en ese orden, igual que choose_action. Estados/acciones desconocidos valen 0.0.
+    ancho = max(len(c[4]) for c in camiones)
+    filas = np.full(n, -1, dtype=np.intp)
+    cols = np.full((n, ancho), -1, dtype=np.intp)
+    n_validas = np.zeros(n, dtype=np.intp)
+    indice_acciones = tabla._indice_acciones
+    for k, (_, _, _, state, valid_actions) in enumerate(camiones):
+        fila = tabla.fila(state)
+        if fila is not None:
+            filas[k] = fila
+        cols[k, :len(valid_actions)] = [indice_acciones.get(a, -1) for a in valid_actions]
+        n_validas[k] = len(valid_actions)
+
+    mascara = np.arange(ancho) < n_validas[:, None]
+    valores = np.zeros((n, ancho), dtype=np.float64)
+    conocidos = mascara & (filas[:, None] >= 0) & (cols >= 0)
+    valores[conocidos] = tabla._q[np.broadcast_to(filas[:, None], cols.shape)[conocidos], cols[conocidos]]
+    valores[~mascara] = -np.inf
+    posiciones = valores.argmax(axis=1)
+
+    explora = np.zeros(n, dtype=bool)
+    if epsilon > 0:
+        rng = rng if rng is not None else np.random.default_rng()
+        explora = rng.random(n) < epsilon
+        azar = (rng.random(n) * n_validas).astype(np.intp)
+        posiciones = np.where(explora, azar, posiciones)
+
+    for k, (i, truck_id, truck_info, _, valid_actions) in enumerate(camiones):
+        if i in errores:
+            continue
+        try:
+            resultados[i].append(fila_asignacion(truck_id, truck_info, valid_actions[posiciones[k]], bool(explora[k])))
+        except Exception as e:
+            errores[i] = e
+    return _con_errores(resultados, errores)
+
+
+def _con_errores(resultados, errores):
+    for i, e in errores.items():
+        resultados[i] = e
+    return resultados
+
+
+class ServidorDecisiones:
+    def __init__(self, q_table, shovel_names, epsilon=0.0, lote_max=32, espera_lote=0.005, workers=2,
+                 cargar=None, semilla=None, espec=None):
+        """
+        Parámetros:
+        - q_table: dict {estado: {accion: Q}} o QTableArray.
+        - shovel_names: orden de las palas del estado.
+        - epsilon: exploración de las decisiones servidas.
+        - lote_max: ticks por pasada como máximo.
+        - espera_lote: segundos que se espera a más solicitudes después de la primera de un lote.
+        - workers: hilos del pool (y lotes que pueden decidirse a la vez).
+        - cargar(): función que devuelve la Q-table del disco, para POST /recargar.
+        - semilla: semilla de la exploración.
+        - espec: EspecDiscretizacion con la que se entrenó la Q-table.
+        """
+        self.tabla = self._como_tabla(q_table, shovel_names)
+        self.shovel_names = shovel_names
+        self.espec = espec
+        self.epsilon = epsilon
+        self.lote_max = max(int(lote_max), 1)
+        self.espera_lote = espera_lote
+        self.workers = max(int(workers), 1)
+        self.cargar = cargar
+        self.rng = np.random.default_rng(semilla)
+        self.solicitudes = 0
+        self.lotes = 0
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="decisiones")
+        self._cola = None
+        self._servidor = None
+        self._tarea_lotes = None
+
+    @staticmethod
+    def _como_tabla(q_table, shovel_names):
+        return q_table if isinstance(q_table, QTableArray) else QTableArray.desde_dict(q_table, shovel_names)
+
+    # -----------------------------
+    # Ciclo de vida
+    # -----------------------------
+    async def iniciar(self, host="127.0.0.1", puerto=8765, ruta_unix=None):
+        """Empieza a escuchar (puerto=0 elige uno libre; ver self.direccion)."""
+        self._cola = asyncio.Queue()
+        self._semaforo = asyncio.Semaphore(self.workers)
+        self._tarea_lotes = asyncio.create_task(self._loop_lotes())
+        if ruta_unix is not None:
+            self._servidor = await asyncio.start_unix_server(self._atender, path=ruta_unix)
+        else:
+            self._servidor = await asyncio.start_server(self._atender, host, puerto)
+        self.direccion = self._servidor.sockets[0].getsockname()
+        return self
+
+    async def detener(self):
+        self._servidor.close()
+        await self._servidor.wait_closed()
+        self._tarea_lotes.cancel()
+        self._pool.shutdown(wait=True)
+
+    async def servir(self, host="127.0.0.1", puerto=8765, ruta_unix=None):
+        """iniciar() y atender hasta que se cancele la tarea (Ctrl+C con asyncio.run)."""
+        await self.iniciar(host, puerto, ruta_unix)
+        try:
+            await self._servidor.serve_forever()
+        finally:
+            await self.detener()
+
+    # -----------------------------
+    # Lotes
+    # -----------------------------
+    async def decidir(self, tick):
+        """Encola un tick y espera sus asignaciones (lo usa POST /decidir)."""
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((tick, futuro))
+        return await futuro
+
+    async def _loop_lotes(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._semaforo.acquire()
+            lote = [await self._cola.get()]
+            limite = loop.time() + self.espera_lote
+            while len(lote) < self.lote_max:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.create_task(self._resolver_lote(lote))
+
+    async def _resolver_lote(self, lote):
+        loop = asyncio.get_running_loop()
+        try:
+            ticks = [tick for tick, _ in lote]
+            # Un generador propio por lote: los lotes pueden correr a la vez en hilos distintos
+            rng = self.rng.spawn(1)[0]
+            resultados = await loop.run_in_executor(self._pool, decidir_lote, self.tabla, ticks,
+                                                    self.shovel_names, self.epsilon, rng, self.espec)
+            for (_, futuro), asignaciones in zip(lote, resultados):
+                if futuro.done():
+                    continue
+                if isinstance(asignaciones, Exception):  # solo falla la solicitud del tick mal formado
+                    futuro.set_exception(asignaciones)
+                else:
+                    futuro.set_result(asignaciones)
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+        finally:
+            self.lotes += 1
+            self._semaforo.release()
+
+    async def recargar(self):
+        """Reemplaza la Q-table por la del disco (la tabla anterior sigue sirviendo a los lotes en curso)."""
+        loop = asyncio.get_running_loop()
+        self.tabla = await loop.run_in_executor(self._pool, lambda: self._como_tabla(self.cargar(), self.shovel_names))
+        return len(self.tabla)
+
+    # -----------------------------
+    # HTTP
+    # -----------------------------
+    async def _atender(self, reader, writer):
+        # HTTP/1.1 mínimo con keep-alive: una solicitud tras otra por conexión
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                metodo, ruta, _ = linea.decode("latin-1").split(" ", 2)
+                cabeceras = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    nombre, _, valor = h.decode("latin-1").partition(":")
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                cuerpo = await reader.readexactly(int(cabeceras.get("content-length", 0)))
+
+                estado, respuesta = await self._responder(metodo, ruta, cuerpo)
+                datos = json.dumps(respuesta, default=str).encode("utf-8")
+                cerrar = cabeceras.get("connection", "").lower() == "close"
+                writer.write(f"HTTP/1.1 {estado} {http.client.responses.get(estado, '')}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(datos)}\r\n"
+                             f"Connection: {'close' if cerrar else 'keep-alive'}\r\n\r\n".encode("latin-1") + datos)
+                await writer.drain()
+                if cerrar:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _responder(self, metodo, ruta, cuerpo):
+        if metodo == "GET" and ruta == "/salud":
+            return 200, {"estado": "ok", "estados": len(self.tabla), "solicitudes": self.solicitudes, "lotes": self.lotes}
+        if metodo == "POST" and ruta == "/recargar":
+            if self.cargar is None:
+                return 400, {"error": "El servidor no tiene una función de carga"}
+            try:
+                return 200, {"estados": await self.recargar()}
+            except Exception as e:  # archivo faltante o ilegible: se sigue sirviendo la tabla actual
+                return 500, {"error": repr(e)}
+        if metodo != "POST" or ruta != "/decidir":
+            return 404, {"error": f"Ruta no encontrada: {metodo} {ruta}"}
+        try:
+            tick = json.loads(cuerpo)
+        except ValueError as e:
+            return 400, {"error": f"JSON inválido: {e}"}
+        if not isinstance(tick, dict) or "truck_states" not in tick or "shovel_states" not in tick:
+            return 400, {"error": "El tick debe tener truck_states y shovel_states"}
+        self.solicitudes += 1
+        try:
+            asignaciones = await self.decidir(tick)
+        except Exception as e:
+            return 500, {"error": repr(e)}
+        return 200, {"tick_id": tick.get("tick_id"), "asignaciones": asignaciones}
+
+
+# -----------------------------
+# Cliente
+# -----------------------------
+class _ConexionUnix(http.client.HTTPConnection):
+    def __init__(self, ruta_unix, timeout=10.0):
+        super().__init__("localhost", timeout=timeout)
+        self.ruta_unix = ruta_unix
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.ruta_unix)
+
+
+class ClienteDecisiones:
+    def __init__(self, host="127.0.0.1", puerto=8765, ruta_unix=None, timeout=10.0):
+        """Cliente de ServidorDecisiones; reutiliza la conexión entre solicitudes."""
+        if ruta_unix is not None:
+            self._conexion = _ConexionUnix(ruta_unix, timeout=timeout)
+        else:
+            self._conexion = http.client.HTTPConnection(host, puerto, timeout=timeout)
+
+    def _pedir(self, metodo, ruta, cuerpo=None):
+        datos = None if cuerpo is None else json.dumps(cuerpo).encode("utf-8")
+        self._conexion.request(metodo, ruta, body=datos, headers={"Content-Type": "application/json"})
+        respuesta = self._conexion.getresponse()
+        contenido = json.loads(respuesta.read())
+        if respuesta.status != 200:
+            raise RuntimeError(f"{respuesta.status}: {contenido.get('error')}")
+        return contenido
+
+    def decidir(self, tick):
+        """Asignaciones de un tick (lista de filas Truck, Shovel, Cost, Changed, ...)."""
+        return self._pedir("POST", "/decidir", tick)["asignaciones"]
+
+    def recargar(self):
+        return self._pedir("POST", "/recargar")["estados"]
+
+    def salud(self):
+        return self._pedir("GET", "/salud")
+
+    def cerrar(self):
+        self._conexion.close()
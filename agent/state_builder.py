@@ -1,5 +1,15 @@
+from __future__ import annotations  # las anotaciones np.ndarray no importan numpy
 import json
-from typing import List, Tuple
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+try:
+    from .arranque import importar_perezoso
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from arranque import importar_perezoso
+
+# numpy solo lo usa la versión vectorizada; state_builder3 no lo necesita
+np = importar_perezoso("numpy")
 #-----------------------------------------------------------------------------------------------
 # Paso 1: Convierte el nivel de combustible (fuel) en un valor discreto (entero: 0, 1 o 2) para usarlo como parte del estado.
 def discretizar_fuel(fuel):
@@ -62,13 +72,14 @@ def discretizar_eta(eta):
 #======================================
 # Función principal: construir estados
 #======================================
-def state_builder3(tick_info: dict, ordered_shovel_names=None) -> List[Tuple]:
+def state_builder3(tick_info: dict, ordered_shovel_names=None, espec=None) -> List[Tuple]:
     """
     Construye una lista de estados para todos los camiones en un tick.
 
     Parámetros:
     - tick_info: diccionario que contiene 'truck_states' y 'shovel_states'.
     - ordered_shovel_names: lista fija para mantener el orden de las palas.
+    - espec: EspecDiscretizacion opcional (discretizacion.py) aplicada a cada estado.
 
     Retorna:
     - states: Lista de tuplas de estados, uno por camión.
@@ -187,10 +198,178 @@ def state_builder3(tick_info: dict, ordered_shovel_names=None) -> List[Tuple]:
         
         # Agregar el estado construido a la lista de estados
         states.append(tuple(state))
+
+    if espec is not None:
+        states = [espec.aplicar_estado(s, len(ordered_shovel_names)) for s in states]
     
     #return states, truck_names, state_labels
     return states, truck_names
 
+
+#==========================================================
+# Versión vectorizada: todos los camiones del tick a la vez
+#==========================================================
+# Bordes de los bins; equivalen a los if/elif de discretizar_eta y discretizar_fuel
+ETA_BORDES = (3.0, 6.0, 9.0, 12.0)
+FUEL_BORDES = (20.0, 50.0)
+
+# Atributos de pala en el orden en que state_builder3 los agrega al estado
+PALA_ATRIBUTOS = ["main_state", "queue_count", "priority", "coverage"]
+
+
+def _a_float(valor):
+    # None -> NaN para poder representarlo en la matriz (se revierte en estados_desde_matriz)
+    return np.nan if valor is None else valor
+
+
+def discretizar_position_lote(valores, bin_size=500):
+    """discretizar_position sobre un array (NaN o negativos -> -1)."""
+    valores = np.asarray(valores, dtype=np.float64)
+    validos = valores >= 0  # NaN >= 0 es False
+    return np.where(validos, np.floor_divide(np.where(validos, valores, 0), bin_size), -1)
+
+
+def discretizar_eta_lote(etas):
+    """discretizar_eta sobre un array (NaN -> -1)."""
+    etas = np.asarray(etas, dtype=np.float64)
+    bins = np.searchsorted(ETA_BORDES, etas, side="right")
+    return np.where(np.isnan(etas), -1, bins)
+
+
+def discretizar_fuel_lote(fuels):
+    """discretizar_fuel sobre un array (NaN -> 0)."""
+    fuels = np.asarray(fuels, dtype=np.float64)
+    bins = np.searchsorted(FUEL_BORDES, fuels, side="right")
+    return np.where(np.isnan(fuels), 0, bins)
+
+
+def construir_matriz_estados(pos_x, pos_y, status_codes, fuel, etas,
+                             main_state, queue_count, priority, coverage,
+                             spot_time, cycle):
+    """
+    Núcleo vectorizado del state builder, a partir de arrays ya extraídos.
+
+    Parámetros:
+    - pos_x, pos_y, status_codes, fuel: arrays (n_camiones,). NaN = dato ausente.
+    - etas: matriz (n_camiones, n_palas) con la ETA de cada camión a cada pala (NaN = sin ETA).
+    - main_state, queue_count, priority, coverage: arrays (n_palas,) con los valores crudos.
+    - spot_time, cycle: arrays (n_palas,) con shovel_spot_time y shovel_cycle() (0 si faltan).
+
+    Retorna:
+    - Matriz float64 (n_camiones, 4 + 6 * n_palas) con el mismo orden de columnas que state_builder3.
+    """
+    etas = np.asarray(etas, dtype=np.float64)
+    n, n_palas = etas.shape
+    X = np.empty((n, 4 + 6 * n_palas), dtype=np.float64)
+
+    # Parte 1: variables del camión
+    X[:, 0] = discretizar_position_lote(pos_x)
+    X[:, 1] = discretizar_position_lote(pos_y)
+    X[:, 2] = status_codes
+    X[:, 3] = discretizar_fuel_lote(fuel)
+
+    # Parte 1.2: ETA y Variable_Tiempo_Nuevo (solo palas activas), calculados una vez por pala
+    activa = np.asarray(main_state, dtype=np.float64) == 1
+    ajuste = np.asarray(spot_time, dtype=np.float64) + np.asarray(cycle, dtype=np.float64)
+    X[:, 4:4 + n_palas] = np.where(activa, discretizar_eta_lote(etas), -1)
+    X[:, 4 + n_palas:4 + 2 * n_palas] = np.where(activa & ~np.isnan(etas), etas - ajuste, -1)
+
+    # Parte 2: variables de pala, idénticas para todos los camiones del tick
+    inicio = 4 + 2 * n_palas
+    for valores in (main_state, queue_count, priority, coverage):
+        X[:, inicio:inicio + n_palas] = np.asarray(valores, dtype=np.float64)
+        inicio += n_palas
+    return X
+
+
+def state_builder_lote(tick_info: dict, ordered_shovel_names=None) -> Tuple[np.ndarray, List[str]]:
+    """
+    Construye los estados de todos los camiones de un tick en una sola pasada.
+
+    Parámetros:
+    - tick_info: diccionario que contiene 'truck_states' y 'shovel_states'.
+    - ordered_shovel_names: lista fija para mantener el orden de las palas.
+
+    Retorna:
+    - X: matriz (n_camiones, n_features); la fila i equivale a state_builder3(...)[0][i]
+      (usar estados_desde_matriz para obtener las tuplas).
+    - truck_names: Lista de nombres reales de los camiones.
+    """
+    truck_dict = tick_info.get("truck_states", {})
+    shovel_dict = tick_info.get("shovel_states", {})
+
+    if ordered_shovel_names is None:
+        ordered_shovel_names = sorted(shovel_dict.keys())
+
+    # Variables de pala: una sola vez por tick
+    palas = [shovel_dict.get(name, {}) for name in ordered_shovel_names]
+    atributos = [[_a_float(p.get(attr, -1)) for p in palas] for attr in PALA_ATRIBUTOS]
+    spot_time = [p.get("shovel_spot_time", 0) or 0 for p in palas]
+    cycle = [p.get("shovel_cycle()", 0) or 0 for p in palas]
+
+    # Variables de camión: una pasada sobre los camiones
+    n = len(truck_dict)
+    truck_names = list(truck_dict.keys())
+    pos_x = np.full(n, np.nan)
+    pos_y = np.full(n, np.nan)
+    status_codes = np.empty(n)
+    fuel = np.full(n, np.nan)
+    etas = np.full((n, len(ordered_shovel_names)), np.nan)
+
+    for i, truck_info in enumerate(truck_dict.values()):
+        position = truck_info.get("position", [-1, -1])
+        if len(position) > 0:
+            pos_x[i] = _a_float(position[0])
+        if len(position) > 1:
+            pos_y[i] = _a_float(position[1])
+        status_codes[i] = status_mapping.get(truck_info.get("status", ""), -1)
+        fuel[i] = _a_float(truck_info.get("tank_fuel_level", None))
+        eta_dict = truck_info.get("ETA", {})
+        if eta_dict:
+            etas[i] = [_a_float(eta_dict.get(name, None)) for name in ordered_shovel_names]
+
+    X = construir_matriz_estados(pos_x, pos_y, status_codes, fuel, etas, *atributos, spot_time, cycle)
+    return X, truck_names
+
+
+def estados_desde_matriz(X: np.ndarray, n_palas: int) -> List[Tuple]:
+    """
+    Convierte la matriz de state_builder_lote a las tuplas que devuelve state_builder3.
+    Las columnas discretas (posición, status, fuel, ETA) vuelven a int, los valores enteros
+    del resto también y los NaN a None, así que las tuplas son iguales (==, hash, repr en
+    los casos habituales) a las originales y sirven como claves de la Q-table.
+    """
+    n_discretas = 4 + n_palas
+    return tuplas_desde_matriz(X, [j < n_discretas for j in range(X.shape[1])])
+
+
+def tuplas_desde_matriz(X: np.ndarray, enteras) -> List[Tuple]:
+    """
+    Tuplas de estado desde una matriz cualquiera: las columnas marcadas en `enteras` pasan
+    a int y el resto como en estados_desde_matriz (enteros a int, NaN a None).
+    """
+    enteras = np.asarray(enteras, dtype=bool)
+    idx_enteras = np.flatnonzero(enteras)
+    idx_resto = np.flatnonzero(~enteras)
+    discretas = X[:, idx_enteras].astype(np.int64).tolist()
+    if not idx_resto.size:
+        return [tuple(d) for d in discretas]
+    continuas = [[None if v != v else (int(v) if v.is_integer() else v) for v in fila]
+                 for fila in X[:, idx_resto].tolist()]
+    if not idx_enteras.size or idx_enteras[-1] == idx_enteras.size - 1:
+        # Caso habitual: las enteras son las primeras columnas
+        return [tuple(d + c) for d, c in zip(discretas, continuas)]
+    reordenar = itemgetter(*np.argsort(np.concatenate([idx_enteras, idx_resto])).tolist())
+    return [reordenar(d + c) for d, c in zip(discretas, continuas)]
+
+
+def estados_tick(tick_info: dict, ordered_shovel_names, espec=None) -> Dict[str, Tuple]:
+    """Atajo para los loops de entrenamiento/producción: {truck_id: estado} de todo el tick."""
+    X, truck_names = state_builder_lote(tick_info, ordered_shovel_names)
+    if espec is not None:
+        return dict(zip(truck_names, espec.estados_desde_matriz(X, len(ordered_shovel_names))))
+    return dict(zip(truck_names, estados_desde_matriz(X, len(ordered_shovel_names))))
+
 """
 #########################################################################################################################################################################
 def validate_state_builder(json_path, tick_id):
@@ -0,0 +1,461 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+try:
+    from .state_builder import construir_matriz_estados, estados_desde_matriz, status_mapping
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from state_builder import construir_matriz_estados, estados_desde_matriz, status_mapping
+
+# =========================================================
+# Cache columnar compilada de archivos de ticks (MINE-hudbay-*.json)
+# =========================================================
+"""
+Compila una sola vez un archivo de ticks a columnas NumPy en disco y las abre con
+memory-map en los entrenamientos siguientes (sin json.load ni recorrer dicts).
+
+Estructura en disco (un directorio por archivo fuente + versión de esquema):
+
+    <cache_dir>/<nombre>.<sha256[:16]>.v<SCHEMA_VERSION>/
+        meta.json          -> tick_keys, nombres de camiones/palas/status, dtypes y formas
+        offsets.bin        -> (n_ticks + 1,) filas de camión de cada tick: [offsets[t], offsets[t+1])
+        camion.bin ...     -> columnas por fila de camión (n_filas,) o (n_filas, n_palas)
+        main_state.bin ... -> columnas por tick y pala (n_ticks, n_palas)
+
+Convenciones de valores (las mismas que usan state_builder3 y calcular_recompensa):
+- None en el JSON -> NaN.
+- Atributo de pala ausente -> -1 (spot_time y cycle ausentes -> 0).
+- Pala ausente en el tick -> todos sus atributos por defecto y ETAs en NaN.
+"""
+
+SCHEMA_VERSION = 1
+
+ATRIBUTOS_PALA = ["main_state", "state", "queue_count", "priority", "coverage"]
+
+# columna -> (dtype, ¿ancho = n_palas?, nivel)
+COLUMNAS = {
+    "offsets": ("int64", False, "offsets"),
+    # Por fila de camión
+    "camion": ("int32", False, "camion"),
+    "status": ("int16", False, "camion"),          # índice en meta["status"], -1 = sin status
+    "pos_x": ("float64", False, "camion"),
+    "pos_y": ("float64", False, "camion"),
+    "fuel": ("float64", False, "camion"),
+    "current_shovel": ("int16", False, "camion"),  # índice en meta["palas"], -1 = sin pala actual
+    "eta": ("float64", True, "camion"),
+    "eta_presente": ("bool", True, "camion"),      # la pala aparece como clave en el dict ETA
+    # Por tick y pala
+    "pala_presente": ("bool", True, "tick"),
+    "main_state": ("float64", True, "tick"),
+    "state": ("float64", True, "tick"),
+    "queue_count": ("float64", True, "tick"),
+    "queue_presente": ("bool", True, "tick"),      # calcular_recompensa usa 0 si falta, no -1
+    "priority": ("float64", True, "tick"),
+    "coverage": ("float64", True, "tick"),
+    "spot_time": ("float64", True, "tick"),
+    "cycle": ("float64", True, "tick"),
+}
+
+
+def _num(valor, campo):
+    if valor is None:
+        return np.nan
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Valor no numérico en '{campo}': {valor!r}")
+
+
+def hash_archivo(path, tamano_bloque=1 << 20):
+    """SHA-256 del archivo fuente, leído por bloques."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def tick_keys_ordenadas(tick_json):
+    """Claves numéricas del JSON en orden (ignora "Elementos_Estat", "Parametros_Globales", etc.)."""
+    return sorted([k for k in tick_json.keys() if k.isdigit()], key=int)
+
+
+def nombres_palas(tick_json, tick_keys):
+    """Palas que aparecen en shovel_states o como destino de alguna ETA, en orden de aparición."""
+    palas = {}
+    for k in tick_keys:
+        tick_data = tick_json[k]
+        for name in tick_data.get("shovel_states", {}):
+            palas.setdefault(name, None)
+        for truck_info in tick_data.get("truck_states", {}).values():
+            for name in (truck_info.get("ETA") or {}):
+                palas.setdefault(name, None)
+    return list(palas)
+
+
+# =========================================================
+# Escritura incremental
+# =========================================================
+class EscritorTicksCompilados:
+    """
+    Escribe ticks uno a uno al formato compilado sin mantenerlos en memoria:
+    cada columna se acumula en un buffer y se vuelca a su archivo .bin por bloques.
+
+    Parámetros:
+    - destino: directorio de salida (se crea).
+    - shovel_names: palas del archivo; fijan el ancho de las columnas por pala.
+    - filas_por_bloque: filas de camión acumuladas antes de volcar a disco.
+    """
+
+    def __init__(self, destino, shovel_names, filas_por_bloque=65536):
+        os.makedirs(destino, exist_ok=True)
+        self.destino = destino
+        self.palas = list(shovel_names)
+        self._indice_pala = {name: i for i, name in enumerate(self.palas)}
+        self._camiones = {}
+        self._status = {}
+        self._tick_keys = []
+        self._n_filas = 0
+        self._filas_por_bloque = filas_por_bloque
+        self._archivos = {col: open(os.path.join(destino, f"{col}.bin"), "wb") for col in COLUMNAS}
+        self._buffers = {col: [] for col in COLUMNAS}
+        self._buffers["offsets"].append(0)
+        # Con agregar_tick_columnas los buffers guardan arrays (bloques) en vez de valores sueltos
+        self._en_bloques = False
+        self._filas_pendientes = 0
+
+    def _codigo(self, vocab, valor):
+        codigo = vocab.get(valor)
+        if codigo is None:
+            codigo = len(vocab)
+            vocab[valor] = codigo
+        return codigo
+
+    def codigos(self, vocab, nombres):
+        """
+        Códigos de `nombres` en el vocabulario "camiones" o "status" (registra los nuevos).
+        Retorna un array int para usar con agregar_tick_columnas.
+        """
+        vocab = {"camiones": self._camiones, "status": self._status}[vocab]
+        return np.array([self._codigo(vocab, n) for n in nombres], dtype=np.int64)
+
+    def _cambiar_modo(self, en_bloques):
+        if self._en_bloques != en_bloques:
+            self._volcar()
+            self._en_bloques = en_bloques
+
+    def agregar_tick(self, tick_key, tick_data):
+        self._cambiar_modo(False)
+        n_palas = len(self.palas)
+        b = self._buffers
+
+        # Filas de camión
+        for truck_id, truck_info in tick_data.get("truck_states", {}).items():
+            b["camion"].append(self._codigo(self._camiones, truck_id))
+            b["status"].append(self._codigo(self._status, truck_info["status"]) if "status" in truck_info else -1)
+            position = truck_info.get("position", [-1, -1])
+            b["pos_x"].append(_num(position[0], "position") if len(position) > 0 else np.nan)
+            b["pos_y"].append(_num(position[1], "position") if len(position) > 1 else np.nan)
+            b["fuel"].append(_num(truck_info.get("tank_fuel_level"), "tank_fuel_level"))
+            b["current_shovel"].append(self._indice_pala.get(truck_info.get("current_shovel"), -1))
+
+            eta = [np.nan] * n_palas
+            eta_presente = [False] * n_palas
+            for name, valor in (truck_info.get("ETA") or {}).items():
+                i = self._indice_pala.get(name)
+                if i is not None:
+                    eta[i] = _num(valor, "ETA")
+                    eta_presente[i] = True
+            b["eta"].append(eta)
+            b["eta_presente"].append(eta_presente)
+            self._n_filas += 1
+
+        # Filas de tick x pala
+        shovel_dict = tick_data.get("shovel_states", {})
+        fila = {col: [] for col in ATRIBUTOS_PALA + ["pala_presente", "queue_presente", "spot_time", "cycle"]}
+        for name in self.palas:
+            info = shovel_dict.get(name)
+            fila["pala_presente"].append(info is not None)
+            info = info or {}
+            for attr in ATRIBUTOS_PALA:
+                fila[attr].append(_num(info.get(attr, -1), attr))
+            fila["queue_presente"].append("queue_count" in info)
+            fila["spot_time"].append(_num(info.get("shovel_spot_time", 0) or 0, "shovel_spot_time"))
+            fila["cycle"].append(_num(info.get("shovel_cycle()", 0) or 0, "shovel_cycle()"))
+        for col, valores in fila.items():
+            b[col].append(valores)
+
+        self._tick_keys.append(str(tick_key))
+        b["offsets"].append(self._n_filas)
+
+        if len(b["camion"]) >= self._filas_por_bloque:
+            self._volcar()
+
+    def agregar_tick_columnas(self, tick_key, filas, palas):
+        """
+        Agrega un tick ya en columnas (sin dicts), p. ej. desde un generador vectorizado.
+
+        Parámetros:
+        - filas: {columna de nivel "camion": array (n_camiones,) o (n_camiones, n_palas)};
+          "camion" y "status" son códigos de codigos().
+        - palas: {columna de nivel "tick": array (n_palas,)}, en el orden de shovel_names.
+        """
+        self._cambiar_modo(True)
+        b = self._buffers
+        n = len(filas["camion"])
+        for col, (dtype, _, nivel) in COLUMNAS.items():
+            if nivel == "camion":
+                b[col].append(np.asarray(filas[col], dtype=dtype))
+            elif nivel == "tick":
+                b[col].append(np.asarray(palas[col], dtype=dtype)[None, :])
+        self._n_filas += n
+        self._filas_pendientes += n
+        self._tick_keys.append(str(tick_key))
+        b["offsets"].append(np.array([self._n_filas], dtype=np.int64))
+
+        if self._filas_pendientes >= self._filas_por_bloque:
+            self._volcar()
+
+    def _volcar(self):
+        n_palas = len(self.palas)
+        for col, valores in self._buffers.items():
+            if not valores:
+                continue
+            dtype, por_pala, _ = COLUMNAS[col]
+            if self._en_bloques:
+                arr = np.concatenate([np.atleast_1d(v) for v in valores]).astype(dtype, copy=False)
+            else:
+                arr = np.asarray(valores, dtype=dtype)
+            if por_pala:
+                arr = arr.reshape(-1, n_palas)
+            arr.tofile(self._archivos[col])
+            valores.clear()
+        self._filas_pendientes = 0
+
+    def cerrar(self, **meta_extra):
+        """Vuelca lo pendiente y escribe meta.json (marca de compilación completa)."""
+        self._volcar()
+        for f in self._archivos.values():
+            f.close()
+        n_ticks = len(self._tick_keys)
+        n_palas = len(self.palas)
+        formas = {}
+        for col, (dtype, por_pala, nivel) in COLUMNAS.items():
+            filas = {"offsets": n_ticks + 1, "camion": self._n_filas, "tick": n_ticks}[nivel]
+            formas[col] = {"dtype": dtype, "shape": [filas, n_palas] if por_pala else [filas]}
+        meta = {
+            "schema_version": SCHEMA_VERSION,
+            "tick_keys": self._tick_keys,
+            "camiones": list(self._camiones),
+            "status": list(self._status),
+            "palas": self.palas,
+            "columnas": formas,
+        }
+        meta.update(meta_extra)
+        with open(os.path.join(self.destino, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return meta
+
+
+# =========================================================
+# Lectura
+# =========================================================
+class TicksCompilados:
+    """
+    Ticks en formato columnar. Las columnas son arrays NumPy (memory-map si se cargó de disco).
+
+    Uso típico:
+        datos = compilar_o_cargar(TICK_JSON_REAL_PATH)
+        for t in range(datos.n_ticks):
+            estados = datos.estados(t, SHOVEL_NAMES)   # {truck_id: estado}, igual que estados_tick
+            tick_data = datos.tick(t)                  # dict reconstruido (compatibilidad)
+    """
+
+    def __init__(self, columnas, meta, ruta=None):
+        self.columnas = columnas
+        self.meta = meta
+        self.ruta = ruta
+        self.tick_keys = meta["tick_keys"]
+        self.camiones = meta["camiones"]
+        self.status = meta["status"]
+        self.palas = meta["palas"]
+        self.offsets = columnas["offsets"]
+        self._indice_pala = {name: i for i, name in enumerate(self.palas)}
+        # status (índice de vocabulario, -1 = ausente) -> código de status_mapping
+        self._status_mapping = np.array([status_mapping.get(s, -1) for s in self.status] + [-1], dtype=np.float64)
+        self._cols_cache = {}
+
+    @classmethod
+    def cargar(cls, ruta, mmap=True):
+        with open(os.path.join(ruta, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        columnas = {}
+        for col, spec in meta["columnas"].items():
+            archivo = os.path.join(ruta, f"{col}.bin")
+            shape = tuple(spec["shape"])
+            if mmap and np.prod(shape) > 0:
+                columnas[col] = np.memmap(archivo, dtype=spec["dtype"], mode="r", shape=shape)
+            else:
+                columnas[col] = np.fromfile(archivo, dtype=spec["dtype"]).reshape(shape)
+        return cls(columnas, meta, ruta)
+
+    @property
+    def n_ticks(self):
+        return len(self.tick_keys)
+
+    def __len__(self):
+        return self.n_ticks
+
+    def filas(self, t):
+        """Slice de filas de camión del tick t."""
+        return slice(int(self.offsets[t]), int(self.offsets[t + 1]))
+
+    def nombres_camiones(self, t):
+        return [self.camiones[c] for c in self.columnas["camion"][self.filas(t)]]
+
+    def columnas_palas(self, shovel_names):
+        """Índices de columna para una lista de palas (-1 si la pala no existe en el archivo)."""
+        clave = tuple(shovel_names)
+        cols = self._cols_cache.get(clave)
+        if cols is None:
+            cols = np.array([self._indice_pala.get(n, -1) for n in shovel_names], dtype=np.intp)
+            self._cols_cache[clave] = cols
+        return cols
+
+    def _por_pala(self, arr, cols, defecto):
+        # Reordena columnas por pala; las palas desconocidas toman el valor por defecto
+        valores = arr[..., np.maximum(cols, 0)]
+        return np.where(cols >= 0, valores, defecto)
+
+    def matriz_estados(self, t, shovel_names, filas=None):
+        """
+        Matriz de estados del tick t (equivale a state_builder_lote sobre el tick original).
+        `filas` permite usar otras filas de camión (índices globales) con las palas del tick t.
+        """
+        c = self.columnas
+        if filas is None:
+            filas = self.filas(t)
+        cols = self.columnas_palas(shovel_names)
+        status_codes = self._status_mapping[c["status"][filas]]
+        atributos = [self._por_pala(c[attr][t], cols, -1.0)
+                     for attr in ("main_state", "queue_count", "priority", "coverage")]
+        return construir_matriz_estados(
+            c["pos_x"][filas], c["pos_y"][filas], status_codes, c["fuel"][filas],
+            self._por_pala(c["eta"][filas], cols, np.nan),
+            *atributos,
+            self._por_pala(c["spot_time"][t], cols, 0.0),
+            self._por_pala(c["cycle"][t], cols, 0.0),
+        )
+
+    def estados(self, t, shovel_names, espec=None):
+        """{truck_id: estado} del tick t, igual que state_builder.estados_tick (con `espec`, discretizado)."""
+        X = self.matriz_estados(t, shovel_names)
+        if espec is not None:
+            return dict(zip(self.nombres_camiones(t), espec.estados_desde_matriz(X, len(shovel_names))))
+        return dict(zip(self.nombres_camiones(t), estados_desde_matriz(X, len(shovel_names))))
+
+    def tick(self, t):
+        """Reconstruye el dict del tick t con los campos compilados."""
+        c = self.columnas
+        filas = self.filas(t)
+        truck_states = {}
+        for fila in range(filas.start, filas.stop):
+            truck_id = self.camiones[c["camion"][fila]]
+            info = {"name": truck_id}
+            status = int(c["status"][fila])
+            if status >= 0:
+                info["status"] = self.status[status]
+            info["position"] = [_a_python(c["pos_x"][fila], -1), _a_python(c["pos_y"][fila], -1)]
+            info["tank_fuel_level"] = _a_python(c["fuel"][fila])
+            info["ETA"] = {
+                self.palas[i]: _a_python(c["eta"][fila, i])
+                for i in np.flatnonzero(c["eta_presente"][fila])
+            }
+            current = int(c["current_shovel"][fila])
+            if current >= 0:
+                info["current_shovel"] = self.palas[current]
+            truck_states[truck_id] = info
+
+        shovel_states = {}
+        for i in np.flatnonzero(c["pala_presente"][t]):
+            name = self.palas[i]
+            info = {"name": name}
+            for attr in ATRIBUTOS_PALA:
+                if attr != "queue_count" or c["queue_presente"][t, i]:
+                    info[attr] = _a_python(c[attr][t, i])
+            info["shovel_spot_time"] = _a_python(c["spot_time"][t, i])
+            info["shovel_cycle()"] = _a_python(c["cycle"][t, i])
+            shovel_states[name] = info
+
+        return {"tick": self.tick_keys[t], "truck_states": truck_states, "shovel_states": shovel_states}
+
+
+def _a_python(valor, defecto=None):
+    # NaN -> None (o el defecto indicado); enteros exactos vuelven a int
+    valor = float(valor)
+    if valor != valor:
+        return defecto
+    return int(valor) if valor.is_integer() else valor
+
+
+# =========================================================
+# Compilación y cache
+# =========================================================
+def _escribir_tick_json(tick_json, destino, **meta_extra):
+    tick_keys = tick_keys_ordenadas(tick_json)
+    escritor = EscritorTicksCompilados(destino, nombres_palas(tick_json, tick_keys))
+    for k in tick_keys:
+        escritor.agregar_tick(k, tick_json[k])
+    return escritor.cerrar(**meta_extra)
+
+
+def compilar_tick_json(tick_json, destino=None, **meta_extra):
+    """
+    Compila un dict de ticks ya cargado (p. ej. datos artificiales).
+    Si destino es None la compilación se hace en un directorio temporal y se carga en memoria.
+    """
+    temporal = destino is None
+    if temporal:
+        import tempfile
+        destino = tempfile.mkdtemp(prefix="ticks_compilados_")
+    _escribir_tick_json(tick_json, destino, **meta_extra)
+    if temporal:
+        datos = TicksCompilados.cargar(destino, mmap=False)
+        shutil.rmtree(destino, ignore_errors=True)
+        return datos
+    return TicksCompilados.cargar(destino)
+
+
+def ruta_cache(json_path, cache_dir=None, sha=None):
+    """Directorio de cache para un archivo fuente: depende de su hash y de SCHEMA_VERSION."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(json_path)), ".tick_cache")
+    if sha is None:
+        sha = hash_archivo(json_path)
+    nombre = os.path.splitext(os.path.basename(json_path))[0]
+    return os.path.join(cache_dir, f"{nombre}.{sha[:16]}.v{SCHEMA_VERSION}")
+
+
+def compilar_o_cargar(json_path, cache_dir=None, mmap=True):
+    """
+    Devuelve los ticks compilados de json_path. Solo compila (json.load + escritura de columnas)
+    si no existe una cache con el mismo hash de archivo y versión de esquema.
+    """
+    sha = hash_archivo(json_path)
+    ruta = ruta_cache(json_path, cache_dir, sha)
+    if os.path.exists(os.path.join(ruta, "meta.json")):
+        return TicksCompilados.cargar(ruta, mmap=mmap)
+
+    print(f"Compilando ticks de {json_path} (una sola vez)...")
+    with open(json_path, "r") as f:
+        tick_json = json.load(f)
+    temporal = ruta + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    _escribir_tick_json(tick_json, temporal, fuente=os.path.abspath(json_path), fuente_sha256=sha)
+    del tick_json
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.replace(temporal, ruta)  # la cache solo aparece completa
+    print(f"Ticks compilados en {ruta}")
+    return TicksCompilados.cargar(ruta, mmap=mmap)
@@ -1,12 +1,17 @@
 #training_agent.py
 import random
 from q_learning_agent import QLearningAgent
-from state_builder import state_builder3
-from rewards import calcular_recompensa
+from q_table_compacta import CompactoQLearningAgent
 import pickle
-import matplotlib.pyplot as plt
 import json
 from generar_data_artifitial import generar_tick_json_artificial
+from tick_cache import compilar_o_cargar, compilar_tick_json
+from transiciones import construir_o_cargar_transiciones
+from discretizacion import discretizacion_para_entrenar
+from log_streaming import LogStreaming, columnas_por_pala
+from convergencia import MonitorConvergencia
+from diagnostico import configurar, activo, diag, ResumenEpisodio, RESUMEN, NORMAL, DETALLE
+from perfilado import TiemposFases, medir_fases, perfilador_desde_entorno
 import pandas as pd
 
 # ========================================================
@@ -18,33 +23,71 @@ SHOVEL_NAMES = ['PH002', 'EX004', 'PH003', 'PH001', 'CF001', 'CF002']
 TICK_JSON_REAL_PATH = r"C:\RL_model\agent\MINE-hudbay-2025-08-19.json"
 LOG_CSV_PATH = f"log_entrenamiento_AgenteRl_{MODO}.csv"
 QTABLE_PATH = f"q_table_{MODO}.pkl"
+# Discretización del estado (JSON/YAML, ver discretizacion.py); None = estado de state_builder3 sin cambios.
+# Producción debe usar la misma especificación (paths.discretizacion_path en config.yaml).
+DISCRETIZACION_PATH = None
+# Q-table compacta (q_table_compacta.py): un array('d') por estado en vez de un dict {accion: Q}.
+# Mismas decisiones y mismo pickle; ~3x menos memoria por estado a cambio de accesos algo más lentos.
+Q_TABLE_COMPACTA = False
+# Parada temprana (convergencia.py): NUM_EPISODIOS pasa a ser un máximo. Se para cuando todas las
+# tolerancias dadas (max/media |ΔQ|, fracción de acciones greedy cambiadas, cambio relativo de la
+# media móvil de la recompensa) se cumplen `paciencia` episodios seguidos, o cuando se acaba
+# segundos_max. Todo en None = sin parada temprana. El motivo queda en QTABLE_PATH + ".parada.json".
+PARADA_TEMPRANA = dict(tol_delta_q_max=None, tol_delta_q_media=None, tol_cambio_politica=None,
+                       tol_recompensa=None, ventana_recompensa=5, paciencia=2, min_episodios=1,
+                       segundos_max=None)
+
+# Log por transición escrito por bloques (memoria constante; lo ya escrito sobrevive a un corte)
+LOG_FORMATO = "csv"            # "csv" o "parquet" (requiere pyarrow)
+LOG_PARQUET_DIR = f"log_entrenamiento_AgenteRl_{MODO}_parquet"
+LOG_FILAS_POR_BLOQUE = 5000    # filas en memoria antes de escribir al disco
+LOG_MUESTREO = 1.0             # fracción de transiciones que se guardan (1.0 = todas)
+
+# Verbosidad: "normal" = mensajes por camión (como siempre), "resumen" = una línea de agregados
+# por episodio, "silencio" = nada. None usa la variable de entorno RL_VERBOSIDAD (o "normal").
+VERBOSIDAD = None
+configurar(VERBOSIDAD)
+
+# Tiempos por fase de cada paso (estado, accion, recompensa, update, log); None usa RL_FASES.
+# Perfilado de toda la corrida con RL_PERFIL=cprofile|muestreo|ambos (ver perfilado.py).
+MEDIR_FASES = None
+fases = TiemposFases()
+medir_pasos = medir_fases(MEDIR_FASES)
+perfil = perfilador_desde_entorno("training_agent").iniciar()
 
 ## COMENTARIO
 
 # ============================================
 # 2. CARGAR DATOS
 # ============================================
-if MODO  == "real":
-    with open(TICK_JSON_REAL_PATH, "r") as f:
-        tick_json = json.load(f)
-    #total_ticks = len(tick_json)  #Estás contando todo el JSON, incluyendo "Elementos_Estat", "Parametros_Globales", etc.
-    tick_keys = sorted([k for k in tick_json.keys() if k.isdigit()], key=int)
-    total_ticks = len(tick_keys)
-else:
-    tick_json = generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5)  # 0 - 9
-    with open("tick_json_artificial_guardado.json", "w") as f:
-        json.dump(tick_json, f, indent=2)
-    print("Datos artificiales guardados en tick_json_artificial_guardado.json")
-    #total_ticks = len(tick_json)  #Estás contando todo el JSON, incluyendo "Elementos_Estat", "Parametros_Globales", etc.
-    tick_keys = sorted([k for k in tick_json.keys() if k.isdigit()], key=int)
-    total_ticks = len(tick_keys)
+# Los ticks se compilan a columnas NumPy una sola vez (cache por hash del JSON) y se abren con memory-map
+with fases.medir("datos"):
+    if MODO  == "real":
+        datos = compilar_o_cargar(TICK_JSON_REAL_PATH)
+    else:
+        tick_json = generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5)  # 0 - 9
+        with open("tick_json_artificial_guardado.json", "w") as f:
+            json.dump(tick_json, f, indent=2)
+        print("Datos artificiales guardados en tick_json_artificial_guardado.json")
+        datos = compilar_tick_json(tick_json)
+#total_ticks = len(tick_json)  #Estás contando todo el JSON, incluyendo "Elementos_Estat", "Parametros_Globales", etc.
+total_ticks = datos.n_ticks
+
+# Estados, siguientes estados y recompensas de todas las acciones no dependen de la acción elegida:
+# se precomputan una vez por dataset y los episodios solo indexan la tabla
+with fases.medir("transiciones"):
+    espec = discretizacion_para_entrenar(DISCRETIZACION_PATH, datos, SHOVEL_NAMES)
+    tabla = construir_o_cargar_transiciones(datos, SHOVEL_NAMES, espec=espec)
 
 # ============================================
 # 3. ENTRENAMIENTO DEL AGENTE RL
 # ============================================
-agent = QLearningAgent(actions=SHOVEL_NAMES)
+agent = (CompactoQLearningAgent if Q_TABLE_COMPACTA else QLearningAgent)(actions=SHOVEL_NAMES)
 rewards_por_episodio = []
-logs_entrenamiento = []  # Para guardar trazabilidad completa
+# Para guardar trazabilidad completa, sin acumular todo en memoria
+logs_entrenamiento = LogStreaming(LOG_CSV_PATH if LOG_FORMATO == "csv" else LOG_PARQUET_DIR,
+                                  formato=LOG_FORMATO, filas_por_bloque=LOG_FILAS_POR_BLOQUE,
+                                  muestreo=LOG_MUESTREO, columnas=columnas_por_pala(SHOVEL_NAMES))
 
 def print_q_vals(state, valid_actions, q_table):
     print(f"  → Q-valores en el estado actual:")
@@ -61,26 +104,42 @@ def print_detalle_acciones(valid_actions, shovel_dict, truck_etas=None):
         eta = truck_etas.get(pala, "N/A") if truck_etas else "N/A"
         print(f"Pala: {pala:<6} | Estado: {estado:<2} | Cola: {cola:<2} | ETA: {eta}")
 
+resumen = ResumenEpisodio()  # agregados por episodio (modo "resumen")
+monitor = MonitorConvergencia.desde_config(PARADA_TEMPRANA)
+if monitor is not None:
+    monitor.iniciar(agent)
+
 #==========Entrenamiento del Agente RL, por EPISODIOS ==============================================================
 for ep in range(NUM_EPISODIOS):
-    print(f"\n--- Episodio {ep + 1} ---")
+    diag(NORMAL, "\n--- Episodio {} ---", ep + 1)
     total_reward = 0  # Total de recompensas
+    # Mensajes por camión: se decide una vez por episodio (sin costo de formateo si están apagados)
+    detalle_consola = activo(NORMAL)
+    # El tick completo (dicts) hace falta en cada paso solo para los mensajes por camión; para el
+    # log se arma recién cuando debe_registrar() acepta una fila de ese tick
+    detalle_tick = detalle_consola
+    fases_ep = TiemposFases() if medir_pasos else None
+    if fases_ep is not None:
+        fases_ep.iniciar()
 
     for tick_index in range(total_ticks):
-        #tick_data = tick_json[str(tick_index)]
-        tick_data = tick_json[tick_keys[tick_index]]  # "5", "13", "27", "41": Cualquier secuencia
-        truck_states = tick_data["truck_states"]
-        shovels_info = tick_data["shovel_states"]
-
-        for truck_id, truck_info in truck_states.items():
-            tick_info = {
-                "truck_states": {truck_id: truck_info},
-                "shovel_states": shovels_info
-            }
+        filas = tabla.filas(tick_index)  # una fila de la tabla por camión, en el mismo orden
+        tick_data = None
+        if detalle_tick:
+            #tick_data = tick_json[str(tick_index)]
+            tick_data = datos.tick(tick_index)  # tick "5", "13", "27", "41": solo se usa para los logs de detalle
+            truck_states = tick_data["truck_states"]
+            shovels_info = tick_data["shovel_states"]
+            camiones_tick = truck_states.items()
+        else:
+            shovels_info = {}
+            camiones_tick = ((tabla.camiones[c], {}) for c in tabla.camion[filas].tolist())
 
-            # 1. Construir estado actual
-            states, truck_names_list = state_builder3(tick_info, SHOVEL_NAMES)
-            state = states[0]  # usamos solo el camion actual
+        for fila, (truck_id, truck_info) in zip(range(filas.start, filas.stop), camiones_tick):
+            # 1. Estado actual (precomputado)
+            state = tabla.estados[tabla.estado[fila]]  # usamos solo el camion actual
+            if fases_ep is not None:
+                fases_ep.vuelta("estado")
 
             # 2. Acciones válidas
             valid_actions = SHOVEL_NAMES    # ← Ahora todas las acciones están disponibles
@@ -91,39 +150,20 @@ for ep in range(NUM_EPISODIOS):
 
             # 3. Elegir acción
             action = agent.choose_action(state, valid_actions)
+            if fases_ep is not None:
+                fases_ep.vuelta("accion")
 
-            # 4. Obtener next_tick (mismo camión, siguiente tick)
-            next_tick_index = (tick_index + 1) % total_ticks
-            next_tick_data = tick_json[tick_keys[next_tick_index]]
-
-            next_truck_info = next_tick_data["truck_states"].get(truck_id, truck_info)
-            next_tick_info = {
-                "truck_states": {truck_id: next_truck_info},
-                "shovel_states": next_tick_data["shovel_states"]
-            }
-            next_states, next_truck_names_list = state_builder3(next_tick_info, SHOVEL_NAMES)
-            next_state = next_states[0]
+            # 4. Siguiente estado (mismo camión, siguiente tick; precomputado)
+            next_state = tabla.estados[tabla.siguiente[fila]]
 
             # 5. Extraer ETAs del camión actual
             truck_etas = truck_info.get("ETA", {})
-            
-            # 5. Recompensa
-            reward = calcular_recompensa(
-                status=next_truck_info.get("status", "waiting for shovel"), # valor por defecto, por si no se encuentra el status en next_truck_info
-                action=action,
-                shovels_info=shovels_info,
-                truck_etas=truck_etas  # Agregar ETAs del camión
-            )
-
-            # 5.1 Calcular recompensas para todas las acciones posibles (debug, análisis, logging)
-            recompensas_acciones_posibles = {
-                a: calcular_recompensa(
-                    status=next_truck_info.get("status", "waiting for shovel"),
-                    action=a,
-                    shovels_info=shovels_info,
-                    truck_etas=truck_etas  # Agregar ETAs del camión
-                ) for a in valid_actions
-            }
+
+            # 5.1 Recompensas para todas las acciones posibles (precomputadas con calcular_recompensa)
+            recompensas_acciones_posibles = dict(zip(tabla.acciones, tabla.recompensas[fila].tolist()))
+
+            # 5. Recompensa de la acción elegida
+            reward = recompensas_acciones_posibles[action]
 
             # ==========Propuesta de Metricas ==================================================
             mejor_accion = max(recompensas_acciones_posibles, key=recompensas_acciones_posibles.get)
@@ -133,51 +173,79 @@ for ep in range(NUM_EPISODIOS):
 
             # 6. Validación de acciones para próximo estado
             next_valid_actions = valid_actions
+            if fases_ep is not None:
+                fases_ep.vuelta("recompensa")
 
             # 7. Actualizar agente
             agent.update(state, action, reward, next_state, next_valid_actions)
 
             total_reward += reward
+            if fases_ep is not None:
+                fases_ep.vuelta("update")
+
+            resumen.sumar("transiciones")
+            resumen.sumar("decisiones_optimas", int(decision_optima))
+            resumen.sumar("exploracion", int(agent.last_action_was_random))
 
             # Logs visibles por consola
-            #print(f"Paso {paso} | Acción: {action} | Recompensa: {reward}")
-            print(f"Tick {tick_index} | Camión: {truck_id} | Acción: {action} | Recompensa: {reward}")
-            print(f" → ETA de la acción elegida: {truck_etas.get(action, 'N/A')}")
-            print(" → Recompensas por cada Accion:", recompensas_acciones_posibles)
-            print(f" → Mejor Accion {mejor_accion} | Decision_Optima {decision_optima}")
-            print_q_vals(state, valid_actions, agent.q_table)
-            print_detalle_acciones(valid_actions, shovels_info, truck_etas)
-
-            logs_entrenamiento.append({
-                "episodio": ep + 1,
-                #"paso": paso,
-                "tick": tick_index,
-                "truck_id": truck_id,
-                "estado": state,
-                "accion_elegida": action,
-                "recompensa": reward,
-                "recompensas_posibles": recompensas_acciones_posibles,  # Recompensas de todas las acciones posibles
-                "q_valores": {a: agent.q_table.get(state, {}).get(a, 0.0) for a in valid_actions},
-                #============================================================================
-                "mejor_accion": mejor_accion,
-                "decision_optima": decision_optima,
-                "pala_asignada": action,
-                #===========================================================================
-                "palas_info": {
-                    a: {
-                        "state": shovels_info.get(a, {}).get("state"),
-                        "queue_count": shovels_info.get(a, {}).get("queue_count")
-                    } for a in valid_actions
-                },
-                #===========================================================================
-                "truck_etas": truck_etas,  # Agregar ETAs del camión para análisis
-                "eta_accion_elegida": truck_etas.get(action, None)  # ETA de la acción elegida
-            })
+            if detalle_consola:
+                #print(f"Paso {paso} | Acción: {action} | Recompensa: {reward}")
+                print(f"Tick {tick_index} | Camión: {truck_id} | Acción: {action} | Recompensa: {reward}")
+                print(f" → ETA de la acción elegida: {truck_etas.get(action, 'N/A')}")
+                print(" → Recompensas por cada Accion:", recompensas_acciones_posibles)
+                print(f" → Mejor Accion {mejor_accion} | Decision_Optima {decision_optima}")
+                print_q_vals(state, valid_actions, agent.q_table)
+                print_detalle_acciones(valid_actions, shovels_info, truck_etas)
+
+            if logs_entrenamiento.debe_registrar():
+                if tick_data is None:  # primera fila muestreada del tick
+                    tick_data = datos.tick(tick_index)
+                    shovels_info = tick_data["shovel_states"]
+                if not detalle_tick:
+                    truck_etas = tick_data["truck_states"][truck_id].get("ETA", {})
+                logs_entrenamiento.registrar({
+                    "episodio": ep + 1,
+                    #"paso": paso,
+                    "tick": tick_index,
+                    "truck_id": truck_id,
+                    "estado": state,
+                    "accion_elegida": action,
+                    "recompensa": reward,
+                    "recompensas_posibles": recompensas_acciones_posibles,  # Recompensas de todas las acciones posibles
+                    "q_valores": {a: agent.q_table.get(state, {}).get(a, 0.0) for a in valid_actions},
+                    #============================================================================
+                    "mejor_accion": mejor_accion,
+                    "decision_optima": decision_optima,
+                    "pala_asignada": action,
+                    #===========================================================================
+                    "palas_info": {
+                        a: {
+                            "state": shovels_info.get(a, {}).get("state"),
+                            "queue_count": shovels_info.get(a, {}).get("queue_count")
+                        } for a in valid_actions
+                    },
+                    #===========================================================================
+                    "truck_etas": truck_etas,  # Agregar ETAs del camión para análisis
+                    "eta_accion_elegida": truck_etas.get(action, None)  # ETA de la acción elegida
+                }, muestreada=True)
+            if fases_ep is not None:
+                fases_ep.vuelta("log")
 
 
     agent.decay_epsilon()
     rewards_por_episodio.append(total_reward)
-    print(f"Recompensa total del episodio {ep + 1}: {total_reward}")
+    with fases.medir("log_disco"):
+        logs_entrenamiento.flush()  # el log de cada episodio terminado queda en disco
+    diag(NORMAL, "Recompensa total del episodio {}: {}", ep + 1, total_reward)
+    resumen.emitir(f"Episodio {ep + 1}/{NUM_EPISODIOS}", recompensa=total_reward,
+                   epsilon=agent.epsilon, estados=len(agent.q_table))
+    if fases_ep is not None:
+        fases.combinar(fases_ep)
+        diag(DETALLE, lambda: fases_ep.resumen(f"Fases episodio {ep + 1}"))
+    if monitor is not None and monitor.fin_episodio(ep, agent, total_reward):
+        break
+
+diag(RESUMEN, lambda: fases.resumen("Fases del entrenamiento"))
 
 # ============================================
 # GUARDAR Q-TABLE
@@ -186,26 +254,34 @@ for ep in range(NUM_EPISODIOS):
 with open(QTABLE_PATH, "wb") as f:
     pickle.dump(agent.q_table, f)
 print(f"Q-table guardada en {QTABLE_PATH}")
+if monitor is not None:
+    monitor.terminar(len(rewards_por_episodio))
+    print(f"Parada: {monitor.motivo} en el episodio {monitor.episodio} ({monitor.guardar(QTABLE_PATH)})")
+for archivo in perfil.detener():  # el gráfico queda fuera del perfil
+    print(f"Perfil guardado en {archivo}")
 
 # =========================
 # Mostrar Q-table
 # =========================
-print("\n--- Muestra de Q-table entrenada ---")
-#for estado, acciones in list(agent.q_table.items())[:10]:
-for estado, acciones in list(agent.q_table.items()):
-    print(f"Estado: {estado} → Q-valores: {acciones}")
+if activo(NORMAL):
+    print("\n--- Muestra de Q-table entrenada ---")
+    #for estado, acciones in list(agent.q_table.items())[:10]:
+    for estado, acciones in list(agent.q_table.items()):
+        print(f"Estado: {estado} → Q-valores: {acciones}")
 
 # ============================================
 # GUARDAR LOG DEL ENTRENAMIENTO
 # ============================================
 #Opcion2:
-df_log = pd.DataFrame(logs_entrenamiento)
-df_log.to_csv(LOG_CSV_PATH, index=False)
-print(f"Log de entrenamiento guardado en: {LOG_CSV_PATH}")
+#df_log = pd.DataFrame(logs_entrenamiento)
+#df_log.to_csv(LOG_CSV_PATH, index=False)
+logs_entrenamiento.cerrar()  # las filas ya se fueron escribiendo por bloques
+print(f"Log de entrenamiento guardado en: {logs_entrenamiento.ruta} ({logs_entrenamiento.filas_escritas} filas)")
 
 # =========================
 # 5. Graficar recompensas
 # =========================
+import matplotlib.pyplot as plt  # solo aquí: importarlo toma casi un segundo
 plt.figure(figsize=(8, 4))
 plt.plot(rewards_por_episodio,  marker='o')
 plt.title(f"Recompensas por episodio ({MODO})")
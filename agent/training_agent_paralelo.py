@@ -6,15 +6,27 @@ Versión optimizada para entrenamiento eficiente con múltiples episodios
 """
 
 import pickle
-import matplotlib.pyplot as plt
 import json
 import pandas as pd
 import time
 import gc
+import numpy as np
 from q_learning_agent import QLearningAgent
-from state_builder import state_builder3
-from rewards import calcular_recompensa
+from q_table_array import ArrayQLearningAgent
+from q_table_compacta import CompactoQLearningAgent
+from aproximador_lineal import AproximadorQLearningAgent, CodificadorTiles
+from replay_buffer import ReplayBuffer
+from entrenamiento_paralelo import entrenar_hogwild
+from checkpoint_delta import CheckpointDelta
+from convergencia import MonitorConvergencia
+from log_streaming import LogStreaming
+from diagnostico import configurar, diag, RESUMEN, DETALLE
+from perfilado import TiemposFases, medir_fases, perfilador_desde_entorno
 from generar_data_artifitial import generar_tick_json_artificial
+from tick_cache import compilar_o_cargar, compilar_tick_json
+from discretizacion import discretizacion_para_entrenar
+from transiciones import (construir_o_cargar_transiciones, preparar_agente, reproducir_episodio,
+                          reproducir_episodio_lote)
 
 # ========================================================
 # 1. CONFIGURACIÓN DE PARÁMETROS
@@ -25,53 +37,210 @@ SHOVEL_NAMES = ['PH002', 'EX004', 'PH003', 'PH001', 'CF001', 'CF002']
 TICK_JSON_REAL_PATH = r"C:\RL_model\agent\MINE-hudbay-2025-08-19.json"
 LOG_CSV_PATH = f"log_entrenamiento_AgenteRl_{MODO}.csv"
 QTABLE_PATH = f"q_table_{MODO}.pkl"
+# Discretización del estado (JSON/YAML, ver discretizacion.py); None = estado de state_builder3 sin cambios.
+# Producción debe usar la misma especificación (paths.discretizacion_path en config.yaml).
+DISCRETIZACION_PATH = None
+
+# Log por transición escrito por bloques (memoria constante; lo ya escrito sobrevive a un corte)
+LOG_FORMATO = "csv"            # "csv" o "parquet" (requiere pyarrow)
+LOG_PARQUET_DIR = f"log_entrenamiento_AgenteRl_{MODO}_parquet"
+LOG_FILAS_POR_BLOQUE = 20000   # filas en memoria antes de escribir al disco
+LOG_MUESTREO = 1.0             # fracción de transiciones que se guardan (1.0 = todas)
+
+# Verbosidad: "normal" (por defecto), "resumen" (sin mensajes por estado nuevo del agente)
+# o "silencio". None usa la variable de entorno RL_VERBOSIDAD.
+VERBOSIDAD = None
+configurar(VERBOSIDAD)
+
+# Experience replay: con TAMANO_LOTE > 0 las transiciones van a un buffer circular y el agente
+# aprende con mini-lotes muestreados (update_lote). Con 0 se actualiza transición por transición.
+TAMANO_LOTE = 0
+CAPACIDAD_BUFFER = 100_000
+SEMILLA_REPLAY = None  # semilla del muestreo y la exploración en modo lote
+
+# Q-table compacta (q_table_compacta.py): un array('d') por estado en vez de un dict {accion: Q}.
+# Mismas decisiones y mismo pickle; ~3x menos memoria por estado a cambio de accesos algo más lentos.
+# Solo sin TAMANO_LOTE (el modo lote usa la matriz).
+Q_TABLE_COMPACTA = False
+
+# Aproximador lineal con tile coding (aproximador_lineal.py) en vez de la Q-table: memoria fija
+# (2**APROXIMADOR_BITS pesos por acción) y Q para estados nunca vistos. Los anchos de los tiles se
+# ajustan a los estados del dataset. Los pesos quedan en APROXIMADOR_PATH; QTABLE_PATH guarda
+# los Q-valores del aproximador en los estados del dataset. Solo sin TAMANO_LOTE ni NUM_PROCESOS.
+APROXIMADOR = False
+APROXIMADOR_TILINGS = 8
+APROXIMADOR_BITS = 16
+APROXIMADOR_TILES_POR_RANGO = 8  # tiles entre los percentiles 5 y 95 de cada columna
+APROXIMADOR_PATH = f"aproximador_{MODO}.pkl"
+
+# Multiproceso: con NUM_PROCESOS > 1 cada proceso recorre un rango de ticks distinto y todos
+# actualizan una misma Q-table en memoria compartida (entrenamiento_paralelo.py).
+NUM_PROCESOS = 1
+SEMILLA_PROCESOS = None  # semilla de la exploración de los workers (None = aleatoria)
+
+# Checkpoints incrementales (checkpoint_delta.py): una base completa + un log con las filas
+# modificadas en cada checkpoint; se restaura con restaurar_agente(CHECKPOINT_PATH, SHOVEL_NAMES, hasta=ep).
+# Con False se guarda un pickle completo por checkpoint (q_table_checkpoint_ep{N}.pkl).
+CHECKPOINT_INCREMENTAL = True
+CHECKPOINT_PATH = f"q_table_checkpoint_{MODO}.pkl"
+CHECKPOINT_COMPACTAR_CADA = 10  # checkpoints en el log antes de reescribir la base
+
+# Parada temprana (convergencia.py): NUM_EPISODIOS pasa a ser un máximo. Se para cuando todas las
+# tolerancias dadas se cumplen `paciencia` episodios seguidos, o cuando no entra otro episodio en
+# segundos_max. Todo en None = sin parada temprana. El motivo queda en <checkpoint>.parada.json.
+PARADA_TEMPRANA = dict(
+    tol_delta_q_max=None,      # max |ΔQ| del episodio
+    tol_delta_q_media=None,    # media |ΔQ| del episodio
+    tol_cambio_politica=None,  # fracción de estados con la acción greedy cambiada
+    tol_recompensa=None,       # cambio relativo de la media móvil de la recompensa
+    ventana_recompensa=5,
+    paciencia=2,
+    min_episodios=1,
+    segundos_max=None,         # presupuesto de tiempo del entrenamiento
+)
+
+# Tiempos por fase: las fases gruesas (datos, transiciones, checkpoint, log_disco) se miden siempre;
+# con MEDIR_FASES además cada paso del episodio (estado, accion, recompensa, update, log).
+# None usa la variable de entorno RL_FASES. El perfilador (cProfile / muestreo) se activa con
+# RL_PERFIL=cprofile|muestreo|ambos (ver perfilado.py).
+MEDIR_FASES = None
 
 # ========================================================
 # 2. CARGAR Y PREPROCESAR DATOS
 # =======================================================
 def cargar_datos():
     """Carga y preprocesa los datos de entrenamiento
-    que soluciona la Carga datos múltiples veces
+    que soluciona la Carga datos múltiples veces.
+    Los ticks reales se compilan a columnas NumPy una sola vez (cache por hash del JSON)
+    y en las siguientes ejecuciones se abren con memory-map, sin json.load.
     """
     if MODO == "real":
-        with open(TICK_JSON_REAL_PATH, "r") as f:
-            tick_json = json.load(f)
-        tick_keys = sorted([k for k in tick_json.keys() if k.isdigit()], key=int)
+        datos = compilar_o_cargar(TICK_JSON_REAL_PATH)
     else:
-        tick_json = generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5)
-        tick_keys = sorted([k for k in tick_json.keys() if k.isdigit()], key=int)
+        datos = compilar_tick_json(generar_tick_json_artificial(SHOVEL_NAMES, num_ticks=10, num_trucks=5))
     
-    total_ticks = len(tick_keys)
-    return tick_json, tick_keys, total_ticks
+    total_ticks = datos.n_ticks
+    return datos, total_ticks
 
 # ========================================================
 # 3. FUNCIONES AUXILIARES OPTIMIZADAS
 # ========================================================
 def print_progress(episodio, total_episodios, reward, tiempo_episodio):
     """Muestra progreso del entrenamiento de forma eficiente"""
-    print(f"Episodio {episodio}/{total_episodios} | "
-          f"Recompensa: {reward:.2f} | "
-          f"Tiempo: {tiempo_episodio:.2f}s")
-
-def guardar_checkpoint(agent, episodio):
-    """Guarda checkpoint optimizado"""
-    with open(f"q_table_checkpoint_ep{episodio}.pkl", "wb") as f:
-        pickle.dump(agent.q_table, f)
+    diag(RESUMEN, lambda: f"Episodio {episodio}/{total_episodios} | "
+                          f"Recompensa: {reward:.2f} | "
+                          f"Tiempo: {tiempo_episodio:.2f}s")
+
+def q_table_serializable(agent):
+    """Q-table en el formato dict de q_table_*.pkl, sea cual sea el motor del agente"""
+    q_table = agent.q_table
+    return q_table.a_dict() if hasattr(q_table, "a_dict") else q_table
+
+def nuevo_checkpoint():
+    """CheckpointDelta del entrenamiento (None si los checkpoints son pickles completos)"""
+    if not CHECKPOINT_INCREMENTAL or APROXIMADOR:
+        return None
+    return CheckpointDelta(CHECKPOINT_PATH, compactar_cada=CHECKPOINT_COMPACTAR_CADA)
+
+def guardar_checkpoint(agent, episodio, checkpoints=None, meta=None):
+    """Guarda checkpoint optimizado (incremental si se pasa un CheckpointDelta). Retorna la ruta"""
+    if checkpoints is not None:
+        filas = checkpoints.guardar(agent, etiqueta=episodio, meta=meta)
+        print(f"Checkpoint episodio {episodio} guardado ({filas} estados escritos)")
+        return checkpoints.ruta
+    if isinstance(agent, AproximadorQLearningAgent):
+        ruta = f"aproximador_checkpoint_ep{episodio}.pkl"
+        agent.guardar(ruta)
+        print(f"Checkpoint episodio {episodio} guardado (pesos del aproximador)")
+        return ruta
+    ruta = f"q_table_checkpoint_ep{episodio}.pkl"
+    with open(ruta, "wb") as f:
+        pickle.dump(q_table_serializable(agent), f)
     print(f"Checkpoint episodio {episodio} guardado")
+    return ruta
+
+def registrar_parada(monitor, agent, episodios, checkpoints=None):
+    """Checkpoint final con el motivo de parada en su meta, y el detalle en <checkpoint>.parada.json"""
+    motivo = monitor.terminar(episodios)
+    ruta = guardar_checkpoint(agent, episodios, checkpoints, meta={"parada": monitor.a_dict(historial=False)})
+    print(f"Parada: {motivo} en el episodio {episodios} ({monitor.guardar(ruta)})")
 
 # ========================================================
 # 4. ENTRENAMIENTO OPTIMIZADO
 # ========================================================
+def entrenar_agente_multiproceso(tabla):
+    """Entrenamiento con NUM_PROCESOS workers sobre una Q-table compartida (un rango de ticks por worker)"""
+    print(f"Iniciando entrenamiento de {NUM_EPISODIOS} episodios con {NUM_PROCESOS} procesos...")
+    inicio_total = time.time()
+    inicio_episodio = [time.time()]
+    checkpoints = nuevo_checkpoint()
+    fases = TiemposFases()  # solo fases gruesas: los pasos corren en los workers
+    monitor = MonitorConvergencia.desde_config(PARADA_TEMPRANA)
+    if monitor is not None:
+        monitor.iniciar()  # el agente se crea dentro de entrenar_hogwild, con la Q-table en 0
+
+    def al_episodio(ep, total_reward, agent):
+        fases.sumar("episodio", time.time() - inicio_episodio[0])
+        print_progress(ep + 1, NUM_EPISODIOS, total_reward, time.time() - inicio_episodio[0])
+        if (ep + 1) % 10 == 0:
+            with fases.medir("checkpoint"):
+                guardar_checkpoint(agent, ep + 1, checkpoints)
+        inicio_episodio[0] = time.time()
+        # Un motivo de parada corta el entrenamiento
+        return monitor.fin_episodio(ep, agent, total_reward) if monitor is not None else None
+
+    agent, rewards_por_episodio, resumen = entrenar_hogwild(
+        tabla, SHOVEL_NAMES, NUM_EPISODIOS, NUM_PROCESOS, semilla=SEMILLA_PROCESOS, al_episodio=al_episodio)
+    if monitor is not None:
+        with fases.medir("checkpoint"):
+            registrar_parada(monitor, agent, len(rewards_por_episodio), checkpoints)
+
+    tiempo_total = time.time() - inicio_total
+    print(f"\n Entrenamiento completado en {tiempo_total:.2f} segundos")
+    diag(RESUMEN, lambda: fases.resumen("Fases del entrenamiento"))
+    # Sin log por camión: los workers solo reportan el resumen de cada episodio
+    return agent, rewards_por_episodio, resumen
+
 def entrenar_agente():
     """Función principal de entrenamiento optimizada"""
     
+    fases = TiemposFases()
+    medir_pasos = medir_fases(MEDIR_FASES)
+
     # Cargar datos : Se llama UNA vez al inicio
-    tick_json, tick_keys, total_ticks = cargar_datos()
+    with fases.medir("datos"):
+        datos, total_ticks = cargar_datos()
+
+    # Estados, siguientes estados y recompensas por acción: una vez por dataset (no por episodio).
+    # Es la fase de construcción de estados y recompensas; en los episodios solo se indexa.
+    with fases.medir("transiciones"):
+        espec = discretizacion_para_entrenar(DISCRETIZACION_PATH, datos, SHOVEL_NAMES)
+        tabla = construir_o_cargar_transiciones(datos, SHOVEL_NAMES, espec=espec)
+
+    if NUM_PROCESOS > 1:
+        return entrenar_agente_multiproceso(tabla)
     
-    # Inicializar agente
-    agent = QLearningAgent(actions=SHOVEL_NAMES)
+    # Inicializar agente (en modo lote, con la Q-table en matriz y el buffer de experiencias)
+    if TAMANO_LOTE > 0:
+        agent = ArrayQLearningAgent(actions=SHOVEL_NAMES)
+        filas = preparar_agente(agent, tabla)
+        buffer = ReplayBuffer(CAPACIDAD_BUFFER, len(agent.q_table.acciones))
+        rng = np.random.default_rng(SEMILLA_REPLAY)
+    elif APROXIMADOR:
+        codificador = CodificadorTiles.desde_estados(tabla.estados, n_tilings=APROXIMADOR_TILINGS,
+                                                     bits=APROXIMADOR_BITS,
+                                                     tiles_por_rango=APROXIMADOR_TILES_POR_RANGO)
+        agent = AproximadorQLearningAgent(actions=SHOVEL_NAMES, codificador=codificador)
+    else:
+        agent = (CompactoQLearningAgent if Q_TABLE_COMPACTA else QLearningAgent)(actions=SHOVEL_NAMES)
     rewards_por_episodio = []
-    logs_entrenamiento = []
+    checkpoints = nuevo_checkpoint()
+    monitor = MonitorConvergencia.desde_config(PARADA_TEMPRANA)
+    if monitor is not None:
+        monitor.iniciar(agent)
+    logs_entrenamiento = LogStreaming(LOG_CSV_PATH if LOG_FORMATO == "csv" else LOG_PARQUET_DIR,
+                                      formato=LOG_FORMATO, filas_por_bloque=LOG_FILAS_POR_BLOQUE,
+                                      muestreo=LOG_MUESTREO)
     
     inicio_total = time.time()
     
@@ -79,84 +248,59 @@ def entrenar_agente():
     
     for ep in range(NUM_EPISODIOS):
         inicio_episodio = time.time()
-        total_reward = 0
-        episodio_logs = []
-        
-        for tick_index in range(total_ticks):
-            tick_data = tick_json[tick_keys[tick_index]]
-            truck_states = tick_data["truck_states"]
-            shovels_info = tick_data["shovel_states"]
-            
-            for truck_id, truck_info in truck_states.items():
-                # Procesar cada camión
-                tick_info = {
-                    "truck_states": {truck_id: truck_info},
-                    "shovel_states": shovels_info
-                }
-                
-                # Construir estado
-                states, _ = state_builder3(tick_info, SHOVEL_NAMES)
-                state = states[0]
-                valid_actions = SHOVEL_NAMES
-                
-                if not valid_actions:
-                    continue
-                
-                # Elegir acción
-                action = agent.choose_action(state, valid_actions)
-                
-                # Obtener siguiente tick
-                next_tick_index = (tick_index + 1) % total_ticks
-                next_tick_data = tick_json[tick_keys[next_tick_index]]
-                next_truck_info = next_tick_data["truck_states"].get(truck_id, truck_info)
-                
-                # Calcular recompensa
-                reward = calcular_recompensa(
-                    status=next_truck_info.get("status", "waiting for shovel"),
-                    action=action,
-                    shovels_info=shovels_info,
-                    truck_etas=truck_info.get("ETA", {})
-                )
-                
-                # Construir próximo estado
-                next_tick_info = {
-                    "truck_states": {truck_id: next_truck_info},
-                    "shovel_states": next_tick_data["shovel_states"]
-                }
-                next_states, _ = state_builder3(next_tick_info, SHOVEL_NAMES)
-                next_state = next_states[0] if next_states else state
-                
-                # Actualizar agente
-                agent.update(state, action, reward, next_state, valid_actions)
-                total_reward += reward
-                
-                # Log simplificado (solo datos esenciales)
-                episodio_logs.append({
-                    "episodio": ep + 1,
-                    "tick": tick_index,
-                    "truck_id": truck_id,
-                    "accion": action,
-                    "recompensa": reward,
-                    "estado": str(state)[:50]  # Limitar tamaño para eficiencia
-                })
+        fases_ep = TiemposFases() if medir_pasos else None
+
+        def registrar_paso(fila, action, reward):
+            # Log simplificado (solo datos esenciales)
+            if not logs_entrenamiento.debe_registrar():
+                return
+            logs_entrenamiento.registrar({
+                "episodio": ep + 1,
+                "tick": int(tabla.tick[fila]),
+                "truck_id": tabla.camiones[tabla.camion[fila]],
+                "accion": action,
+                "recompensa": reward,
+                "estado": str(tabla.estados[tabla.estado[fila]])[:50]  # Limitar tamaño para eficiencia
+            }, muestreada=True)
+
+        # Replay del episodio sobre la tabla precomputada (choose_action + update por camión y tick)
+        if TAMANO_LOTE > 0:
+            total_reward = reproducir_episodio_lote(agent, tabla, buffer, TAMANO_LOTE, rng, filas,
+                                                    al_paso=registrar_paso, fases=fases_ep)
+        else:
+            total_reward = reproducir_episodio(agent, tabla, al_paso=registrar_paso, fases=fases_ep)
         
         # Final del episodio
         agent.decay_epsilon()
         rewards_por_episodio.append(total_reward)
-        logs_entrenamiento.extend(episodio_logs)
+        with fases.medir("log_disco"):
+            logs_entrenamiento.flush()  # el log de cada episodio terminado queda en disco
         
         tiempo_episodio = time.time() - inicio_episodio
         print_progress(ep + 1, NUM_EPISODIOS, total_reward, tiempo_episodio)
+        if fases_ep is not None:
+            fases.combinar(fases_ep)
+            diag(DETALLE, lambda: fases_ep.resumen(f"Fases episodio {ep + 1}"))
         
         # Guardar checkpoint y liberar memoria (Cada 10 episodios)
         if (ep + 1) % 10 == 0: # Libera datos ya procesados
-            guardar_checkpoint(agent, ep + 1)
+            with fases.medir("checkpoint"):
+                guardar_checkpoint(agent, ep + 1, checkpoints)
             gc.collect()
+
+        if monitor is not None and monitor.fin_episodio(ep, agent, total_reward):
+            break
     
+    if monitor is not None:
+        with fases.medir("checkpoint"):
+            registrar_parada(monitor, agent, len(rewards_por_episodio), checkpoints)
+
     # Final del entrenamiento
     tiempo_total = time.time() - inicio_total
     print(f"\n Entrenamiento completado en {tiempo_total:.2f} segundos")
+    diag(RESUMEN, lambda: fases.resumen("Fases del entrenamiento"))
     
+    logs_entrenamiento.cerrar()
     return agent, rewards_por_episodio, logs_entrenamiento
 
 # ========================================================
@@ -167,18 +311,25 @@ def guardar_resultados(agent, rewards_por_episodio, logs_entrenamiento):
     
     # Guardar Q-table
     with open(QTABLE_PATH, "wb") as f:
-        pickle.dump(agent.q_table, f)
+        pickle.dump(q_table_serializable(agent), f)
     print(f"Q-table guardada en {QTABLE_PATH}")
+    if isinstance(agent, AproximadorQLearningAgent):
+        agent.guardar(APROXIMADOR_PATH)
+        print(f"Pesos del aproximador guardados en {APROXIMADOR_PATH} ({agent.nbytes / 2**20:.1f} MB)")
     
-    # Guardar logs
-    df_log = pd.DataFrame(logs_entrenamiento)
-    df_log.to_csv(LOG_CSV_PATH, index=False)
-    print(f"Logs guardados en {LOG_CSV_PATH}")
+    # Guardar logs (el log por transición ya se escribió por bloques durante el entrenamiento)
+    if isinstance(logs_entrenamiento, LogStreaming):
+        print(f"Logs guardados en {logs_entrenamiento.ruta} ({logs_entrenamiento.filas_escritas} filas)")
+    else:
+        df_log = pd.DataFrame(logs_entrenamiento)
+        df_log.to_csv(LOG_CSV_PATH, index=False)
+        print(f"Logs guardados en {LOG_CSV_PATH}")
     
-    # Guardar gráfico
+    # Guardar gráfico (matplotlib se importa solo aquí: toma casi un segundo)
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.plot(rewards_por_episodio, 'b-', linewidth=2)
-    plt.title(f"Recompensas por Episodio ({MODO}) - {NUM_EPISODIOS} episodios")
+    plt.title(f"Recompensas por Episodio ({MODO}) - {len(rewards_por_episodio)} episodios")
     plt.xlabel("Episodio")
     plt.ylabel("Recompensa Total")
     plt.grid(True, alpha=0.3)
@@ -201,6 +352,8 @@ if __name__ == "__main__":
     print("AGENTE RL - SISTEMA DE OPTIMIZACIÓN DE FLOTA")
     print("=" * 60)
     
+    # Perfilado opcional (RL_PERFIL): pstats y/o pilas colapsadas de toda la corrida
+    perfil = perfilador_desde_entorno("training_agent_paralelo").iniciar()
     try:
         # Entrenar agente
         agent, rewards, logs = entrenar_agente()
@@ -215,4 +368,7 @@ if __name__ == "__main__":
             
     except Exception as e:
         print(f"Error durante el entrenamiento: {e}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        for archivo in perfil.detener():
+            print(f"Perfil guardado en {archivo}")
\ No newline at end of file
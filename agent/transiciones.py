@@ -0,0 +1,459 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+try:
+    from .state_builder import estados_desde_matriz, tuplas_desde_matriz
+    from .rewards import calcular_recompensa_lote
+    from .q_table_array import ArrayQLearningAgent
+    from .aproximador_lineal import AproximadorQLearningAgent
+    from .memoria_compartida import publicar, adjuntar
+except ImportError:  # ejecución directa desde la carpeta agent/
+    from state_builder import estados_desde_matriz, tuplas_desde_matriz
+    from rewards import calcular_recompensa_lote
+    from q_table_array import ArrayQLearningAgent
+    from aproximador_lineal import AproximadorQLearningAgent
+    from memoria_compartida import publicar, adjuntar
+
+# =========================================================
+# Tabla de transiciones precomputada para el replay offline
+# =========================================================
+"""
+En el replay de entrenamiento, para cada (tick, camión):
+- el estado actual y el siguiente estado NO dependen de la acción elegida, y
+- la recompensa de cada acción posible tampoco depende de lo que haga el agente
+  (se calcula para todo el dataset con una sola llamada a calcular_recompensa_lote).
+
+Por eso se precomputan una sola vez por dataset:
+
+    estado[k]       -> id del estado del camión en la fila k
+    siguiente[k]    -> id del estado del mismo camión en el tick siguiente
+    recompensas[k]  -> vector (n_acciones,) con calcular_recompensa para cada pala
+
+y cada episodio se reduce a indexar arrays. Las filas siguen el mismo orden que
+los loops originales (ticks en orden, camiones en el orden del JSON), y el
+tick siguiente del último tick es el primero (igual que `(tick_index + 1) % total_ticks`).
+"""
+
+TRANSICIONES_VERSION = 1
+
+
+class TablaTransiciones:
+    """
+    Atributos:
+    - estados: lista id -> tupla de estado (la misma que devuelve state_builder3).
+    - acciones: nombres de palas, en el orden de las columnas de `recompensas`.
+    - estado, siguiente: arrays int32 (n_filas,) con ids de estado.
+    - recompensas: array float64 (n_filas, n_acciones).
+    - tick, camion: arrays int32 (n_filas,) con el índice de tick y el código de camión de cada fila.
+    - offsets: array (n_ticks + 1,) con las filas de cada tick.
+    """
+
+    def __init__(self, estados, acciones, estado, siguiente, recompensas, tick, camion, offsets, camiones=None):
+        self.estados = estados
+        self.acciones = list(acciones)
+        self.estado = estado
+        self.siguiente = siguiente
+        self.recompensas = recompensas
+        self.tick = tick
+        self.camion = camion
+        self.offsets = offsets
+        self.camiones = camiones or []
+
+    @property
+    def n_filas(self):
+        return len(self.estado)
+
+    @property
+    def n_estados(self):
+        return len(self.estados)
+
+    def filas(self, t):
+        return slice(int(self.offsets[t]), int(self.offsets[t + 1]))
+
+    def arreglos(self):
+        """Arrays de la tabla por nombre (para guardar o compartir entre procesos)."""
+        return {
+            "estado": self.estado,
+            "siguiente": self.siguiente,
+            "recompensas": self.recompensas,
+            "tick": self.tick,
+            "camion": self.camion,
+            "offsets": self.offsets,
+        }
+
+    # -----------------------------
+    # Persistencia
+    # -----------------------------
+    def guardar(self, ruta, n_palas, enteras=None):
+        """
+        Guarda la tabla en un directorio de .npy (los estados como matriz float64, None -> NaN).
+        `enteras`: columnas enteras del estado si está discretizado (EspecDiscretizacion.columnas_enteras).
+        """
+        os.makedirs(ruta, exist_ok=True)
+        for nombre, arr in self.arreglos().items():
+            np.save(os.path.join(ruta, f"{nombre}.npy"), arr)
+        ancho = len(enteras) if enteras is not None else 4 + 6 * n_palas
+        matriz = np.array([[np.nan if v is None else v for v in s] for s in self.estados], dtype=np.float64)
+        np.save(os.path.join(ruta, "estados.npy"), matriz.reshape(len(self.estados), ancho))
+        with open(os.path.join(ruta, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": TRANSICIONES_VERSION, "acciones": self.acciones,
+                       "camiones": self.camiones, "n_palas": n_palas,
+                       "enteras": None if enteras is None else [bool(e) for e in enteras]}, f)
+
+    @classmethod
+    def cargar(cls, ruta, mmap=True):
+        with open(os.path.join(ruta, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        modo = "r" if mmap else None
+        arr = {nombre: np.load(os.path.join(ruta, f"{nombre}.npy"), mmap_mode=modo)
+               for nombre in ("estado", "siguiente", "recompensas", "tick", "camion", "offsets")}
+        matriz = np.load(os.path.join(ruta, "estados.npy"))
+        if meta.get("enteras") is not None:
+            estados = tuplas_desde_matriz(matriz, meta["enteras"])
+        else:
+            estados = estados_desde_matriz(matriz, meta["n_palas"])
+        return cls(estados, meta["acciones"], camiones=meta["camiones"], **arr)
+
+
+# =========================================================
+# Construcción
+# =========================================================
+def construir_tabla_transiciones(datos, shovel_names, acciones=None, espec=None):
+    """
+    Construye la tabla a partir de ticks compilados (tick_cache.TicksCompilados).
+
+    Parámetros:
+    - datos: TicksCompilados.
+    - shovel_names: orden de palas del state builder (SHOVEL_NAMES).
+    - acciones: acciones posibles del agente (por defecto, shovel_names).
+    - espec: EspecDiscretizacion opcional (discretizacion.py) aplicada a los estados.
+
+    Retorna:
+    - TablaTransiciones
+    """
+    acciones = list(acciones or shovel_names)
+    n_ticks = datos.n_ticks
+    c = datos.columnas
+    a_tuplas = espec.estados_desde_matriz if espec is not None else estados_desde_matriz
+
+    indice_estados = {}
+    estados = []
+
+    def internar(tuplas):
+        ids = []
+        for s in tuplas:
+            i = indice_estados.get(s)
+            if i is None:
+                i = len(estados)
+                indice_estados[s] = i
+                estados.append(s)
+            ids.append(i)
+        return ids
+
+    # Estados de cada tick, construidos una sola vez (también sirven como "siguiente" del tick anterior)
+    ids_por_tick = [internar(a_tuplas(datos.matriz_estados(t, shovel_names), len(shovel_names)))
+                    for t in range(n_ticks)]
+
+    estado, siguiente, fila_status = [], [], []
+    for t in range(n_ticks):
+        nt = (t + 1) % n_ticks
+        filas = datos.filas(t)
+        filas_next = datos.filas(nt)
+        camiones_t = c["camion"][filas].tolist()
+        pos_next = {cam: j for j, cam in enumerate(c["camion"][filas_next].tolist())}
+
+        for i, cam in enumerate(camiones_t):
+            j = pos_next.get(cam)
+            if j is not None:
+                sig = ids_por_tick[nt][j]
+                fila_status.append(filas_next.start + j)
+            else:
+                # El camión no aparece en el siguiente tick: su info actual con las palas del siguiente
+                X = datos.matriz_estados(nt, shovel_names, filas=[filas.start + i])
+                sig = internar(a_tuplas(X, len(shovel_names)))[0]
+                fila_status.append(filas.start + i)
+            estado.append(ids_por_tick[t][i])
+            siguiente.append(sig)
+
+    tick = np.repeat(np.arange(n_ticks, dtype=np.int32), np.diff(np.asarray(datos.offsets)))
+    return TablaTransiciones(
+        estados, acciones,
+        estado=np.asarray(estado, dtype=np.int32),
+        siguiente=np.asarray(siguiente, dtype=np.int32),
+        recompensas=recompensas_dataset(datos, tick, np.asarray(fila_status, dtype=np.int64), acciones),
+        tick=tick,
+        camion=np.asarray(c["camion"], dtype=np.int32),
+        offsets=np.asarray(datos.offsets, dtype=np.int64),
+        camiones=list(datos.camiones),
+    )
+
+
+def recompensas_dataset(datos, tick, fila_status, acciones):
+    """
+    Recompensas (n_filas, n_acciones) de todo el dataset en una llamada al kernel vectorizado.
+    Equivale a calcular_recompensa(status del camión en el tick siguiente, accion,
+    shovel_states del tick, ETA del camión) para cada fila y acción.
+    """
+    c = datos.columnas
+    codigos = np.asarray(c["status"])[fila_status]
+    # Sin status -> "waiting for shovel" (valor por defecto de los loops de entrenamiento)
+    vocab = list(datos.status) + ["waiting for shovel"]
+    status = [vocab[k] for k in codigos.tolist()]
+
+    # Todas las palas del archivo como columnas (el bonus de mejor ETA las considera a todas)
+    state = np.asarray(c["state"])[tick]
+    cola = np.where(np.asarray(c["queue_presente"])[tick], np.asarray(c["queue_count"])[tick], 0)
+    presente = np.asarray(c["pala_presente"])[tick]
+    matriz = calcular_recompensa_lote(status, state, cola, np.asarray(c["eta"]), presente)
+
+    # Columnas de las acciones; una acción que no existe en el archivo es siempre inválida (-20)
+    cols = datos.columnas_palas(acciones)
+    return np.where(cols >= 0, matriz[:, np.maximum(cols, 0)], -20).astype(np.float64)
+
+
+def _huella_codigo():
+    # Si cambia el state builder o la función de recompensa, la tabla cacheada deja de ser válida
+    h = hashlib.sha256()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for nombre in ("state_builder.py", "rewards.py", "transiciones.py"):
+        with open(os.path.join(base, nombre), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def construir_o_cargar_transiciones(datos, shovel_names, acciones=None, espec=None):
+    """
+    Igual que construir_tabla_transiciones, pero si los ticks vienen de una cache en disco
+    guarda la tabla junto a ella y la reutiliza en las siguientes ejecuciones (memory-map).
+    Cada discretización (`espec`) tiene su propia tabla.
+    """
+    acciones = list(acciones or shovel_names)
+    if datos.ruta is None:
+        return construir_tabla_transiciones(datos, shovel_names, acciones, espec)
+
+    partes = [list(shovel_names), acciones, TRANSICIONES_VERSION, _huella_codigo()]
+    if espec is not None:
+        partes.append(espec.huella())
+    clave = hashlib.sha256(json.dumps(partes).encode("utf-8")).hexdigest()[:16]
+    ruta = os.path.join(datos.ruta, f"transiciones.{clave}")
+    if os.path.exists(os.path.join(ruta, "meta.json")):
+        return TablaTransiciones.cargar(ruta)
+
+    print("Precomputando tabla de transiciones (una sola vez por dataset)...")
+    tabla = construir_tabla_transiciones(datos, shovel_names, acciones, espec)
+    temporal = ruta + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    tabla.guardar(temporal, len(shovel_names),
+                  enteras=espec.columnas_enteras(len(shovel_names)) if espec is not None else None)
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.replace(temporal, ruta)
+    return tabla
+
+
+# =========================================================
+# Replay de un episodio
+# =========================================================
+def preparar_agente(agent, tabla):
+    """
+    Interna todos los estados de la tabla en la Q-table de un ArrayQLearningAgent.
+    Devuelve el array id de estado -> fila del agente (válido mientras no se reemplace la Q-table).
+    """
+    return agent.q_table.filas_de(tabla.estados, tabla.acciones)
+
+
+def reproducir_episodio(agent, tabla, filas=None, al_paso=None, fases=None):
+    """
+    Recorre todas las transiciones una vez (un episodio) con choose_action/update
+    y devuelve la recompensa total. No hace decay_epsilon.
+
+    Con ArrayQLearningAgent usa la ruta por índices (sin tuplas ni dicts);
+    `filas` es el resultado de preparar_agente (se calcula si no se pasa).
+    Con AproximadorQLearningAgent las features de cada estado se calculan una vez (agent.preparar).
+    `al_paso(k, accion, reward)` se llama tras cada transición (p. ej. para logs).
+    Con `fases` (perfilado.TiemposFases) acumula el tiempo de cada paso en las fases
+    estado / accion / recompensa / update / log (loop aparte: sin `fases` no cuesta nada).
+    """
+    acciones = tabla.acciones
+    estado_ids = tabla.estado
+    siguiente_ids = tabla.siguiente
+    recompensas = tabla.recompensas
+    total_reward = 0.0
+
+    if isinstance(agent, ArrayQLearningAgent):
+        if filas is None:
+            filas = preparar_agente(agent, tabla)
+        cols = agent.q_table.columnas(acciones)
+        if fases is not None:
+            return _reproducir_episodio_fases(agent, tabla, filas, cols, al_paso, fases)
+        for k in range(tabla.n_filas):
+            fila = filas[estado_ids[k]]
+            a = agent.elegir_accion_fila(fila, cols)
+            reward = float(recompensas[k, a])
+            agent.actualizar_fila(fila, cols[a], reward, filas[siguiente_ids[k]], cols)
+            total_reward += reward
+            if al_paso is not None:
+                al_paso(k, acciones[a], reward)
+        return total_reward
+
+    if isinstance(agent, AproximadorQLearningAgent):
+        features = agent.preparar(tabla)  # también deja los estados de la tabla como referencia de q_table
+        if fases is None:
+            cols = agent.columnas(acciones)
+            for k in range(tabla.n_filas):
+                indices = features[estado_ids[k]]
+                a = agent.elegir_accion_indices(indices, cols)
+                reward = float(recompensas[k, a])
+                agent.actualizar_indices(indices, cols[a], reward, features[siguiente_ids[k]], cols)
+                total_reward += reward
+                if al_paso is not None:
+                    al_paso(k, acciones[a], reward)
+            return total_reward
+
+    if fases is not None:
+        return _reproducir_episodio_fases(agent, tabla, None, None, al_paso, fases)
+    estados = tabla.estados
+    indice_acciones = {a: i for i, a in enumerate(acciones)}
+    for k in range(tabla.n_filas):
+        state = estados[estado_ids[k]]
+        action = agent.choose_action(state, acciones)
+        reward = float(recompensas[k, indice_acciones[action]])
+        agent.update(state, action, reward, estados[siguiente_ids[k]], acciones)
+        total_reward += reward
+        if al_paso is not None:
+            al_paso(k, action, reward)
+    return total_reward
+
+
+def _reproducir_episodio_fases(agent, tabla, filas, cols, al_paso, fases):
+    """reproducir_episodio con tiempos por fase (filas/cols solo para ArrayQLearningAgent)."""
+    acciones = tabla.acciones
+    estado_ids = tabla.estado
+    siguiente_ids = tabla.siguiente
+    recompensas = tabla.recompensas
+    vuelta = fases.vuelta
+    total_reward = 0.0
+    fases.iniciar()
+
+    if filas is not None:
+        for k in range(tabla.n_filas):
+            fila = filas[estado_ids[k]]
+            vuelta("estado")
+            a = agent.elegir_accion_fila(fila, cols)
+            vuelta("accion")
+            reward = float(recompensas[k, a])
+            vuelta("recompensa")
+            agent.actualizar_fila(fila, cols[a], reward, filas[siguiente_ids[k]], cols)
+            total_reward += reward
+            vuelta("update")
+            if al_paso is not None:
+                al_paso(k, acciones[a], reward)
+                vuelta("log")
+        return total_reward
+
+    estados = tabla.estados
+    indice_acciones = {a: i for i, a in enumerate(acciones)}
+    for k in range(tabla.n_filas):
+        state = estados[estado_ids[k]]
+        vuelta("estado")
+        action = agent.choose_action(state, acciones)
+        vuelta("accion")
+        reward = float(recompensas[k, indice_acciones[action]])
+        vuelta("recompensa")
+        agent.update(state, action, reward, estados[siguiente_ids[k]], acciones)
+        total_reward += reward
+        vuelta("update")
+        if al_paso is not None:
+            al_paso(k, action, reward)
+            vuelta("log")
+    return total_reward
+
+
+def _sin_fases(fase):
+    pass
+
+
+def reproducir_episodio_lote(agent, tabla, buffer, tamano_lote, rng, filas=None, al_paso=None, fases=None):
+    """
+    Episodio con experience replay (solo ArrayQLearningAgent): por cada tick elige las acciones
+    de todos sus camiones de forma vectorizada, guarda las transiciones en `buffer`
+    (replay_buffer.ReplayBuffer) y aplica un mini-lote muestreado de `tamano_lote`
+    transiciones con update_lote por cada `tamano_lote` transiciones nuevas.
+
+    `rng` es un np.random.Generator (exploración y muestreo). Devuelve la recompensa total.
+    Con `fases` (perfilado.TiemposFases) acumula los tiempos por tick en las fases
+    estado / accion / recompensa / buffer / log / update.
+    """
+    if filas is None:
+        filas = preparar_agente(agent, tabla)
+    cols = agent.q_table.columnas(tabla.acciones)
+    mascara = np.zeros(buffer.n_acciones, dtype=bool)
+    mascara[cols] = True  # todas las palas son acciones válidas en el siguiente estado
+    total_reward = 0.0
+    pendientes = 0
+    vuelta = _sin_fases
+    if fases is not None:
+        vuelta = fases.vuelta
+        fases.iniciar()
+
+    for t in range(len(tabla.offsets) - 1):
+        rango = tabla.filas(t)
+        if rango.start == rango.stop:
+            continue
+        filas_t = filas[tabla.estado[rango]]
+        vuelta("estado")
+        a = agent.elegir_acciones_filas(filas_t, cols, rng)
+        vuelta("accion")
+        rewards = tabla.recompensas[rango][np.arange(len(a)), a]
+        vuelta("recompensa")
+        buffer.agregar_lote(filas_t, cols[a], rewards, filas[tabla.siguiente[rango]], mascara)
+        total_reward += float(rewards.sum())
+        vuelta("buffer")
+        if al_paso is not None:
+            for k, (i, r) in enumerate(zip(a.tolist(), rewards.tolist()), start=rango.start):
+                al_paso(k, tabla.acciones[i], r)
+            vuelta("log")
+
+        pendientes += len(a)
+        while pendientes >= tamano_lote:
+            agent.update_lote(*buffer.muestrear(tamano_lote, rng))
+            pendientes -= tamano_lote
+        vuelta("update")
+    return total_reward
+
+
+# =========================================================
+# Tabla compartida entre procesos (memoria compartida)
+# =========================================================
+def compartir_tabla(tabla):
+    """
+    Publica los arrays de la tabla en memoria compartida (una sola copia para todos los procesos).
+
+    Retorna:
+    - (bloques, descriptor): los bloques se liberan con memoria_compartida.liberar(bloques, destruir=True)
+      cuando ningún worker los use; el descriptor se pasa a los workers (adjuntar_tabla).
+    """
+    bloques, descriptores = publicar(tabla.arreglos())
+    return bloques, {
+        "arreglos": descriptores,
+        "acciones": list(tabla.acciones),
+        "camiones": list(tabla.camiones),
+        "n_estados": tabla.n_estados,
+    }
+
+
+def adjuntar_tabla(descriptor):
+    """
+    Tabla de solo lectura sobre los arrays compartidos por compartir_tabla (sin copiar).
+    Los estados se identifican por su id (range) en vez de por la tupla: alcanza para
+    entrenar y evaluar con reproducir_episodio, pero la Q-table resultante queda indexada
+    por id de estado. Retorna (bloques, tabla); los bloques deben vivir mientras se use la tabla.
+    """
+    bloques, arrays = adjuntar(descriptor["arreglos"])
+    for arr in arrays.values():
+        arr.flags.writeable = False
+    tabla = TablaTransiciones(range(descriptor["n_estados"]), descriptor["acciones"],
+                              camiones=descriptor["camiones"], **arrays)
+    return bloques, tabla
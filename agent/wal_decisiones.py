@@ -0,0 +1,191 @@
+import os
+import pickle
+import struct
+import zlib
+
+# =========================================================
+# Write-ahead log de las decisiones pendientes
+# =========================================================
+"""
+Reemplaza el pickle de decisiones pendientes (reescrito completo en cada tick y
+borrado después de procesarlo) por un log de solo-agregar con dos tipos de registro:
+
+    {"tipo": "decision", "seq", "tick_id", "truck_id", "state", "action", "valid_actions", "timestamp"}
+    {"tipo": "update", "seq", "reward", "next_state"}   update aplicado a la decisión `seq`
+                                                        (reward None: decisión descartada, sin update)
+
+Una decisión es pendiente mientras no tenga su registro "update". La Q-table se
+guarda con el número de secuencia hasta el que incluye updates (meta {"wal_seq": n}
+de checkpoint_delta); al reiniciar se vuelven a aplicar, en orden, los updates del
+log con seq > n (los anteriores ya están en la Q-table: el replay es idempotente) y
+las decisiones sin update quedan pendientes. Así un corte en cualquier punto (entre
+el guardado de la Q-table y el del log, a mitad de una escritura, ...) ni pierde ni
+repite updates.
+
+Cada registro va con su largo y CRC; un registro cortado al final del log se descarta
+al abrirlo. El fsync se hace por tandas (cada `fsync_cada` escrituras) o con sincronizar().
+"""
+
+_CABECERA = struct.Struct("<II")  # largo, crc32 del registro
+
+
+def fsync_directorio(ruta):
+    """
+    fsync del directorio de `ruta`, para que un os.replace sobre ese archivo sobreviva a un
+    corte de energía. En Windows no se puede abrir un directorio (NTFS ya registra el rename
+    en su journal), así que no hace nada.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(ruta)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WalDecisiones:
+    def __init__(self, ruta, fsync_cada=1):
+        """
+        Parámetros:
+        - ruta: archivo del log (se crea si no existe).
+        - fsync_cada: escrituras (tandas de registros) entre dos fsync; 1 = cada tick queda en disco.
+        """
+        self.ruta = ruta
+        self.fsync_cada = max(int(fsync_cada), 1)
+        self.decisiones = {}      # seq -> registro "decision"
+        self.updates = []         # registros "update" en orden
+        self.siguiente_seq = 1
+        self._sin_fsync = 0
+        self._leer()
+        self._archivo = open(ruta, "ab")
+
+    # -----------------------------
+    # Lectura / formato
+    # -----------------------------
+    @staticmethod
+    def _empaquetar(registro):
+        datos = pickle.dumps(registro)
+        return _CABECERA.pack(len(datos), zlib.crc32(datos)) + datos
+
+    def _agregar_en_memoria(self, registro):
+        if registro["tipo"] == "decision":
+            self.decisiones[registro["seq"]] = registro
+        elif registro["tipo"] == "update":
+            self.updates.append(registro)
+        self.siguiente_seq = max(self.siguiente_seq, registro["seq"] + 1)
+
+    def _leer(self):
+        if not os.path.exists(self.ruta):
+            return
+        valido = 0
+        with open(self.ruta, "rb") as f:
+            contenido = f.read()
+        while valido + _CABECERA.size <= len(contenido):
+            largo, crc = _CABECERA.unpack_from(contenido, valido)
+            inicio, fin = valido + _CABECERA.size, valido + _CABECERA.size + largo
+            if fin > len(contenido) or zlib.crc32(contenido[inicio:fin]) != crc:
+                break
+            self._agregar_en_memoria(pickle.loads(contenido[inicio:fin]))
+            valido = fin
+        if valido < len(contenido):
+            # Registro cortado por un corte durante la escritura: se descarta para seguir agregando
+            with open(self.ruta, "r+b") as f:
+                f.truncate(valido)
+
+    # -----------------------------
+    # Escritura
+    # -----------------------------
+    def _escribir(self, registros):
+        self._archivo.write(b"".join(self._empaquetar(r) for r in registros))
+        self._archivo.flush()
+        self._sin_fsync += 1
+        if self._sin_fsync >= self.fsync_cada:
+            self.sincronizar()
+        for r in registros:
+            self._agregar_en_memoria(r)
+
+    def sincronizar(self):
+        """Fuerza al disco lo escrito (fsync)."""
+        if self._sin_fsync:
+            os.fsync(self._archivo.fileno())
+            self._sin_fsync = 0
+
+    def registrar_decisiones(self, decisiones):
+        """
+        Agrega decisiones nuevas (dicts truck_id, state, action, valid_actions, ...) en una sola escritura.
+        Retorna las decisiones con su "seq" asignado.
+        """
+        registros = []
+        for dec in decisiones:
+            registros.append({**dec, "tipo": "decision", "seq": self.siguiente_seq + len(registros)})
+        if registros:
+            self._escribir(registros)
+        return registros
+
+    def registrar_updates(self, updates):
+        """Agrega los updates aplicados [(seq, reward, next_state), ...] en una sola escritura."""
+        registros = [{"tipo": "update", "seq": seq, "reward": reward, "next_state": next_state}
+                     for seq, reward, next_state in updates]
+        if registros:
+            self._escribir(registros)
+
+    # -----------------------------
+    # Recuperación
+    # -----------------------------
+    def pendientes(self):
+        """Decisiones sin update, en orden de secuencia."""
+        aplicadas = {u["seq"] for u in self.updates}
+        return [self.decisiones[s] for s in sorted(self.decisiones) if s not in aplicadas]
+
+    def ultimo_update(self):
+        """Secuencia del último update registrado (0 si no hay)."""
+        return max((u["seq"] for u in self.updates), default=0)
+
+    def reaplicar(self, aplicar, incluido_hasta):
+        """
+        Vuelve a aplicar los updates que la Q-table guardada no incluye.
+
+        Parámetros:
+        - aplicar(decision, reward, next_state): aplica un update al agente.
+        - incluido_hasta: secuencia hasta la que la Q-table ya incluye updates (meta "wal_seq").
+
+        Retorna:
+        - número de updates reaplicados.
+        """
+        n = 0
+        for u in self.updates:
+            if u["seq"] > incluido_hasta and u["reward"] is not None and u["seq"] in self.decisiones:
+                aplicar(self.decisiones[u["seq"]], u["reward"], u["next_state"])
+                n += 1
+        return n
+
+    def compactar(self, incluido_hasta):
+        """
+        Reescribe el log sin lo que ya está en la Q-table guardada: decisiones con update
+        y updates con seq <= incluido_hasta. La secuencia sigue desde donde estaba.
+        """
+        self.sincronizar()
+        con_update = {u["seq"] for u in self.updates if u["seq"] <= incluido_hasta}
+        decisiones = [d for s, d in sorted(self.decisiones.items()) if s not in con_update]
+        updates = [u for u in self.updates if u["seq"] > incluido_hasta]
+        # Marca de secuencia: si el log queda vacío, la próxima decisión no repite números
+        marca = {"tipo": "inicio", "seq": self.siguiente_seq - 1}
+        datos = b"".join(self._empaquetar(r) for r in [marca] + decisiones + updates)
+        with open(self.ruta + ".tmp", "wb") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        self._archivo.close()
+        os.replace(self.ruta + ".tmp", self.ruta)
+        fsync_directorio(self.ruta)
+        self._archivo = open(self.ruta, "ab")
+        self.decisiones = {d["seq"]: d for d in decisiones}
+        self.updates = updates
+
+    def tamano(self):
+        return self._archivo.tell()
+
+    def cerrar(self):
+        self.sincronizar()
+        self._archivo.close()
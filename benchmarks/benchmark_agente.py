@@ -0,0 +1,341 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import pickle
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+import contextlib
+import multiprocessing as mp
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Importar funciones y clases del proyecto
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agent.generador_sintetico import generar_tick_json_sintetico
+from agent.diagnostico import configurar
+
+# =====================================================================================
+# Benchmarks del agente: microbenchmarks y escalamiento (camiones × palas × ticks)
+# =====================================================================================
+# Cada caso corre en un proceso nuevo (así el pico de RSS es solo de ese caso) sobre datos
+# de generador_sintetico.py con una semilla fija. Se mide el mejor tiempo y la mediana
+# de `--repeticiones` corridas.
+#
+#   python benchmarks/benchmark_agente.py                                   -> tabla + resultados JSON
+#   python benchmarks/benchmark_agente.py --escalas 5x6x100,50x10x500 --casos state_builder3,allticks
+#   python benchmarks/benchmark_agente.py --guardar-baseline benchmarks/baseline.json
+#   python benchmarks/benchmark_agente.py --baseline benchmarks/baseline.json   -> compara; código 1 si hay regresiones
+#
+# La baseline depende de la máquina: se guarda en la misma máquina en que se va a comparar.
+
+SHOVEL_NAMES_BASE = ['PH002', 'EX004', 'PH003', 'PH001', 'CF001', 'CF002']
+ESCALAS = "5x6x100,20x6x300,50x10x300"
+SALIDA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+# ==== DATOS ====
+def palas_para(n_palas):
+    """Nombres de palas: las de producción y, si faltan, PX007, PX008, ..."""
+    return (SHOVEL_NAMES_BASE + [f"PX{i + 1:03d}" for i in range(len(SHOVEL_NAMES_BASE), n_palas)])[:n_palas]
+
+
+def generar_datos(camiones, palas, ticks, semilla):
+    """Ticks sintéticos con el esquema de producción (ETA, main_state, priority, coverage, ...)."""
+    shovel_names = palas_para(palas)
+    tick_json = generar_tick_json_sintetico(shovel_names, num_ticks=ticks, num_trucks=camiones, semilla=semilla)
+    return tick_json, shovel_names
+
+
+def _estados_de(tick_json, shovel_names):
+    from agent.state_builder import state_builder3
+    estados = []
+    for tick in tick_json.values():
+        estados.extend(state_builder3(tick, shovel_names)[0])
+    return estados
+
+
+# ==== CASOS ====
+# Cada caso recibe (tick_json, shovel_names) y devuelve (correr, info): correr() hace una
+# repetición y retorna el número de operaciones; info() agrega datos al resultado (p. ej. estados).
+
+def caso_state_builder3(tick_json, shovel_names):
+    from agent.state_builder import state_builder3
+    ticks = list(tick_json.values())
+
+    def correr():
+        n = 0
+        for tick in ticks:
+            n += len(state_builder3(tick, shovel_names)[0])
+        return n
+    return correr, dict
+
+
+def caso_calcular_recompensa(tick_json, shovel_names):
+    from agent.rewards import calcular_recompensa
+    llamadas = []
+    for tick in tick_json.values():
+        for info in tick["truck_states"].values():
+            for action in shovel_names:
+                llamadas.append((info["status"], action, tick["shovel_states"], info["ETA"]))
+
+    def correr():
+        for status, action, shovels_info, etas in llamadas:
+            calcular_recompensa(status=status, action=action, shovels_info=shovels_info, truck_etas=etas)
+        return len(llamadas)
+    return correr, dict
+
+
+def _agente_con_estados(tick_json, shovel_names):
+    from agent.q_learning_agent import QLearningAgent
+    estados = _estados_de(tick_json, shovel_names)
+    agent = QLearningAgent(actions=shovel_names, epsilon=0.1)
+    rng = random.Random(0)
+    for state in estados:
+        agent.q_table[state] = {a: rng.uniform(-5, 5) for a in shovel_names}
+    return agent, estados
+
+
+def caso_choose_action(tick_json, shovel_names):
+    agent, estados = _agente_con_estados(tick_json, shovel_names)
+
+    def correr():
+        for state in estados:
+            agent.choose_action(state, shovel_names)
+        return len(estados)
+    return correr, lambda: {"estados": len(agent.q_table)}
+
+
+def caso_update(tick_json, shovel_names):
+    agent, estados = _agente_con_estados(tick_json, shovel_names)
+    rng = random.Random(1)
+    transiciones = [(s, rng.choice(shovel_names), rng.uniform(-10, 10), estados[(i + 1) % len(estados)])
+                    for i, s in enumerate(estados)]
+
+    def correr():
+        for state, action, reward, next_state in transiciones:
+            agent.update(state, action, reward, next_state, shovel_names)
+        return len(transiciones)
+    return correr, lambda: {"estados": len(agent.q_table)}
+
+
+def _caso_episodio(clase):
+    def caso(tick_json, shovel_names):
+        from agent.tick_cache import compilar_tick_json
+        from agent.transiciones import construir_tabla_transiciones, reproducir_episodio
+        tabla = construir_tabla_transiciones(compilar_tick_json(tick_json), shovel_names)
+        agent = clase(actions=shovel_names, epsilon=1.0)
+
+        def correr():
+            reproducir_episodio(agent, tabla)
+            agent.decay_epsilon()
+            return tabla.n_filas
+        return correr, lambda: {"estados": len(agent.q_table)}
+    return caso
+
+
+def caso_episodio_dict(tick_json, shovel_names):
+    from agent.q_learning_agent import QLearningAgent
+    return _caso_episodio(QLearningAgent)(tick_json, shovel_names)
+
+
+def caso_episodio_array(tick_json, shovel_names):
+    from agent.q_table_array import ArrayQLearningAgent
+    return _caso_episodio(ArrayQLearningAgent)(tick_json, shovel_names)
+
+
+def caso_allticks(tick_json, shovel_names):
+    """Ejecucion_Agente_AllTicks completo (decisión + recompensa + update + checkpoints) sobre todos los ticks."""
+    # Por ruta: el paquete `test` de la biblioteca estándar tapa a test/ del repo
+    import importlib.util
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'Ejecucion_Agente_AllTicks.py')
+    spec = importlib.util.spec_from_file_location("Ejecucion_Agente_AllTicks", ruta)
+    validacion = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(validacion)
+    validacion.SHOVEL_NAMES = shovel_names
+    directorio = tempfile.mkdtemp(prefix="benchmark_allticks_")
+    resultado = {}
+
+    def correr():
+        qtable_path = os.path.join(directorio, f"q_table_{len(os.listdir(directorio))}.pkl")
+        with contextlib.redirect_stdout(io.StringIO()):
+            metricas = validacion.ejecutar_validacion(qtable_path=qtable_path, nuevos_ticks=tick_json)
+        resultado["qtable_path"] = qtable_path
+        return metricas["total_ticks_procesados"]
+
+    def info():
+        with open(resultado["qtable_path"], "rb") as f:
+            estados = len(pickle.load(f))
+        datos = {"estados": estados, "qtable_bytes": os.path.getsize(resultado["qtable_path"])}
+        shutil.rmtree(directorio, ignore_errors=True)
+        return datos
+    return correr, info
+
+
+CASOS = {
+    "state_builder3": caso_state_builder3,
+    "calcular_recompensa": caso_calcular_recompensa,
+    "choose_action": caso_choose_action,
+    "update": caso_update,
+    "episodio_dict": caso_episodio_dict,
+    "episodio_array": caso_episodio_array,
+    "allticks": caso_allticks,
+}
+
+
+# ==== EJECUCIÓN ====
+def rss_pico_mb():
+    """Pico de memoria residente del proceso (None si el sistema no lo informa, p. ej. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KB y macOS en bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def ejecutar_caso(nombre, escala, repeticiones, semilla, verbosidad):
+    """Un caso en una escala; corre en un proceso propio. Retorna el dict de resultado."""
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+    configurar(verbosidad, salida=logging.info)
+    camiones, palas, ticks = escala
+    tick_json, shovel_names = generar_datos(camiones, palas, ticks, semilla)
+    correr, info = CASOS[nombre](tick_json, shovel_names)
+
+    tiempos = []
+    ops = 0
+    for _ in range(repeticiones):
+        random.seed(semilla)
+        inicio = time.perf_counter()
+        ops = correr()
+        tiempos.append(time.perf_counter() - inicio)
+
+    mejor = min(tiempos)
+    return {
+        "caso": nombre,
+        "escala": "x".join(map(str, escala)),
+        "camiones": camiones, "palas": palas, "ticks": ticks,
+        "ops": ops,
+        "segundos_min": mejor,
+        "segundos_mediana": statistics.median(tiempos),
+        "ops_por_segundo": ops / mejor if mejor > 0 else None,
+        "rss_pico_mb": rss_pico_mb(),
+        **info(),
+    }
+
+
+def leer_escalas(texto):
+    """"5x6x100,20x6x300" -> [(5, 6, 100), (20, 6, 300)] (camiones x palas x ticks)."""
+    escalas = []
+    for parte in texto.split(","):
+        valores = tuple(int(v) for v in parte.strip().lower().split("x"))
+        if len(valores) != 3 or min(valores) < 1 or valores[2] < 2:
+            raise argparse.ArgumentTypeError(f"Escala inválida {parte!r}: camionesxpalasxticks (ticks >= 2)")
+        escalas.append(valores)
+    return escalas
+
+
+def comparar(resultados, baseline, tolerancia):
+    """
+    Compara ops/s con la baseline por (caso, escala).
+
+    Retorna:
+    - (filas, regresiones): filas para la tabla y lista de las que bajaron más que `tolerancia`.
+    """
+    base = {(r["caso"], r["escala"]): r for r in baseline["resultados"]}
+    filas, regresiones = [], []
+    for r in resultados:
+        b = base.get((r["caso"], r["escala"]))
+        cambio = None
+        if b and b.get("ops_por_segundo") and r.get("ops_por_segundo"):
+            cambio = r["ops_por_segundo"] / b["ops_por_segundo"] - 1.0
+            if cambio < -tolerancia:
+                regresiones.append(r)
+        filas.append((r, b, cambio))
+    return filas, regresiones
+
+
+def imprimir_tabla(filas, tolerancia):
+    print(f"{'caso':<20} {'escala':<12} {'ops/s':>14} {'baseline':>14} {'cambio':>8} {'rss MB':>8} {'estados':>9}")
+    for r, b, cambio in filas:
+        base = f"{b['ops_por_segundo']:14.1f}" if b and b.get("ops_por_segundo") else f"{'-':>14}"
+        texto_cambio = f"{cambio:+8.1%}" if cambio is not None else f"{'-':>8}"
+        marca = "  REGRESIÓN" if cambio is not None and cambio < -tolerancia else ""
+        rss = f"{r['rss_pico_mb']:8.1f}" if r["rss_pico_mb"] is not None else f"{'-':>8}"
+        print(f"{r['caso']:<20} {r['escala']:<12} {r['ops_por_segundo']:14.1f} {base} {texto_cambio} {rss} "
+              f"{r.get('estados', ''):>9}{marca}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del agente RL")
+    parser.add_argument("--escalas", type=leer_escalas, default=leer_escalas(ESCALAS),
+                        help=f"camionesxpalasxticks separadas por coma (por defecto {ESCALAS})")
+    parser.add_argument("--casos", default=",".join(CASOS), help="casos separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--verbosidad", default="resumen", help="verbosidad de los loops (diagnostico.py)")
+    parser.add_argument("--salida", default=None, help="JSON de resultados (por defecto benchmarks/resultados/<fecha>.json)")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--guardar-baseline", default=None, help="además, guarda los resultados como baseline aquí")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="caída de ops/s tolerada antes de marcar regresión")
+    args = parser.parse_args(argv)
+
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconocidos = [c for c in casos if c not in CASOS]
+    if desconocidos:
+        parser.error(f"Casos desconocidos: {desconocidos}. Disponibles: {list(CASOS)}")
+
+    resultados = []
+    # Un proceso nuevo por caso: el pico de RSS y los imports no se mezclan entre casos
+    contexto = mp.get_context("spawn")
+    for escala in args.escalas:
+        for nombre in casos:
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as ejecutor:
+                r = ejecutor.submit(ejecutar_caso, nombre, escala, args.repeticiones, args.semilla,
+                                    args.verbosidad).result()
+            resultados.append(r)
+            print(f"  {r['caso']:<20} {r['escala']:<12} {r['ops_por_segundo']:14.1f} ops/s", flush=True)
+
+    informe = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "procesador": platform.processor() or platform.machine(),
+            "repeticiones": args.repeticiones,
+            "semilla": args.semilla,
+            "verbosidad": args.verbosidad,
+        },
+        "resultados": resultados,
+    }
+    salida = args.salida or os.path.join(SALIDA, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2)
+    if args.guardar_baseline:
+        with open(args.guardar_baseline, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    filas, regresiones = comparar(resultados, baseline or {"resultados": []}, args.tolerancia)
+    print()
+    imprimir_tabla(filas, args.tolerancia)
+    print(f"\nResultados guardados en: {salida}")
+    if regresiones:
+        print(f"{len(regresiones)} regresiones de más de {args.tolerancia:.0%} respecto a {args.baseline}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
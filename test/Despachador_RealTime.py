@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+from datetime import datetime
+import yaml
+
+# Importar funciones y clases del proyecto
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agent.despacho import ColaTicks, Despachador, PersistenciaAsincrona, recuperar_estado
+from agent.discretizacion import cargar_discretizacion
+from agent.diagnostico import configurar, activo, ResumenEpisodio, NORMAL
+from agent.q_learning_agent import QLearningAgent
+from agent.q_table_compacta import CompactoQLearningAgent
+from agent.poda_q_table import PodaQTable
+
+# =====================================================================================
+# Despachador residente: la versión de larga duración de Ejecucion_Agente_RealTime.py
+# =====================================================================================
+# Carga config.yaml, la Q-table y las decisiones pendientes UNA sola vez y después procesa
+# tick tras tick con todo en memoria. Las pendientes van al WAL en cada tick y la Q-table se guarda
+# en segundo plano (mismos archivos que el script de un tick, así se puede volver a él en cualquier momento).
+#
+# Entrada (config.yaml -> despacho.entrada, o el primer argumento):
+#   python Despachador_RealTime.py inbox   -> cada archivo *.json nuevo en inbox_dir es un tick;
+#                                             las asignaciones se escriben en salida_dir con el mismo nombre
+#   python Despachador_RealTime.py stdin   -> una línea JSON por tick; una línea JSON de asignaciones por tick en stdout
+#
+# Se detiene con Ctrl+C / SIGTERM (o fin de stdin) y antes de salir deja la Q-table completa en disco.
+
+# Cargar archivo YAML
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml"), "r", encoding="utf-8") as f:
+    config = yaml.safe_load(f)
+
+# Paths
+QTABLE_PATH = config["paths"]["qtable_path"]
+DECISION_LOG_PATH = config["paths"]["decision_log_path"]
+DECISION_WAL_PATH = config["paths"]["decision_wal_path"]
+WAL_FSYNC_CADA = config["paths"].get("wal_fsync_cada", 1)
+LOG_DIR = config["paths"]["log_dir"]
+SHOVEL_NAMES = config["agent"]["shovel_names"]
+CLASE_AGENTE = CompactoQLearningAgent if config["agent"].get("q_table_compacta") else QLearningAgent
+# La misma discretización del entrenamiento (sin ella los estados no coinciden con la Q-table)
+ESPEC = cargar_discretizacion(config["paths"].get("discretizacion_path"))
+
+# Despacho
+DESPACHO = config["despacho"]
+ENTRADA = sys.argv[1] if len(sys.argv) > 1 else DESPACHO["entrada"]
+INBOX_DIR = DESPACHO["inbox_dir"]
+SALIDA_DIR = DESPACHO["salida_dir"]
+INTERVALO_INBOX = DESPACHO["intervalo_inbox"]
+
+os.makedirs(LOG_DIR, exist_ok=True)
+LOG_PATH = os.path.join(LOG_DIR, f"despachador_rl_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+
+# Solo a archivo: con entrada stdin, stdout es el canal de las asignaciones
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] RLDispatcher: %(message)s",
+    handlers=[logging.FileHandler(LOG_PATH, encoding='utf-8')]
+)
+configurar(config["logging"].get("verbosidad"), salida=logging.info)
+
+detener = threading.Event()
+
+
+# ==== LECTORES DE TICKS ====
+def leer_inbox(cola):
+    """Revisa INBOX_DIR; cada *.json se lee, se mueve a procesados/ y se encola."""
+    procesados = os.path.join(INBOX_DIR, "procesados")
+    os.makedirs(procesados, exist_ok=True)
+    while not detener.is_set():
+        for nombre in sorted(os.listdir(INBOX_DIR)):
+            if not nombre.endswith(".json"):
+                continue
+            ruta = os.path.join(INBOX_DIR, nombre)
+            try:
+                with open(ruta, "r", encoding="utf-8") as f:
+                    tick_data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"No se pudo leer el tick {nombre}: {e}")
+                tick_data = None
+            os.replace(ruta, os.path.join(procesados, nombre))
+            if tick_data is not None:
+                encolar(cola, nombre, tick_data)
+        detener.wait(INTERVALO_INBOX)
+    cola.cerrar()
+
+
+def leer_stdin(cola):
+    """Una línea JSON por tick; al terminar stdin se cierra la cola."""
+    for n, linea in enumerate(sys.stdin):
+        if detener.is_set():
+            break
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            tick_data = json.loads(linea)
+        except ValueError as e:
+            logging.error(f"Línea {n + 1} de stdin no es JSON válido: {e}")
+            continue
+        encolar(cola, f"linea-{n + 1}", tick_data)
+    cola.cerrar()
+
+
+def encolar(cola, nombre, tick_data):
+    descartado = cola.poner((nombre, tick_data, time.perf_counter()))
+    if descartado is not None:
+        logging.warning(f"Cola llena ({cola.politica}): se descarta el tick {descartado[0]}")
+
+
+# ==== SALIDA ====
+def emitir(nombre, resultado):
+    if ENTRADA == "stdin":
+        print(json.dumps(resultado, default=str), flush=True)
+        return
+    ruta = os.path.join(SALIDA_DIR, nombre)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(resultado, f, default=str)
+    os.replace(ruta + ".tmp", ruta)
+
+
+# ==== CARGAR AGENTE Y DECISIONES PENDIENTES (una sola vez) ====
+# Q-table + WAL: reaplica los updates que la Q-table guardada no alcanzó a incluir
+agent, wal, checkpoints, checkpoint_info = recuperar_estado(QTABLE_PATH, DECISION_WAL_PATH, SHOVEL_NAMES,
+                                                            decision_pickle=DECISION_LOG_PATH,
+                                                            compactar_cada=DESPACHO["compactar_cada"],
+                                                            fsync_cada=WAL_FSYNC_CADA,
+                                                            politica_path=config["paths"].get("politica_path"),
+                                                            clase=CLASE_AGENTE)
+if checkpoint_info is not None:
+    logging.info(f"Q-table cargada con {len(agent.q_table)} estados conocidos.")
+else:
+    logging.warning("No se encontró Q-table previa. Iniciando desde cero.")
+
+# Techo de la Q-table (agent.poda en config.yaml): sin él crece con cada estado nuevo
+poda = PodaQTable.desde_config(agent, config["agent"].get("poda"))
+despachador = Despachador(agent, SHOVEL_NAMES, wal, ESPEC, poda)
+logging.info(f"{len(despachador.pendientes)} decisiones pendientes cargadas.")
+persistencia = PersistenciaAsincrona(despachador, checkpoints,
+                                     intervalo_segundos=DESPACHO["intervalo_persistencia"]).iniciar()
+cola = ColaTicks(DESPACHO["cola_max"], DESPACHO["politica"])
+resumen = ResumenEpisodio(intervalo_segundos=10.0)
+
+if ENTRADA == "stdin":
+    lector = threading.Thread(target=leer_stdin, args=(cola,), name="lector", daemon=True)
+else:
+    os.makedirs(INBOX_DIR, exist_ok=True)
+    os.makedirs(SALIDA_DIR, exist_ok=True)
+    lector = threading.Thread(target=leer_inbox, args=(cola,), name="lector", daemon=True)
+
+
+def terminar(signum, frame):
+    detener.set()
+    cola.cerrar()
+
+
+signal.signal(signal.SIGTERM, terminar)
+signal.signal(signal.SIGINT, terminar)
+lector.start()
+logging.info(f"Despachador iniciado (entrada: {ENTRADA}, cola: {cola.maximo}, política: {cola.politica}).")
+
+# ==== LOOP PRINCIPAL ====
+try:
+    while True:
+        item = cola.sacar(timeout=1.0)
+        if item is None:
+            if cola.cerrada and not len(cola):
+                break
+            continue
+        nombre, tick_data, llegada = item
+        resultado = despachador.procesar_tick(tick_data)
+        emitir(nombre, resultado)
+
+        for error in resultado["errores"]:
+            logging.error(error)
+        if activo(NORMAL):
+            for asignacion in resultado["asignaciones"]:
+                logging.info(f"[{nombre}] Camión {asignacion['Truck']} Asignar a {asignacion['Shovel']}")
+        resumen.sumar("ticks")
+        resumen.sumar("asignaciones", len(resultado["asignaciones"]))
+        resumen.sumar("podados", resultado["podados"])
+        resumen.sumar("segundos_proceso", resultado["segundos"])
+        resumen.sumar("segundos_espera", time.perf_counter() - llegada - resultado["segundos"])
+        resumen.emitir("[Despacho]", descartados=cola.descartados)
+finally:
+    detener.set()
+    persistencia.detener()
+    logging.info(f"Despachador detenido: {despachador.ticks_procesados} ticks procesados, "
+                 f"{cola.descartados} descartados, {persistencia.guardados} guardados.")
+    if poda is not None:
+        logging.info(f"[Poda] {poda.resumen()}")
@@ -2,20 +2,30 @@
 #=======================================================================
 # 1. Importación y configuración de entorno
 #=======================================================================
+import time
+_INICIO = time.perf_counter()  # antes de los imports: el desglose de arranque los incluye
 import os, sys
 # Agregamos el directorio padre al path para poder importar módulos del proyecto
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import time
-import pickle
 import json
+import numpy as np
 from agent.q_learning_agent import QLearningAgent
-from agent.state_builder import state_builder3
+# ArrayQLearningAgent y ReplayBuffer se importan solo con TAMANO_LOTE_ONLINE > 0
+from agent.state_builder import state_builder3, estados_tick
 from agent.rewards import calcular_recompensa
+from agent.diagnostico import configurar, activo, ResumenEpisodio, NORMAL
+from agent.checkpoint_delta import CheckpointDelta, cargar_checkpoint
+from agent.arranque import TiemposArranque
+from agent.discretizacion import cargar_discretizacion
+from agent.poda_q_table import PodaQTable
 
 import logging
 from datetime import datetime
 
+arranque = TiemposArranque(_INICIO)
+arranque.marcar("imports")
+
 # ================================================================
 # 2. Configuración de parámetros y rutas
 # ================================================================
@@ -24,10 +34,41 @@ QTABLE_PATH = r"C:\Simluador_Opt_GRUPAL\Simulador_Inteligente\MVP1\src_new\algor
 
 # Cada cuántos ticks se guarda la Q-table en produccion 
 QTABLE_SAVE_INTERVAL = 5  # cada cuántos ticks guardamos
+# Los guardados periódicos solo agregan las filas modificadas a QTABLE_PATH + ".delta"
+# (checkpoint_delta.py); cada QTABLE_COMPACTAR_CADA guardados, y al terminar, se reescribe
+# QTABLE_PATH completo (mismo formato dict de siempre).
+QTABLE_COMPACTAR_CADA = 20
+
+# Aprendizaje por lotes: con TAMANO_LOTE_ONLINE > 0 las transiciones se acumulan en un buffer
+# y se aplican juntas (update_lote) al cerrar el tick en que se juntan al menos ese número.
+# Con 0 se actualiza la Q-table camión por camión, como siempre.
+TAMANO_LOTE_ONLINE = 0
+
+# Verbosidad del log: "normal" (detalle por camión: Q-values, justificación, comparación de palas),
+# "resumen" (una línea de agregados por tick) o "silencio". None usa la variable de entorno RL_VERBOSIDAD.
+# En "resumen" no se arma ni se formatea nada del detalle por camión.
+VERBOSIDAD = None
+# Mínimo de segundos entre dos líneas de resumen (0 = una por tick)
+RESUMEN_INTERVALO_SEGUNDOS = 0.0
 
 # Acciones posibles: nombres de palas que se pueden asignar
 SHOVEL_NAMES = ['PH002', 'EX004', 'PH003', 'PH001', 'CF001', 'CF002']
 
+# Discretización del estado con la que se entrenó la Q-table (JSON/YAML, ver agent/discretizacion.py).
+# None = estado de state_builder3 sin cambios.
+DISCRETIZACION_PATH = None
+
+# Q-table compacta (agent/q_table_compacta.py): un array('d') por estado en vez de un dict {accion: Q}.
+# Mismas decisiones y mismo pickle; ~3x menos memoria por estado. Solo con TAMANO_LOTE_ONLINE = 0.
+Q_TABLE_COMPACTA = False
+
+# Techo de la Q-table (agent/poda_q_table.py): con QTABLE_MAX_ESTADOS o QTABLE_MAX_MB, al superarlo se
+# sacan estados según QTABLE_POLITICA_PODA ("lru", "min_visitas" o "ceros"). None = la tabla solo crece.
+# Solo con TAMANO_LOTE_ONLINE = 0.
+QTABLE_MAX_ESTADOS = None
+QTABLE_MAX_MB = None
+QTABLE_POLITICA_PODA = "lru"
+
 # Datos a Procesar(Inputs) en formato json
 TICK_FILE = r"C:\Simluador_Opt_GRUPAL\Simulador_Inteligente\MVP1\src_new\algorithms\RL_model\agent\MINE-hudbay-TicksTrainRL-TIME-2025-08-01.json"
 
@@ -36,19 +77,26 @@ TICK_FILE = r"C:\Simluador_Opt_GRUPAL\Simulador_Inteligente\MVP1\src_new\algorit
 #========================================================================
 # Ruta donde se guardaran los LOGS de los Procesamientos Agente RL
 LOG_DIR = r"C:\Simluador_Opt_GRUPAL\Simulador_Inteligente\MVP1\src_new\algorithms\RL_model\logs"
-LOG_FILE = f"agente_rl_produccion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-LOG_PATH = os.path.join(LOG_DIR, LOG_FILE)
-# Asegurarse que el directorio exista
-os.makedirs(LOG_DIR, exist_ok=True) # Crear carpeta si no existe
-# Configuración del logger
-logging.basicConfig(
-    level=logging.INFO,  # Esto asegura que todo lo importante se guarda tanto en consola como en archivo Log
-    format="%(asctime)s [%(levelname)s] RLDispatcher: %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_PATH, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+
+
+def configurar_logger(log_dir=LOG_DIR):
+    """Crea el archivo de log de la ejecución y conecta los diagnósticos del agente. Retorna su ruta."""
+    log_file = f"agente_rl_produccion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    log_path = os.path.join(log_dir, log_file)
+    # Asegurarse que el directorio exista
+    os.makedirs(log_dir, exist_ok=True) # Crear carpeta si no existe
+    # Configuración del logger
+    logging.basicConfig(
+        level=logging.INFO,  # Esto asegura que todo lo importante se guarda tanto en consola como en archivo Log
+        format="%(asctime)s [%(levelname)s] RLDispatcher: %(message)s",
+        handlers=[
+            logging.FileHandler(log_path, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+    # Los diagnósticos del agente (p. ej. estados nuevos) también van al logger
+    configurar(VERBOSIDAD, salida=logging.info)
+    return log_path
 
 #======================================
 # 4. Funciones auxiliares
@@ -165,285 +213,378 @@ def mostrar_comparacion_opciones(state, action, q_table, truck_etas, shovels_inf
     #print(f"   {'─'*80}")
     logging.info(f"   {'─'*80}")
 
-# ======================================
-# 5. Carga del agente entrenado
-# ======================================
-agent = QLearningAgent(actions=SHOVEL_NAMES)
-
-# Cargar Q-table entrenada: Si ya existe una Q-table guardada, la cargamos
-if os.path.exists(QTABLE_PATH):
-    with open(QTABLE_PATH, "rb") as f:
-        agent.q_table = pickle.load(f)
-    print(f"Q-table cargada exitosamente desde: {QTABLE_PATH}")
-    print(f"   Estados conocidos: {len(agent.q_table)}")
-else:
-    print("No se encontró Q-table previa. Se iniciará desde cero.")
-
-# Guardamos una copia de la Q-table inicial para comparar después
-q_table_inicial = agent.q_table.copy()
-
-# =====================================================
-# 6. Cargar Datos De Producción (ticks REALES)
-# =====================================================
-print(f"\nCargando datos de producción desde: {TICK_FILE}")
-with open(TICK_FILE, "r") as f:
-    nuevos_ticks = json.load(f)
-
-# Extraemos y ordenamos las claves (ticks numéricos) de menor a mayor
-tick_keys = sorted([k for k in nuevos_ticks if k.isdigit()], key=int)
-total_ticks = len(tick_keys)
-print(f"Datos cargados: {total_ticks} ticks encontrados")
-
-# ===============================================================
-# 7. Flujo de Procesamiento del Agente RL en Producción
-# ==============================================================
-logging.info("Iniciando validación del agente en producción con datos REALES...")
-
-# Métricas globales para toda la ejecución
-metricas_globales = {
-    "total_ticks_procesados": 0,
-    "total_camiones_optimizados": 0,
-    "total_camiones_fijos": 0,
-    "total_camiones_error": 0,
-    "recompensa_total_acumulada": 0.0,
-    "estados_nuevos_encontrados": 0,
-    "acciones_por_pala": {a: 0 for a in SHOVEL_NAMES},
-    "decisiones_exploracion": 0,
-    "decisiones_explotacion": 0,
-    "q_values_actualizados": 0,
-    "estados_unicos_vistos": set()
-}
-
-# ==========================================
-# 7.1 Se procesan de a pares de ticks (actual y siguiente)
-# ==========================================
-for idx, tick_id in enumerate(tick_keys[:-1]):
-    tick_actual = nuevos_ticks[tick_id] # tick actual
-    tick_siguiente = nuevos_ticks[tick_keys[idx + 1]] # tick siguiente
-    
-    truck_states = tick_actual["truck_states"]
-    shovels_info = tick_actual["shovel_states"]
-
-    # ==============================================================================
-    # 7.2 Clasificamos los camiones
-    # ============================================================================
-    camiones_optimizados = []
-    camiones_fijos = []
-    camiones_error = []
-
-    # Logica para poner camiones Fijadas o Libres para Optimizar
-    for truck_id, truck_info in truck_states.items():
-        if truck_info.get("status") != "waiting for shovel":
-            camiones_fijos.append(truck_id)
-        else:
-            camiones_optimizados.append(truck_id)
-
-    # Actualizar métricas globales
-    metricas_globales["total_ticks_procesados"] += 1
-    metricas_globales["total_camiones_fijos"] += len(camiones_fijos)
-
-    # ============================================================================
-    # Logging inicial del tick
-    # ============================================================================
-    logging.info(f"[Tick {tick_id}] INICIO -> Optimizar: {camiones_optimizados} | Fijos: {camiones_fijos}")
-
-    camiones_realmente_optimizados = []
-    
-    # 7.3 Por cada camión optimizable
-    for truck_id in camiones_optimizados:
-        try:
-            # Extraer información del camión y palas para el estado actual
-            tick_info = {
-                "truck_states": {truck_id: truck_states[truck_id]},
-                "shovel_states": shovels_info
-            }
-
-            # Construir estado actual
-            states_result, truck_names_result = state_builder3(tick_info, SHOVEL_NAMES)
-            state = states_result[0]  # Tomamos el estado del primer (y único) camión
-
-            # Chequeo de existencia en la Q-table entrenada
-            if state in agent.q_table:
-                logging.info(f"Estado encontrado en Q-table: {state}")
+# ==========================================================================
+# 5-8. Validación completa (también la usa benchmarks/benchmark_agente.py)
+# ==========================================================================
+def ejecutar_validacion(qtable_path=QTABLE_PATH, tick_file=TICK_FILE, nuevos_ticks=None, log_path=None,
+                        arranque=None, discretizacion_path=DISCRETIZACION_PATH):
+    """
+    Procesa todos los ticks con el agente (decisión, recompensa y update por camión),
+    guarda la Q-table y muestra las métricas finales.
+
+    Parámetros:
+    - qtable_path: Q-table a cargar y actualizar.
+    - tick_file: JSON de ticks; no se lee si se da `nuevos_ticks` (mismo formato, ya cargado).
+    - log_path: solo para mostrarlo al final.
+    - arranque: TiemposArranque donde seguir marcando las fases (por defecto uno nuevo).
+    - discretizacion_path: especificación de discretización de la Q-table (None = sin discretizar).
+
+    Retorna:
+    - metricas_globales (dict con totales de camiones, recompensas, decisiones, ...).
+    """
+    arranque = arranque or TiemposArranque()
+    espec = cargar_discretizacion(discretizacion_path)
+    resumen_tick = ResumenEpisodio(intervalo_segundos=RESUMEN_INTERVALO_SEGUNDOS)
+
+    # ======================================
+    # 5. Carga del agente entrenado
+    # ======================================
+    if TAMANO_LOTE_ONLINE > 0:
+        from agent.q_table_array import ArrayQLearningAgent
+        from agent.replay_buffer import ReplayBuffer
+        agent = ArrayQLearningAgent(actions=SHOVEL_NAMES)
+        buffer = ReplayBuffer(max(10 * TAMANO_LOTE_ONLINE, 10_000), len(SHOVEL_NAMES))
+    elif Q_TABLE_COMPACTA:
+        from agent.q_table_compacta import CompactoQLearningAgent
+        agent = CompactoQLearningAgent(actions=SHOVEL_NAMES)
+    else:
+        agent = QLearningAgent(actions=SHOVEL_NAMES)
+
+    # Cargar Q-table entrenada: Si ya existe una Q-table guardada, la cargamos
+    if os.path.exists(qtable_path):
+        # Base + cambios del log incremental (si una ejecución anterior se cortó antes de compactar)
+        agent.q_table, _ = cargar_checkpoint(qtable_path)
+        print(f"Q-table cargada exitosamente desde: {qtable_path}")
+        print(f"   Estados conocidos: {len(agent.q_table)}")
+    else:
+        print("No se encontró Q-table previa. Se iniciará desde cero.")
+
+    # Guardamos una copia de la Q-table inicial para comparar después
+    q_table_inicial = agent.q_table.copy()
+    checkpoints = CheckpointDelta(qtable_path, compactar_cada=QTABLE_COMPACTAR_CADA)
+    poda = PodaQTable.desde_config(agent, {"max_estados": QTABLE_MAX_ESTADOS, "max_mb": QTABLE_MAX_MB,
+                                           "politica": QTABLE_POLITICA_PODA})
+    arranque.marcar("qtable")
+
+    # =====================================================
+    # 6. Cargar Datos De Producción (ticks REALES)
+    # =====================================================
+    if nuevos_ticks is None:
+        print(f"\nCargando datos de producción desde: {tick_file}")
+        with open(tick_file, "r") as f:
+            nuevos_ticks = json.load(f)
+
+    # Extraemos y ordenamos las claves (ticks numéricos) de menor a mayor
+    tick_keys = sorted([k for k in nuevos_ticks if k.isdigit()], key=int)
+    total_ticks = len(tick_keys)
+    print(f"Datos cargados: {total_ticks} ticks encontrados")
+    arranque.marcar("ticks")
+    print(f"Arranque: {arranque.resumen()}")
+    logging.info(f"[Arranque] {arranque.resumen()}")
+
+    # ===============================================================
+    # 7. Flujo de Procesamiento del Agente RL en Producción
+    # ==============================================================
+    logging.info("Iniciando validación del agente en producción con datos REALES...")
+
+    # Métricas globales para toda la ejecución
+    metricas_globales = {
+        "total_ticks_procesados": 0,
+        "total_camiones_optimizados": 0,
+        "total_camiones_fijos": 0,
+        "total_camiones_error": 0,
+        "recompensa_total_acumulada": 0.0,
+        "estados_nuevos_encontrados": 0,
+        "acciones_por_pala": {a: 0 for a in SHOVEL_NAMES},
+        "decisiones_exploracion": 0,
+        "decisiones_explotacion": 0,
+        "q_values_actualizados": 0,
+        "estados_unicos_vistos": set()
+    }
+
+    # ==========================================
+    # 7.1 Se procesan de a pares de ticks (actual y siguiente)
+    # ==========================================
+    for idx, tick_id in enumerate(tick_keys[:-1]):
+        tick_actual = nuevos_ticks[tick_id] # tick actual
+        tick_siguiente = nuevos_ticks[tick_keys[idx + 1]] # tick siguiente
+
+        truck_states = tick_actual["truck_states"]
+        shovels_info = tick_actual["shovel_states"]
+
+        # ==============================================================================
+        # 7.2 Clasificamos los camiones
+        # ============================================================================
+        camiones_optimizados = []
+        camiones_fijos = []
+        camiones_error = []
+
+        # Logica para poner camiones Fijadas o Libres para Optimizar
+        for truck_id, truck_info in truck_states.items():
+            if truck_info.get("status") != "waiting for shovel":
+                camiones_fijos.append(truck_id)
             else:
-                logging.warning(f"Estado Nuevo NO encontrado en Q-table: {state}")
+                camiones_optimizados.append(truck_id)
 
+        # Actualizar métricas globales
+        metricas_globales["total_ticks_procesados"] += 1
+        metricas_globales["total_camiones_fijos"] += len(camiones_fijos)
 
-            # Filtrar acciones válidas con ETAs reales
-            truck_etas = truck_states[truck_id].get("ETA", {})
-            valid_actions = list(truck_etas.keys())
-            #valid_actions = SHOVEL_NAMES
+        # ============================================================================
+        # Logging inicial del tick
+        # ============================================================================
+        detalle = activo(NORMAL)
+        if detalle:
+            logging.info(f"[Tick {tick_id}] INICIO -> Optimizar: {camiones_optimizados} | Fijos: {camiones_fijos}")
 
-            # Verificar si es un estado nuevo
-            if state not in q_table_inicial:
-                metricas_globales["estados_nuevos_encontrados"] += 1
-                logging.info(f"NUEVO ESTADO detectado con respecto al entrenamiento: {state}")
+        camiones_realmente_optimizados = []
 
-            # Si la accion no es valida entonces ese Camion, se agrega como Error, porque no se procesara
-            if not valid_actions:
+        # Estados de todos los camiones del tick actual y del siguiente, en una sola pasada por tick
+        # (los del siguiente se reutilizan como actuales en la próxima iteración)
+        estados_actuales = estados_siguientes if idx > 0 else estados_tick(tick_actual, SHOVEL_NAMES, espec)
+        estados_siguientes = estados_tick(tick_siguiente, SHOVEL_NAMES, espec)
+
+        # 7.3 Por cada camión optimizable
+        for truck_id in camiones_optimizados:
+            try:
+                # Construir estado actual
+                state = estados_actuales[truck_id]
+
+                # Chequeo de existencia en la Q-table entrenada
+                if state in agent.q_table:
+                    if detalle:
+                        logging.info(f"Estado encontrado en Q-table: {state}")
+                else:
+                    logging.warning(f"Estado Nuevo NO encontrado en Q-table: {state}")
+
+
+                # Filtrar acciones válidas con ETAs reales
+                truck_etas = truck_states[truck_id].get("ETA", {})
+                valid_actions = list(truck_etas.keys())
+                #valid_actions = SHOVEL_NAMES
+
+                # Verificar si es un estado nuevo
+                if state not in q_table_inicial:
+                    metricas_globales["estados_nuevos_encontrados"] += 1
+                    resumen_tick.sumar("estados_nuevos")
+                    if detalle:
+                        logging.info(f"NUEVO ESTADO detectado con respecto al entrenamiento: {state}")
+
+                # Si la accion no es valida entonces ese Camion, se agrega como Error, porque no se procesara
+                if not valid_actions:
+                    camiones_error.append(truck_id)
+                    continue
+
+                # El agente decide una pala
+                #=============================================================================================
+                #El agente decide qué acción tomar (en este caso, a qué pala enviar el camión) basándose en el 
+                #state actual del entorno y las acciones válidas (valid_actions, que son las palas disponibles 
+                #en ese momento).
+                #==============================================================================================
+                action = agent.choose_action(state, valid_actions)
+
+                #=========================================================================================
+                # ¿Exploración o explotación?
+                # Esta línea verifica si la acción que acaba de tomar fue por exploración (decisión aleatoria) 
+                #o por explotación (usando la política aprendida). Esto depende si el agente guarda una propiedad
+                # llamada last_action_was_random. Si no existe, asumimos False.
+                #========================================================================================
+                exploracion = getattr(agent, "last_action_was_random", False)
+
+                # Actualizar métricas de exploración/explotación: Si fue una acción por exploración, sumamos 1 a ese contador.
+                if exploracion:
+                    metricas_globales["decisiones_exploracion"] += 1
+                else:
+                    metricas_globales["decisiones_explotacion"] += 1
+
+                # =============================================================
+                # Preparación info del siguiente estado en el siguiente tick
+                # ============================================================
+                next_truck_info = tick_siguiente["truck_states"].get(truck_id, truck_states[truck_id])
+
+                # Construir siguiente estado
+                next_state = estados_siguientes.get(truck_id)
+                if next_state is None:
+                    # El camión no aparece en el siguiente tick: su info actual con las palas del siguiente
+                    next_tick_info = {
+                        "truck_states": {truck_id: next_truck_info},
+                        "shovel_states": tick_siguiente["shovel_states"]
+                    }
+                    next_states_result, _ = state_builder3(next_tick_info, SHOVEL_NAMES, espec)
+                    # Tomamos el estado del primer (y único) camión
+                    next_state = next_states_result[0]
+
+                # ==============================
+                # Cálculo de recompensa
+                # ==============================
+                reward = calcular_recompensa(
+                    status=next_truck_info.get("status", "N/A"),
+                    action=action,
+                    shovels_info=shovels_info,
+                    truck_etas=truck_etas
+                )
+
+                # Obtener el valor Q anterior para este estado y acción.
+                # Si el estado no existe aún en la Q-table, marcamos como "Nuevo estado".
+                # agent.q_table es un diccionario con claves de estados.
+                valor_anterior = agent.q_table.get(state, {}).get(action, "Nuevo estado")
+
+                if TAMANO_LOTE_ONLINE > 0:
+                    # La transición queda pendiente en el buffer (mismas reglas de inicialización que update)
+                    q_table = agent.q_table
+                    fila = q_table.agregar_estado(state, SHOVEL_NAMES)
+                    fila_next = q_table.agregar_estado(next_state, valid_actions)
+                    cols_validas = q_table.columnas(valid_actions)
+                    col = q_table.columna(action)
+                    buffer.ajustar_acciones(len(q_table.acciones))
+                    mascara = np.zeros(buffer.n_acciones, dtype=bool)
+                    mascara[cols_validas] = True
+                    buffer.agregar(fila, col, reward, fila_next, mascara)
+                    # Valor Q actual (el lote todavía no se aplicó)
+                    valor_nuevo = agent.q_table[state].get(action, 0.0)
+                else:
+                    # El agente actualiza la Q-table
+                    agent.update(state, action, reward, next_state, valid_actions)
+
+                    # Valor Q después de la actualización
+                    valor_nuevo = agent.q_table[state][action]
+
+                # Verificar si el Q-value cambió
+                # Verifica que el valor anterior no sea un string (como "Nuevo estado").
+                # Verifica que el nuevo valor Q sea diferente al anterior (más que un pequeño margen)
+                if isinstance(valor_anterior, (int, float)) and abs(valor_nuevo - valor_anterior) > 1e-6: 
+                    metricas_globales["q_values_actualizados"] += 1
+
+                if detalle:
+                    # Justificación: Explicación de la decisión con información detallada
+                    razon = get_decision_reason(state, action, agent.q_table, exploracion, truck_etas, shovels_info)
+
+                    # ==============================
+                    # Logging detallado por camión
+                    # ==============================
+                    q_vals_actuales = agent.q_table[state]
+                    q_string = ", ".join([f"{a}: {round(v, 3)}" for a, v in q_vals_actuales.items()])
+
+                    logging.info(f"Camión {truck_id}: Estado → {state}")
+                    logging.info(f"  - Q-values: {q_string}")
+                    logging.info(f"  - Acción: {action} | Q: {round(valor_nuevo, 3)} | Recompensa: {round(reward, 3)} ") # | Explora: {exploracion}
+                    logging.info(f"  - Justificación: {razon}")
+
+                    # Add logging.info() de las comparaciones
+                    mostrar_comparacion_opciones(state, action, agent.q_table, truck_etas, shovels_info, exploracion)
+                    #coomparativas = mostrar_comparacion_opciones(state, action, agent.q_table, truck_etas, shovels_info, exploracion)
+                    #logging.info(coomparativas)
+
+                    # ===================================================
+                    # Logging detallado por pala seleccionada (Accion)
+                    # ===================================================
+                    shovel_data = shovels_info.get(action, {})
+                    estado_pala = shovel_data.get("state", "N/A")
+                    cola_en_pala = shovel_data.get("queue_count", "N/A")
+                    logging.info(f"  - Pala {action}: estado={estado_pala}, cola={cola_en_pala}")
+
+                # Agregados del tick (línea de resumen)
+                resumen_tick.sumar("optimizados")
+                resumen_tick.sumar("exploracion", int(exploracion))
+                resumen_tick.sumar("recompensa", float(reward))
+
+                # ====================================================
+                # Actualizar métricas globales
+                # ====================================================
+                metricas_globales["total_camiones_optimizados"] += 1
+                metricas_globales["recompensa_total_acumulada"] += reward
+                metricas_globales["acciones_por_pala"][action] += 1
+                metricas_globales["estados_unicos_vistos"].add(state)
+                camiones_realmente_optimizados.append(truck_id)
+
+
+            except Exception as e:
+                logging.error(f"Error al procesar camión {truck_id}: {e}")
                 camiones_error.append(truck_id)
-                continue
-
-            # El agente decide una pala
-            #=============================================================================================
-            #El agente decide qué acción tomar (en este caso, a qué pala enviar el camión) basándose en el 
-            #state actual del entorno y las acciones válidas (valid_actions, que son las palas disponibles 
-            #en ese momento).
-            #==============================================================================================
-            action = agent.choose_action(state, valid_actions)
-
-            #=========================================================================================
-            # ¿Exploración o explotación?
-            # Esta línea verifica si la acción que acaba de tomar fue por exploración (decisión aleatoria) 
-            #o por explotación (usando la política aprendida). Esto depende si el agente guarda una propiedad
-            # llamada last_action_was_random. Si no existe, asumimos False.
-            #========================================================================================
-            exploracion = getattr(agent, "last_action_was_random", False)
-            
-            # Actualizar métricas de exploración/explotación: Si fue una acción por exploración, sumamos 1 a ese contador.
-            if exploracion:
-                metricas_globales["decisiones_exploracion"] += 1
-            else:
-                metricas_globales["decisiones_explotacion"] += 1
-
-            # =============================================================
-            # Preparación info del siguiente estado en el siguiente tick
-            # ============================================================
-            next_truck_info = tick_siguiente["truck_states"].get(truck_id, truck_states[truck_id])
-            next_tick_info = {
-                "truck_states": {truck_id: next_truck_info},
-                "shovel_states": tick_siguiente["shovel_states"]
-            }
-
-            # Construir siguiente estado
-            next_states_result, _ = state_builder3(next_tick_info, SHOVEL_NAMES)
-            # Tomamos el estado del primer (y único) camión
-            next_state = next_states_result[0]
- 
-            # ==============================
-            # Cálculo de recompensa
-            # ==============================
-            reward = calcular_recompensa(
-                status=next_truck_info.get("status", "N/A"),
-                action=action,
-                shovels_info=shovels_info,
-                truck_etas=truck_etas
-            )
-
-            # Obtener el valor Q anterior para este estado y acción.
-            # Si el estado no existe aún en la Q-table, marcamos como "Nuevo estado".
-            # agent.q_table es un diccionario con claves de estados.
-            valor_anterior = agent.q_table.get(state, {}).get(action, "Nuevo estado")
-
-            # El agente actualiza la Q-table
-            agent.update(state, action, reward, next_state, valid_actions)
-
-            # Valor Q después de la actualización
-            valor_nuevo = agent.q_table[state][action]
-
-            # Verificar si el Q-value cambió
-            # Verifica que el valor anterior no sea un string (como "Nuevo estado").
-            # Verifica que el nuevo valor Q sea diferente al anterior (más que un pequeño margen)
-            if isinstance(valor_anterior, (int, float)) and abs(valor_nuevo - valor_anterior) > 1e-6: 
-                metricas_globales["q_values_actualizados"] += 1
-
-            # Justificación: Explicación de la decisión con información detallada
-            razon = get_decision_reason(state, action, agent.q_table, exploracion, truck_etas, shovels_info)
-
-            # ==============================
-            # Logging detallado por camión
-            # ==============================
-            q_vals_actuales = agent.q_table[state]
-            q_string = ", ".join([f"{a}: {round(v, 3)}" for a, v in q_vals_actuales.items()])
-
-            logging.info(f"Camión {truck_id}: Estado → {state}")
-            logging.info(f"  - Q-values: {q_string}")
-            logging.info(f"  - Acción: {action} | Q: {round(valor_nuevo, 3)} | Recompensa: {round(reward, 3)} ") # | Explora: {exploracion}
-            logging.info(f"  - Justificación: {razon}")
-
-            # Add logging.info() de las comparaciones
-            mostrar_comparacion_opciones(state, action, agent.q_table, truck_etas, shovels_info, exploracion)
-            #coomparativas = mostrar_comparacion_opciones(state, action, agent.q_table, truck_etas, shovels_info, exploracion)
-            #logging.info(coomparativas)
-
-             # ===================================================
-            # Logging detallado por pala seleccionada (Accion)
-            # ===================================================
-            shovel_data = shovels_info.get(action, {})
-            estado_pala = shovel_data.get("state", "N/A")
-            cola_en_pala = shovel_data.get("queue_count", "N/A")
-            logging.info(f"  - Pala {action}: estado={estado_pala}, cola={cola_en_pala}")
-
-            # ====================================================
-            # Actualizar métricas globales
-            # ====================================================
-            metricas_globales["total_camiones_optimizados"] += 1
-            metricas_globales["recompensa_total_acumulada"] += reward
-            metricas_globales["acciones_por_pala"][action] += 1
-            metricas_globales["estados_unicos_vistos"].add(state)
-            camiones_realmente_optimizados.append(truck_id)
-
-
-        except Exception as e:
-            logging.error(f"Error al procesar camión {truck_id}: {e}")
-            camiones_error.append(truck_id)
-
-    # =======================================
-    # Guardado periódico de la Q-table
-    # =======================================
-    if (idx + 1) % QTABLE_SAVE_INTERVAL == 0 or (idx + 1) == total_ticks:
-        with open(QTABLE_PATH, "wb") as f:
-            pickle.dump(agent.q_table, f)
-        logging.info(f"[Tick {tick_id}] Q-table guardada exitosamente.")
-
-# =======================================================
-# ANÁLISIS FINAL Y MÉTRICAS DE PERFORMANCE
-# =======================================================
-print("\n" + "="*80)
-print("MÉTRICAS FINALES DE VALIDACIÓN EN PRODUCCIÓN")
-print("="*80)
-
-# Análisis de estados nuevos
-#estados_nuevos_agregados = analizar_estados_nuevos(q_table_inicial, agent.q_table)
-
-# Métricas generales
-print(f"\n MÉTRICAS GENERALES:")
-print(f"  Total de ticks procesados:        {metricas_globales['total_ticks_procesados']}")
-print(f"  Total de camiones optimizados:    {metricas_globales['total_camiones_optimizados']}")
-print(f"  Total de camiones fijos:          {metricas_globales['total_camiones_fijos']}")
-print(f"  Total de camiones con error:      {metricas_globales['total_camiones_error']}")
-print(f"  Estados únicos vistos:            {len(metricas_globales['estados_unicos_vistos'])}")
-
-# Métricas de aprendizaje
-print(f"\n MÉTRICAS DE APRENDIZAJE:")
-print(f"  Estados nuevos encontrados:       {metricas_globales['estados_nuevos_encontrados']}")
-print(f"  Q-values actualizados:            {metricas_globales['q_values_actualizados']}")
-print(f"  Decisiones por exploración:       {metricas_globales['decisiones_exploracion']}")
-print(f"  Decisiones por explotación:       {metricas_globales['decisiones_explotacion']}")
-if metricas_globales['total_camiones_optimizados'] > 0:
-    tasa_exploracion = (metricas_globales['decisiones_exploracion'] / metricas_globales['total_camiones_optimizados']) * 100
-    print(f"  Tasa de exploración:             {tasa_exploracion:.1f}%")
-
-# Métricas de rendimiento
-print(f"\n MÉTRICAS DE RENDIMIENTO:")
-print(f"  Recompensa total acumulada:       {round(metricas_globales['recompensa_total_acumulada'], 2)}")
-if metricas_globales['total_camiones_optimizados'] > 0:
-    recompensa_promedio = metricas_globales['recompensa_total_acumulada'] / metricas_globales['total_camiones_optimizados']
-    print(f"  Recompensa promedio por camión:   {round(recompensa_promedio, 3)}")
-
-# Distribución de acciones por pala
-print(f"\n DISTRIBUCIÓN DE ACCIONES POR PALA:")
-for pala, count in metricas_globales['acciones_por_pala'].items():
-    if count > 0:
-        porcentaje = (count / metricas_globales['total_camiones_optimizados']) * 100
-        print(f"  - {pala}: {count} veces ({porcentaje:.1f}%)")
-
-# Resumen de la Q-table
-print(f"\n RESUMEN DE LA Q-TABLE:")
-print(f"  Estados iniciales:               {len(q_table_inicial)}")
-print(f"  Estados finales:                 {len(agent.q_table)}")
-print(f"  Estados agregados:               {len(agent.q_table) - len(q_table_inicial)}")
-
-print("\n Proceso de validación en producción completado exitosamente!")
-print(f" Logs guardados en: {LOG_PATH}")
-print(f" Q-table actualizada guardada en: {QTABLE_PATH}")
\ No newline at end of file
+
+        resumen_tick.emitir(f"[Tick {tick_id}]", forzar=(idx == total_ticks - 2),
+                            fijos=len(camiones_fijos), errores=len(camiones_error))
+
+        # =======================================
+        # Aprendizaje por lotes (transiciones pendientes)
+        # =======================================
+        if TAMANO_LOTE_ONLINE > 0 and len(buffer) and (len(buffer) >= TAMANO_LOTE_ONLINE or idx == total_ticks - 2):
+            n_pendientes = len(buffer)
+            cambios = agent.update_lote(*buffer.extraer())
+            metricas_globales["q_values_actualizados"] += int((cambios > 1e-6).sum())
+            logging.info(f"[Tick {tick_id}] Lote de {n_pendientes} transiciones aplicado a la Q-table.")
+
+        # =======================================
+        # Poda y guardado periódico de la Q-table
+        # =======================================
+        if poda is not None:
+            poda.podar_si_hace_falta()
+        if (idx + 1) % QTABLE_SAVE_INTERVAL == 0 or (idx + 1) == total_ticks:
+            filas_guardadas = checkpoints.guardar(agent, etiqueta=idx + 1)
+            logging.info(f"[Tick {tick_id}] Q-table guardada exitosamente ({filas_guardadas} estados escritos).")
+
+    # Al terminar, QTABLE_PATH queda completo (sin log pendiente) para los demás scripts
+    checkpoints.compactar(agent, etiqueta=total_ticks)
+
+    # =======================================================
+    # ANÁLISIS FINAL Y MÉTRICAS DE PERFORMANCE
+    # =======================================================
+    print("\n" + "="*80)
+    print("MÉTRICAS FINALES DE VALIDACIÓN EN PRODUCCIÓN")
+    print("="*80)
+
+    # Análisis de estados nuevos
+    #estados_nuevos_agregados = analizar_estados_nuevos(q_table_inicial, agent.q_table)
+
+    # Métricas generales
+    print(f"\n MÉTRICAS GENERALES:")
+    print(f"  Total de ticks procesados:        {metricas_globales['total_ticks_procesados']}")
+    print(f"  Total de camiones optimizados:    {metricas_globales['total_camiones_optimizados']}")
+    print(f"  Total de camiones fijos:          {metricas_globales['total_camiones_fijos']}")
+    print(f"  Total de camiones con error:      {metricas_globales['total_camiones_error']}")
+    print(f"  Estados únicos vistos:            {len(metricas_globales['estados_unicos_vistos'])}")
+
+    # Métricas de aprendizaje
+    print(f"\n MÉTRICAS DE APRENDIZAJE:")
+    print(f"  Estados nuevos encontrados:       {metricas_globales['estados_nuevos_encontrados']}")
+    print(f"  Q-values actualizados:            {metricas_globales['q_values_actualizados']}")
+    print(f"  Decisiones por exploración:       {metricas_globales['decisiones_exploracion']}")
+    print(f"  Decisiones por explotación:       {metricas_globales['decisiones_explotacion']}")
+    if metricas_globales['total_camiones_optimizados'] > 0:
+        tasa_exploracion = (metricas_globales['decisiones_exploracion'] / metricas_globales['total_camiones_optimizados']) * 100
+        print(f"  Tasa de exploración:             {tasa_exploracion:.1f}%")
+
+    # Métricas de rendimiento
+    print(f"\n MÉTRICAS DE RENDIMIENTO:")
+    print(f"  Recompensa total acumulada:       {round(metricas_globales['recompensa_total_acumulada'], 2)}")
+    if metricas_globales['total_camiones_optimizados'] > 0:
+        recompensa_promedio = metricas_globales['recompensa_total_acumulada'] / metricas_globales['total_camiones_optimizados']
+        print(f"  Recompensa promedio por camión:   {round(recompensa_promedio, 3)}")
+
+    # Distribución de acciones por pala
+    print(f"\n DISTRIBUCIÓN DE ACCIONES POR PALA:")
+    for pala, count in metricas_globales['acciones_por_pala'].items():
+        if count > 0:
+            porcentaje = (count / metricas_globales['total_camiones_optimizados']) * 100
+            print(f"  - {pala}: {count} veces ({porcentaje:.1f}%)")
+
+    # Resumen de la Q-table
+    print(f"\n RESUMEN DE LA Q-TABLE:")
+    print(f"  Estados iniciales:               {len(q_table_inicial)}")
+    print(f"  Estados finales:                 {len(agent.q_table)}")
+    print(f"  Estados agregados:               {len(agent.q_table) - len(q_table_inicial)}")
+    if poda is not None:
+        print(f"  Poda:                            {poda.resumen()}")
+
+    print("\n Proceso de validación en producción completado exitosamente!")
+    if log_path is not None:
+        print(f" Logs guardados en: {log_path}")
+    print(f" Q-table actualizada guardada en: {qtable_path}")
+
+    return metricas_globales
+
+
+if __name__ == "__main__":
+    LOG_PATH = configurar_logger(LOG_DIR)
+    arranque.marcar("config")
+    ejecutar_validacion(log_path=LOG_PATH, arranque=arranque)
@@ -1,18 +1,27 @@
+import time
+_INICIO = time.perf_counter()  # antes de los imports: el desglose de arranque los incluye
 import os
 import sys
 import json
-import time
-import pickle
 import logging
 from datetime import datetime
-import pandas as pd
 import yaml
 
 # Importar funciones y clases del proyecto
+# (pandas se importa recién al mostrar el resultado; numpy no se usa en este camino)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from agent.q_learning_agent import QLearningAgent
 from agent.state_builder import state_builder3
 from agent.rewards import calcular_recompensa
+from agent.diagnostico import configurar, activo, ResumenEpisodio, NORMAL
+from agent.despacho import recuperar_estado, aplicar_update
+from agent.arranque import TiemposArranque
+from agent.q_learning_agent import QLearningAgent
+from agent.q_table_compacta import CompactoQLearningAgent
+from agent.poda_q_table import PodaQTable
+from agent.discretizacion import cargar_discretizacion
+
+arranque = TiemposArranque(_INICIO)
+arranque.marcar("imports")
 
 # Cargar archivo YAML
 with open("config.yaml", "r", encoding="utf-8") as f:
@@ -22,7 +31,15 @@ with open("config.yaml", "r", encoding="utf-8") as f:
 QTABLE_PATH = config["paths"]["qtable_path"]
 TICK_FILE = config["paths"]["tick_file"]
 DECISION_LOG_PATH = config["paths"]["decision_log_path"]
+DECISION_WAL_PATH = config["paths"]["decision_wal_path"]
+WAL_FSYNC_CADA = config["paths"].get("wal_fsync_cada", 1)
+WAL_MAX_BYTES = 1 << 20  # tamaño del WAL a partir del cual se compacta después de guardar la Q-table
+# Política compilada (Q-table abierta con mmap en vez de pickle.load); sin la clave, se carga el pickle
+POLITICA_PATH = config["paths"].get("politica_path")
 SHOVEL_NAMES = config["agent"]["shovel_names"]
+CLASE_AGENTE = CompactoQLearningAgent if config["agent"].get("q_table_compacta") else QLearningAgent
+# La misma discretización del entrenamiento (sin ella los estados no coinciden con la Q-table)
+ESPEC = cargar_discretizacion(config["paths"].get("discretizacion_path"))
 
 
 LOG_DIR = config["paths"]["log_dir"]
@@ -41,6 +58,11 @@ logging.basicConfig(
         #logging.StreamHandler()
     ]
 )
+# Verbosidad: con "resumen" no se calcula la justificación por camión (get_decision_reason)
+configurar(config["logging"].get("verbosidad"), salida=logging.info)
+detalle = activo(NORMAL)
+resumen_tick = ResumenEpisodio()
+arranque.marcar("config")
 
 #===== Funciones Auxiliares =========
 
@@ -108,14 +130,22 @@ def get_decision_reason(state, action, q_table, exploracion, truck_etas=None, sh
     return base_reason + eta_info + shovel_info #+ etas_info
 #=====================================================================================================================
 
-# ==== CARGAR AGENTE ====
-agent = QLearningAgent(actions=SHOVEL_NAMES)
-if os.path.exists(QTABLE_PATH):
-    with open(QTABLE_PATH, "rb") as f:
-        agent.q_table = pickle.load(f)
-    logging.info(f"Q-table cargada con {len(agent.q_table)} estados conocidos.")
+# ==== CARGAR AGENTE Y DECISIONES PENDIENTES ====
+# Q-table (con el log incremental, si lo hay) + WAL de decisiones: si la ejecución anterior se cortó
+# después de registrar updates pero antes de guardar la Q-table, aquí se reaplican
+agent, wal, checkpoints, checkpoint_info = recuperar_estado(QTABLE_PATH, DECISION_WAL_PATH, SHOVEL_NAMES,
+                                                            decision_pickle=DECISION_LOG_PATH,
+                                                            fsync_cada=WAL_FSYNC_CADA,
+                                                            politica_path=POLITICA_PATH, clase=CLASE_AGENTE)
+if checkpoint_info is not None:
+    logging.info(f"Q-table cargada con {len(agent.q_table)} estados conocidos"
+                 f"{' (política compilada)' if checkpoint_info.get('compilada') else ''}.")
 else:
     logging.warning("No se encontró Q-table previa. Iniciando desde cero.")
+# Techo de la Q-table (agent.poda en config.yaml). Cada ejecución procesa un solo tick, así que
+# aquí no hay visitas previas: la política útil es "ceros" (filas que nunca se actualizaron)
+poda = PodaQTable.desde_config(agent, config["agent"].get("poda"))
+arranque.marcar("qtable")
 
 # ==== CARGAR TICK ACTUAL ====
 logging.info(f"Cargando tick desde: {TICK_FILE}")
@@ -135,56 +165,54 @@ for truck_id, truck_info in truck_states.items():
         camiones_fijos.append(truck_id)
 
 logging.info(f"[Tick] Optimizar: {camiones_optimizados} | Fijos: {camiones_fijos}")
+arranque.marcar("tick")
 
 
 # ==== ACTUALIZAR Q-TABLE CON DECISIONES PENDIENTES (del tick anterior) ====
-if os.path.exists(DECISION_LOG_PATH):
-    with open(DECISION_LOG_PATH, "rb") as f:
-        decisiones_previas = pickle.load(f)
-
-    if decisiones_previas:
-        logging.info(f"Procesando {len(decisiones_previas)} decisiones pendientes para actualización...")
-        for dec in decisiones_previas:
-            try:
-                # Estado y acción del tick anterior
-                state_prev = dec["state"]
-                action_prev = dec["action"]
-                valid_actions_prev = dec["valid_actions"]
-                truck_id = dec["truck_id"]
-
-                # Recompensa usando la situación actual del tick
-                recompensa = calcular_recompensa(
-                    status=truck_states.get(truck_id, {}).get("status", "N/A"),
-                    action=action_prev,
-                    shovels_info=shovels_info,
-                    truck_etas=truck_states.get(truck_id, {}).get("ETA", {})
-                )
-
-                # Construimos el next_state a partir del tick actual
-                tick_info_actual = {
-                    "truck_states": {truck_id: truck_states[truck_id]},
-                    "shovel_states": shovels_info
-                }
-                states_result_actual, _ = state_builder3(tick_info_actual, SHOVEL_NAMES)
-                next_state = states_result_actual[0]
-
-                # Si es nuevo estado, inicializamos sus valores Q
-                if next_state not in agent.q_table:
-                    agent.q_table[next_state] = {a: 0.0 for a in SHOVEL_NAMES}
-
-                # Actualizamos Q-table
-                agent.update(state_prev, action_prev, recompensa, next_state, valid_actions_prev)
-
-            except Exception as e:
-                logging.error(f"Error actualizando Q para camión {dec.get('truck_id')}: {e}")
-
-        # Guardamos la Q-table actualizada
-        with open(QTABLE_PATH, "wb") as f:
-            pickle.dump(agent.q_table, f)
-        logging.info("Q-table actualizada y guardada.")
-
-    # Eliminamos las decisiones ya procesadas
-    os.remove(DECISION_LOG_PATH)
+decisiones_previas = wal.pendientes()
+guardado_hasta = None  # secuencia del WAL incluida en la Q-table guardada en esta ejecución
+if decisiones_previas:
+    logging.info(f"Procesando {len(decisiones_previas)} decisiones pendientes para actualización...")
+    updates = []
+    for dec in decisiones_previas:
+        try:
+            truck_id = dec["truck_id"]
+
+            # Recompensa usando la situación actual del tick
+            recompensa = calcular_recompensa(
+                status=truck_states.get(truck_id, {}).get("status", "N/A"),
+                action=dec["action"],
+                shovels_info=shovels_info,
+                truck_etas=truck_states.get(truck_id, {}).get("ETA", {})
+            )
+
+            # Construimos el next_state a partir del tick actual
+            tick_info_actual = {
+                "truck_states": {truck_id: truck_states[truck_id]},
+                "shovel_states": shovels_info
+            }
+            states_result_actual, _ = state_builder3(tick_info_actual, SHOVEL_NAMES, ESPEC)
+            updates.append((dec, recompensa, states_result_actual[0]))
+
+        except Exception as e:
+            # Se descarta la decisión (queda resuelta en el WAL, sin update)
+            updates.append((dec, None, None))
+            logging.error(f"Error actualizando Q para camión {dec.get('truck_id')}: {e}")
+
+    # Primero el WAL (updates con su recompensa y next_state), después la Q-table
+    wal.registrar_updates([(dec["seq"], recompensa, next_state) for dec, recompensa, next_state in updates])
+    for dec, recompensa, next_state in updates:
+        if recompensa is not None:
+            aplicar_update(agent, dec, recompensa, next_state, SHOVEL_NAMES)
+
+    if poda is not None and poda.podar_si_hace_falta():
+        logging.info(f"[Poda] {poda.resumen()}")
+
+    # Guardamos la Q-table actualizada (registro incremental) con la secuencia del WAL que ya incluye
+    guardado_hasta = wal.ultimo_update()
+    checkpoints.guardar(agent, etiqueta=tick_data.get("tick_id"), meta={"wal_seq": guardado_hasta})
+    logging.info("Q-table actualizada y guardada.")
+arranque.marcar("pendientes")
 
 
 # ==== PROCESAR TICK ACTUAL Y ELEGIR ACCIONES ====
@@ -199,7 +227,7 @@ for truck_id in camiones_optimizados:
         }
 
         # Construimos el estado actual
-        states_result, _ = state_builder3(tick_info, SHOVEL_NAMES)
+        states_result, _ = state_builder3(tick_info, SHOVEL_NAMES, ESPEC)
         state = states_result[0]
 
         # Si el estado no está en la Q-table, lo creamos con Q=0
@@ -218,8 +246,8 @@ for truck_id in camiones_optimizados:
         action = agent.choose_action(state, valid_actions)
         exploracion = getattr(agent, "last_action_was_random", False)
 
-        # Razón de la decisión (para logs)
-        razon = get_decision_reason(state, action, agent.q_table, exploracion, truck_etas, shovels_info)
+        resumen_tick.sumar("optimizados")
+        resumen_tick.sumar("exploracion", int(exploracion))
 
         # Guardar esta decisión para actualizarla en el próximo tick
         decisiones_guardar.append({
@@ -244,16 +272,29 @@ for truck_id in camiones_optimizados:
             "Changed": action != truck_states[truck_id].get("current_shovel", "NONE")
         })
 
-        logging.info(f"Camión {truck_id} Asignar a {action} | Razón: {razon}")
+        if detalle:
+            # Razón de la decisión (para logs)
+            razon = get_decision_reason(state, action, agent.q_table, exploracion, truck_etas, shovels_info)
+            logging.info(f"Camión {truck_id} Asignar a {action} | Razón: {razon}")
 
     except Exception as e:
         logging.error(f"Error procesando camión {truck_id}: {e}")
 
+resumen_tick.emitir("[Tick]", fijos=len(camiones_fijos))
+arranque.marcar("decisiones")
+
 # ==== GUARDAR DECISIONES PARA EL PRÓXIMO TICK ====
-with open(DECISION_LOG_PATH, "wb") as f:
-    pickle.dump(decisiones_guardar, f)
+# Se agregan al WAL (una escritura); lo ya incluido en la Q-table sale del WAL cuando crece
+wal.registrar_decisiones(decisiones_guardar)
+if guardado_hasta is not None and wal.tamano() > WAL_MAX_BYTES:
+    wal.compactar(guardado_hasta)
+wal.cerrar()
 logging.info(f"Guardadas {len(decisiones_guardar)} decisiones para reentrenamiento en próximo tick.")
+arranque.marcar("guardado")
+# Desglose del tiempo hasta tener las decisiones
+logging.info(f"[Arranque] {arranque.resumen()}")
 
 # ==== MOSTRAR RESULTADOS ====
+import pandas as pd
 df_result = pd.DataFrame(resultados)
 print(df_result)
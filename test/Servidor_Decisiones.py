@@ -0,0 +1,56 @@
+import os
+import sys
+import asyncio
+import logging
+import yaml
+
+# Importar funciones y clases del proyecto
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agent.checkpoint_delta import cargar_checkpoint
+from agent.servidor_decisiones import ServidorDecisiones
+from agent.discretizacion import cargar_discretizacion
+
+# ===================================================================================
+# API HTTP local de decisiones: la Q-table se carga una vez y se sirven asignaciones
+# ===================================================================================
+# Uso desde otro proceso (sin lanzar Python por tick):
+#   curl -X POST http://127.0.0.1:8765/decidir -d @tick_228.json
+# o desde Python:
+#   from agent.servidor_decisiones import ClienteDecisiones
+#   ClienteDecisiones(puerto=8765).decidir(tick)
+# POST /recargar vuelve a leer la Q-table (p. ej. después de un guardado de Despachador_RealTime.py).
+
+# Cargar archivo YAML
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml"), "r", encoding="utf-8") as f:
+    config = yaml.safe_load(f)
+
+QTABLE_PATH = config["paths"]["qtable_path"]
+SHOVEL_NAMES = config["agent"]["shovel_names"]
+ESPEC = cargar_discretizacion(config["paths"].get("discretizacion_path"))
+SERVIDOR = config["servidor"]
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] RLDecisiones: %(message)s")
+
+
+def cargar_q_table():
+    if not os.path.exists(QTABLE_PATH):
+        logging.warning("No se encontró Q-table. Se sirve con Q=0 para todos los estados.")
+        return {}
+    q_table, _ = cargar_checkpoint(QTABLE_PATH)
+    return q_table
+
+
+async def main():
+    servidor = ServidorDecisiones(cargar_q_table(), SHOVEL_NAMES, epsilon=SERVIDOR["epsilon"],
+                                  lote_max=SERVIDOR["lote_max"], espera_lote=SERVIDOR["espera_lote_ms"] / 1000,
+                                  workers=SERVIDOR["workers"], cargar=cargar_q_table, espec=ESPEC)
+    logging.info(f"Q-table con {len(servidor.tabla)} estados. Escuchando en "
+                 f"{SERVIDOR['ruta_unix'] or (SERVIDOR['host'], SERVIDOR['puerto'])}")
+    await servidor.servir(SERVIDOR["host"], SERVIDOR["puerto"], SERVIDOR["ruta_unix"])
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logging.info("Servidor detenido.")
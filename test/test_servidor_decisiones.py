@@ -0,0 +1,66 @@
+import os
+import sys
+import asyncio
+import threading
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agent.state_builder import estados_tick
+from agent.servidor_decisiones import ServidorDecisiones, ClienteDecisiones
+
+# =========================================================
+# Servidor de decisiones + cliente local (puerto TCP libre)
+# =========================================================
+PALAS = ["PH002", "EX004", "PH003", "PH001", "CF001", "CF002"]
+
+TICK = {
+    "tick_id": 7,
+    "truck_states": {
+        "CM01": {"status": "waiting for shovel", "position": [205692.0, 8398022.0], "tank_fuel_level": 18,
+                 "current_shovel": "PH002", "ETA": {"PH002": 12.7, "EX004": 5.3}},
+        "CM02": {"status": "moving load", "position": [204954.0, 8394494.0], "tank_fuel_level": 93,
+                 "ETA": {"PH003": 12.3}},
+    },
+    "shovel_states": {p: {"main_state": 1, "queue_count": 0, "priority": 1, "coverage": 50} for p in PALAS},
+}
+
+
+@pytest.fixture
+def servidor():
+    # El servidor corre en su propio loop de asyncio, en otro hilo; el cliente es bloqueante
+    estado = estados_tick(TICK, PALAS)["CM01"]
+    q_table = {estado: {"PH002": 1.0, "EX004": -1.0}}
+
+    def cargar():
+        raise FileNotFoundError("q_table_real.pkl")
+
+    loop = asyncio.new_event_loop()
+    hilo = threading.Thread(target=loop.run_forever, daemon=True)
+    hilo.start()
+    srv = asyncio.run_coroutine_threadsafe(
+        ServidorDecisiones(q_table, PALAS, cargar=cargar).iniciar(puerto=0), loop).result(timeout=10)
+    cliente = ClienteDecisiones(*srv.direccion[:2])
+    yield srv, cliente
+    cliente.cerrar()
+    asyncio.run_coroutine_threadsafe(srv.detener(), loop).result(timeout=10)
+    loop.call_soon_threadsafe(loop.stop)
+    hilo.join(timeout=10)
+
+
+def test_decidir_y_salud(servidor):
+    srv, cliente = servidor
+    asignaciones = cliente.decidir(TICK)
+    assert [(a["Truck"], a["Shovel"], a["Changed"]) for a in asignaciones] == [("CM01", "PH002", False)]
+    salud = cliente.salud()
+    assert salud["estado"] == "ok" and salud["estados"] == 1 and salud["solicitudes"] == 1
+
+
+def test_recargar_fallido_responde_error_y_mantiene_la_tabla(servidor):
+    srv, cliente = servidor
+    with pytest.raises(RuntimeError, match="500.*FileNotFoundError"):
+        cliente.recargar()
+    # La conexión sigue viva y se sigue sirviendo la tabla anterior
+    assert cliente.salud()["estados"] == 1
+    assert cliente.decidir(TICK)[0]["Shovel"] == "PH002"
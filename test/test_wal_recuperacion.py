@@ -0,0 +1,109 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agent.q_learning_agent import QLearningAgent
+from agent.wal_decisiones import WalDecisiones
+from agent.checkpoint_delta import cargar_checkpoint
+from agent.despacho import recuperar_estado, aplicar_update
+
+# =========================================================
+# Recuperación tras un corte: WAL de decisiones + checkpoint incremental
+# =========================================================
+PALAS = ["PH001", "PH002", "EX004"]
+
+
+def _decision(i):
+    return {"tick_id": i, "truck_id": f"T{i % 3}", "state": (i % 4, 1, 2), "action": PALAS[i % 3],
+            "valid_actions": list(PALAS), "timestamp": None}
+
+
+def _updates(desde, hasta):
+    # (seq, reward, next_state) deterministas para las decisiones desde..hasta
+    return [(seq, float(seq % 5) - 2.0, ((seq + 1) % 4, 1, 2)) for seq in range(desde, hasta + 1)]
+
+
+def _agente_referencia(updates):
+    # Q-table que resulta de aplicar todos los updates sin ningún corte
+    agent = QLearningAgent(actions=PALAS)
+    for seq, reward, next_state in updates:
+        aplicar_update(agent, _decision(seq - 1), reward, next_state, PALAS)
+    return agent
+
+
+def _aplicar(agent, wal, updates):
+    # Como Despachador.aplicar_pendientes: primero al WAL, después a la Q-table en memoria
+    wal.registrar_updates(updates)
+    for seq, reward, next_state in updates:
+        aplicar_update(agent, wal.decisiones[seq], reward, next_state, PALAS)
+
+
+def test_registro_cortado_al_final_se_descarta(tmp_path):
+    ruta = str(tmp_path / "decisiones.wal")
+    wal = WalDecisiones(ruta)
+    wal.registrar_decisiones([_decision(i) for i in range(3)])
+    wal.registrar_updates(_updates(1, 2))
+    wal.cerrar()
+    tamano_valido = os.path.getsize(ruta)
+
+    # Corte a mitad de una escritura: cabecera completa y la mitad del registro
+    registro = WalDecisiones._empaquetar({"tipo": "update", "seq": 3, "reward": 1.0, "next_state": (0, 1, 2)})
+    with open(ruta, "ab") as f:
+        f.write(registro[:len(registro) // 2])
+
+    wal = WalDecisiones(ruta)
+    assert os.path.getsize(ruta) == tamano_valido
+    assert [u["seq"] for u in wal.updates] == [1, 2]
+    assert [d["seq"] for d in wal.pendientes()] == [3]
+
+    # Lo que se agrega después del registro descartado se lee bien
+    wal.registrar_updates(_updates(3, 3))
+    wal.cerrar()
+    assert [u["seq"] for u in WalDecisiones(ruta).updates] == [1, 2, 3]
+
+
+def test_corte_despues_del_checkpoint_reaplica_desde_wal_seq(tmp_path):
+    qtable = str(tmp_path / "q_table.pkl")
+    ruta_wal = str(tmp_path / "decisiones.wal")
+
+    agent, wal, checkpoints, info = recuperar_estado(qtable, ruta_wal, PALAS)
+    assert info is None and checkpoints.fsync
+    wal.registrar_decisiones([_decision(i) for i in range(10)])
+    _aplicar(agent, wal, _updates(1, 4))
+    checkpoints.guardar(agent, etiqueta=1, meta={"wal_seq": 4})
+    wal.compactar(4)
+    _aplicar(agent, wal, _updates(5, 7))
+    checkpoints.guardar(agent, etiqueta=2, meta={"wal_seq": 7})
+    # Updates 8-9 solo en el WAL (corte antes del próximo checkpoint) y un registro cortado al final
+    _aplicar(agent, wal, _updates(8, 9))
+    wal.sincronizar()
+    with open(ruta_wal, "ab") as f:
+        f.write(b"\x10\x00\x00")
+
+    _, info = cargar_checkpoint(qtable)
+    assert info["meta"] == {"wal_seq": 7}
+
+    recuperado, wal, _, info = recuperar_estado(qtable, ruta_wal, PALAS)
+    assert recuperado.q_table == _agente_referencia(_updates(1, 9)).q_table
+    assert [d["seq"] for d in wal.pendientes()] == [10]
+    wal.cerrar()
+
+
+def test_reaplicar_es_idempotente(tmp_path):
+    qtable = str(tmp_path / "q_table.pkl")
+    ruta_wal = str(tmp_path / "decisiones.wal")
+
+    agent, wal, checkpoints, _ = recuperar_estado(qtable, ruta_wal, PALAS)
+    wal.registrar_decisiones([_decision(i) for i in range(6)])
+    _aplicar(agent, wal, _updates(1, 3))
+    checkpoints.guardar(agent, etiqueta=1, meta={"wal_seq": 3})
+    _aplicar(agent, wal, _updates(4, 6))
+    wal.cerrar()
+
+    # Dos reinicios seguidos sin guardar: cada uno reaplica 4-6 sobre la misma base
+    esperado = _agente_referencia(_updates(1, 6)).q_table
+    for _ in range(2):
+        recuperado, wal, _, _ = recuperar_estado(qtable, ruta_wal, PALAS)
+        wal.cerrar()
+        assert recuperado.q_table == esperado